@@ -0,0 +1,62 @@
+"""
+Micro-benchmarks for pure compute helpers on hot request paths.
+
+    pytest benchmarks --benchmark-autosave                 # record a run
+    pytest benchmarks --benchmark-compare \
+        --benchmark-compare-fail=median:15%                # fail on regression
+"""
+from engines.fraud import FeatureStore, transaction
+from routes.admin import aggregate_sales
+from routes.ai_advanced import calculate_risk_factors
+from routes.loyalty import compute_installment
+from routes.rides import calculate_fare
+from routes.voice_commands import detect_intent
+
+
+def bench_calculate_fare(benchmark, ride_batch):
+    def run():
+        return [calculate_fare(*ride) for ride in ride_batch]
+
+    fares = benchmark(run)
+    assert len(fares) == len(ride_batch)
+
+
+def bench_calculate_risk_factors(benchmark, fraud_batch):
+    store = FeatureStore()
+    txns = [transaction(r.customer_id, r.amount, ip=r.ip_address) for r in fraud_batch]
+    for txn in txns:
+        store.record(txn)
+    batch = [(request, store.features(txn)) for request, txn in zip(fraud_batch, txns)]
+
+    def run():
+        return [calculate_risk_factors(request, features) for request, features in batch]
+
+    factors = benchmark(run)
+    assert all(factors)
+
+
+def bench_detect_intent(benchmark, utterance_batch):
+    def run():
+        return [detect_intent(text, lang) for text, lang in utterance_batch]
+
+    intents = benchmark(run)
+    assert "unknown" in intents and "sales" in intents
+
+
+def bench_compute_installment(benchmark, installment_batch):
+    def run():
+        return [compute_installment(amount, months) for amount, months in installment_batch]
+
+    plans = benchmark(run)
+    assert plans[0]["monthly_payment"] > 0
+
+
+def bench_aggregate_sales_week(benchmark, orders_week):
+    total_revenue, total_orders, _, top = benchmark(aggregate_sales, orders_week)
+    assert total_orders == len(orders_week) and len(top) == 10
+
+
+def bench_aggregate_sales_year(benchmark, orders_year):
+    total_revenue, total_orders, _, top = benchmark.pedantic(
+        aggregate_sales, args=(orders_year,), rounds=5, iterations=1)
+    assert total_orders == len(orders_year)
@@ -0,0 +1,97 @@
+"""
+Per-request overhead of RateLimitMiddleware (in-memory store).
+
+Each round pushes BATCH requests through the middleware around a no-op app
+on one event loop, so the figure includes the ASGI call itself. The
+asserts hold the budget of 50 µs per request: limited routes must stay under
+half of it, unlimited paths under a tenth. Authorized requests carry 500
+signed tokens, so after the first round the user key comes from the
+verified-token cache; forged tokens are verified (and rejected) on every
+request and may use the whole budget. With --benchmark-disable nothing is
+timed and the budgets are not checked.
+"""
+import asyncio
+import time
+
+import jwt
+import pytest
+
+from core.rate_limit import JWT_ALGORITHM, JWT_SECRET, Limit, RateLimiter, RateLimitMiddleware
+
+BATCH = 1000
+BUDGET_SECONDS = 50e-6
+LIMITED = BUDGET_SECONDS / 2
+UNLIMITED = BUDGET_SECONDS / 10
+EXPIRES = int(time.time()) + 3600
+TOKENS = [jwt.encode({"user_id": f"user-{i}", "role": "customer", "exp": EXPIRES}, JWT_SECRET,
+                     algorithm=JWT_ALGORITHM) for i in range(500)]
+
+
+async def _noop_app(scope, receive, send):
+    pass
+
+
+async def _send(message):
+    pass
+
+
+def _scope(path, i, authorized, forged=False):
+    headers = [(b"host", b"api.oceansouq.sa"), (b"accept", b"application/json"),
+               (b"user-agent", b"bench"), (b"accept-encoding", b"gzip, br")]
+    if forged:
+        headers.append((b"authorization", f"Bearer {TOKENS[i % 500][:-4]}AAAA".encode()))
+    elif authorized:
+        headers.append((b"authorization", f"Bearer {TOKENS[i % 500]}".encode()))
+    return {"type": "http", "method": "GET", "path": path, "headers": headers,
+            "client": (f"10.0.{i % 250}.{i % 200}", 40000)}
+
+
+@pytest.fixture(scope="module")
+def limited():
+    limiter = RateLimiter()
+    limiter.enabled = True
+    limiter.limit("GET", "/api/search/suggestions", Limit(10, per=1, burst=20))
+    limiter.limit("GET", "/api/chat/history", Limit(20, per=60), Limit(600, per=60, key="route"))
+    limiter.limit_prefix("/api/ai-engines", Limit(120, per=60, burst=30))
+    return RateLimitMiddleware(_noop_app, limiter)
+
+
+def _run(benchmark, middleware, scopes, budget):
+    loop = asyncio.new_event_loop()
+
+    async def batch():
+        for scope in scopes:
+            await middleware(scope, None, _send)
+
+    try:
+        benchmark(lambda: loop.run_until_complete(batch()))
+    finally:
+        loop.close()
+    if not benchmark.disabled:
+        per_request = benchmark.stats.stats.median / len(scopes)
+        assert per_request < budget, f"{per_request * 1e6:.1f} µs per request, budget {budget * 1e6:.0f} µs"
+
+
+def bench_rate_limit_unlimited_path(benchmark, limited):
+    _run(benchmark, limited, [_scope("/api/products", i, True) for i in range(BATCH)], UNLIMITED)
+
+
+def bench_rate_limit_by_user(benchmark, limited):
+    _run(benchmark, limited, [_scope("/api/search/suggestions", i, True) for i in range(BATCH)], LIMITED)
+
+
+def bench_rate_limit_forged_token(benchmark, limited):
+    scopes = [_scope("/api/search/suggestions", i, True, forged=True) for i in range(BATCH)]
+    _run(benchmark, limited, scopes, BUDGET_SECONDS)
+
+
+def bench_rate_limit_by_ip(benchmark, limited):
+    _run(benchmark, limited, [_scope("/api/search/suggestions", i, False) for i in range(BATCH)], LIMITED)
+
+
+def bench_rate_limit_two_limits(benchmark, limited):
+    _run(benchmark, limited, [_scope("/api/chat/history", i, True) for i in range(BATCH)], LIMITED)
+
+
+def bench_rate_limit_router_prefix(benchmark, limited):
+    _run(benchmark, limited, [_scope("/api/ai-engines/search", i, True) for i in range(BATCH)], LIMITED)
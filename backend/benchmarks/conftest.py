@@ -0,0 +1,95 @@
+"""
+Shared fixtures for the micro-benchmarks. Every batch is generated from a
+fixed seed so runs on different commits measure the same work.
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BATCH = 1000
+
+
+@pytest.fixture(scope="session")
+def rng():
+    return random.Random(20240101)
+
+
+@pytest.fixture(scope="session")
+def ride_batch(rng):
+    """1,000 intra-city trips around Riyadh across all ride types"""
+    ride_types = ["economy", "comfort", "premium", "xl"]
+    return [
+        (24.6 + rng.random() * 0.3, 46.6 + rng.random() * 0.3,
+         24.6 + rng.random() * 0.3, 46.6 + rng.random() * 0.3,
+         ride_types[i % len(ride_types)])
+        for i in range(BATCH)
+    ]
+
+
+@pytest.fixture(scope="session")
+def fraud_batch(rng):
+    from routes.ai_advanced import FraudAnalysisRequest
+    return [
+        FraudAnalysisRequest(
+            transaction_id=f"TXN-{i}",
+            amount=round(rng.lognormvariate(5, 1.2), 2),
+            payment_method=rng.choice(["card", "apple_pay", "cod"]),
+            customer_id=f"C-{rng.randrange(500)}",
+            ip_address=f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}",
+        )
+        for i in range(BATCH)
+    ]
+
+
+@pytest.fixture(scope="session")
+def utterance_batch(rng):
+    """Voice commands: mostly matches, some misses that scan every keyword"""
+    from routes.voice_commands import SUPPORTED_COMMANDS
+    batch = []
+    for i in range(BATCH):
+        lang = "ar" if i % 2 else "en"
+        if i % 5 == 0:
+            batch.append(("random chatter without a command" if lang == "en" else "كلام عادي بدون أمر", lang))
+        else:
+            keywords = rng.choice(list(SUPPORTED_COMMANDS[lang].values()))
+            batch.append((f"please {rng.choice(keywords)} now", lang))
+    return batch
+
+
+@pytest.fixture(scope="session")
+def installment_batch(rng):
+    return [(round(rng.uniform(500, 100000), 2), rng.choice([3, 6, 12, 24])) for _ in range(BATCH)]
+
+
+def _orders(rng, count, products=2000):
+    now = datetime.utcnow()
+    orders = []
+    for i in range(count):
+        items = [{
+            "product_id": f"P-{rng.randrange(products)}",
+            "price": round(rng.uniform(5, 500), 2),
+            "quantity": rng.randint(1, 3),
+        } for _ in range(rng.randint(1, 4))]
+        orders.append({
+            "id": f"O-{i}",
+            "items": items,
+            "total": sum(item["price"] * item["quantity"] for item in items),
+            "created_at": (now - timedelta(minutes=i)).isoformat(),
+        })
+    return orders
+
+
+@pytest.fixture(scope="session")
+def orders_week(rng):
+    """Roughly a week of orders for a mid-size marketplace"""
+    return _orders(rng, 10000)
+
+
+@pytest.fixture(scope="session")
+def orders_year(rng):
+    return _orders(rng, 100000)
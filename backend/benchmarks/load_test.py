@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Load-test driver for the OceanSouq API.
+
+Runs weighted scenarios (browse, cart/checkout, seller dashboard, ride
+request/accept, hotel search) from N concurrent virtual users with
+asyncio + httpx against a locally running server backed by a local MongoDB
+seeded with `scripts/seed_data.py --scale --manifest ...`.
+
+    python scripts/seed_data.py --scale --products 50000 --orders 100000 \
+        --manifest benchmarks/results/seed_manifest.json
+    python benchmarks/load_test.py --users 50 --duration 60 \
+        --baseline benchmarks/baseline.json
+
+Produces a JSON report with throughput and latency percentiles per step and
+compares it with a stored baseline; the exit code is 1 when any step
+regresses beyond --tolerance. A --baseline that does not exist is an error
+(exit code 2, before any load is sent); record one first with
+
+    python benchmarks/load_test.py --users 50 --duration 60 \
+        --baseline benchmarks/baseline.json --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MANIFEST = os.path.join(HERE, "results", "seed_manifest.json")
+DEFAULT_OUT = os.path.join(HERE, "results", "latest.json")
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+
+DEFAULT_MIX = "browse=50,checkout=15,seller=10,ride=10,hotel=15"
+
+
+# ==================== RECORDING ====================
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}  # step -> [seconds]
+        self.errors = {}     # step -> count
+        self.statuses = {}   # step -> {status: count}
+
+    def record(self, step, seconds, status):
+        self.latencies.setdefault(step, []).append(seconds)
+        by_status = self.statuses.setdefault(step, {})
+        by_status[status] = by_status.get(status, 0) + 1
+        if status >= 400:
+            self.errors[step] = self.errors.get(step, 0) + 1
+
+    def error(self, step):
+        self.errors[step] = self.errors.get(step, 0) + 1
+        by_status = self.statuses.setdefault(step, {})
+        by_status["transport"] = by_status.get("transport", 0) + 1
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(recorder, elapsed):
+    steps = {}
+    total = 0
+    for step in sorted(set(recorder.latencies) | set(recorder.errors)):
+        values = sorted(recorder.latencies.get(step, []))
+        total += len(values)
+        steps[step] = {
+            "count": len(values),
+            "errors": recorder.errors.get(step, 0),
+            "rps": round(len(values) / elapsed, 2) if elapsed else 0,
+            "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0,
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p90_ms": round(percentile(values, 90) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2) if values else 0,
+            "statuses": {str(k): v for k, v in recorder.statuses.get(step, {}).items()},
+        }
+    return {"total_requests": total, "rps": round(total / elapsed, 2) if elapsed else 0, "steps": steps}
+
+
+# ==================== SCENARIOS ====================
+
+class Context:
+    """Shared per-run state: HTTP client, recorder, manifest and cached logins"""
+
+    def __init__(self, client, recorder, manifest, rng):
+        self.client = client
+        self.recorder = recorder
+        self.manifest = manifest
+        self.rng = rng
+        self.tokens = {}
+
+    async def call(self, step, method, url, token=None, **kwargs):
+        headers = {"Authorization": f"Bearer {token}"} if token else None
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=headers, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.error(step)
+            return None
+        self.recorder.record(step, time.perf_counter() - start, response.status_code)
+        return response
+
+    async def login(self, email):
+        token = self.tokens.get(email)
+        if token is None:
+            response = await self.call("auth.login", "POST", "/api/auth/login",
+                                       json={"email": email, "password": self.manifest["password"]})
+            if response is None or response.status_code != 200:
+                return None
+            token = self.tokens[email] = response.json()["token"]
+        return token
+
+
+async def scenario_browse(ctx):
+    rng, m = ctx.rng, ctx.manifest
+    await ctx.call("browse.list_category", "GET", "/api/products",
+                   params={"category": rng.choice(m["categories"])})
+    product_id = rng.choice(m["product_ids"])
+    await ctx.call("browse.product", "GET", f"/api/products/{product_id}")
+    await ctx.call("browse.similar", "GET", f"/api/products/{product_id}/similar")
+    await ctx.call("browse.suggestions", "GET", "/api/search/suggestions",
+                   params={"q": rng.choice(["Smart", "Watch", "Lamp", "Prem"])})
+    await ctx.call("browse.trending", "GET", "/api/products/trending")
+
+
+async def scenario_checkout(ctx):
+    rng, m = ctx.rng, ctx.manifest
+    token = await ctx.login(rng.choice(m["buyers"]))
+    if token is None:
+        return
+    for product_id in rng.sample(m["product_ids"], min(3, len(m["product_ids"]))):
+        await ctx.call("checkout.add_to_cart", "POST", "/api/cart", token=token,
+                       json={"product_id": product_id, "quantity": 1})
+    await ctx.call("checkout.get_cart", "GET", "/api/cart", token=token)
+    await ctx.call("checkout.create_order", "POST", "/api/orders", token=token, json={
+        "shipping_name": "Bench Buyer",
+        "shipping_address": "Bench Street",
+        "shipping_city": rng.choice(m["cities"]),
+        "shipping_zip": "12345",
+        "shipping_phone": "+966500000000",
+    })
+
+
+async def scenario_seller(ctx):
+    token = await ctx.login(ctx.rng.choice(ctx.manifest["sellers"]))
+    if token is None:
+        return
+    await ctx.call("seller.dashboard_stats", "GET", "/api/seller/dashboard/stats", token=token)
+    await ctx.call("seller.orders", "GET", "/api/seller/orders", token=token)
+    await ctx.call("seller.products", "GET", "/api/seller/products", token=token)
+
+
+async def scenario_ride(ctx):
+    rng, m = ctx.rng, ctx.manifest
+    rider = await ctx.login(rng.choice(m["buyers"]))
+    captain = await ctx.login(rng.choice(m["captains"]))
+    if rider is None or captain is None:
+        return
+    lat, lng = 24.7 + rng.random() * 0.1, 46.6 + rng.random() * 0.1
+    response = await ctx.call("ride.request", "POST", "/api/rides/request", token=rider, json={
+        "pickup_lat": lat, "pickup_lng": lng, "pickup_address": "Bench pickup",
+        "dropoff_lat": lat + 0.05, "dropoff_lng": lng + 0.05, "dropoff_address": "Bench dropoff",
+        "ride_type": rng.choice(["economy", "comfort", "premium", "xl"]),
+    })
+    await ctx.call("ride.captain_available", "GET", "/api/rides/captain/available", token=captain)
+    if response is not None and response.status_code == 200:
+        ride_id = response.json()["ride"]["id"]
+        await ctx.call("ride.accept", "POST", f"/api/rides/captain/{ride_id}/accept", token=captain)
+
+
+async def scenario_hotel(ctx):
+    rng, m = ctx.rng, ctx.manifest
+    await ctx.call("hotel.search", "GET", "/api/hotels/search", params={
+        "city": rng.choice(m["cities"]),
+        "sort_by": rng.choice(["recommended", "price_low", "rating"]),
+    })
+
+
+SCENARIOS = {
+    "browse": scenario_browse,
+    "checkout": scenario_checkout,
+    "seller": scenario_seller,
+    "ride": scenario_ride,
+    "hotel": scenario_hotel,
+}
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}', choose from {', '.join(SCENARIOS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+# ==================== RUNNER ====================
+
+async def virtual_user(ctx, weights, deadline, iterations):
+    names, values = list(weights), list(weights.values())
+    while time.perf_counter() < deadline:
+        scenario = ctx.rng.choices(names, values)[0]
+        await SCENARIOS[scenario](ctx)
+        iterations[scenario] = iterations.get(scenario, 0) + 1
+
+
+async def run(base_url, manifest, users, duration, weights, seed, warmup):
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        contexts = [Context(client, recorder, manifest, random.Random(seed + i)) for i in range(users)]
+
+        if warmup:
+            warm_deadline = time.perf_counter() + warmup
+            await asyncio.gather(*(virtual_user(ctx, weights, warm_deadline, {}) for ctx in contexts))
+            recorder.__init__()
+
+        iterations = {}
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(virtual_user(ctx, weights, deadline, iterations) for ctx in contexts))
+        elapsed = time.perf_counter() - start
+
+    report = summarize(recorder, elapsed)
+    report["iterations"] = iterations
+    report["elapsed_s"] = round(elapsed, 2)
+    return report
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ==================== BASELINE COMPARISON ====================
+
+COMPARED_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def compare(report, baseline, tolerance):
+    """Per-step deltas against the baseline; a step regresses when a latency
+    percentile grows, or throughput drops, by more than `tolerance` (fraction)"""
+    regressions, rows = [], []
+    for step, current in sorted(report["steps"].items()):
+        previous = baseline.get("steps", {}).get(step)
+        if not previous:
+            rows.append((step, "new", "", ""))
+            continue
+        for metric in COMPARED_METRICS + ("rps",):
+            before, after = previous.get(metric, 0), current.get(metric, 0)
+            if not before:
+                continue
+            change = (after - before) / before
+            worse = change < -tolerance if metric == "rps" else change > tolerance
+            rows.append((step, metric, f"{before} -> {after}", f"{change:+.1%}{'  REGRESSION' if worse else ''}"))
+            if worse:
+                regressions.append({"step": step, "metric": metric, "before": before, "after": after,
+                                    "change": round(change, 4)})
+    return regressions, rows
+
+
+def print_report(report):
+    print(f"\n{'step':32} {'count':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for step, s in report["steps"].items():
+        print(f"{step:32} {s['count']:>7} {s['errors']:>5} {s['rps']:>8} {s['p50_ms']:>8} "
+              f"{s['p95_ms']:>8} {s['p99_ms']:>8} {s['max_ms']:>8}")
+    print(f"\nTotal: {report['total_requests']} requests in {report['elapsed_s']}s ({report['rps']} req/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OceanSouq API load test")
+    parser.add_argument("--base-url", default=os.environ.get("BENCH_BASE_URL", "http://localhost:8001"))
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured warm-up seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights, e.g. browse=50,hotel=10")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    parser.add_argument("--baseline", default=None, help="baseline JSON to diff against")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression, fraction")
+    args = parser.parse_args()
+    if args.baseline and not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error(f"baseline {args.baseline} does not exist; record one on this machine by "
+                     f"re-running with --save-baseline, then commit it")
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+
+    weights = parse_mix(args.mix)
+    report = asyncio.run(run(args.base_url, manifest, args.users, args.duration, weights, args.seed, args.warmup))
+    report["meta"] = {
+        "git": git_revision(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "base_url": args.base_url,
+        "users": args.users,
+        "duration_s": args.duration,
+        "mix": weights,
+        "seed_counts": manifest.get("counts"),
+    }
+    print_report(report)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.out}")
+
+    if args.save_baseline:
+        path = args.baseline or DEFAULT_BASELINE
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {path}")
+        return
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions, rows = compare(report, baseline, args.tolerance)
+        print(f"\nCompared with baseline {baseline.get('meta', {}).get('git')}:")
+        for row in rows:
+            print(f"  {row[0]:32} {row[1]:8} {row[2]:>24} {row[3]}")
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\n✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
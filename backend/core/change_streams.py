@@ -0,0 +1,216 @@
+"""
+Change-stream consumers for derived state (caches, indexes, rollups).
+
+A consumer sees every write to a collection, whichever router made it:
+
+    @change_feed.consumer("category_stats", "products", resync=rebuild_stats)
+    def on_products(db, changes): ...
+
+Handlers receive batches of up to `batch_size` changes, delivered once the
+batch is full or `max_wait` seconds after its first change:
+
+    {"op": "insert" | "update" | "replace" | "delete",
+     "key": document _id, "doc": full document (None for deletes),
+     "ts": position of the change, the same string in every process}
+
+On a replica set each consumer tails `collection.watch()` with
+updateLookup. Checkpointed consumers store the stream's resume token in
+`change_checkpoints` after each delivered batch and resume from it after a
+restart; a handler error reopens the stream from the last checkpoint, so
+delivery is at-least-once. Consumers of process-local state pass
+checkpoint=False and start from "now" (their state is rebuilt at startup).
+With several workers a checkpointed consumer runs in one process at a time
+(the holder of its `changes:<name>` lease, see core.shared_state); the
+others wait and take over from the checkpoint if it goes away. Consumers of
+process-local state run everywhere.
+`resync(db)` runs when there is no usable checkpoint (first start, or the
+oplog no longer covers it) after the stream is open, so nothing written in
+between is missed. `on_start(db)` runs every time a consumer (re)starts
+reading, including when this process takes over the lease, so handlers
+keeping in-process state can drop anything that may have gone stale.
+
+On a standalone server (local development) the same consumers run on a
+polling tailer over `poll_field` (updated_at), checkpointing the last
+(updated_at, _id) seen. It only sees writes that bump updated_at and it
+cannot see deletes, so every product write (storefront, seller and admin
+routes, pricing runs, checkout stock decrements) sets `updated_at` as an
+ISO string; a write that skips it is invisible to consumers in poll mode.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+from core.database import is_replica_set
+from core.shared_state import Leader
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_WAIT = 0.5
+POLL_INTERVAL = 2.0
+RETRY_BACKOFF = (1, 2, 5, 10, 30)
+OPERATIONS = ("insert", "update", "replace", "delete")
+# Resume point no longer in the oplog / unusable token
+RESUME_LOST_CODES = {260, 280, 286}
+
+
+class Consumer:
+    def __init__(self, name, collection, handler, operations=OPERATIONS, batch_size=BATCH_SIZE,
+                 max_wait=MAX_WAIT, checkpoint=True, resync=None, on_start=None, poll_field="updated_at"):
+        self.name = name
+        self.collection = collection
+        self.handler = handler
+        self.operations = tuple(operations)
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.checkpoint = checkpoint
+        self.resync = resync
+        self.on_start = on_start
+        self.poll_field = poll_field
+        self.leader = Leader(f"changes:{name}") if checkpoint else None
+
+    def leading(self):
+        return self.leader is None or self.leader.held()
+
+    def pipeline(self):
+        return [{"$match": {"operationType": {"$in": list(self.operations)}}}]
+
+
+def _change(event):
+    cluster_time = event.get("clusterTime")
+    return {"op": event["operationType"], "key": event["documentKey"]["_id"], "doc": event.get("fullDocument"),
+            "ts": f"{cluster_time.time}.{cluster_time.inc}" if cluster_time else None}
+
+
+class ChangeFeed:
+    def __init__(self):
+        self.consumers = {}
+        self.db = None
+        self.mode = None
+        self.stats = {}             # name -> {"batches", "changes", "errors", "last_batch_at"}
+        self._threads = {}
+
+    def consumer(self, name, collection, **options):
+        """Register fn(db, changes) as a consumer of `collection`"""
+        def register(fn):
+            self.consumers[name] = Consumer(name, collection, fn, **options)
+            return fn
+        return register
+
+    def start(self, db):
+        self.db = db
+        self.mode = "stream" if is_replica_set(db.client) else "poll"
+        for name, consumer in self.consumers.items():
+            if name in self._threads:
+                continue
+            self.stats[name] = {"batches": 0, "changes": 0, "errors": 0, "last_batch_at": None}
+            target = self._run_stream if self.mode == "stream" else self._run_poll
+            thread = threading.Thread(target=self._supervise, args=(target, consumer),
+                                      name=f"changes-{name}", daemon=True)
+            self._threads[name] = thread
+            thread.start()
+
+    # ---------- checkpoints ----------
+
+    def _load(self, consumer):
+        if not consumer.checkpoint:
+            return None
+        doc = self.db.change_checkpoints.find_one({"_id": consumer.name})
+        return doc and doc.get(self.mode)
+
+    def _save(self, consumer, position):
+        if consumer.checkpoint:
+            self.db.change_checkpoints.update_one(
+                {"_id": consumer.name},
+                {"$set": {self.mode: position, "updated_at": datetime.utcnow()}}, upsert=True)
+
+    def _clear(self, consumer):
+        self.db.change_checkpoints.update_one({"_id": consumer.name}, {"$unset": {self.mode: ""}})
+
+    # ---------- delivery ----------
+
+    def _deliver(self, consumer, changes):
+        consumer.handler(self.db, changes)
+        stats = self.stats[consumer.name]
+        stats["batches"] += 1
+        stats["changes"] += len(changes)
+        stats["last_batch_at"] = datetime.utcnow().isoformat()
+
+    def _supervise(self, target, consumer):
+        failures = 0
+        while True:
+            try:
+                if consumer.leader is not None:
+                    consumer.leader.wait()
+                if consumer.on_start:
+                    consumer.on_start(self.db)
+                target(consumer)
+                failures = 0
+            except Exception:
+                self.stats[consumer.name]["errors"] += 1
+                delay = RETRY_BACKOFF[min(failures, len(RETRY_BACKOFF) - 1)]
+                failures += 1
+                logger.exception("Change consumer %s failed; restarting from checkpoint in %ss",
+                                 consumer.name, delay)
+                time.sleep(delay)
+
+    def _run_stream(self, consumer):
+        collection = self.db[consumer.collection]
+        token = self._load(consumer)
+        options = {"full_document": "updateLookup", "max_await_time_ms": int(consumer.max_wait * 1000)}
+        try:
+            stream = collection.watch(consumer.pipeline(), resume_after=token, **options)
+        except OperationFailure as e:
+            if token is None or e.code not in RESUME_LOST_CODES:
+                raise
+            logger.warning("Change consumer %s: checkpoint no longer resumable, resyncing", consumer.name)
+            self._clear(consumer)
+            token = None
+            stream = collection.watch(consumer.pipeline(), **options)
+
+        with stream:
+            if token is None and consumer.resync:
+                consumer.resync(self.db)
+            batch, deadline = [], None
+            while stream.alive and consumer.leading():
+                event = stream.try_next()
+                if event is not None:
+                    batch.append(_change(event))
+                    deadline = deadline or time.monotonic() + consumer.max_wait
+                if batch and (len(batch) >= consumer.batch_size or time.monotonic() >= deadline):
+                    self._deliver(consumer, batch)
+                    self._save(consumer, stream.resume_token)
+                    batch, deadline = [], None
+
+    def _run_poll(self, consumer):
+        collection = self.db[consumer.collection]
+        field = consumer.poll_field
+        collection.create_index([(field, ASCENDING), ("_id", ASCENDING)])
+        position = self._load(consumer)
+        if position is None:
+            # Start from the newest document, then rebuild from scratch
+            newest = collection.find_one({field: {"$exists": True}}, {field: 1}, sort=[(field, -1), ("_id", -1)])
+            position = {"value": newest[field], "id": newest["_id"]} if newest else None
+            if consumer.resync:
+                consumer.resync(self.db)
+        while consumer.leading():
+            query = {field: {"$exists": True}}
+            if position is not None:
+                query = {"$or": [{field: {"$gt": position["value"]}},
+                                 {field: position["value"], "_id": {"$gt": position["id"]}}]}
+            docs = list(collection.find(query).sort([(field, ASCENDING), ("_id", ASCENDING)])
+                        .limit(consumer.batch_size))
+            if docs:
+                self._deliver(consumer, [{"op": "update", "key": d["_id"], "doc": d, "ts": f"{d[field]}/{d['_id']}"}
+                                         for d in docs])
+                position = {"value": docs[-1][field], "id": docs[-1]["_id"]}
+                self._save(consumer, position)
+            if len(docs) < consumer.batch_size:
+                time.sleep(POLL_INTERVAL)
+
+
+change_feed = ChangeFeed()
@@ -0,0 +1,171 @@
+"""
+Negotiated response compression (brotli, gzip).
+
+Pure ASGI middleware. The encoding is picked from Accept-Encoding (brotli
+preferred when the `brotli` package is installed and the client accepts
+it, then gzip). Bodies under `minimum_size` and already-encoded or
+incompressible content types pass through untouched.
+
+Single-message bodies are compressed in one go; streaming responses are
+compressed chunk by chunk with a sync flush after each, so clients still
+receive data as it is produced. A strong ETag becomes weak on the
+compressed representation (If-None-Match compares weakly, so 304s keep
+working), and compressed bodies of ETagged responses are memoised, so
+precompiled payloads are compressed once per encoding, not per request.
+"""
+import threading
+import zlib
+from collections import OrderedDict
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MINIMUM_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4          # near gzip-6 speed, noticeably smaller output
+MEMO_SIZE = 512
+SKIP_TYPES = ("image/", "video/", "audio/", "font/woff", "application/zip", "application/gzip",
+              "application/octet-stream", "text/event-stream")
+
+
+def negotiate(accept_encoding):
+    """'br', 'gzip' or None for an Accept-Encoding header value"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    wildcard = accepted.get("*", 0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+class _Encoder:
+    def __init__(self, encoding, gzip_level, brotli_quality):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+            self.compress, self._flush, self._finish = (
+                self._compressor.process, self._compressor.flush, self._compressor.finish)
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self.compress = self._compressor.compress
+            self._flush = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._compressor.flush
+
+    def chunk(self, data):
+        return self.compress(data) + self._flush()
+
+    def finish(self, data=b""):
+        return self.compress(data) + self._finish()
+
+
+class _Memo:
+    def __init__(self, size):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=MINIMUM_SIZE, gzip_level=GZIP_LEVEL, brotli_quality=BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.memo = _Memo(MEMO_SIZE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder = None          # set once we are streaming compressed output
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = Headers(raw=message.get("headers", []))
+                content_type = headers.get("content-type", "")
+                passthrough = (message["status"] < 200 or message["status"] in (204, 304)
+                               or "content-encoding" in headers
+                               or content_type.startswith(SKIP_TYPES))
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if encoder is None:
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                if not more:
+                    # Whole body in one message
+                    if len(body) < self.minimum_size:
+                        await send(start)
+                        await send(message)
+                        return
+                    etag = headers.get("etag")
+                    key = (etag, encoding) if etag and not etag.startswith("W/") else None
+                    compressed = self.memo.get(key) if key else None
+                    if compressed is None:
+                        compressed = _Encoder(encoding, self.gzip_level, self.brotli_quality).finish(body)
+                        if key:
+                            self.memo.put(key, compressed)
+                    self._encoded_headers(headers, encoding, len(compressed))
+                    await send({**start, "headers": headers.raw})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                encoder = _Encoder(encoding, self.gzip_level, self.brotli_quality)
+                self._encoded_headers(headers, encoding, None)
+                await send({**start, "headers": headers.raw})
+            data = encoder.chunk(body) if more else encoder.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _encoded_headers(headers, encoding, length):
+        headers["content-encoding"] = encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["etag"] = f"W/{etag}"
+        if length is None:
+            del headers["content-length"]
+        else:
+            headers["content-length"] = str(length)
@@ -0,0 +1,188 @@
+"""
+Central MongoDB connection factory.
+
+Every process (API workers, seed and batch scripts) builds its client here so
+pool sizing, timeouts, wire compression and command/pool monitoring are
+configured in one place. Environment:
+
+    MONGO_URL                      connection string
+    DB_NAME                        database name (oceansouq)
+    WEB_CONCURRENCY                API worker processes on this host
+    MONGO_CONNECTION_BUDGET        connections this host may open in total (400)
+    MONGO_MAX_POOL_SIZE            per-process override of the derived pool size
+    MONGO_MIN_POOL_SIZE            warm connections kept per process (0)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS    max wait for a pooled connection (2000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS  (5000)
+    MONGO_CONNECT_TIMEOUT_MS       (5000)
+    MONGO_SOCKET_TIMEOUT_MS        (30000)
+    MONGO_COMPRESSORS              preference order (zstd,snappy,zlib)
+    MONGO_ANALYTICS_MAX_STALENESS_S  staleness bound for secondary reads (0 = none)
+"""
+import importlib.util
+import os
+import threading
+import time
+
+from pymongo import MongoClient, monitoring
+from pymongo.read_preferences import SecondaryPreferred
+
+from core.metrics import MongoCommandListener, registry
+from core.query_debug import query_debugger
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
+DB_NAME = os.environ.get('DB_NAME', 'oceansouq')
+
+# Minimum pool per process: the default anyio threadpool runs 40 sync
+# endpoints concurrently, each of which holds a connection while querying.
+MIN_WORKER_POOL = 40
+
+# Compressor name -> module that must be importable for pymongo to use it
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def worker_count():
+    """API worker processes sharing this host's connection budget"""
+    return max(_env_int("WEB_CONCURRENCY", 1), 1)
+
+
+def pool_size(workers=None):
+    """Per-process maxPoolSize derived from the host budget and worker count"""
+    override = _env_int("MONGO_MAX_POOL_SIZE", 0)
+    if override:
+        return override
+    budget = _env_int("MONGO_CONNECTION_BUDGET", 400)
+    return max(budget // (workers or worker_count()), MIN_WORKER_POOL)
+
+
+def available_compressors():
+    """Requested compressors whose Python bindings are installed"""
+    requested = os.environ.get("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+    names = [c.strip() for c in requested.split(",") if c.strip()]
+    return [c for c in names if c in _COMPRESSOR_MODULES
+            and importlib.util.find_spec(_COMPRESSOR_MODULES[c]) is not None]
+
+
+class PoolWaitListener(monitoring.ConnectionPoolListener):
+    """
+    Exports how long operations wait to check a connection out of the pool.
+    Check-out start and completion fire on the same thread, so a thread-local
+    start time is enough.
+    """
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics or registry
+        self._local = threading.local()
+
+    def _started(self):
+        self._local.started = time.perf_counter()
+
+    def _elapsed(self):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return time.perf_counter() - started if started is not None else None
+
+    def connection_check_out_started(self, event):
+        self._started()
+
+    def connection_checked_out(self, event):
+        waited = self._elapsed()
+        if waited is not None:
+            self.metrics.observe("mongo_pool_wait_seconds", waited,
+                                 "Time spent waiting for a pooled MongoDB connection")
+
+    def connection_check_out_failed(self, event):
+        waited = self._elapsed()
+        if waited is not None:
+            self.metrics.observe("mongo_pool_wait_seconds", waited,
+                                 "Time spent waiting for a pooled MongoDB connection")
+        self.metrics.inc_counter("mongo_pool_checkout_failures_total", 1,
+                                 "Failed connection check-outs by reason", reason=str(event.reason))
+
+    def connection_created(self, event):
+        self.metrics.inc_counter("mongo_pool_connections_created_total", 1, "Pooled connections opened")
+
+    def connection_closed(self, event):
+        self.metrics.inc_counter("mongo_pool_connections_closed_total", 1, "Pooled connections closed")
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.metrics.inc_counter("mongo_pool_cleared_total", 1, "Pool clears after network errors")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+def client_options(app_name="oceansouq-api", workers=None):
+    """Keyword arguments for MongoClient; split out so they can be inspected"""
+    options = {
+        "appname": app_name,
+        "maxPoolSize": pool_size(workers),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 30000),
+        "retryWrites": True,
+        "retryReads": True,
+    }
+    compressors = available_compressors()
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+        if "zlib" in compressors:
+            options["zlibCompressionLevel"] = 1  # favour CPU over ratio
+    return options
+
+
+def create_client(app_name="oceansouq-api", url=None, monitor=True, **overrides):
+    """
+    Build a configured MongoClient. Call once per process, after any fork:
+    pymongo clients are not fork-safe.
+    """
+    listeners = []
+    if monitor:
+        listeners = [MongoCommandListener(), PoolWaitListener()]
+        if query_debugger.enabled:
+            listeners.append(query_debugger)
+    options = {**client_options(app_name), **overrides}
+    return MongoClient(url or MONGO_URL, event_listeners=listeners, **options)
+
+
+def get_database(client, name=None):
+    """Primary-only handle: checkout, carts and anything that reads its own writes"""
+    return client.get_database(name or DB_NAME)
+
+
+def get_analytics_database(client, name=None):
+    """
+    Same pool, but reads may be served by secondaries (secondaryPreferred).
+    For dashboards and reports that tolerate replication lag; writes made
+    through this handle still go to the primary.
+    """
+    staleness = _env_int("MONGO_ANALYTICS_MAX_STALENESS_S", 0)
+    read_preference = SecondaryPreferred(max_staleness=staleness) if staleness else SecondaryPreferred()
+    return client.get_database(name or DB_NAME, read_preference=read_preference)
+
+
+def is_replica_set(client):
+    """True on replica sets and sharded clusters (transactions, change streams)"""
+    try:
+        hello = client.admin.command("hello")
+    except Exception:
+        return False
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
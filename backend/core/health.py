@@ -0,0 +1,61 @@
+"""
+Liveness and readiness for load balancers and orchestrators.
+
+    /api/health/live    the process is up and serving its event loop
+    /api/health/ready   startup has finished and every registered check passes
+
+A worker is not ready until the app's startup handlers have run and the
+checks (MongoDB ping, shared-state threads, ...) succeed, and stops being
+ready as soon as shutdown begins, so traffic drains from a worker before it
+exits. Checks are plain callables returning True or raising; each result is
+cached for CHECK_TTL seconds so a tight probe interval does not turn into a
+ping per probe.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CHECK_TTL = 2.0
+
+
+class Readiness:
+    def __init__(self):
+        self.checks = {}
+        self.started = False
+        self.stopping = False
+        self._cache = {}            # name -> (ok, detail, checked_at)
+        self._lock = threading.Lock()
+
+    def check(self, name):
+        """Register fn() as a readiness check"""
+        def register(fn):
+            self.checks[name] = fn
+            return fn
+        return register
+
+    def _run(self, name, fn):
+        now = time.monotonic()
+        cached = self._cache.get(name)
+        if cached and now - cached[2] < CHECK_TTL:
+            return cached[0], cached[1]
+        try:
+            ok, detail = bool(fn()), None
+        except Exception as e:
+            ok, detail = False, f"{type(e).__name__}: {e}"
+            logger.warning("Readiness check %s failed: %s", name, detail)
+        with self._lock:
+            self._cache[name] = (ok, detail, now)
+        return ok, detail
+
+    def status(self):
+        """(ready, details)"""
+        results = {name: self._run(name, fn) for name, fn in self.checks.items()}
+        details = {name: "ok" if ok else (detail or "failed") for name, (ok, detail) in results.items()}
+        details["startup"] = "stopping" if self.stopping else ("ok" if self.started else "pending")
+        ready = self.started and not self.stopping and all(ok for ok, _ in results.values())
+        return ready, details
+
+
+readiness = Readiness()
@@ -0,0 +1,257 @@
+"""
+Idempotency-Key support for retry-prone POST endpoints.
+
+A client that sends `Idempotency-Key: <uuid>` gets exactly one execution per
+key (scoped to its Authorization header and the route). Retries receive the
+stored response (with `Idempotent-Replayed: true`) without re-running the
+handler; a retry that arrives while the first attempt is still running
+waits for it — in the same process via a shared future, across processes
+by polling the claim document.
+
+Completed responses live in `idempotency_keys` (TTL index on expires_at)
+with a small in-memory LRU in front. 5xx responses and exceptions release
+the claim so the client can retry for real. Reusing a key with a different
+body is rejected with 422.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+
+HEADER = b"idempotency-key"
+REPLAY_HEADER = (b"idempotent-replayed", b"true")
+
+IDEMPOTENT_ROUTES = {
+    ("POST", "/api/orders"),
+    ("POST", "/api/food/orders"),
+    ("POST", "/api/rides/request"),
+    ("POST", "/api/hotels/bookings"),
+}
+
+RESPONSE_TTL = timedelta(hours=24)
+CLAIM_TTL = timedelta(minutes=2)      # a crashed worker's claim frees up after this
+MAX_KEY_LENGTH = 255
+MAX_STORED_BODY = 1 << 20
+CACHE_SIZE = 10000
+POLL_INTERVAL = 0.1
+
+
+class _LRU:
+    def __init__(self, size):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+
+class IdempotencyStore:
+    def __init__(self, collection=None, cache_size=CACHE_SIZE):
+        self.collection = collection
+        self.cache = _LRU(cache_size)
+        self.inflight = {}
+        self._indexed = False
+
+    def configure(self, collection):
+        self.collection = collection
+        self._indexed = False
+
+    def _ensure_index(self):
+        if not self._indexed:
+            self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+
+    def claim(self, key, fingerprint):
+        """True if this caller owns the key; otherwise the existing doc"""
+        self._ensure_index()
+        now = datetime.utcnow()
+        # A stale claim (its worker died) can be taken over
+        self.collection.delete_one({"_id": key, "status": "processing", "expires_at": {"$lt": now}})
+        try:
+            self.collection.insert_one({"_id": key, "status": "processing", "fingerprint": fingerprint,
+                                        "created_at": now, "expires_at": now + CLAIM_TTL})
+            return True, None
+        except DuplicateKeyError:
+            return False, self.collection.find_one({"_id": key})
+
+    def complete(self, key, fingerprint, response):
+        self.cache.put(key, (fingerprint, response), RESPONSE_TTL.total_seconds())
+        self.collection.update_one({"_id": key}, {"$set": {
+            "status": "completed",
+            "response": {"status": response["status"], "headers": response["headers"],
+                         "body": Binary(response["body"])},
+            "expires_at": datetime.utcnow() + RESPONSE_TTL,
+        }})
+
+    def release(self, key):
+        self.collection.delete_one({"_id": key, "status": "processing"})
+
+    def find(self, key):
+        return self.collection.find_one({"_id": key})
+
+
+idempotency_store = IdempotencyStore()
+
+
+def _stored(doc):
+    response = doc["response"]
+    return {"status": response["status"], "headers": response["headers"], "body": bytes(response["body"])}
+
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware; only IDEMPOTENT_ROUTES requests carrying the header are affected"""
+
+    def __init__(self, app, store=None, routes=IDEMPOTENT_ROUTES):
+        self.app = app
+        self.store = store or idempotency_store
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or (scope["method"], scope["path"]) not in self.routes
+                or self.store.collection is None):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        raw_key = headers.get(HEADER)
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not raw_key or len(raw_key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, {"detail": "Invalid Idempotency-Key header"})
+            return
+
+        body = await _read_body(receive)
+        principal = hashlib.sha256(headers.get(b"authorization", b"")).hexdigest()[:16]
+        key = f"{principal}:{scope['method']}:{scope['path']}:{raw_key.decode('latin-1')}"
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        cached = self.store.cache.get(key)
+        if cached is not None:
+            await self._replay(send, fingerprint, *cached)
+            return
+
+        # Futures are loop-bound, so in-process coalescing is per event loop
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        pending = self.store.inflight.get(slot)
+        if pending is not None:
+            stored_fingerprint, response = await asyncio.shield(pending)
+            await self._replay(send, fingerprint, stored_fingerprint, response)
+            return
+
+        future = loop.create_future()
+        self.store.inflight[slot] = future
+        owner = False
+        try:
+            owner, doc = await run_in_threadpool(self.store.claim, key, fingerprint)
+            if not owner:
+                doc = await self._wait_for_other(key, doc)
+                if doc is None:
+                    await _send_json(send, 409, {"detail": "A request with this Idempotency-Key is in progress"})
+                    future.set_result((fingerprint, None))
+                    return
+                result = (doc["fingerprint"], _stored(doc))
+                future.set_result(result)
+                await self._replay(send, fingerprint, *result)
+                return
+
+            response = await self._execute(scope, body, send)
+            if response is not None and response["status"] < 500 and len(response["body"]) <= MAX_STORED_BODY:
+                await run_in_threadpool(self.store.complete, key, fingerprint, response)
+            else:
+                await run_in_threadpool(self.store.release, key)
+            future.set_result((fingerprint, response))
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                future.exception()  # retrieved even when nobody is waiting
+            if owner:
+                await run_in_threadpool(self.store.release, key)
+            raise
+        finally:
+            self.store.inflight.pop(slot, None)
+
+    async def _wait_for_other(self, key, doc):
+        """Poll a claim held by another worker until it completes or lapses"""
+        deadline = time.monotonic() + CLAIM_TTL.total_seconds()
+        while doc is not None and doc.get("status") == "processing" and time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            doc = await run_in_threadpool(self.store.find, key)
+        if doc is None or doc.get("status") != "completed":
+            return None
+        return doc
+
+    async def _execute(self, scope, body, send):
+        """Run the app with the buffered body, streaming its response while capturing it"""
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                return {"type": "http.disconnect"}
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        captured = {"status": 500, "headers": [], "body": bytearray()}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = [[k.decode("latin-1"), v.decode("latin-1")] for k, v in message.get("headers", [])]
+            elif message["type"] == "http.response.body":
+                captured["body"] += message.get("body", b"")
+            await send(message)
+
+        await self.app(scope, receive, capture)
+        captured["body"] = bytes(captured["body"])
+        return captured
+
+    async def _replay(self, send, fingerprint, stored_fingerprint, response):
+        if response is None:
+            await _send_json(send, 409, {"detail": "A request with this Idempotency-Key is in progress"})
+            return
+        if stored_fingerprint != fingerprint:
+            await _send_json(send, 422, {"detail": "Idempotency-Key was already used with a different request body"})
+            return
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in response["headers"]]
+        await send({"type": "http.response.start", "status": response["status"], "headers": headers + [REPLAY_HEADER]})
+        await send({"type": "http.response.body", "body": response["body"]})
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
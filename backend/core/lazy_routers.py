@@ -0,0 +1,176 @@
+"""
+Lazily mounted routers.
+
+Each route module builds its literal catalogues and response payloads at
+import time, and importing all of them dominates cold start. server.py
+registers them here instead of importing them:
+
+    lazy_routers.register("rides", "routes.rides", "/api/rides")
+    lazy_routers.register("reports", "routes.reports", "/api/reports", database="analytics")
+    lazy_routers.configure(app, {"primary": db, "analytics": analytics_db})
+
+`LazyRouterMiddleware` looks up the first two path segments of each request
+(/api/rides/...) and, the first time a registered prefix is hit, imports the
+module in the threadpool, calls its set_db() and includes its router; later
+requests cost one dict lookup. /openapi.json and /docs mount every enabled
+router first so the schema is complete.
+
+Per deployment:
+
+    OCEAN_ROUTERS            routers or profiles this process serves (default: all);
+                             e.g. OCEAN_ROUTERS=rides-only on a rides pod.
+                             Requests for the others get 404 without importing them.
+    OCEAN_PRELOAD_ROUTERS    "all" or a list to mount at startup instead of on first
+                             request; "background" mounts every enabled router on a
+                             thread once the worker is up.
+"""
+import logging
+import os
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+DOC_PATHS = ("/openapi.json", "/docs", "/redoc")
+
+
+class RouterSpec:
+    __slots__ = ("name", "module", "prefix", "database", "include_options", "mounted", "load_ms")
+
+    def __init__(self, name, module, prefix, database, include_options):
+        self.name = name
+        self.module = module
+        self.prefix = prefix
+        self.database = database
+        self.include_options = include_options
+        self.mounted = False
+        self.load_ms = None
+
+
+def _split(value):
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+def path_prefix(path):
+    """'/api/rides/request' -> '/api/rides'"""
+    return "/".join(path.split("/", 3)[:3])
+
+
+class LazyRouters:
+    def __init__(self):
+        self.specs = {}
+        self.profiles = {}
+        self.enabled = set()
+        self.app = None
+        self.databases = {}
+        self._by_prefix = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, module, prefix, database="primary", **include_options):
+        """
+        `prefix` is the router's mount point, /api/<segment>; a router declared
+        without a prefix is included under it. `database` is what set_db()
+        receives: "primary", "analytics" or "both" (primary, analytics).
+        Extra keyword arguments go to include_router.
+        """
+        if path_prefix(prefix) != prefix:
+            raise ValueError(f"Router prefix must be /api/<segment>: {prefix}")
+        self.specs[name] = RouterSpec(name, module, prefix, database, include_options)
+
+    def profile(self, name, routers):
+        """Named set of routers for OCEAN_ROUTERS, e.g. a rides-only deployment"""
+        self.profiles[name] = list(routers)
+
+    def resolve(self, selection):
+        names = set()
+        for item in selection:
+            if item == "all":
+                names.update(self.specs)
+            elif item in self.profiles:
+                names.update(self.profiles[item])
+            elif item in self.specs:
+                names.add(item)
+            else:
+                raise ValueError(f"Unknown router or profile in OCEAN_ROUTERS: {item}")
+        return names
+
+    def configure(self, app, databases, enabled=None, preload=None):
+        self.app = app
+        self.databases = databases
+        self.enabled = self.resolve(enabled if enabled is not None else _split(os.environ.get("OCEAN_ROUTERS")) or ["all"])
+        self._by_prefix = {spec.prefix: spec for spec in self.specs.values() if spec.name in self.enabled}
+        preload = preload if preload is not None else _split(os.environ.get("OCEAN_PRELOAD_ROUTERS"))
+        if preload == ["background"]:
+            threading.Thread(target=self.mount_all, name="router-preload", daemon=True).start()
+        elif preload:
+            for name in self.resolve(preload) & self.enabled:
+                self.mount(name)
+
+    def _set_db_args(self, spec):
+        if spec.database == "both":
+            return self.databases["primary"], self.databases["analytics"]
+        return (self.databases[spec.database],)
+
+    def mount(self, name):
+        spec = self.specs[name]
+        with self._lock:
+            if spec.mounted:
+                return
+            started = time.perf_counter()
+            # __import__ rather than importlib.import_module so -X importtime profiles include it
+            module = __import__(spec.module, fromlist=["router"])
+            if hasattr(module, "set_db"):
+                module.set_db(*self._set_db_args(spec))
+            options = dict(spec.include_options)
+            if not module.router.prefix:
+                options["prefix"] = spec.prefix
+            elif module.router.prefix != spec.prefix:
+                raise RuntimeError(f"{spec.module} is mounted at {module.router.prefix}, registered as {spec.prefix}")
+            self.app.include_router(module.router, **options)
+            self.app.openapi_schema = None
+            spec.load_ms = round((time.perf_counter() - started) * 1000, 1)
+            spec.mounted = True
+        logger.info("Mounted router %s (%s) in %.1f ms", name, spec.module, spec.load_ms)
+
+    def mount_all(self):
+        for name in sorted(self.enabled):
+            self.mount(name)
+
+    def pending(self, path):
+        """Spec to mount before `path` can be routed, or None"""
+        spec = self._by_prefix.get(path_prefix(path))
+        return spec if spec is not None and not spec.mounted else None
+
+    def has_pending(self):
+        return any(not spec.mounted for spec in self._by_prefix.values())
+
+    def summary(self):
+        return {
+            "enabled": sorted(self.enabled),
+            "mounted": {s.name: s.load_ms for s in self.specs.values() if s.mounted},
+            "pending": sorted(s.name for s in self.specs.values() if s.name in self.enabled and not s.mounted),
+            "disabled": sorted(set(self.specs) - self.enabled),
+        }
+
+
+lazy_routers = LazyRouters()
+
+
+class LazyRouterMiddleware:
+    """Pure ASGI: mounts a request's router before FastAPI routes it"""
+
+    def __init__(self, app, routers=None):
+        self.app = app
+        self.routers = routers or lazy_routers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            path = scope["path"]
+            spec = self.routers.pending(path)
+            if spec is not None:
+                await run_in_threadpool(self.routers.mount, spec.name)
+            elif path in DOC_PATHS and self.routers.has_pending():
+                await run_in_threadpool(self.routers.mount_all)
+        await self.app(scope, receive, send)
@@ -0,0 +1,275 @@
+"""
+Request instrumentation for the OceanSouq API.
+
+Records per-route latency histograms, in-flight gauges, status counters and
+MongoDB command time attributed to the request that issued it. Everything is
+rendered in Prometheus text format by /api/metrics.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+# Log-spaced latency buckets: 0.5ms, 1ms, 2ms ... ~16s
+LATENCY_BUCKETS = tuple(round(0.0005 * 2 ** i, 6) for i in range(16))
+# Mongo commands issued by a single request
+QUERY_COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    """Fixed-bucket histogram with Prometheus `le` semantics"""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    """Per-request accumulator, reachable from any thread via `current_request`"""
+    __slots__ = ("method", "path", "scope", "route", "started", "db_time", "db_queries", "commands")
+
+    def __init__(self, scope):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.scope = scope
+        self.route = UNMATCHED_ROUTE
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.commands = None  # fingerprint -> count, filled by the query debugger
+
+    def resolve_route(self):
+        """Route template once FastAPI has matched it, e.g. /api/products/{product_id}"""
+        route = self.scope.get("route")
+        if route is not None:
+            self.route = getattr(route, "path", UNMATCHED_ROUTE)
+        return self.route
+
+
+_current_request: ContextVar = ContextVar("ocean_current_request", default=None)
+
+
+def current_request():
+    """Stats of the request being served in this context, or None"""
+    return _current_request.get()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+class MetricsRegistry:
+    """Process-local metric store. All mutation happens under one lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}          # (method, route) -> Histogram
+            self.db_time = {}          # (method, route) -> Histogram
+            self.db_queries = {}       # (method, route) -> Histogram
+            self.status_counts = {}    # (method, route, status) -> int
+            self.in_flight = {}        # method -> int
+            self.command_latency = {}  # command name -> Histogram
+            self.gauges = {}           # (name, labels tuple) -> (help, value)
+            self.counters = {}         # (name, labels tuple) -> (help, value)
+            self.histograms = {}       # (name, labels tuple) -> (help, Histogram)
+
+    # ---- HTTP ----
+
+    def request_started(self, method):
+        with self._lock:
+            self.in_flight[method] = self.in_flight.get(method, 0) + 1
+
+    def request_finished(self, stats, status, duration):
+        key = (stats.method, stats.route)
+        with self._lock:
+            self.in_flight[stats.method] -= 1
+
+            hist = self.latency.get(key)
+            if hist is None:
+                hist = self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.db_time[key] = Histogram(LATENCY_BUCKETS)
+                self.db_queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+            hist.observe(duration)
+            self.db_time[key].observe(stats.db_time)
+            self.db_queries[key].observe(stats.db_queries)
+
+            status_key = (stats.method, stats.route, status)
+            self.status_counts[status_key] = self.status_counts.get(status_key, 0) + 1
+
+    # ---- MongoDB ----
+
+    def command_finished(self, command_name, duration):
+        stats = _current_request.get()
+        if stats is not None:
+            # Only this request's context touches its stats object
+            stats.db_time += duration
+            stats.db_queries += 1
+        with self._lock:
+            hist = self.command_latency.get(command_name)
+            if hist is None:
+                hist = self.command_latency[command_name] = Histogram(LATENCY_BUCKETS)
+            hist.observe(duration)
+
+    # ---- Generic metrics for other subsystems ----
+
+    def set_gauge(self, name, value, help_text="", **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = (help_text, value)
+
+    def inc_counter(self, name, amount=1, help_text="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            current = self.counters.get(key)
+            self.counters[key] = (help_text, (current[1] if current else 0) + amount)
+
+    def observe(self, name, value, help_text="", buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            entry = self.histograms.get(key)
+            if entry is None:
+                entry = self.histograms[key] = (help_text, Histogram(buckets))
+            entry[1].observe(value)
+
+    # ---- Rendering ----
+
+    def _render_histogram(self, lines, name, help_text, series):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, hist in series:
+            cumulative = 0
+            for bound, count in zip(hist.bounds, hist.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(**labels, le=_format_bound(bound))} {cumulative}")
+            cumulative += hist.counts[-1]
+            lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {cumulative}")
+            lines.append(f"{name}_sum{_labels(**labels)} {hist.sum:.6f}")
+            lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+
+    def render(self):
+        """Render every metric in Prometheus text exposition format (0.0.4)"""
+        lines = []
+        with self._lock:
+            def by_route(store):
+                return [({"method": m, "route": r}, h) for (m, r), h in sorted(store.items())]
+
+            self._render_histogram(
+                lines, "http_request_duration_seconds",
+                "HTTP request latency by route", by_route(self.latency))
+            self._render_histogram(
+                lines, "http_request_db_seconds",
+                "MongoDB time spent per request by route", by_route(self.db_time))
+            self._render_histogram(
+                lines, "http_request_db_queries",
+                "MongoDB commands issued per request by route", by_route(self.db_queries))
+
+            lines.append("# HELP http_requests_total HTTP responses by route and status")
+            lines.append("# TYPE http_requests_total counter")
+            for (method, route, status), count in sorted(self.status_counts.items()):
+                lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+            lines.append("# HELP http_requests_in_flight Requests currently being served")
+            lines.append("# TYPE http_requests_in_flight gauge")
+            for method, count in sorted(self.in_flight.items()):
+                lines.append(f"http_requests_in_flight{_labels(method=method)} {count}")
+
+            self._render_histogram(
+                lines, "mongo_command_duration_seconds",
+                "MongoDB command latency by command name",
+                [({"command": name}, h) for name, h in sorted(self.command_latency.items())])
+
+            for kind, store in (("gauge", self.gauges), ("counter", self.counters)):
+                seen = set()
+                for (name, labels), (help_text, value) in sorted(store.items()):
+                    if name not in seen:
+                        seen.add(name)
+                        lines.append(f"# HELP {name} {help_text}")
+                        lines.append(f"# TYPE {name} {kind}")
+                    lines.append(f"{name}{_labels(**dict(labels))} {value}")
+
+            grouped = {}
+            for (name, labels), (help_text, hist) in sorted(self.histograms.items()):
+                grouped.setdefault(name, (help_text, []))[1].append((dict(labels), hist))
+            for name, (help_text, series) in grouped.items():
+                self._render_histogram(lines, name, help_text, series)
+        lines.append("")
+        return "\n".join(lines)
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware overhead). The matched route
+    template is read back from the scope after FastAPI's router has set it,
+    so `/api/products/{product_id}` is one series, not one per product.
+    """
+
+    def __init__(self, app, metrics=None):
+        self.app = app
+        self.metrics = metrics or registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current_request.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self.metrics.request_started(stats.method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stats.resolve_route()
+            self.metrics.request_finished(stats, status_code, time.perf_counter() - stats.started)
+            _current_request.reset(token)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Attributes each MongoDB command's server round-trip to the current request"""
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics or registry
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.metrics.command_finished(event.command_name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        self.metrics.command_finished(event.command_name, event.duration_micros / 1e6)
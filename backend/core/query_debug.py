@@ -0,0 +1,211 @@
+"""
+Development-mode MongoDB query debugger.
+
+Fingerprints every command issued during a request by its shape (command,
+collection and filter keys with values stripped), then warns with a stack
+trace when a request repeats the same shape more than REPEAT_THRESHOLD times
+(an N+1 loop) or when a single command exceeds SLOW_MS. Worst offenders are
+summarised for /api/debug/queries.
+
+Enable with OCEAN_QUERY_DEBUG=1. Capturing stacks is expensive; never turn
+this on in production.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+from collections import deque
+
+from pymongo import monitoring
+
+from core.metrics import current_request
+
+logger = logging.getLogger("ocean.query_debug")
+
+QUERY_DEBUG_ENABLED = os.environ.get("OCEAN_QUERY_DEBUG", "0").lower() in ("1", "true", "yes")
+REPEAT_THRESHOLD = int(os.environ.get("OCEAN_QUERY_DEBUG_REPEAT", "5"))
+SLOW_MS = float(os.environ.get("OCEAN_QUERY_DEBUG_SLOW_MS", "100"))
+
+STACK_DEPTH = 8
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def _shape(value):
+    """Replace every literal with '?' keeping keys and operators"""
+    if isinstance(value, dict):
+        return {k: _shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(v, (dict, list, tuple)) for v in value):
+            return [_shape(v) for v in value]
+        # $in / $nin lists of any length share one shape
+        return ["?"] if value else []
+    return "?"
+
+
+def fingerprint(command_name, command):
+    """Stable shape key for a command, e.g. `find hotel_rooms {"hotel_id": "?"}`"""
+    collection = command.get(command_name)
+    if not isinstance(collection, str):
+        collection = command.get("collection", "?")  # getMore, killCursors
+
+    if command_name == "find":
+        body = command.get("filter", {})
+    elif command_name in ("count", "distinct", "findAndModify"):
+        body = command.get("query", {})
+    elif command_name == "update":
+        body = [u.get("q", {}) for u in command.get("updates", [])[:1]]
+    elif command_name == "delete":
+        body = [d.get("q", {}) for d in command.get("deletes", [])[:1]]
+    elif command_name == "aggregate":
+        body = command.get("pipeline", [])
+    else:
+        body = None
+
+    if body is None:
+        return f"{command_name} {collection}"
+    return f"{command_name} {collection} {json.dumps(_shape(body), sort_keys=True, default=str)}"
+
+
+def _capture_stack():
+    """Application frames only: drop pymongo, the stdlib and this module"""
+    frames = [
+        f for f in traceback.extract_stack()
+        if "site-packages" not in f.filename
+        and "/lib/python" not in f.filename
+        and os.path.abspath(f.filename) != _THIS_FILE
+    ]
+    return traceback.format_list(frames[-STACK_DEPTH:])
+
+
+class Offender:
+    __slots__ = ("route", "fingerprint", "count", "requests", "total_time", "max_time",
+                 "max_per_request", "n_plus_one_requests", "sample_stack")
+
+    def __init__(self, route, fp):
+        self.route = route
+        self.fingerprint = fp
+        self.count = 0
+        self.requests = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.max_per_request = 0
+        self.n_plus_one_requests = 0
+        self.sample_stack = None
+
+    def to_dict(self):
+        return {
+            "route": self.route,
+            "fingerprint": self.fingerprint,
+            "count": self.count,
+            "requests": self.requests,
+            "total_ms": round(self.total_time * 1000, 3),
+            "max_ms": round(self.max_time * 1000, 3),
+            "max_per_request": self.max_per_request,
+            "n_plus_one_requests": self.n_plus_one_requests,
+            "sample_stack": self.sample_stack,
+        }
+
+
+class QueryDebugger(monitoring.CommandListener):
+    """CommandListener that tracks query shapes per request"""
+
+    def __init__(self, enabled=QUERY_DEBUG_ENABLED, repeat_threshold=REPEAT_THRESHOLD, slow_ms=SLOW_MS):
+        self.enabled = enabled
+        self.repeat_threshold = repeat_threshold
+        self.slow_seconds = slow_ms / 1000
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.offenders = {}  # (route, fingerprint) -> Offender
+            self.slow_queries = deque(maxlen=100)
+            self.started_at = time.time()
+
+    # ---- CommandListener ----
+
+    def started(self, event):
+        if not self.enabled:
+            return
+        stats = current_request()
+        if stats is None:
+            return
+        fp = fingerprint(event.command_name, event.command)
+        self._pending[(event.connection_id, event.request_id)] = (stats, fp, _capture_stack())
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    # ---- Tracking ----
+
+    def _finished(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        stats, fp, stack = pending
+        duration = event.duration_micros / 1e6
+        route = stats.resolve_route()
+
+        if stats.commands is None:
+            stats.commands = {}
+        per_request = stats.commands.get(fp, 0) + 1
+        stats.commands[fp] = per_request
+
+        with self._lock:
+            offender = self.offenders.get((route, fp))
+            if offender is None:
+                offender = self.offenders[(route, fp)] = Offender(route, fp)
+            offender.count += 1
+            offender.total_time += duration
+            offender.max_time = max(offender.max_time, duration)
+            offender.max_per_request = max(offender.max_per_request, per_request)
+            if per_request == 1:
+                offender.requests += 1
+            if per_request == self.repeat_threshold + 1:
+                offender.n_plus_one_requests += 1
+                offender.sample_stack = stack
+
+            if duration >= self.slow_seconds:
+                self.slow_queries.append({
+                    "route": route,
+                    "path": stats.path,
+                    "fingerprint": fp,
+                    "duration_ms": round(duration * 1000, 3),
+                    "at": time.time(),
+                    "stack": stack,
+                })
+
+        if per_request == self.repeat_threshold + 1:
+            logger.warning(
+                "Possible N+1: %s %s issued `%s` more than %d times\n%s",
+                stats.method, route, fp, self.repeat_threshold, "".join(stack))
+        if duration >= self.slow_seconds:
+            logger.warning(
+                "Slow query (%.1f ms) in %s %s: `%s`\n%s",
+                duration * 1000, stats.method, route, fp, "".join(stack))
+
+    def summary(self, limit=20, sort="total_time"):
+        """Worst offenders, sorted by total_time, count, max_per_request or max_time"""
+        if sort not in ("total_time", "count", "max_per_request", "max_time"):
+            sort = "total_time"
+        with self._lock:
+            offenders = sorted(self.offenders.values(), key=lambda o: getattr(o, sort), reverse=True)
+            return {
+                "config": {
+                    "repeat_threshold": self.repeat_threshold,
+                    "slow_ms": self.slow_seconds * 1000,
+                },
+                "since": self.started_at,
+                "n_plus_one": [o.to_dict() for o in offenders if o.n_plus_one_requests][:limit],
+                "offenders": [o.to_dict() for o in offenders[:limit]],
+                "slow_queries": list(self.slow_queries)[-limit:],
+            }
+
+
+query_debugger = QueryDebugger()
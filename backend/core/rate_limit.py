@@ -0,0 +1,333 @@
+"""
+Per-client and per-route rate limiting.
+
+Each limit is a token bucket of `burst` tokens refilled at `rate` per `per`
+seconds, stored in GCRA form: one float per key (the time the bucket will be
+full again), so a check is a dict lookup, two additions and a compare.
+
+    rate_limiter.limit("POST", "/api/auth/login", Limit(20, per=60, burst=10, key="ip", shared=True))
+    rate_limiter.limit_prefix("/api/ai-engines", Limit(120, per=60, burst=30))    # a whole router
+
+Keys:
+    user    the user_id of a valid bearer token (signature and expiry
+            checked, decoded tokens cached for their lifetime); requests
+            without one, or with a forged or expired one, fall back to the
+            client IP, so random Authorization headers buy no extra buckets
+    ip      scope client address (uvicorn has already applied X-Forwarded-For
+            from the proxies in FORWARDED_ALLOW_IPS, see serve.py)
+    route   one bucket shared by every caller, to cap total load or spend
+
+An exact (method, path) rule takes precedence over its router's prefix
+rule; every limit of the matching rule must have a token. Exhausted
+requests get 429 with Retry-After, before the endpoint (or its lazily
+mounted router) runs.
+
+Stores:
+    MemoryBucketStore   SHARDS dicts, each behind its own lock and bounded
+                        to MAX_KEYS_PER_SHARD (full buckets are swept first).
+                        With several workers an unshared limit is split
+                        between them (rate and burst divided by
+                        WEB_CONCURRENCY), which is close because connections
+                        spread evenly.
+    MongoBucketStore    `rate_limits`, one atomic pipeline update per check,
+                        exact across workers and nodes. Used for shared=True
+                        limits when the shared-state backend is mongo; the
+                        check runs in the threadpool, so keep it to expensive
+                        endpoints (login, LLM chat). A store error lets the
+                        request through.
+
+OCEAN_RATE_LIMITS=off disables limiting (load tests from one address).
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import jwt
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from starlette.concurrency import run_in_threadpool
+
+from core.database import worker_count
+from core.lazy_routers import path_prefix
+from core.metrics import registry
+from core.shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+KEYS = ("user", "ip", "route")
+SHARDS = 64
+MAX_KEYS_PER_SHARD = 20000
+MAX_CACHED_TOKENS = 10000
+
+JWT_SECRET = os.environ.get('JWT_SECRET', 'oceansouq-secret-key-change-in-production')
+JWT_ALGORITHM = "HS256"
+
+
+class Limit:
+    __slots__ = ("rate", "per", "burst", "key", "shared")
+
+    def __init__(self, rate, per=1.0, burst=None, key="user", shared=False):
+        if key not in KEYS:
+            raise ValueError(f"Rate limit key must be one of {KEYS}: {key}")
+        self.rate = rate
+        self.per = per
+        self.burst = burst or rate
+        self.key = key
+        self.shared = shared
+
+    def __repr__(self):
+        return f"{self.rate}/{self.per:g}s burst {self.burst} by {self.key}{' (shared)' if self.shared else ''}"
+
+
+class _Compiled:
+    """A Limit bound to its store, with worker scaling applied"""
+    __slots__ = ("id", "limit", "key", "interval", "tolerance", "store", "header")
+
+    def __init__(self, id, limit, store, workers):
+        rate = limit.rate / workers
+        burst = max(limit.burst / workers, 1)
+        self.id = id
+        self.limit = limit
+        self.key = limit.key
+        self.interval = limit.per / rate
+        self.tolerance = burst * self.interval
+        self.store = store
+        self.header = f"{limit.rate};w={limit.per:g}"
+
+
+class _Shard:
+    __slots__ = ("data", "lock")
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+
+class MemoryBucketStore:
+    shared = False
+
+    def __init__(self, shards=SHARDS, max_keys=MAX_KEYS_PER_SHARD):
+        self._shards = [_Shard() for _ in range(shards)]
+        self._mask = shards - 1
+        self.max_keys = max_keys
+
+    def take(self, key, interval, tolerance, now):
+        """(allowed, retry_after seconds, remaining tokens)"""
+        shard = self._shards[hash(key) & self._mask]
+        with shard.lock:
+            tat = shard.data.get(key, now)
+            if tat < now:
+                tat = now
+            new = tat + interval
+            if new - now > tolerance:
+                return False, new - now - tolerance, 0
+            shard.data[key] = new
+            if len(shard.data) > self.max_keys:
+                self._sweep(shard, now)
+        return True, 0.0, int((tolerance - (new - now)) / interval)
+
+    def _sweep(self, shard, now):
+        full = [k for k, tat in shard.data.items() if tat <= now]
+        for k in full:
+            del shard.data[k]
+        # Still over the bound (many distinct clients): drop the oldest entries
+        excess = len(shard.data) - self.max_keys // 2
+        if excess > 0:
+            for k in list(shard.data)[:excess]:
+                del shard.data[k]
+
+    def __len__(self):
+        return sum(len(shard.data) for shard in self._shards)
+
+
+class MongoBucketStore:
+    shared = True
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def take(self, key, interval, tolerance, now):
+        start = {"$max": [{"$ifNull": ["$tat", now]}, now]}
+        doc = self.collection.find_one_and_update({"_id": key}, [
+            {"$set": {"start": start}},
+            {"$set": {"ok": {"$lte": [{"$subtract": [{"$add": ["$start", interval]}, now]}, tolerance]}}},
+            {"$set": {"tat": {"$cond": ["$ok", {"$add": ["$start", interval]}, "$start"]},
+                      # Bucket is full again by then; the TTL monitor removes it
+                      "expires_at": datetime.utcnow() + timedelta(seconds=tolerance + interval)}},
+            {"$project": {"start": 0}},
+        ], upsert=True, return_document=ReturnDocument.AFTER)
+        if not doc["ok"]:
+            return False, doc["tat"] + interval - now - tolerance, 0
+        return True, 0.0, int((tolerance - (doc["tat"] - now)) / interval)
+
+
+_tokens = {}     # bearer token -> (user identity, expiry); only verified tokens are cached
+
+
+def _user(token, now):
+    cached = _tokens.get(token)
+    if cached is not None:
+        return cached[0] if cached[1] > now else None
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.InvalidTokenError:
+        return None
+    user_id = payload.get("user_id")
+    if not user_id:
+        return None
+    if len(_tokens) >= MAX_CACHED_TOKENS:
+        _tokens.clear()
+    identity = f"user:{user_id}"
+    _tokens[token] = (identity, payload.get("exp", now + 3600))
+    return identity
+
+
+def _identity(scope, key, now):
+    if key == "route":
+        return ""
+    if key == "user":
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                if value[:7].lower() == b"bearer ":
+                    user = _user(value[7:], now)
+                    if user is not None:
+                        return user
+                break
+    client = scope.get("client")
+    return client[0] if client else ""
+
+
+class RateLimiter:
+    def __init__(self):
+        self.enabled = os.environ.get("OCEAN_RATE_LIMITS", "on").lower() not in ("off", "0", "false")
+        self.memory = MemoryBucketStore()
+        self.shared_store = None
+        self.workers = 1
+        self._rules = []            # (method or None, path or prefix, is_prefix, limits)
+        self._exact = {}            # (method, path) -> (local limits, shared limits)
+        self._prefix = {}           # prefix -> {method or None: (local limits, shared limits)}
+        self.rejected = 0
+
+    def limit(self, method, path, *limits):
+        """Limits for one endpoint"""
+        self._rules.append((method, path, False, limits))
+        self._compile()
+
+    def limit_prefix(self, prefix, *limits, methods=None):
+        """Limits for every endpoint under a router prefix (/api/<segment>), optionally only some methods"""
+        if path_prefix(prefix) != prefix:
+            raise ValueError(f"Rate limit prefix must be /api/<segment>: {prefix}")
+        for method in methods or (None,):
+            self._rules.append((method, prefix, True, limits))
+        self._compile()
+
+    def configure(self, db):
+        """Bind shared limits to Mongo when the shared-state backend is; split local limits across workers"""
+        self.workers = worker_count()
+        if shared_state.backend.name == "mongo":
+            store = MongoBucketStore(db.rate_limits)
+            try:
+                store.ensure_indexes()
+            except PyMongoError:
+                logger.exception("Could not create rate limit indexes")
+            self.shared_store = store
+        self._compile()
+
+    def _compile(self):
+        self._exact, self._prefix = {}, {}
+        for method, path, is_prefix, limits in self._rules:
+            local, shared = [], []
+            for i, limit in enumerate(limits):
+                exact_store = limit.shared and self.shared_store is not None
+                compiled = _Compiled(f"{method or '*'} {path}#{i}", limit,
+                                     self.shared_store if exact_store else self.memory,
+                                     1 if exact_store else self.workers)
+                (shared if exact_store else local).append(compiled)
+            entry = (tuple(local), tuple(shared))
+            if is_prefix:
+                self._prefix.setdefault(path, {})[method] = entry
+            else:
+                self._exact[(method, path)] = entry
+
+    def match(self, method, path):
+        entry = self._exact.get((method, path))
+        if entry is None:
+            rules = self._prefix.get(path_prefix(path))
+            if rules is not None:
+                entry = rules.get(method) or rules.get(None)
+        return entry
+
+    def check(self, scope, limits, now=None):
+        """None when every limit has a token, else (limit, retry_after)"""
+        now = now or time.time()
+        for limit in limits:
+            identity = _identity(scope, limit.key, now)
+            if limit.store.shared:
+                digest = hashlib.blake2b(identity.encode(), digest_size=12).hexdigest()
+                key = f"{limit.id}:{digest}"
+            else:
+                key = (limit.id, identity)
+            try:
+                allowed, retry_after, _ = limit.store.take(key, limit.interval, limit.tolerance, now)
+            except PyMongoError:
+                logger.warning("Rate limit store unavailable; allowing %s", limit.id)
+                continue
+            if not allowed:
+                return limit, retry_after
+        return None
+
+    def summary(self):
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "shared_store": self.shared_store is not None,
+            "rules": [{"method": m, "path": p, "prefix": is_prefix, "limits": [repr(l) for l in limits]}
+                      for m, p, is_prefix, limits in self._rules],
+            "memory_keys": len(self.memory),
+            "rejected": self.rejected,
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+class RateLimitMiddleware:
+    """Pure ASGI: one dict lookup for unlimited paths, 429 + Retry-After when a bucket is empty"""
+
+    def __init__(self, app, limiter=None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.limiter.enabled:
+            entry = self.limiter.match(scope["method"], scope["path"])
+            if entry is not None:
+                local, shared = entry
+                rejected = self.limiter.check(scope, local) if local else None
+                if rejected is None and shared:
+                    rejected = await run_in_threadpool(self.limiter.check, scope, shared)
+                if rejected is not None:
+                    await self._reject(scope, send, *rejected)
+                    return
+        await self.app(scope, receive, send)
+
+    async def _reject(self, scope, send, limit, retry_after):
+        self.limiter.rejected += 1
+        registry.inc_counter("rate_limited_total", 1, "Requests rejected by rate limits", limit=limit.id)
+        seconds = max(math.ceil(retry_after), 1)
+        body = b'{"detail":"Too many requests, retry in %d seconds"}' % seconds
+        await send({"type": "http.response.start", "status": 429, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(seconds).encode()),
+            (b"x-ratelimit-limit", limit.header.encode()),
+            (b"x-ratelimit-remaining", b"0"),
+        ]})
+        await send({"type": "http.response.body", "body": body})
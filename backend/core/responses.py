@@ -0,0 +1,181 @@
+"""
+JSON response classes and precompiled static payloads.
+
+`DefaultJSONResponse` is ORJSONResponse when orjson is installed (several
+times faster than the stdlib encoder on our large Arabic payloads) and
+falls back to JSONResponse otherwise; server.py uses it as the app-wide
+default response class.
+
+Endpoints that return constant data register it once:
+
+    RIDE_TYPES = static_responses.register("rides.types", [...])
+
+    @router.get("/types")
+    async def get_ride_types(request: Request):
+        return RIDE_TYPES.respond(request)
+
+The payload is encoded once, hashed into a strong ETag and wrapped in a
+ready Response; every hit returns that same object (no encoding, no
+body allocation), and a matching If-None-Match gets the shared 304. Payloads
+that depend on a small set of inputs (a query filter, a config document)
+use `variant(name, key, factory)`, which compiles each key on first use
+and keeps at most MAX_VARIANTS per name.
+
+Dynamic reads that only change when a collection changes (the catalog) use
+`content_versions`: change consumers publish each collection's latest
+change position, and `conditional()` turns it into a weak ETag before the
+handler touches Mongo, so a repeat request is answered with 304 from
+memory. Until a version is known no ETag is sent. Write endpoints also call
+`content_versions.bump(name)`, which moves the version at once in every
+worker: the poll-mode feed lags by a poll interval and never sees deletes.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from core.shared_state import shared_state
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:
+    orjson = None
+    DefaultJSONResponse = JSONResponse
+
+MAX_VARIANTS = 256
+CACHE_CONTROL = "public, max-age=300"
+PRIVATE_CACHE = "private, no-cache"       # behind auth: always revalidate, 304 when unchanged
+
+
+def dumps(payload):
+    """Compact UTF-8 JSON bytes, the same output DefaultJSONResponse renders"""
+    return DefaultJSONResponse(jsonable_encoder(payload)).body
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(","))
+
+
+class SharedResponse(Response):
+    """A Response reused across requests: middleware edits a copy of its headers, never the original"""
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": list(self.raw_headers)})
+        await send({"type": "http.response.body", "body": self.body})
+
+
+class Precompiled:
+    __slots__ = ("name", "body", "etag", "ok", "not_modified")
+
+    def __init__(self, name, payload, cache_control=CACHE_CONTROL):
+        self.name = name
+        self.body = dumps(payload)
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()[:20]}"'
+        headers = {"ETag": self.etag, "Cache-Control": cache_control}
+        self.ok = SharedResponse(self.body, media_type="application/json", headers=headers)
+        self.not_modified = SharedResponse(status_code=304, headers=headers)
+
+    def respond(self, request):
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return self.not_modified
+        return self.ok
+
+
+class StaticResponses:
+    def __init__(self):
+        self.entries = {}
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, payload, cache_control=CACHE_CONTROL):
+        entry = Precompiled(name, payload, cache_control)
+        self.entries[name] = entry
+        return entry
+
+    def variant(self, name, key, factory, cache_control=CACHE_CONTROL):
+        """Precompiled payload for one input combination, built by factory() on first use"""
+        with self._lock:
+            variants = self._variants.setdefault(name, OrderedDict())
+            entry = variants.get(key)
+            if entry is not None:
+                variants.move_to_end(key)
+                return entry
+        entry = Precompiled(name, factory(), cache_control)
+        with self._lock:
+            variants[key] = entry
+            while len(variants) > MAX_VARIANTS:
+                variants.popitem(last=False)
+        return entry
+
+    def summary(self):
+        return {
+            "entries": {name: {"bytes": len(e.body), "etag": e.etag} for name, e in self.entries.items()},
+            "variants": {name: len(v) for name, v in self._variants.items()},
+        }
+
+
+static_responses = StaticResponses()
+
+
+class ContentVersions:
+    """Latest change position per collection, as published by change consumers"""
+
+    def __init__(self):
+        self._versions = {}
+        shared_state.subscribe("content_versions", self._from_peer)
+
+    def set(self, name, version):
+        if version is not None:
+            self._versions[name] = (str(version), time.time())
+
+    def bump(self, name):
+        """Invalidate `name` after a write, here and in the other workers"""
+        version = f"w:{uuid.uuid4().hex[:16]}"
+        self.set(name, version)
+        shared_state.publish("content_versions", [name, version])
+
+    def _from_peer(self, message):
+        name, version = message
+        self.set(name, version)
+
+    def get(self, name):
+        entry = self._versions.get(name)
+        return entry and entry[0]
+
+    def etag(self, name, *parts):
+        """Weak ETag for a view of `name` selected by `parts` (query parameters)"""
+        version = self.get(name)
+        if version is None:
+            return None
+        digest = hashlib.blake2b(repr((name, version, parts)).encode(), digest_size=10).hexdigest()
+        return f'W/"{digest}"'
+
+    def summary(self):
+        return {name: {"version": v, "updated_at": t} for name, (v, t) in self._versions.items()}
+
+
+content_versions = ContentVersions()
+
+
+def conditional(request, name, *parts):
+    """
+    (etag, not_modified): not_modified is a 304 to return straight away when
+    the client's copy is current; otherwise pass `etag` to the response.
+    """
+    etag = content_versions.etag(name, *parts)
+    if etag is None:
+        return None, None
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return etag, Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return etag, None
@@ -0,0 +1,330 @@
+"""
+State shared by every API worker process (and every node).
+
+Module-level dicts only work while the API is a single process. Anything
+that has to agree across workers goes through `shared_state` instead:
+
+    shared_state.incr("login:1.2.3.4", ttl=60)      # counters and values with a TTL
+    shared_state.publish("alerts", {...})           # fan-out to the other processes
+    shared_state.subscribe("alerts", handler)       # handler(message) for peers' messages
+    Leader("pricing-scheduler").held()              # one process runs singleton jobs
+
+Two backends implement the same interface:
+
+    memory   in-process dicts; publish has no peers to reach and every
+             process leads. The default for a single worker.
+    mongo    `shared_state` documents (TTL index on expires_at) for values
+             and leases; messages go through the capped `shared_messages`
+             collection, tailed by one thread per process. Published
+             messages are buffered and written in one document per channel
+             every PUBLISH_INTERVAL, so high-rate replication (trending
+             events, fraud counters) costs one insert per flush, not per event.
+
+`configure(db)` picks the backend from OCEAN_SHARED_STATE (memory | mongo),
+defaulting to mongo when WEB_CONCURRENCY > 1. Subscribers only receive
+messages published by other processes: the publisher has already applied
+its own change locally.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure, PyMongoError
+
+from core.database import worker_count
+
+logger = logging.getLogger(__name__)
+
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+LEASE_TTL = 30
+PUBLISH_INTERVAL = 0.2
+MESSAGES_SIZE = 64 * 1024 * 1024        # capped collection bytes; a few minutes of peak traffic
+RETRY_BACKOFF = (0.5, 1, 2, 5, 10)
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self):
+        self._values = {}           # key -> (value, expires_at monotonic or None)
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._values[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            return entry and entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    def incr(self, key, amount=1, ttl=None):
+        """Add to a counter; a new (or expired) counter starts its TTL now"""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._live(key, now)
+            if entry is None:
+                entry = (0, now + ttl if ttl else None)
+            value = entry[0] + amount
+            self._values[key] = (value, entry[1])
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def acquire(self, name, owner, ttl):
+        return True
+
+    def publish(self, channel, message):
+        pass
+
+    def start(self, dispatch):
+        pass
+
+    def close(self):
+        pass
+
+    def healthy(self):
+        return True
+
+
+class MongoBackend:
+    name = "mongo"
+
+    def __init__(self, db):
+        self.values = db.shared_state
+        self.messages = db.shared_messages
+        self._outbox = defaultdict(list)
+        self._outbox_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._threads = []
+        self.tail_errors = 0
+        self.last_message_at = None
+
+    def ensure_collections(self):
+        self.values.create_index("expires_at", expireAfterSeconds=0)
+        try:
+            self.messages.database.create_collection(self.messages.name, capped=True, size=MESSAGES_SIZE)
+        except CollectionInvalid:
+            pass            # already there
+
+    # ---------- values ----------
+
+    @staticmethod
+    def _expiry(ttl):
+        return datetime.utcnow() + timedelta(seconds=ttl) if ttl else None
+
+    def get(self, key):
+        doc = self.values.find_one({"_id": key})
+        if doc is None or (doc.get("expires_at") and doc["expires_at"] <= datetime.utcnow()):
+            return None     # the TTL monitor only sweeps once a minute
+        return doc.get("value")
+
+    def set(self, key, value, ttl=None):
+        self.values.replace_one({"_id": key}, {"value": value, "expires_at": self._expiry(ttl)}, upsert=True)
+
+    def incr(self, key, amount=1, ttl=None):
+        now = datetime.utcnow()
+        live = {"_id": key, "$or": [{"expires_at": None}, {"expires_at": {"$gt": now}}]}
+        for _ in range(3):
+            try:
+                doc = self.values.find_one_and_update(
+                    live, {"$inc": {"value": amount}, "$setOnInsert": {"expires_at": self._expiry(ttl)}},
+                    upsert=True, return_document=True)
+                return doc["value"]
+            except DuplicateKeyError:
+                # An expired counter the TTL monitor hasn't removed yet: restart it
+                self.values.delete_one({"_id": key, "expires_at": {"$lte": now}})
+        raise RuntimeError(f"Could not increment shared counter {key}")
+
+    def delete(self, key):
+        self.values.delete_one({"_id": key})
+
+    def acquire(self, name, owner, ttl):
+        """Take or renew the lease on `name`; False while another live owner holds it"""
+        now = datetime.utcnow()
+        try:
+            self.values.update_one(
+                {"_id": f"lease:{name}", "$or": [{"value": owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"value": owner, "expires_at": now + timedelta(seconds=ttl)}}, upsert=True)
+            return True
+        except DuplicateKeyError:
+            return False
+
+    # ---------- messages ----------
+
+    def publish(self, channel, message):
+        with self._outbox_lock:
+            self._outbox[channel].append(message)
+
+    def flush(self):
+        with self._outbox_lock:
+            outbox, self._outbox = self._outbox, defaultdict(list)
+        if outbox:
+            self.messages.insert_many([{"channel": channel, "origin": ORIGIN, "messages": batch,
+                                        "created_at": datetime.utcnow()}
+                                       for channel, batch in outbox.items()], ordered=False)
+
+    def start(self, dispatch):
+        for name, target in (("shared-state-publisher", self._publish_loop),
+                             ("shared-state-tail", lambda: self._tail_loop(dispatch))):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _publish_loop(self):
+        while not self._wake.wait(PUBLISH_INTERVAL):
+            try:
+                self.flush()
+            except PyMongoError:
+                logger.exception("Publishing shared messages failed")
+
+    def _tail_loop(self, dispatch):
+        newest = self.messages.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        last = newest["_id"] if newest else None
+        failures = 0
+        while not self._wake.is_set():
+            try:
+                query = {"_id": {"$gt": last}} if last is not None else {}
+                cursor = self.messages.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive and not self._wake.is_set():
+                    received = False
+                    for doc in cursor:
+                        last = doc["_id"]
+                        received = True
+                        if doc.get("origin") != ORIGIN:
+                            dispatch(doc["channel"], doc["messages"])
+                    if received:
+                        self.last_message_at = time.time()
+                    else:
+                        time.sleep(0.05)
+                failures = 0
+                time.sleep(0.05)        # empty collection: the tailable cursor dies straight away
+            except OperationFailure:
+                # Cursor fell off the capped collection; lost messages are not replayed
+                self.tail_errors += 1
+                logger.warning("Shared message tail lost its position, restarting from the newest message")
+                newest = self.messages.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+                last = newest["_id"] if newest else None
+            except PyMongoError:
+                self.tail_errors += 1
+                delay = RETRY_BACKOFF[min(failures, len(RETRY_BACKOFF) - 1)]
+                failures += 1
+                logger.exception("Shared message tail failed; retrying in %ss", delay)
+                time.sleep(delay)
+
+    def close(self):
+        self._wake.set()
+        try:
+            self.flush()
+        except PyMongoError:
+            logger.exception("Final shared message flush failed")
+
+    def healthy(self):
+        return all(thread.is_alive() for thread in self._threads)
+
+
+class SharedState:
+    def __init__(self):
+        self.backend = MemoryBackend()
+        self._handlers = defaultdict(list)
+        self.received = defaultdict(int)
+
+    def configure(self, db, backend=None):
+        """Switch to the configured backend; call once per process after the Mongo client exists"""
+        backend = backend or os.environ.get("OCEAN_SHARED_STATE") or ("mongo" if worker_count() > 1 else "memory")
+        if backend == "mongo":
+            mongo = MongoBackend(db)
+            try:
+                mongo.ensure_collections()
+            except PyMongoError:
+                logger.exception("Could not prepare shared state collections")
+            self.backend = mongo
+        elif backend != "memory":
+            raise ValueError(f"Unknown OCEAN_SHARED_STATE backend: {backend}")
+        self.backend.start(self._dispatch)
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl)
+
+    def incr(self, key, amount=1, ttl=None):
+        return self.backend.incr(key, amount, ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def acquire(self, name, owner=ORIGIN, ttl=LEASE_TTL):
+        return self.backend.acquire(name, owner, ttl)
+
+    def publish(self, channel, message):
+        """Send a JSON-able message to the other processes' subscribers"""
+        self.backend.publish(channel, message)
+
+    def subscribe(self, channel, handler):
+        self._handlers[channel].append(handler)
+
+    def _dispatch(self, channel, messages):
+        self.received[channel] += len(messages)
+        for handler in self._handlers.get(channel, ()):
+            for message in messages:
+                try:
+                    handler(message)
+                except Exception:
+                    logger.exception("Shared message handler for %s failed", channel)
+
+    def close(self):
+        self.backend.close()
+
+    def summary(self):
+        return {"backend": self.backend.name, "origin": ORIGIN, "healthy": self.backend.healthy(),
+                "channels": sorted(self._handlers), "received": dict(self.received)}
+
+
+shared_state = SharedState()
+
+
+class Leader:
+    """
+    Lease-based leadership for jobs that must run in one process at a time.
+    held() renews at most every ttl/3 seconds, so it is cheap to call in a loop.
+    """
+
+    def __init__(self, name, ttl=LEASE_TTL, state=None):
+        self.name = name
+        self.ttl = ttl
+        self.state = state or shared_state
+        self._held = False
+        self._checked = 0.0
+
+    def held(self):
+        now = time.monotonic()
+        if now - self._checked >= self.ttl / 3:
+            try:
+                self._held = self.state.acquire(self.name, ttl=self.ttl)
+            except PyMongoError:
+                logger.exception("Lease check for %s failed", self.name)
+                self._held = False
+            self._checked = now
+        return self._held
+
+    def wait(self, interval=None):
+        """Block until this process holds the lease"""
+        while not self.held():
+            time.sleep(interval or self.ttl / 3)
@@ -0,0 +1,243 @@
+"""
+LLM chat session manager.
+
+Live chat clients are kept in an LRU bounded by MAX_SESSIONS and expired
+after SESSION_TTL of inactivity, instead of one client per session forever.
+On a miss the session is rebuilt from its last HISTORY_TURNS turns in
+`chat_history`, so eviction and restarts lose no context.
+
+Upstream calls go through a semaphore (MAX_CONCURRENCY in flight), messages
+within one session are serialised, and an identical message that arrives
+while the same one is still in flight for that session (double submits,
+client retries) waits for that answer instead of calling the LLM again.
+
+History rows are buffered and written with insert_many by a background
+thread every FLUSH_INTERVAL or FLUSH_SIZE rows; reads flush first.
+
+The client itself is injected: `factory(session_id, system_message)`
+returns an object (it runs in a worker thread, so it may import the client
+library on first use without blocking the event loop), `ask(client, text)` awaits the full reply and the
+optional `stream(client, text)` yields reply deltas. Without a stream
+adapter, `stream()` falls back to one full-reply chunk.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+MAX_SESSIONS = int(os.environ.get("CHAT_MAX_SESSIONS", "2000"))
+SESSION_TTL = int(os.environ.get("CHAT_SESSION_TTL", "1800"))
+MAX_CONCURRENCY = int(os.environ.get("CHAT_MAX_CONCURRENCY", "16"))
+HISTORY_TURNS = 10
+FLUSH_INTERVAL = 1.0
+FLUSH_SIZE = 200
+
+
+def with_transcript(system_message, turns):
+    """System prompt followed by the prior conversation, for rehydrated sessions"""
+    if not turns:
+        return system_message
+    lines = []
+    for turn in turns:
+        lines.append(f"User: {turn['user_message']}")
+        lines.append(f"Assistant: {turn['ai_response']}")
+    return f"{system_message}\n\nConversation so far:\n" + "\n".join(lines)
+
+
+class HistoryWriter:
+    """Buffered chat_history inserts flushed by a background thread"""
+
+    def __init__(self, collection=None):
+        self.collection = collection
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, collection):
+        self.collection = collection
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, record):
+        with self._lock:
+            self._buffer.append(record)
+            full = len(self._buffer) >= FLUSH_SIZE
+        if full or self._thread is None:
+            self.flush()
+
+    def discard(self, session_id):
+        with self._lock:
+            self._buffer = [r for r in self._buffer if r["session_id"] != session_id]
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except PyMongoError:
+            logger.exception("Chat history flush failed; %d rows re-queued", len(batch))
+            with self._lock:
+                self._buffer[:0] = batch
+
+    def _run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+
+class _Session:
+    __slots__ = ("client", "language", "last_used", "lock", "inflight")
+
+    def __init__(self, client, language):
+        self.client = client
+        self.language = language
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.inflight = {}
+
+
+class ChatSessionManager:
+    def __init__(self, factory=None, ask=None, stream=None, system_prompt=None,
+                 max_sessions=MAX_SESSIONS, ttl=SESSION_TTL, max_concurrency=MAX_CONCURRENCY):
+        self.factory = factory
+        self.ask = ask
+        self.stream_fn = stream
+        self.system_prompt = system_prompt
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_concurrency = max_concurrency
+        self.history = HistoryWriter()
+        self.collection = None
+        self._sessions = OrderedDict()
+        self._loading = {}
+        self._semaphore = None
+
+    def configure(self, collection, factory, ask, system_prompt, stream=None):
+        self.collection = collection
+        self.factory, self.ask, self.stream_fn, self.system_prompt = factory, ask, stream, system_prompt
+        self.history.start(collection)
+
+    @property
+    def semaphore(self):
+        # Created lazily so it binds to the serving event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def __len__(self):
+        return len(self._sessions)
+
+    # ---------- sessions ----------
+
+    def _evict(self, now):
+        """Drop expired sessions and the least recently used beyond capacity"""
+        for _ in range(len(self._sessions)):
+            session_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - session.last_used < self.ttl:
+                break
+            if session.lock.locked():
+                # Busy sessions are not evicted mid-call; revisit on the next pass
+                self._sessions.move_to_end(session_id)
+                continue
+            del self._sessions[session_id]
+
+    def _recent_turns(self, session_id):
+        self.history.flush()
+        turns = list(self.collection.find(
+            {"session_id": session_id}, {"_id": 0, "user_message": 1, "ai_response": 1}
+        ).sort("created_at", -1).limit(HISTORY_TURNS))
+        turns.reverse()
+        return turns
+
+    async def session(self, session_id, language):
+        now = time.monotonic()
+        session = self._sessions.get(session_id)
+        if session is not None and (session.language != language or now - session.last_used >= self.ttl):
+            session = None
+        if session is None:
+            # One rehydration per session id, however many requests missed at once
+            loading = self._loading.get(session_id)
+            if loading is None:
+                loading = asyncio.ensure_future(self._load(session_id, language))
+                self._loading[session_id] = loading
+                loading.add_done_callback(lambda _: self._loading.pop(session_id, None))
+            session = await asyncio.shield(loading)
+        session.last_used = now
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        self._evict(now)
+        return session
+
+    async def _load(self, session_id, language):
+        turns = await asyncio.to_thread(self._recent_turns, session_id)
+        system_message = with_transcript(self.system_prompt(language), turns)
+        session = _Session(await asyncio.to_thread(self.factory, session_id, system_message), language)
+        self._sessions[session_id] = session
+        return session
+
+    def drop(self, session_id):
+        self._sessions.pop(session_id, None)
+        self.history.discard(session_id)
+
+    # ---------- messages ----------
+
+    def _record(self, session_id, user_id, language, message, response):
+        self.history.add({
+            "id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "user_id": user_id,
+            "user_message": message,
+            "ai_response": response,
+            "language": language,
+            "created_at": datetime.utcnow().isoformat(),
+        })
+
+    async def send(self, session_id, user_id, language, message):
+        """Full reply for one message; duplicate in-flight messages share the call"""
+        session = await self.session(session_id, language)
+        pending = session.inflight.get(message)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        session.inflight[message] = future
+        try:
+            async with session.lock, self.semaphore:
+                response = await self.ask(session.client, message)
+            self._record(session_id, user_id, language, message, response)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            session.inflight.pop(message, None)
+
+    async def stream(self, session_id, user_id, language, message):
+        """Reply deltas as they arrive; the full reply is recorded at the end"""
+        if self.stream_fn is None:
+            yield await self.send(session_id, user_id, language, message)
+            return
+        session = await self.session(session_id, language)
+        parts = []
+        async with session.lock, self.semaphore:
+            async for delta in self.stream_fn(session.client, message):
+                parts.append(delta)
+                yield delta
+        self._record(session_id, user_id, language, message, "".join(parts))
+
+
+chat_manager = ChatSessionManager()
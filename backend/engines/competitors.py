@@ -0,0 +1,355 @@
+"""
+Competitor price snapshot store.
+
+Prices are pulled by pluggable fetchers (one per competitor domain) and
+kept as one compact snapshot document per product in
+`competitor_snapshots`:
+
+    {product_id, prices: [{c: competitor, p: price, s: in_stock, d: change %}],
+     min_price (lowest in-stock), fetched_at, expires_at}
+
+`expires_at` carries a TTL index, so products that stop being crawled age
+out instead of serving stale prices forever. Price moves and stock-outs
+found while crawling become rows in `competitor_alerts` (also TTL'd).
+
+Crawls run on asyncio with a global concurrency bound and a per-domain
+request rate, either in the background thread started by the API (tracked
+products only) or from scripts/crawl_competitors.py for the full catalog.
+API reads are a single indexed find_one.
+
+Fetchers: FileFetcher reads data/competitor_prices.json (local stub used in
+development and tests); HttpFetcher calls COMPETITOR_URL_TEMPLATE per domain.
+Pick with COMPETITOR_FETCHER=file|http. data/ is not committed: the stub is
+generated from the products in the database by scripts/seed_data.py (as part
+of demo and --scale seeding, or alone with --competitor-prices).
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from core.shared_state import Leader, shared_state
+
+logger = logging.getLogger(__name__)
+
+COMPETITORS = {
+    "amazon.sa": {"name": "أمازون السعودية", "icon": "🛒", "reliability": 95},
+    "noon.com": {"name": "نون", "icon": "🟡", "reliability": 92},
+    "extra.com": {"name": "اكسترا", "icon": "🔵", "reliability": 90},
+    "jarir.com": {"name": "جرير", "icon": "📚", "reliability": 94},
+    "lulu.com": {"name": "لولو", "icon": "🟢", "reliability": 88},
+    "carrefour.sa": {"name": "كارفور", "icon": "🔴", "reliability": 87},
+    "panda.com.sa": {"name": "بنده", "icon": "🐼", "reliability": 85},
+}
+
+SNAPSHOT_TTL = timedelta(hours=24)
+ALERT_TTL = timedelta(days=7)
+CRAWL_INTERVAL = 3600
+CONCURRENCY = 16
+DOMAIN_RPS = 2.0
+REQUEST_TIMEOUT = 10.0
+CHUNK_SIZE = 500
+ALERT_CHANGE = 5.0          # % move that raises an alert
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+STUB_PATH = os.path.join(DATA_DIR, "competitor_prices.json")
+
+
+# ==================== FETCHERS ====================
+
+class Fetcher:
+    """Fetches one competitor's offer for a product; None when not listed"""
+
+    def __init__(self, domain):
+        self.domain = domain
+
+    async def fetch(self, product):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class FileFetcher(Fetcher):
+    """
+    Local stub: {"amazon.sa": {"<product_id>": {"price": 99.5, "in_stock": true}}}.
+    The file is re-read when it changes.
+    """
+
+    _cache = {"mtime": None, "data": {}}
+    _lock = threading.Lock()
+
+    def __init__(self, domain, path=STUB_PATH):
+        super().__init__(domain)
+        self.path = path
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return {}
+        with self._lock:
+            if self._cache["mtime"] != (self.path, mtime):
+                with open(self.path, encoding="utf-8") as f:
+                    self._cache.update(mtime=(self.path, mtime), data=json.load(f))
+            return self._cache["data"]
+
+    async def fetch(self, product):
+        return self._load().get(self.domain, {}).get(product["id"])
+
+
+class HttpFetcher(Fetcher):
+    """GET url_template (formatted with domain / product_id / sku) returning {price, in_stock}"""
+
+    def __init__(self, domain, url_template, client=None):
+        super().__init__(domain)
+        self.url_template = url_template
+        self._client = client
+
+    async def fetch(self, product):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(timeout=REQUEST_TIMEOUT, follow_redirects=True)
+        url = self.url_template.format(domain=self.domain, product_id=product["id"],
+                                       sku=product.get("sku") or product["id"])
+        response = await self._client.get(url)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        data = response.json()
+        return {"price": data.get("price"), "in_stock": data.get("in_stock", True), "url": data.get("url", url)}
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+def default_fetchers():
+    kind = os.environ.get("COMPETITOR_FETCHER", "file")
+    if kind == "http":
+        template = os.environ.get("COMPETITOR_URL_TEMPLATE", "https://{domain}/api/prices/{sku}")
+        return [HttpFetcher(domain, template) for domain in COMPETITORS]
+    return [FileFetcher(domain) for domain in COMPETITORS]
+
+
+# ==================== CRAWLING ====================
+
+class DomainRateLimiter:
+    """Spaces requests to the same domain at least 1/rate seconds apart"""
+
+    def __init__(self, rate=DOMAIN_RPS):
+        self.interval = 1.0 / rate
+        self._next = {}
+        self._locks = {}
+
+    async def wait(self, domain):
+        lock = self._locks.setdefault(domain, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            at = max(now, self._next.get(domain, 0.0))
+            self._next[domain] = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+
+def ensure_indexes(db):
+    db.competitor_snapshots.create_index("product_id", unique=True)
+    db.competitor_snapshots.create_index("expires_at", expireAfterSeconds=0)
+    db.competitor_alerts.create_index([("created_at", DESCENDING)])
+    db.competitor_alerts.create_index("expires_at", expireAfterSeconds=0)
+    db.competitor_tracking.create_index("product_id", unique=True)
+
+
+def build_snapshot(product, offers, previous, now):
+    """Compact snapshot doc plus alerts against the previous snapshot"""
+    before = {p["c"]: p for p in (previous or {}).get("prices", [])}
+    prices, alerts = [], []
+    for domain, offer in offers.items():
+        if not offer or offer.get("price") is None:
+            continue
+        price, in_stock = round(float(offer["price"]), 2), bool(offer.get("in_stock", True))
+        old = before.get(domain)
+        change = round((price - old["p"]) / old["p"] * 100, 1) if old and old["p"] else 0.0
+        prices.append({"c": domain, "p": price, "s": in_stock, "d": change})
+        if old:
+            alert = _alert(product, domain, old, price, in_stock, change, now)
+            if alert:
+                alerts.append(alert)
+    prices.sort(key=lambda p: p["p"])
+    in_stock = [p["p"] for p in prices if p["s"]]
+    return {
+        "product_id": product["id"],
+        "prices": prices,
+        "min_price": min(in_stock) if in_stock else None,
+        "fetched_at": now.isoformat(),
+        "expires_at": now + SNAPSHOT_TTL,
+    }, alerts
+
+
+def _alert(product, domain, old, price, in_stock, change, now):
+    our_price = product.get("price")
+    base = {
+        "id": f"ALT-{str(uuid4())[:8].upper()}",
+        "product_id": product["id"],
+        "product": product.get("title"),
+        "competitor_id": domain,
+        "competitor": COMPETITORS.get(domain, {}).get("name", domain),
+        "our_price": our_price,
+        "created_at": now.isoformat(),
+        "expires_at": now + ALERT_TTL,
+    }
+    if old["s"] and not in_stock:
+        return {**base, "type": "out_of_stock", "severity": "medium",
+                "message": "المنتج غير متوفر لدى المنافس - فرصة لزيادة السعر"}
+    if abs(change) < ALERT_CHANGE:
+        return None
+    undercut = our_price is not None and price < our_price
+    return {**base, "type": "price_drop" if change < 0 else "price_increase",
+            "severity": "high" if change < 0 and undercut else "medium" if change < 0 else "low",
+            "old_price": old["p"], "new_price": price, "change": change,
+            "action_required": "تخفيض السعر للحفاظ على التنافسية" if undercut else "لا يلزم إجراء - سعرنا تنافسي"}
+
+
+async def _fetch_offer(fetcher, product, semaphore, limiter, stats):
+    if product.get("competitors") and fetcher.domain not in product["competitors"]:
+        return None
+    async with semaphore:
+        await limiter.wait(fetcher.domain)
+        try:
+            return await fetcher.fetch(product)
+        except Exception as e:
+            stats["errors"] += 1
+            logger.debug("Fetch %s/%s failed: %s", fetcher.domain, product["id"], e)
+            return None
+
+
+async def crawl(db, products, fetchers=None, concurrency=CONCURRENCY, domain_rps=DOMAIN_RPS, chunk_size=CHUNK_SIZE):
+    """Fetch every (product, competitor) pair and upsert snapshots; returns stats"""
+    own_fetchers = fetchers is None
+    fetchers = fetchers or default_fetchers()
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = DomainRateLimiter(domain_rps)
+    stats = {"products": 0, "offers": 0, "alerts": 0, "errors": 0}
+    products = iter(products)
+    try:
+        while True:
+            chunk = list(itertools.islice(products, chunk_size))
+            if not chunk:
+                break
+            results = await asyncio.gather(*(
+                _fetch_offer(f, p, semaphore, limiter, stats) for p in chunk for f in fetchers))
+            previous = {s["product_id"]: s for s in db.competitor_snapshots.find(
+                {"product_id": {"$in": [p["id"] for p in chunk]}}, {"_id": 0, "product_id": 1, "prices": 1})}
+
+            now = datetime.utcnow()
+            ops, alerts = [], []
+            for i, product in enumerate(chunk):
+                offers = {f.domain: results[i * len(fetchers) + j] for j, f in enumerate(fetchers)}
+                snapshot, found = build_snapshot(product, offers, previous.get(product["id"]), now)
+                if not snapshot["prices"]:
+                    continue
+                ops.append(UpdateOne({"product_id": product["id"]}, {"$set": snapshot}, upsert=True))
+                alerts.extend(found)
+                stats["offers"] += len(snapshot["prices"])
+            if ops:
+                db.competitor_snapshots.bulk_write(ops, ordered=False)
+            if alerts:
+                db.competitor_alerts.insert_many(alerts, ordered=False)
+            stats["products"] += len(chunk)
+            stats["alerts"] += len(alerts)
+    finally:
+        if own_fetchers:
+            for fetcher in fetchers:
+                await fetcher.close()
+    return stats
+
+
+# ==================== READS ====================
+
+def get_snapshot(db, product_id):
+    return db.competitor_snapshots.find_one({"product_id": product_id}, {"_id": 0})
+
+
+def expand_prices(snapshot):
+    """Snapshot prices in the API's long format, cheapest first"""
+    if not snapshot:
+        return []
+    return [{
+        "competitor_id": p["c"],
+        "competitor_name": COMPETITORS.get(p["c"], {}).get("name", p["c"]),
+        "icon": COMPETITORS.get(p["c"], {}).get("icon", ""),
+        "price": p["p"],
+        "currency": "SAR",
+        "in_stock": p["s"],
+        "last_updated": snapshot["fetched_at"],
+        "price_change": p["d"],
+        "url": f"https://{p['c']}/product/{snapshot['product_id']}",
+    } for p in snapshot["prices"]]
+
+
+def recent_alerts(db, limit=50):
+    return list(db.competitor_alerts.find({}, {"_id": 0, "expires_at": 0}).sort("created_at", DESCENDING).limit(limit))
+
+
+# ==================== SCHEDULER ====================
+
+class CompetitorCrawler:
+    """
+    Background thread crawling tracked products every CRAWL_INTERVAL. Only the
+    `competitor-crawler` lease holder crawls; wake() reaches it from any worker.
+    """
+
+    def __init__(self):
+        self.db = None
+        self._thread = None
+        self._wake = threading.Event()
+        self.leader = Leader("competitor-crawler", ttl=CRAWL_INTERVAL * 3)
+
+    def start(self, db):
+        self.db = db
+        if self._thread is not None:
+            return
+        try:
+            ensure_indexes(db)
+        except PyMongoError:
+            logger.exception("Could not create competitor indexes")
+        shared_state.subscribe("competitors.wake", lambda message: self._wake.set())
+        self._thread = threading.Thread(target=self._run, name="competitor-crawler", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Crawl now (e.g. after a product is added to tracking)"""
+        self._wake.set()
+        shared_state.publish("competitors.wake", {})
+
+    def tracked_products(self):
+        """Tracked products, each carrying the competitor list it is tracked against"""
+        tracked = {t["product_id"]: t.get("competitors") for t in self.db.competitor_tracking.find({}, {"_id": 0})}
+        ids = list(tracked)
+        for start in range(0, len(ids), CHUNK_SIZE):
+            for product in self.db.products.find({"id": {"$in": ids[start:start + CHUNK_SIZE]}},
+                                                 {"_id": 0, "id": 1, "title": 1, "price": 1, "sku": 1}):
+                yield {**product, "competitors": tracked[product["id"]]}
+
+    def _run(self):
+        while True:
+            self._wake.wait(CRAWL_INTERVAL)
+            self._wake.clear()
+            if not self.leader.held():
+                continue
+            try:
+                stats = asyncio.run(crawl(self.db, self.tracked_products()))
+                logger.info("Competitor crawl: %s", stats)
+            except Exception:
+                logger.exception("Competitor crawl failed")
+
+
+competitor_crawler = CompetitorCrawler()
@@ -0,0 +1,112 @@
+"""
+Change-stream consumers keeping derived catalog state fresh.
+
+Importing this module registers the consumers on `change_feed`; they pick
+up product writes from every router (admin approvals, seller bulk stock
+updates, scripts) without hooks at the write sites.
+
+    similarity       in-process similarity index (search / similar products)
+    category_stats   per-category product counts and price range in
+                     `category_stats`, read by the admin categories page
+    catalog_version  content version behind the catalog ETags (core.responses)
+"""
+from pymongo import UpdateOne
+
+from core.change_streams import change_feed
+from core.responses import content_versions
+from engines.similarity import similarity_index
+
+SIMILARITY_FIELDS = ("id", "title", "description", "category", "price")
+
+
+@change_feed.consumer("similarity", "products", operations=("insert", "update", "replace"), checkpoint=False)
+def update_similarity(db, changes):
+    """Re-vector changed products; deletes carry no product id and stay with the inline remove() calls"""
+    for change in changes:
+        doc = change["doc"]
+        if doc and doc.get("id"):
+            similarity_index.upsert({k: doc.get(k) for k in SIMILARITY_FIELDS})
+
+
+class ProductCategories:
+    """
+    _id -> category of every product, so an update or delete also refreshes
+    the category a product left (change events carry no pre-images). Loaded
+    on the first batch after each (re)start, since changes made while this
+    process was not consuming are not in it.
+    """
+
+    def __init__(self):
+        self.categories = {}
+        self.loaded = False
+
+    def reset(self, db=None):
+        self.categories, self.loaded = {}, False
+
+    def load(self, db):
+        db.products.create_index("category")
+        self.categories = {d["_id"]: d.get("category") for d in db.products.find({}, {"category": 1})}
+        self.loaded = True
+
+    def apply(self, changes):
+        """Categories `changes` touched, before and after, updating the map"""
+        touched = set()
+        for change in changes:
+            key = change["key"]
+            if key in self.categories:
+                touched.add(self.categories[key])
+            if change["doc"] is None:
+                self.categories.pop(key, None)
+            else:
+                self.categories[key] = change["doc"].get("category")
+                touched.add(self.categories[key])
+        return touched
+
+
+product_categories = ProductCategories()
+
+
+def category_stats(db, categories=None):
+    """Recompute stats for `categories` (all when None) and replace them in category_stats"""
+    match = {} if categories is None else {"category": {"$in": list(categories)}}
+    rows = list(db.products.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$category", "count": {"$sum": 1},
+                    "min_price": {"$min": "$price"}, "max_price": {"$max": "$price"},
+                    "avg_price": {"$avg": "$price"}, "stock": {"$sum": "$stock"}}},
+    ]))
+    found = {row["_id"] for row in rows}
+    ops = [UpdateOne({"_id": row["_id"]}, {"$set": {k: v for k, v in row.items() if k != "_id"}}, upsert=True)
+           for row in rows]
+    if ops:
+        db.category_stats.bulk_write(ops, ordered=False)
+    # Categories that lost their last product
+    stale = {"_id": {"$nin": list(found)}}
+    if categories is not None:
+        stale["_id"]["$in"] = list(categories)
+    db.category_stats.delete_many(stale)
+
+
+@change_feed.consumer("category_stats", "products", resync=category_stats, on_start=product_categories.reset)
+def update_category_stats(db, changes):
+    """
+    Recompute only the categories a batch touched (on the category index).
+    The first batch after a (re)start recomputes everything while the
+    _id -> category map is loaded.
+    """
+    if not product_categories.loaded:
+        product_categories.load(db)
+        category_stats(db)
+    else:
+        category_stats(db, product_categories.apply(changes))
+
+
+def seed_catalog_version(db):
+    """Starting version, identical in every process until the first change arrives"""
+    newest = db.products.find_one({"updated_at": {"$exists": True}}, {"updated_at": 1}, sort=[("updated_at", -1)])
+    content_versions.set("products", f"{newest and newest['updated_at']}/{db.products.estimated_document_count()}")
+
+
+@change_feed.consumer("catalog_version", "products", checkpoint=False, max_wait=0.1, resync=seed_catalog_version)
+def update_catalog_version(db, changes):
+    content_versions.set("products", changes[-1]["ts"])
@@ -0,0 +1,352 @@
+"""
+Item-to-item co-purchase model ("frequently bought together" / cross-sell).
+
+An offline job (scripts/build_copurchase.py) scans `orders.items`, builds the
+sparse item x item co-occurrence matrix with scipy.sparse, scores every pair
+by PMI (or lift / confidence) and keeps the top-K neighbours per item. The
+result is written as flat .npy arrays that API processes memory-map, so a
+lookup is a dict hit plus a K-element slice.
+
+Orders placed after the snapshot are folded in incrementally: each process
+keeps pair deltas in memory and re-scores a product's K snapshot neighbours
+plus its delta neighbours at query time. The next offline build absorbs them.
+The delta is bounded: at MAX_DELTA_ORDERS the oldest orders are compacted
+away (down to COMPACT_TO) and the process asks for a rebuild, which runs in
+a background thread of whichever worker holds the rebuild lease, at most
+once per REBUILD_INTERVAL. Dropped orders are still in `orders`, so the
+rebuild restores them.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from array import array
+
+import numpy as np
+from scipy import sparse
+
+from core.shared_state import Leader
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_DIR = os.environ.get(
+    "COPURCHASE_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "copurchase"))
+DEFAULT_TOP_K = 20
+DEFAULT_MIN_SUPPORT = 2
+SCORES = ("pmi", "lift", "confidence")
+
+# Pending incremental orders before the process compacts and asks for a rebuild
+MAX_DELTA_ORDERS = 50000
+# Newest orders kept in the delta after compaction
+COMPACT_TO = MAX_DELTA_ORDERS // 2
+# Minimum seconds between rebuilds started by API processes
+REBUILD_INTERVAL = 600
+# Seconds between checks for a newer snapshot on disk
+RELOAD_INTERVAL = 60
+
+
+def _score(metric, support, count_i, count_j, n_orders):
+    """Vectorised pair score; works on NumPy arrays and on plain floats"""
+    if metric == "confidence":
+        return support / count_i
+    lift = support * n_orders / (count_i * count_j)
+    return lift if metric == "lift" else np.log(lift)
+
+
+def build_model(baskets, top_k=DEFAULT_TOP_K, min_support=DEFAULT_MIN_SUPPORT, metric="pmi"):
+    """
+    Build top-K neighbour arrays from an iterable of baskets (lists of product
+    ids). Returns a dict of arrays ready for `save_model`.
+    """
+    if metric not in SCORES:
+        raise ValueError(f"metric must be one of {SCORES}")
+
+    item_index = {}
+    rows, cols = array("i"), array("i")
+    n_orders = 0
+    for basket in baskets:
+        items = {item_index.setdefault(pid, len(item_index)) for pid in basket if pid}
+        if not items:
+            continue
+        rows.extend([n_orders] * len(items))
+        cols.extend(items)
+        n_orders += 1
+
+    n_items = len(item_index)
+    item_ids = [None] * n_items
+    for pid, idx in item_index.items():
+        item_ids[idx] = pid
+
+    neighbors = np.full((n_items, top_k), -1, dtype=np.int32)
+    scores = np.zeros((n_items, top_k), dtype=np.float32)
+    supports = np.zeros((n_items, top_k), dtype=np.int32)
+    if n_items == 0:
+        return {"item_ids": item_ids, "item_counts": np.zeros(0, dtype=np.int32), "neighbors": neighbors,
+                "scores": scores, "supports": supports, "n_orders": 0, "metric": metric}
+
+    rows_np = np.frombuffer(rows, dtype=np.int32)
+    cols_np = np.frombuffer(cols, dtype=np.int32)
+    basket_matrix = sparse.csr_matrix(
+        (np.ones(len(rows_np), dtype=np.int32), (rows_np, cols_np)), shape=(n_orders, n_items))
+    cooc = (basket_matrix.T @ basket_matrix).tocsr()
+    item_counts = cooc.diagonal().astype(np.int32)
+    cooc.setdiag(0)
+    cooc.eliminate_zeros()
+
+    # Score every non-zero pair at once
+    row_of = np.repeat(np.arange(n_items, dtype=np.int32), np.diff(cooc.indptr))
+    support = cooc.data.astype(np.float64)
+    pair_scores = _score(metric, support, item_counts[row_of].astype(np.float64),
+                         item_counts[cooc.indices].astype(np.float64), float(n_orders))
+    pair_scores[support < min_support] = -np.inf
+
+    indptr, indices = cooc.indptr, cooc.indices
+    for i in range(n_items):
+        start, end = indptr[i], indptr[i + 1]
+        if start == end:
+            continue
+        row_scores = pair_scores[start:end]
+        if len(row_scores) > top_k:
+            top = np.argpartition(-row_scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(row_scores))
+        top = top[np.argsort(-row_scores[top], kind="stable")]
+        top = top[np.isfinite(row_scores[top])]
+        n = len(top)
+        neighbors[i, :n] = indices[start:end][top]
+        scores[i, :n] = row_scores[top]
+        supports[i, :n] = cooc.data[start:end][top]
+
+    return {"item_ids": item_ids, "item_counts": item_counts, "neighbors": neighbors,
+            "scores": scores, "supports": supports, "n_orders": n_orders, "metric": metric}
+
+
+def save_model(model, model_dir=DEFAULT_MODEL_DIR, keep=2):
+    """
+    Write a snapshot into a fresh versioned directory and atomically point
+    CURRENT at it, so readers never see a half-written model. Only the
+    newest `keep` snapshots stay on disk (unlinking a mapped file is safe).
+    """
+    version = time.strftime("v%Y%m%d%H%M%S") + f"-{os.getpid()}"
+    target = os.path.join(model_dir, version)
+    os.makedirs(target, exist_ok=True)
+    for name in ("item_counts", "neighbors", "scores", "supports"):
+        np.save(os.path.join(target, f"{name}.npy"), model[name])
+    with open(os.path.join(target, "meta.json"), "w") as f:
+        json.dump({
+            "item_ids": model["item_ids"],
+            "n_orders": model["n_orders"],
+            "metric": model["metric"],
+            "built_at": model.get("built_at", time.time()),
+        }, f)
+    pointer = os.path.join(model_dir, "CURRENT")
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+
+    versions = sorted(d for d in os.listdir(model_dir) if d.startswith("v"))
+    for stale in versions[:-keep]:
+        shutil.rmtree(os.path.join(model_dir, stale), ignore_errors=True)
+    return target
+
+
+def order_baskets(db, since=None):
+    """Stream product-id baskets out of `orders`"""
+    query = {"status": {"$ne": "cancelled"}}
+    if since:
+        query["created_at"] = {"$gte": since}
+    for order in db.orders.find(query, {"_id": 0, "items.product_id": 1}).batch_size(5000):
+        yield [item.get("product_id") for item in order.get("items", [])]
+
+
+class CoPurchaseIndex:
+    """Memory-mapped read side of the model plus in-process incremental deltas"""
+
+    def __init__(self, model_dir=DEFAULT_MODEL_DIR):
+        self.model_dir = model_dir
+        self._lock = threading.Lock()
+        self.version = None
+        self._checked_at = 0.0
+        self._row = {}
+        self._db = None
+        self._rebuild_started = 0.0
+        self.leader = Leader("copurchase-rebuild", ttl=REBUILD_INTERVAL)
+        self._reset_delta()
+
+    def start(self, db):
+        """Let this process rebuild the snapshot from `db` once its delta is full"""
+        self._db = db
+
+    def _reset_delta(self):
+        self.delta_orders = []   # (timestamp, product ids)
+        self.delta_pairs = {}    # product id -> {neighbour id: count}
+        self.delta_counts = {}   # product id -> count
+        self.needs_rebuild = False
+
+    # ---- Snapshot loading ----
+
+    def _current_version(self):
+        try:
+            with open(os.path.join(self.model_dir, "CURRENT")) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def maybe_reload(self, force=False):
+        now = time.time()
+        if not force and now - self._checked_at < RELOAD_INTERVAL:
+            return
+        self._checked_at = now
+        version = self._current_version()
+        if version is None or version == self.version:
+            return
+        path = os.path.join(self.model_dir, version)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                  for name in ("item_counts", "neighbors", "scores", "supports")}
+        with self._lock:
+            self.item_ids = meta["item_ids"]
+            self.n_orders = meta["n_orders"]
+            self.metric = meta["metric"]
+            self.built_at = meta["built_at"]
+            self._row = {pid: i for i, pid in enumerate(self.item_ids)}
+            self.item_counts = arrays["item_counts"]
+            self.neighbor_rows = arrays["neighbors"]
+            self.scores = arrays["scores"]
+            self.supports = arrays["supports"]
+            self.version = version
+            # Orders already covered by the new snapshot leave the delta
+            pending = [(ts, ids) for ts, ids in self.delta_orders if ts > self.built_at]
+            self._reset_delta()
+            for ts, ids in pending:
+                self._add_delta(ts, ids)
+
+    @property
+    def loaded(self):
+        return self.version is not None
+
+    # ---- Incremental updates ----
+
+    def _add_delta(self, ts, product_ids):
+        self.delta_orders.append((ts, product_ids))
+        for pid in product_ids:
+            self.delta_counts[pid] = self.delta_counts.get(pid, 0) + 1
+            pairs = self.delta_pairs.setdefault(pid, {})
+            for other in product_ids:
+                if other != pid:
+                    pairs[other] = pairs.get(other, 0) + 1
+        if len(self.delta_orders) >= MAX_DELTA_ORDERS:
+            self.needs_rebuild = True
+            self._compact()
+
+    def _compact(self):
+        """Drop the oldest delta orders and their pair counts, keeping COMPACT_TO"""
+        dropped = self.delta_orders[:-COMPACT_TO] if COMPACT_TO else self.delta_orders
+        self.delta_orders = self.delta_orders[len(dropped):]
+        for _, product_ids in dropped:
+            for pid in product_ids:
+                count = self.delta_counts[pid] - 1
+                if count:
+                    self.delta_counts[pid] = count
+                else:
+                    del self.delta_counts[pid]
+                pairs = self.delta_pairs[pid]
+                for other in product_ids:
+                    if other != pid:
+                        if pairs[other] > 1:
+                            pairs[other] -= 1
+                        else:
+                            del pairs[other]
+                if not pairs:
+                    del self.delta_pairs[pid]
+        logger.info("Co-purchase delta compacted: dropped %d orders awaiting a rebuild", len(dropped))
+
+    def record_order(self, product_ids, ts=None):
+        """Fold a newly placed order into this process's view of the model"""
+        ids = list(dict.fromkeys(pid for pid in product_ids if pid))
+        if not ids:
+            return
+        with self._lock:
+            self._add_delta(ts or time.time(), ids)
+            rebuild_due = (self.needs_rebuild and self._db is not None
+                           and time.time() - self._rebuild_started >= REBUILD_INTERVAL)
+            if rebuild_due:
+                self._rebuild_started = time.time()
+        if rebuild_due:
+            threading.Thread(target=self._rebuild, name="copurchase-rebuild", daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            if self.leader.held():
+                path, model = rebuild(self._db, self.model_dir)
+                logger.info("Co-purchase model rebuilt: %d items from %d orders -> %s",
+                            len(model["item_ids"]), model["n_orders"], path)
+            # Without the lease a peer rebuilds; its snapshot arrives on a later reload check
+            self.maybe_reload(force=True)
+        except Exception:
+            logger.exception("Co-purchase rebuild failed")
+
+    # ---- Queries ----
+
+    def _count(self, pid):
+        row = self._row.get(pid)
+        base = int(self.item_counts[row]) if row is not None else 0
+        return base + self.delta_counts.get(pid, 0)
+
+    def neighbors(self, product_id, k=10, min_support=DEFAULT_MIN_SUPPORT):
+        """
+        Top-k co-purchased products as dicts with score, support (orders
+        containing both) and confidence (P(neighbour | product)).
+        """
+        self.maybe_reload()
+        with self._lock:
+            if not self.loaded and not self.delta_orders:
+                return []
+            metric = self.metric if self.loaded else "pmi"
+            n_orders = (self.n_orders if self.loaded else 0) + len(self.delta_orders)
+
+            candidates = {}
+            row = self._row.get(product_id)
+            if row is not None:
+                for j, support in zip(self.neighbor_rows[row].tolist(), self.supports[row].tolist()):
+                    if j < 0:
+                        break
+                    candidates[self.item_ids[j]] = support
+            for other, count in self.delta_pairs.get(product_id, {}).items():
+                candidates[other] = candidates.get(other, 0) + count
+            if not candidates:
+                return []
+
+            count_i = self._count(product_id)
+            results = []
+            for other, support in candidates.items():
+                if support < min_support:
+                    continue
+                count_j = self._count(other)
+                results.append({
+                    "product_id": other,
+                    "score": round(float(_score(metric, support, count_i, count_j, n_orders)), 4),
+                    "support": support,
+                    "confidence": round(support / count_i, 4) if count_i else 0.0,
+                })
+        results.sort(key=lambda r: r["score"], reverse=True)
+        return results[:k]
+
+
+def rebuild(db, model_dir=DEFAULT_MODEL_DIR, top_k=DEFAULT_TOP_K, min_support=DEFAULT_MIN_SUPPORT, metric="pmi"):
+    """Full offline build from `orders`; returns (snapshot path, model)"""
+    started = time.time()
+    model = build_model(order_baskets(db), top_k=top_k, min_support=min_support, metric=metric)
+    model["built_at"] = started  # orders created after this stay in process deltas
+    return save_model(model, model_dir), model
+
+
+copurchase_index = CoPurchaseIndex()
+
+
+def cross_sell_ids(product_id, k=6):
+    return [n["product_id"] for n in copurchase_index.neighbors(product_id, k=k)]
@@ -0,0 +1,249 @@
+"""
+Transactional outbox and event bus.
+
+Write paths record their side effects as events in the `outbox` collection
+together with the business write: `event_bus.insert(db, collection, doc,
+"order.created", payload)` runs both inserts in one transaction when the
+deployment supports it (replica set / mongos). On a standalone server the
+document is written first and the event right after.
+
+A dispatcher thread delivers events to subscribers off the request path:
+
+    @event_bus.subscriber("notifications", "order.created", "ride.requested")
+    def notify(db, events): ...
+
+Each subscriber gets a batch of up to BATCH_SIZE events per call. An event
+keeps the names of the subscribers that still have to process it
+(`pending`); a successful call pulls the name, a failure schedules a retry
+with exponential backoff and after MAX_ATTEMPTS the name moves to `failed`.
+Events are claimed with a lease, so several API processes can dispatch
+concurrently and a crashed dispatcher's batch is picked up again after
+LEASE. Delivery is at-least-once: handlers whose effects are not naturally
+idempotent wrap their writes in `first_delivery()` to skip events they
+already applied.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from core.database import is_replica_set
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+POLL_INTERVAL = 1.0
+LEASE = timedelta(seconds=30)
+MAX_ATTEMPTS = 8
+RETRY_BASE = 2.0                      # seconds, doubled per attempt
+DELIVERED_TTL = timedelta(days=7)
+RECEIPT_TTL = timedelta(days=7)
+
+
+def _backoff(attempts):
+    return timedelta(seconds=min(RETRY_BASE * 2 ** (attempts - 1), 3600))
+
+
+class EventBus:
+    def __init__(self):
+        self.handlers = {}          # name -> (event types, fn)
+        self.db = None
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._transactions = {}     # id(client) -> bool
+        self._thread = None
+        self._wake = threading.Event()
+
+    # ---------- subscribing ----------
+
+    def subscriber(self, name, *event_types):
+        """Register fn(db, events) for the given event types"""
+        def register(fn):
+            self.handlers[name] = (set(event_types), fn)
+            return fn
+        return register
+
+    def subscribers_for(self, event_type):
+        return [name for name, (types, _) in self.handlers.items() if event_type in types]
+
+    # ---------- publishing ----------
+
+    def event(self, event_type, payload):
+        now = datetime.utcnow()
+        return {
+            "_id": str(uuid.uuid4()),
+            "type": event_type,
+            "payload": payload,
+            "pending": self.subscribers_for(event_type),
+            "failed": [],
+            "attempts": 0,
+            "status": "pending",
+            "next_attempt_at": now,
+            "locked_until": now,
+            "created_at": now,
+        }
+
+    def record(self, db, write, events):
+        """Run write(session) and store `events` atomically where the deployment allows"""
+        events = [e for e in events if e["pending"]]
+        client = db.client
+        key = id(client)
+        if key not in self._transactions:
+            self._transactions[key] = is_replica_set(client)
+        if self._transactions[key]:
+            with client.start_session() as session:
+                def body(s):
+                    result = write(s)
+                    if events:
+                        db.outbox.insert_many(events, session=s)
+                    return result
+                result = session.with_transaction(body)
+        else:
+            result = write(None)
+            if events:
+                db.outbox.insert_many(events)
+        if events:
+            self._wake.set()
+        return result
+
+    def insert(self, db, collection, doc, event_type, payload):
+        """insert_one(doc) plus its event"""
+        return self.record(db, lambda s: collection.insert_one(doc, session=s),
+                           [self.event(event_type, payload)])
+
+    def update(self, db, collection, filter, update, event_type, payload):
+        """update_one(filter, update) plus its event"""
+        return self.record(db, lambda s: collection.update_one(filter, update, session=s),
+                           [self.event(event_type, payload)])
+
+    def publish(self, db, event_type, payload):
+        """An event with no accompanying write"""
+        self.record(db, lambda s: None, [self.event(event_type, payload)])
+
+    # ---------- dispatching ----------
+
+    def ensure_indexes(self, db):
+        db.outbox.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+        db.outbox.create_index("expires_at", expireAfterSeconds=0)
+        db.event_receipts.create_index("expires_at", expireAfterSeconds=0)
+
+    @contextmanager
+    def first_delivery(self, db, name, events):
+        """
+        Yields the events `name` has not applied yet and marks them applied;
+        the marks are removed again if the block raises, so a retry redoes them.
+        """
+        fresh = []
+        if events:
+            expires_at = datetime.utcnow() + RECEIPT_TTL
+            try:
+                db.event_receipts.insert_many(
+                    [{"_id": f"{name}:{e['_id']}", "expires_at": expires_at} for e in events], ordered=False)
+                fresh = events
+            except BulkWriteError as error:
+                seen = {err["op"]["_id"] for err in error.details["writeErrors"] if err.get("code") == 11000}
+                fresh = [e for e in events if f"{name}:{e['_id']}" not in seen]
+        try:
+            yield fresh
+        except BaseException:
+            db.event_receipts.delete_many({"_id": {"$in": [f"{name}:{e['_id']}" for e in fresh]}})
+            raise
+
+    def _claim(self, db, limit):
+        now = datetime.utcnow()
+        due = {"status": "pending", "next_attempt_at": {"$lte": now}, "locked_until": {"$lte": now}}
+        ids = [d["_id"] for d in db.outbox.find(due, {"_id": 1}).sort("next_attempt_at", ASCENDING).limit(limit)]
+        if not ids:
+            return []
+        db.outbox.update_many({**due, "_id": {"$in": ids}},
+                              {"$set": {"locked_until": now + LEASE, "locked_by": self.worker_id}})
+        return list(db.outbox.find({"_id": {"$in": ids}, "locked_by": self.worker_id,
+                                    "locked_until": {"$gt": now}}).sort("created_at", ASCENDING))
+
+    def dispatch_once(self, db, limit=BATCH_SIZE):
+        """Deliver one batch; returns the number of events claimed"""
+        events = self._claim(db, limit)
+        if not events:
+            return 0
+        now = datetime.utcnow()
+        failed = {}                 # event id -> [subscriber names]
+        for e in events:
+            # Subscribers this process doesn't know (older/newer deploy) count as failures
+            unknown = [name for name in e["pending"] if name not in self.handlers]
+            if unknown:
+                failed[e["_id"]] = unknown
+        for name, (_, fn) in self.handlers.items():
+            batch = [e for e in events if name in e["pending"]]
+            if not batch:
+                continue
+            try:
+                fn(db, batch)
+            except Exception:
+                logger.exception("Event subscriber %s failed on %d events", name, len(batch))
+                for e in batch:
+                    failed.setdefault(e["_id"], []).append(name)
+                continue
+            db.outbox.update_many({"_id": {"$in": [e["_id"] for e in batch]}}, {"$pull": {"pending": name}})
+
+        for e in events:
+            names = failed.get(e["_id"])
+            if not names:
+                continue
+            attempts = e["attempts"] + 1
+            if attempts >= MAX_ATTEMPTS:
+                logger.error("Event %s (%s) gave up on %s", e["_id"], e["type"], names)
+                db.outbox.update_one({"_id": e["_id"]}, {"$pull": {"pending": {"$in": names}},
+                                                         "$push": {"failed": {"$each": names}}})
+            else:
+                db.outbox.update_one({"_id": e["_id"]}, {"$set": {"attempts": attempts,
+                                                                  "next_attempt_at": now + _backoff(attempts)}})
+
+        ids = [e["_id"] for e in events]
+        done = {"_id": {"$in": ids}, "pending": {"$size": 0}}
+        db.outbox.update_many({**done, "failed": {"$size": 0}},
+                              {"$set": {"status": "delivered", "delivered_at": now,
+                                        "expires_at": now + DELIVERED_TTL}})
+        # Given-up events are kept (no expiry) for inspection and replay
+        db.outbox.update_many({**done, "failed.0": {"$exists": True}}, {"$set": {"status": "dead"}})
+        # Release the lease so retries are governed by next_attempt_at alone
+        db.outbox.update_many({"_id": {"$in": ids}, "locked_by": self.worker_id},
+                              {"$set": {"locked_until": now}})
+        return len(events)
+
+    def drain(self, db, limit=BATCH_SIZE):
+        """Dispatch until nothing is due; returns events claimed"""
+        total = 0
+        while True:
+            n = self.dispatch_once(db, limit)
+            total += n
+            if n < limit:
+                return total
+
+    def start(self, db):
+        self.db = db
+        if self._thread is not None:
+            return
+        try:
+            self.ensure_indexes(db)
+        except PyMongoError:
+            logger.exception("Could not create outbox indexes")
+        self._thread = threading.Thread(target=self._run, name="event-dispatcher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                self.drain(self.db)
+            except PyMongoError:
+                logger.exception("Event dispatch failed")
+                time.sleep(POLL_INTERVAL)
+
+
+event_bus = EventBus()
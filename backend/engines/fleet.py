@@ -0,0 +1,245 @@
+"""
+Car rental fleet: inventory, availability and reservations.
+
+Cars live in `rental_cars`; each car document also carries its booked
+intervals ({start, end, booking_id}), which never overlap. Reserving is a
+single conditional update that only matches when no stored interval
+overlaps the requested one, so two concurrent bookings for the same car
+cannot both succeed, across processes too.
+
+For reads, FleetIndex keeps per-car sorted start/end arrays. Because a
+car's intervals are disjoint, both arrays are sorted and an overlap test is
+one bisect:
+
+    i = first interval with end > start;  busy  <=>  starts[i] < end
+
+so "cars free in city X for [pickup, return)" costs O(log n) per car. A
+city's cars are reloaded from Mongo when older than INDEX_TTL, and the
+local process updates its index directly after its own writes.
+"""
+import bisect
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+INDEX_TTL = 30.0
+VAT_RATE = 0.15
+CANCELLATION_FEE = 50
+MAX_RENTAL_DAYS = 90
+HISTORY_KEEP = timedelta(days=1)      # past intervals pruned after this
+
+INSURANCE = {
+    "basic": {"price": 50, "coverage": "تغطية أساسية"},
+    "full": {"price": 100, "coverage": "تغطية شاملة + سائق إضافي"},
+}
+EXTRAS = {
+    "GPS": 25,
+    "كرسي أطفال": 30,
+    "WiFi": 20,
+}
+CATEGORIES = ["اقتصادية", "سيدان", "SUV", "فاخرة", "عائلية"]
+
+LOCATIONS = [
+    {"id": "LOC-001", "name": "مطار الملك خالد - الرياض", "city": "الرياض", "type": "airport", "hours": "24/7"},
+    {"id": "LOC-002", "name": "وسط الرياض - العليا", "city": "الرياض", "type": "city", "hours": "8AM-10PM"},
+    {"id": "LOC-003", "name": "مطار الملك عبدالعزيز - جدة", "city": "جدة", "type": "airport", "hours": "24/7"},
+    {"id": "LOC-004", "name": "مطار الدمام", "city": "الدمام", "type": "airport", "hours": "24/7"},
+]
+
+# Initial fleet, inserted when rental_cars is empty
+DEFAULT_FLEET = [
+    {"id": "CAR-001", "brand": "تويوتا", "model": "كامري 2024", "category": "سيدان", "year": 2024, "color": "أبيض",
+     "seats": 5, "transmission": "أوتوماتيك", "fuel_type": "بنزين", "daily_rate": 250, "weekly_rate": 1500,
+     "monthly_rate": 5000, "features": ["بلوتوث", "كاميرا خلفية", "مثبت سرعة"], "city": "الرياض",
+     "location_id": "LOC-001", "location": "مطار الرياض", "plate": "ABC 1234",
+     "image": "/images/cars/camry-2024.jpg", "rating": 4.8},
+    {"id": "CAR-002", "brand": "هيونداي", "model": "سوناتا 2024", "category": "سيدان", "year": 2024, "color": "أسود",
+     "seats": 5, "transmission": "أوتوماتيك", "fuel_type": "بنزين", "daily_rate": 200, "weekly_rate": 1200,
+     "monthly_rate": 4000, "features": ["بلوتوث", "شاشة لمس"], "city": "الرياض",
+     "location_id": "LOC-002", "location": "وسط الرياض", "plate": "BCD 2345",
+     "image": "/images/cars/sonata-2024.jpg", "rating": 4.6},
+    {"id": "CAR-003", "brand": "لكزس", "model": "ES 350 2024", "category": "فاخرة", "year": 2024, "color": "فضي",
+     "seats": 5, "transmission": "أوتوماتيك", "fuel_type": "بنزين", "daily_rate": 450, "weekly_rate": 2800,
+     "monthly_rate": 10000, "features": ["مقاعد جلد", "نظام صوتي مارك ليفنسون", "شاشة HUD"], "city": "الرياض",
+     "location_id": "LOC-001", "location": "مطار الرياض", "plate": "CDE 3456",
+     "image": "/images/cars/lexus-es-2024.jpg", "rating": 4.9},
+    {"id": "CAR-004", "brand": "تويوتا", "model": "فورتشنر 2024", "category": "SUV", "year": 2024, "color": "أبيض",
+     "seats": 7, "transmission": "أوتوماتيك", "fuel_type": "بنزين", "daily_rate": 350, "weekly_rate": 2100,
+     "monthly_rate": 7500, "features": ["دفع رباعي", "شاشة كبيرة", "كاميرات 360"], "city": "الرياض",
+     "location_id": "LOC-001", "location": "مطار الرياض", "plate": "DEF 4567",
+     "image": "/images/cars/fortuner-2024.jpg", "rating": 4.7},
+    {"id": "CAR-005", "brand": "نيسان", "model": "صني 2024", "category": "اقتصادية", "year": 2024, "color": "رمادي",
+     "seats": 5, "transmission": "أوتوماتيك", "fuel_type": "بنزين", "daily_rate": 120, "weekly_rate": 700,
+     "monthly_rate": 2500, "features": ["بلوتوث", "تكييف"], "city": "الرياض",
+     "location_id": "LOC-002", "location": "وسط الرياض", "plate": "EFG 5678",
+     "image": "/images/cars/sunny-2024.jpg", "rating": 4.4},
+]
+
+CAR_FIELDS = {"_id": 0, "intervals": 0}
+
+
+class BookingConflict(Exception):
+    pass
+
+
+# ==================== PRICING ====================
+
+def rental_days(pickup, dropoff):
+    """Whole days charged, any started day counts"""
+    return max(1, math.ceil((dropoff - pickup).total_seconds() / 86400))
+
+
+def rental_cost(car, days):
+    """Cheapest mix of monthly / weekly / daily rates for `days` days"""
+    daily = car["daily_rate"]
+    weekly = car.get("weekly_rate") or daily * 7
+    monthly = car.get("monthly_rate") or weekly * 30 / 7
+    rest = days % 30
+    partial = (rest // 7) * weekly + min((rest % 7) * daily, weekly)
+    return (days // 30) * monthly + min(partial, monthly)
+
+
+def quote(car, pickup, dropoff, insurance_type="basic", extras=()):
+    days = rental_days(pickup, dropoff)
+    rental = rental_cost(car, days)
+    insurance_daily = INSURANCE[insurance_type]["price"]
+    extras_daily = sum(EXTRAS[e] for e in extras)
+    total = rental + (insurance_daily + extras_daily) * days
+    return {
+        "days": days,
+        "daily_rate": car["daily_rate"],
+        "effective_daily_rate": round(rental / days, 2),
+        "insurance_daily": insurance_daily,
+        "extras_daily": extras_daily,
+        "subtotal": round(rental, 2),
+        "insurance_total": insurance_daily * days,
+        "extras_total": extras_daily * days,
+        "vat": round(total * VAT_RATE, 2),
+        "total": round(total * (1 + VAT_RATE), 2),
+    }
+
+
+# ==================== INDEX ====================
+
+class _CarSlots:
+    __slots__ = ("starts", "ends", "bookings")
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda i: i["start"])
+        self.starts = [i["start"] for i in intervals]
+        self.ends = [i["end"] for i in intervals]
+        self.bookings = [i.get("booking_id") for i in intervals]
+
+    def is_free(self, start, end):
+        i = bisect.bisect_right(self.ends, start)
+        return i == len(self.starts) or self.starts[i] >= end
+
+    def add(self, start, end, booking_id):
+        i = bisect.bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.bookings.insert(i, booking_id)
+
+    def remove(self, booking_id):
+        if booking_id in self.bookings:
+            i = self.bookings.index(booking_id)
+            del self.starts[i], self.ends[i], self.bookings[i]
+
+
+class FleetIndex:
+    def __init__(self):
+        self.cars = {}          # car_id -> car doc (without intervals)
+        self.slots = {}         # car_id -> _CarSlots
+        self.by_city = {}       # city -> [car_id]
+        self.loaded_at = {}     # city -> monotonic time
+        self._lock = threading.Lock()
+        self._seeded = False
+
+    def ensure_seeded(self, db):
+        if self._seeded:
+            return
+        db.rental_cars.create_index("id", unique=True)
+        db.rental_cars.create_index([("city", ASCENDING), ("category", ASCENDING)])
+        db.car_bookings.create_index([("user_id", ASCENDING), ("created_at", ASCENDING)])
+        db.car_bookings.create_index("id", unique=True)
+        if db.rental_cars.count_documents({}, limit=1) == 0:
+            db.rental_cars.insert_many([{**car, "status": "active", "intervals": []} for car in DEFAULT_FLEET])
+        self._seeded = True
+
+    def load_city(self, db, city, force=False):
+        if not force and time.monotonic() - self.loaded_at.get(city, -INDEX_TTL) < INDEX_TTL:
+            return
+        self.ensure_seeded(db)
+        docs = list(db.rental_cars.find({"city": city, "status": "active"}, {"_id": 0}))
+        with self._lock:
+            ids = []
+            for doc in docs:
+                intervals = doc.pop("intervals", None) or []
+                self.cars[doc["id"]] = doc
+                self.slots[doc["id"]] = _CarSlots(intervals)
+                ids.append(doc["id"])
+            self.by_city[city] = ids
+            self.loaded_at[city] = time.monotonic()
+
+    def car(self, db, car_id):
+        if car_id not in self.cars:
+            doc = db.rental_cars.find_one({"id": car_id}, {"_id": 0, "city": 1})
+            if not doc:
+                return None
+            self.load_city(db, doc["city"], force=True)
+        else:
+            self.load_city(db, self.cars[car_id]["city"])
+        return self.cars.get(car_id)
+
+    def available(self, db, city, start, end, category=None):
+        """Cars in `city` free for the whole of [start, end)"""
+        self.load_city(db, city)
+        result = []
+        for car_id in self.by_city.get(city, []):
+            car = self.cars[car_id]
+            if category and car.get("category") != category:
+                continue
+            if self.slots[car_id].is_free(start, end):
+                result.append(car)
+        return result
+
+    def is_free(self, db, car_id, start, end):
+        return self.car(db, car_id) is not None and self.slots[car_id].is_free(start, end)
+
+    def calendar(self, db, car_id, days=14):
+        """Per-day availability for the next `days` days"""
+        self.car(db, car_id)
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        slots = self.slots[car_id]
+        return [{"date": (today + timedelta(days=i)).strftime("%Y-%m-%d"),
+                 "available": slots.is_free(today + timedelta(days=i), today + timedelta(days=i + 1))}
+                for i in range(days)]
+
+    # ---------- writes ----------
+
+    def reserve(self, db, car_id, start, end, booking_id):
+        """Atomically claim [start, end) on the car or raise BookingConflict"""
+        result = db.rental_cars.update_one(
+            {"id": car_id, "status": "active",
+             "intervals": {"$not": {"$elemMatch": {"start": {"$lt": end}, "end": {"$gt": start}}}}},
+            {"$push": {"intervals": {"start": start, "end": end, "booking_id": booking_id}}})
+        if not result.modified_count:
+            # Someone else got there first: refresh this car's slots
+            self.load_city(db, self.cars[car_id]["city"], force=True)
+            raise BookingConflict()
+        db.rental_cars.update_one({"id": car_id},
+                                  {"$pull": {"intervals": {"end": {"$lt": datetime.utcnow() - HISTORY_KEEP}}}})
+        with self._lock:
+            self.slots[car_id].add(start, end, booking_id)
+
+    def release(self, db, car_id, booking_id):
+        db.rental_cars.update_one({"id": car_id}, {"$pull": {"intervals": {"booking_id": booking_id}}})
+        with self._lock:
+            if car_id in self.slots:
+                self.slots[car_id].remove(booking_id)
+
+
+fleet_index = FleetIndex()
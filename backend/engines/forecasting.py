@@ -0,0 +1,316 @@
+"""
+Demand and sales forecasting from real orders.
+
+Daily series are built with one aggregation over `orders` per request type
+and resampled onto a dense zero-filled day grid with NumPy (np.add.at into
+an n_series x n_days matrix), per product, per category or in total.
+
+Each series is fitted with two lightweight models and the one with the
+lower one-step-ahead error over the last weeks wins:
+
+  * damped additive Holt-Winters with a weekly season (small grid search
+    over alpha / beta / gamma), and
+  * seasonal naive: recent level times multiplicative weekday factors.
+
+Fitted state (level, trend, season, residual sigma) is cached in-process
+and in `forecast_models`, keyed by series and the last complete day of
+data, so a series is refitted at most once per day; serving a forecast is
+just extrapolating the stored state. Bulk refits (scripts/fit_forecasts.py)
+fan out over a process pool.
+"""
+import itertools
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+SEASON = 7
+HISTORY_DAYS = 365
+MIN_HISTORY = 2 * SEASON
+VALIDATION_DAYS = 28
+DAMPING = 0.9
+INTERVAL_Z = 1.28          # ~80% prediction interval
+POOL_MIN_SERIES = 32       # below this, fitting inline beats process start-up
+
+ALPHAS = (0.1, 0.3, 0.5)
+BETAS = (0.0, 0.05, 0.15)
+GAMMAS = (0.05, 0.2, 0.4)
+
+METRICS = ("units", "revenue", "orders")
+MONTHS_AR = ["يناير", "فبراير", "مارس", "أبريل", "مايو", "يونيو",
+             "يوليو", "أغسطس", "سبتمبر", "أكتوبر", "نوفمبر", "ديسمبر"]
+
+
+# ==================== SERIES ====================
+
+def _day_grid(end_date, days):
+    start = end_date - timedelta(days=days - 1)
+    return start, np.datetime64(start.isoformat(), "D")
+
+
+def resample_daily(rows, keys, end_date, days=HISTORY_DAYS):
+    """
+    rows: iterable of (key, 'YYYY-MM-DD', value). Returns (keys, start date,
+    matrix) with one zero-filled row per key over `days` days to end_date.
+    """
+    start, start64 = _day_grid(end_date, days)
+    index = {key: i for i, key in enumerate(keys)}
+    row_idx, day_idx, values = [], [], []
+    for key, day, value in rows:
+        i = index.get(key)
+        if i is None:
+            continue
+        row_idx.append(i)
+        day_idx.append(day)
+        values.append(value)
+    matrix = np.zeros((len(keys), days), dtype=np.float64)
+    if values:
+        offsets = (np.array(day_idx, dtype="datetime64[D]") - start64).astype(np.int64)
+        keep = (offsets >= 0) & (offsets < days)
+        np.add.at(matrix, (np.array(row_idx)[keep], offsets[keep]), np.array(values, dtype=np.float64)[keep])
+    return keys, start, matrix
+
+
+def last_complete_day():
+    return datetime.utcnow().date() - timedelta(days=1)
+
+
+def _order_match(since):
+    return {"status": {"$ne": "cancelled"}, "created_at": {"$gte": since.isoformat()}}
+
+
+def item_rows(db, since, metric="units", product_ids=None):
+    """(product_id, day, value) per order line, aggregated per day in Mongo"""
+    value = "$items.quantity" if metric == "units" else \
+        {"$ifNull": ["$items.item_total", {"$multiply": ["$items.price", "$items.quantity"]}]}
+    pipeline = [
+        {"$match": _order_match(since)},
+        {"$unwind": "$items"},
+    ]
+    if product_ids:
+        pipeline.append({"$match": {"items.product_id": {"$in": list(product_ids)}}})
+    pipeline.append({"$group": {
+        "_id": {"p": "$items.product_id", "d": {"$substr": ["$created_at", 0, 10]}},
+        "v": {"$sum": value},
+    }})
+    return [(r["_id"]["p"], r["_id"]["d"], r["v"] or 0) for r in db.orders.aggregate(pipeline, allowDiskUse=True)]
+
+
+def total_rows(db, since, metric="revenue"):
+    value = "$total" if metric == "revenue" else 1
+    pipeline = [
+        {"$match": _order_match(since)},
+        {"$group": {"_id": {"$substr": ["$created_at", 0, 10]}, "v": {"$sum": value}}},
+    ]
+    return [("total", r["_id"], r["v"] or 0) for r in db.orders.aggregate(pipeline)]
+
+
+def build_series(db, level="total", metric="revenue", keys=None, days=HISTORY_DAYS, end_date=None):
+    """
+    Dense daily series ending at the last complete day.
+    level: 'total', 'product' or 'category'. Returns (keys, start, matrix).
+    """
+    end_date = end_date or last_complete_day()
+    since = end_date - timedelta(days=days - 1)
+    if level == "total":
+        return resample_daily(total_rows(db, since, metric), ["total"], end_date, days)
+
+    if level == "product":
+        rows = item_rows(db, since, metric, keys)
+        keys = list(keys) if keys else sorted({r[0] for r in rows if r[0]})
+        return resample_daily(rows, keys, end_date, days)
+
+    # Category: product-level rows folded through one product -> category lookup
+    query = {"category": {"$in": list(keys)}} if keys else {}
+    category_of = {p["id"]: p.get("category") for p in db.products.find(query, {"_id": 0, "id": 1, "category": 1})}
+    rows = [(category_of.get(pid), day, v) for pid, day, v in item_rows(db, since, metric, category_of if keys else None)]
+    keys = list(keys) if keys else sorted({r[0] for r in rows if r[0]})
+    return resample_daily(rows, keys, end_date, days)
+
+
+# ==================== MODELS ====================
+
+def _trim(y):
+    """Drop leading zeros (before the product existed)"""
+    nonzero = np.flatnonzero(y)
+    return y[nonzero[0]:] if len(nonzero) else y[:0]
+
+
+def _holt_winters(y, alpha, beta, gamma):
+    """One pass of damped additive Holt-Winters; returns (sse tail, state)"""
+    m = SEASON
+    level = y[:m].mean()
+    trend = (y[m:2 * m].mean() - y[:m].mean()) / m if len(y) >= 2 * m else 0.0
+    season = list(y[:m] - level)
+    errors = []
+    for t in range(m, len(y)):
+        s = season[t % m]
+        forecast = level + DAMPING * trend + s
+        errors.append(y[t] - forecast)
+        new_level = alpha * (y[t] - s) + (1 - alpha) * (level + DAMPING * trend)
+        trend = beta * (new_level - level) + (1 - beta) * DAMPING * trend
+        season[t % m] = gamma * (y[t] - new_level) + (1 - gamma) * s
+        level = new_level
+    tail = np.array(errors[-VALIDATION_DAYS:])
+    return float(np.abs(tail).mean()) if len(tail) else math.inf, {
+        "level": float(level), "trend": float(trend),
+        "season": [float(season[(len(y) + h) % m]) for h in range(m)],  # aligned to the next day
+        "sigma": float(np.std(errors)) if errors else 0.0,
+    }
+
+
+def _seasonal_naive(y):
+    """Recent level x weekday factors; returns (mae tail, state)"""
+    m = SEASON
+    n = len(y)
+    window = y[-8 * m:] if n >= 8 * m else y[-(n // m) * m:]
+    level = float(window[-4 * m:].mean()) if len(window) else 0.0
+    overall = window.mean() if len(window) else 0.0
+    offset = n - len(window)
+    factors = np.ones(m)
+    if overall > 0:
+        for d in range(m):
+            factors[d] = window[(np.arange(len(window)) + offset) % m == d].mean() / overall
+    predicted = np.array([y[t - m] for t in range(max(m, n - VALIDATION_DAYS), n)])
+    actual = y[max(m, n - VALIDATION_DAYS):]
+    errors = actual - predicted
+    return float(np.abs(errors).mean()) if len(errors) else math.inf, {
+        "level": level, "trend": 0.0,
+        "season": [float(factors[(n + h) % m]) for h in range(m)],
+        "sigma": float(np.std(y[-VALIDATION_DAYS:] - level * factors[np.arange(n - min(n, VALIDATION_DAYS), n) % m]))
+                 if n else 0.0,
+    }
+
+
+def fit_series(y):
+    """Fit both models to one daily series and keep the better one"""
+    y = _trim(np.asarray(y, dtype=np.float64))
+    n = len(y)
+    mean = float(y.mean()) if n else 0.0
+    if n < MIN_HISTORY:
+        return {"model": "mean", "level": mean, "trend": 0.0, "season": [0.0] * SEASON,
+                "sigma": float(y.std()) if n else 0.0, "mae": None, "n_obs": n, "scale": mean}
+
+    best_mae, best = _seasonal_naive(y)
+    best["model"] = "seasonal_naive"
+    for alpha, beta, gamma in itertools.product(ALPHAS, BETAS, GAMMAS):
+        mae, state = _holt_winters(y, alpha, beta, gamma)
+        if mae < best_mae:
+            best_mae, best = mae, {**state, "model": "holt_winters", "alpha": alpha, "beta": beta, "gamma": gamma}
+    best["mae"] = round(best_mae, 4)
+    best["n_obs"] = n
+    best["scale"] = float(y[-VALIDATION_DAYS:].mean())
+    return best
+
+
+def forecast_from_state(state, horizon, seasonality=True, trend=True):
+    """Extrapolate a fitted state; returns (point, low, high) arrays"""
+    h = np.arange(1, horizon + 1)
+    season = np.array(state["season"])[(h - 1) % SEASON]
+    if state["model"] == "seasonal_naive":
+        point = state["level"] * (season if seasonality else 1.0)
+    else:
+        damped = DAMPING * (1 - DAMPING ** h) / (1 - DAMPING)
+        point = state["level"] + (state["trend"] * damped if trend else 0.0) + (season if seasonality else 0.0)
+    point = np.maximum(point, 0.0)
+    spread = INTERVAL_Z * state["sigma"] * np.sqrt(h)
+    return point, np.maximum(point - spread, 0.0), point + spread
+
+
+def accuracy(state):
+    """100 - weighted MAPE over the validation tail, as a percentage"""
+    if state.get("mae") is None or not state.get("scale"):
+        return None
+    return round(max(0.0, 100 * (1 - state["mae"] / state["scale"])), 1)
+
+
+# ==================== CACHE / SERVING ====================
+
+def _fit_pairs(pairs):
+    return [(key, fit_series(y)) for key, y in pairs]
+
+
+def fit_many(series, workers=None):
+    """{key: y} -> {key: state}; large batches are spread over a process pool"""
+    items = list(series.items())
+    if len(items) < POOL_MIN_SERIES:
+        return dict(_fit_pairs(items))
+    workers = workers or max((os.cpu_count() or 2) - 1, 1)
+    size = max(len(items) // (workers * 4), 1)
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return {key: state for chunk in pool.map(_fit_pairs, chunks) for key, state in chunk}
+
+
+class ForecastCache:
+    """Fitted states keyed by (series key, last data day), in memory and in Mongo"""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get(self, db, series_key, last_day):
+        key = (series_key, last_day)
+        state = self._states.get(key)
+        if state is None and db is not None:
+            doc = db.forecast_models.find_one({"series": series_key, "last_day": last_day}, {"_id": 0, "state": 1})
+            if doc:
+                state = doc["state"]
+                with self._lock:
+                    self._states[key] = state
+        return state
+
+    def put(self, db, series_key, last_day, state):
+        state = {**state, "fitted_at": datetime.utcnow().isoformat()}
+        with self._lock:
+            # Older days for this series are superseded
+            for stale in [k for k in self._states if k[0] == series_key and k[1] != last_day]:
+                del self._states[stale]
+            self._states[(series_key, last_day)] = state
+        if db is not None:
+            db.forecast_models.update_one({"series": series_key},
+                                          {"$set": {"last_day": last_day, "state": state}}, upsert=True)
+        return state
+
+
+forecast_cache = ForecastCache()
+
+
+def series_key(level, metric, key):
+    return f"{level}:{metric}:{key}"
+
+
+def get_state(db, level, metric, key):
+    """Cached fitted state for one series, fitting it on a miss"""
+    last_day = last_complete_day().isoformat()
+    skey = series_key(level, metric, key)
+    state = forecast_cache.get(db, skey, last_day)
+    if state is None:
+        keys, _, matrix = build_series(db, level, metric, None if level == "total" else [key])
+        state = forecast_cache.put(db, skey, last_day, fit_series(matrix[0]))
+    return state
+
+
+def daily_forecast(db, level, metric, key, horizon, seasonality=True, trend=True):
+    """[{date, value, low, high}] for the `horizon` days after the last complete day"""
+    state = get_state(db, level, metric, key)
+    point, low, high = forecast_from_state(state, horizon, seasonality, trend)
+    first = last_complete_day() + timedelta(days=1)
+    return state, [
+        {"date": (first + timedelta(days=i)).isoformat(), "value": float(point[i]),
+         "low": float(low[i]), "high": float(high[i])}
+        for i in range(horizon)
+    ]
+
+
+def refit_all(db, level="product", metric="units", workers=None):
+    """Bulk refit for every series at `level`; returns the number fitted"""
+    last_day = last_complete_day().isoformat()
+    keys, _, matrix = build_series(db, level, metric)
+    states = fit_many({key: matrix[i] for i, key in enumerate(keys)}, workers)
+    for key, state in states.items():
+        forecast_cache.put(db, series_key(level, metric, key), last_day, state)
+    return len(states)
@@ -0,0 +1,339 @@
+"""
+Loyalty points ledger.
+
+Every points movement is an append-only row in `loyalty_ledger` carrying a
+unique idempotency key (e.g. "order:<id>"), so replays and retries post
+once. The balance lives materialised in `loyalty_points` and is only ever
+changed with an atomic $inc, so reads are a single find_one and concurrent
+posts cannot lose updates. Redemptions decrement conditionally
+(points >= n), so balances never go negative; like earns, their ledger row
+is written first and dropped again if the balance does not cover it.
+
+Earned points expire EXPIRY_DAYS after they were earned, oldest first:
+for a user, the points that expire by time T are
+
+    max(0, earned with expires_at <= T - all debits so far)
+
+(debits = redemptions + earlier expiries), which needs no per-entry
+bookkeeping. Expiring users are found through the partial index on
+earn entries' expires_at.
+
+Tiers follow the balance and are recomputed only for the users a write
+touched. Ledger rows stay `applied: False` until their $inc has landed;
+reconcile() rebuilds those users' balances from the ledger after a crash.
+"""
+import itertools
+import math
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+EXPIRY_DAYS = 365
+EXPIRING_SOON_DAYS = 30
+POINTS_PER_UNIT = 1          # points per currency unit of a delivered order
+CHUNK_SIZE = 1000
+
+TIERS = [("platinum", 1000), ("gold", 500), ("silver", 200), ("bronze", 0)]
+TIER_NAMES_AR = {"bronze": "برونزي", "silver": "فضي", "gold": "ذهبي", "platinum": "بلاتيني"}
+
+
+class InsufficientPoints(Exception):
+    pass
+
+
+def tier_for(points):
+    for name, threshold in TIERS:
+        if points >= threshold:
+            return name
+    return "bronze"
+
+
+def ensure_indexes(db):
+    db.loyalty_ledger.create_index("idempotency_key", unique=True)
+    db.loyalty_ledger.create_index([("user_id", ASCENDING), ("created_at", ASCENDING)])
+    db.loyalty_ledger.create_index("expires_at", partialFilterExpression={"type": "earn"})
+    db.loyalty_ledger.create_index("applied", partialFilterExpression={"applied": False})
+    db.loyalty_points.create_index("user_id", unique=True)
+
+
+def _entry(user_id, points, entry_type, source, key, now, expires=True):
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "points": points,
+        "type": entry_type,
+        "source": source,
+        "idempotency_key": key or f"{entry_type}:{uuid.uuid4()}",
+        "created_at": now.isoformat(),
+        "expires_at": now + timedelta(days=EXPIRY_DAYS) if entry_type == "earn" and expires else None,
+        "applied": False,
+    }
+
+
+def _apply_balance(db, user_id, points, now):
+    """$inc the balance and fix the tier if it changed; returns the balance doc"""
+    inc = {"points": points}
+    if points > 0:
+        inc["lifetime_points"] = points
+    balance = db.loyalty_points.find_one_and_update(
+        {"user_id": user_id},
+        {"$inc": inc, "$set": {"updated_at": now.isoformat()}, "$setOnInsert": {"tier": "bronze"}},
+        upsert=True, return_document=ReturnDocument.AFTER, projection={"_id": 0})
+    tier = tier_for(balance["points"])
+    if tier != balance.get("tier"):
+        db.loyalty_points.update_one({"user_id": user_id}, {"$set": {"tier": tier}})
+        balance["tier"] = tier
+    return balance
+
+
+def get_balance(db, user_id):
+    return db.loyalty_points.find_one({"user_id": user_id}, {"_id": 0}) or \
+        {"user_id": user_id, "points": 0, "lifetime_points": 0, "tier": "bronze"}
+
+
+def earn(db, user_id, points, source, idempotency_key=None):
+    """Credit points once per key; returns (balance, replayed)"""
+    if points <= 0:
+        raise ValueError("points must be positive")
+    now = datetime.utcnow()
+    entry = _entry(user_id, int(points), "earn", source, idempotency_key, now)
+    try:
+        db.loyalty_ledger.insert_one(entry)
+    except DuplicateKeyError:
+        return get_balance(db, user_id), True
+    balance = _apply_balance(db, user_id, entry["points"], now)
+    db.loyalty_ledger.update_one({"id": entry["id"]}, {"$set": {"applied": True}})
+    return balance, False
+
+
+def redeem(db, user_id, points, source, idempotency_key=None, entry_type="redeem"):
+    """Debit points if the balance covers them; returns (balance, replayed)"""
+    if points <= 0:
+        raise ValueError("points must be positive")
+    now = datetime.utcnow()
+    entry = _entry(user_id, -int(points), entry_type, source, idempotency_key, now)
+    try:
+        db.loyalty_ledger.insert_one(entry)
+    except DuplicateKeyError:
+        return get_balance(db, user_id), True
+    taken = db.loyalty_points.update_one(
+        {"user_id": user_id, "points": {"$gte": points}},
+        {"$inc": {"points": -points}, "$set": {"updated_at": now.isoformat()}})
+    if not taken.modified_count:
+        # Nothing was debited: drop the row so the key can be retried
+        db.loyalty_ledger.delete_one({"id": entry["id"], "applied": False})
+        raise InsufficientPoints()
+    db.loyalty_ledger.update_one({"id": entry["id"]}, {"$set": {"applied": True}})
+    return _apply_balance(db, user_id, 0, now), False
+
+
+def lifetime_redemptions(db, user_id):
+    """Points the user has redeemed, over the whole ledger"""
+    result = list(db.loyalty_ledger.aggregate([
+        {"$match": {"user_id": user_id, "type": "redeem"}},
+        {"$group": {"_id": None, "points": {"$sum": "$points"}}},
+    ]))
+    return -result[0]["points"] if result else 0
+
+
+def history(db, user_id, limit=50):
+    return list(db.loyalty_ledger.find(
+        {"user_id": user_id}, {"_id": 0, "expires_at": 0, "applied": 0}
+    ).sort("created_at", -1).limit(limit))
+
+
+# ==================== EXPIRY ====================
+
+def _expirable(db, user_ids, cutoff):
+    """{user_id: points that have expired by `cutoff` and are still unspent}"""
+    pipeline = [
+        {"$match": {"user_id": {"$in": list(user_ids)}}},
+        {"$group": {
+            "_id": "$user_id",
+            "earned": {"$sum": {"$cond": [
+                {"$and": [{"$eq": ["$type", "earn"]}, {"$lte": ["$expires_at", cutoff]}]}, "$points", 0]}},
+            "debits": {"$sum": {"$cond": [{"$lt": ["$points", 0]}, {"$multiply": ["$points", -1]}, 0]}},
+        }},
+    ]
+    return {r["_id"]: max(0, r["earned"] - r["debits"]) for r in db.loyalty_ledger.aggregate(pipeline)}
+
+
+def expiring_soon(db, user_id, days=EXPIRING_SOON_DAYS):
+    cutoff = datetime.utcnow() + timedelta(days=days)
+    already = _expirable(db, [user_id], datetime.utcnow()).get(user_id, 0)
+    return max(0, _expirable(db, [user_id], cutoff).get(user_id, 0) - already)
+
+
+def expire_points(db, since, until=None, chunk_size=CHUNK_SIZE):
+    """Post expiry debits for users with earn entries expiring in (since, until]"""
+    until = until or datetime.utcnow()
+    users = db.loyalty_ledger.distinct("user_id", {"type": "earn", "expires_at": {"$gt": since, "$lte": until}})
+    expired = 0
+    for start in range(0, len(users), chunk_size):
+        for user_id, points in _expirable(db, users[start:start + chunk_size], until).items():
+            if points <= 0:
+                continue
+            balance = get_balance(db, user_id)
+            points = min(points, balance["points"])
+            if points <= 0:
+                continue
+            try:
+                redeem(db, user_id, points, "انتهاء صلاحية النقاط",
+                       f"expire:{user_id}:{until.date().isoformat()}", entry_type="expire")
+                expired += points
+            except InsufficientPoints:
+                pass
+    return expired
+
+
+# ==================== BULK ACCRUAL ====================
+
+def order_points(order):
+    return int(math.floor((order.get("total") or 0) * POINTS_PER_UNIT))
+
+
+def _inserted(docs, error):
+    """Docs of an unordered insert_many that were not rejected as duplicates"""
+    failed = {e["index"] for e in error.details.get("writeErrors", [])}
+    other = [e for e in error.details.get("writeErrors", []) if e.get("code") != 11000]
+    if other:
+        raise error
+    return [d for i, d in enumerate(docs) if i not in failed]
+
+
+def post_entries(db, entries):
+    """Insert ledger entries (duplicates skipped) and apply them to balances in bulk"""
+    if not entries:
+        return []
+    try:
+        db.loyalty_ledger.insert_many(entries, ordered=False)
+        inserted = entries
+    except BulkWriteError as e:
+        inserted = _inserted(entries, e)
+    if not inserted:
+        return []
+
+    now = datetime.utcnow()
+    totals, lifetime = {}, {}
+    for entry in inserted:
+        totals[entry["user_id"]] = totals.get(entry["user_id"], 0) + entry["points"]
+        if entry["points"] > 0:
+            lifetime[entry["user_id"]] = lifetime.get(entry["user_id"], 0) + entry["points"]
+    db.loyalty_points.bulk_write([
+        UpdateOne({"user_id": user_id}, {
+            "$inc": {"points": points, "lifetime_points": lifetime.get(user_id, 0)},
+            "$set": {"updated_at": now.isoformat()}, "$setOnInsert": {"tier": "bronze"}}, upsert=True)
+        for user_id, points in totals.items()
+    ], ordered=False)
+    db.loyalty_ledger.update_many({"id": {"$in": [e["id"] for e in inserted]}}, {"$set": {"applied": True}})
+    update_tiers(db, list(totals))
+    return inserted
+
+
+def update_tiers(db, user_ids):
+    """Recompute tiers for the given users only"""
+    ops = []
+    for balance in db.loyalty_points.find({"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "points": 1, "tier": 1}):
+        tier = tier_for(balance.get("points") or 0)
+        if tier != balance.get("tier"):
+            ops.append(UpdateOne({"user_id": balance["user_id"]}, {"$set": {"tier": tier}}))
+    if ops:
+        db.loyalty_points.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def order_entry(order, now=None):
+    return _entry(order["user_id"], order_points(order), "earn", f"طلب #{order['id'][:8]}",
+                  f"order:{order['id']}", now or datetime.utcnow())
+
+
+def accrue_order(db, order):
+    """Credit a delivered order once; returns points posted (0 on replay)"""
+    if not order.get("user_id") or order_points(order) <= 0:
+        return 0
+    _, replayed = earn(db, order["user_id"], order_points(order), f"طلب #{order['id'][:8]}", f"order:{order['id']}")
+    return 0 if replayed else order_points(order)
+
+
+def reverse_order(db, order):
+    """Take back a refunded order's points (as far as the balance allows)"""
+    if not db.loyalty_ledger.find_one({"idempotency_key": f"order:{order['id']}"}, {"_id": 1}):
+        return 0
+    points = min(order_points(order), get_balance(db, order["user_id"])["points"])
+    if points <= 0:
+        return 0
+    try:
+        _, replayed = redeem(db, order["user_id"], points, f"استرجاع طلب #{order['id'][:8]}",
+                             f"order-reversal:{order['id']}", entry_type="reversal")
+    except InsufficientPoints:
+        return 0
+    return 0 if replayed else points
+
+
+def accrue_delivered(db, since, until, chunk_size=CHUNK_SIZE):
+    """Post points for every order delivered in [since, until); returns (orders, points) posted"""
+    window = {"$gte": since.isoformat(), "$lt": until.isoformat()}
+    cursor = db.orders.find({
+        "status": "delivered",
+        "$or": [{"status_updated_at": window},
+                {"status_updated_at": {"$exists": False}, "created_at": window}],
+    }, {"_id": 0, "id": 1, "user_id": 1, "total": 1}).batch_size(chunk_size)
+
+    posted_orders = posted_points = 0
+    now = datetime.utcnow()
+    while True:
+        chunk = list(itertools.islice(cursor, chunk_size))
+        if not chunk:
+            break
+        entries = [order_entry(o, now) for o in chunk if o.get("user_id") and order_points(o) > 0]
+        inserted = post_entries(db, entries)
+        posted_orders += len(inserted)
+        posted_points += sum(e["points"] for e in inserted)
+    return posted_orders, posted_points
+
+
+def open_balances(db, chunk_size=CHUNK_SIZE):
+    """
+    One-off: record balances that predate the ledger as non-expiring opening
+    entries (already applied), so reconcile() sums to the same balance.
+    """
+    cursor = db.loyalty_points.find({"points": {"$gt": 0}}, {"_id": 0, "user_id": 1, "points": 1})
+    now = datetime.utcnow()
+    opened = 0
+    while True:
+        chunk = list(itertools.islice(cursor, chunk_size))
+        if not chunk:
+            return opened
+        entries = []
+        for balance in chunk:
+            entry = _entry(balance["user_id"], balance["points"], "adjust", "رصيد افتتاحي",
+                           f"opening:{balance['user_id']}", now)
+            entry["applied"] = True
+            entries.append(entry)
+        try:
+            db.loyalty_ledger.insert_many(entries, ordered=False)
+            opened += len(entries)
+        except BulkWriteError as e:
+            opened += len(_inserted(entries, e))
+
+
+def reconcile(db, chunk_size=CHUNK_SIZE):
+    """Rebuild balances of users with entries whose $inc may not have landed"""
+    users = db.loyalty_ledger.distinct("user_id", {"applied": False})
+    for start in range(0, len(users), chunk_size):
+        batch = users[start:start + chunk_size]
+        sums = {r["_id"]: r for r in db.loyalty_ledger.aggregate([
+            {"$match": {"user_id": {"$in": batch}}},
+            {"$group": {"_id": "$user_id", "points": {"$sum": "$points"},
+                        "lifetime": {"$sum": {"$cond": [{"$gt": ["$points", 0]}, "$points", 0]}}}},
+        ])}
+        db.loyalty_points.bulk_write([
+            UpdateOne({"user_id": user_id}, {"$set": {"points": r["points"], "lifetime_points": r["lifetime"]}},
+                      upsert=True)
+            for user_id, r in sums.items()
+        ], ordered=False)
+        db.loyalty_ledger.update_many({"user_id": {"$in": batch}, "applied": False}, {"$set": {"applied": True}})
+        update_tiers(db, batch)
+    return len(users)
@@ -0,0 +1,356 @@
+"""
+Dynamic pricing: auto-pricing rules evaluated over the catalog.
+
+Rules live in `pricing_rules`. A product is governed by its most specific
+active rule (product > category > catalog-wide). A run streams products in
+chunks, loads the chunk's competitor floor prices with one $in query, and
+evaluates every product of the chunk at once on NumPy arrays (price, cost,
+stock, competitor min, rule parameters):
+
+    target = competitor_min * (1 - undercut)   if the rule matches competitors
+           = price                             otherwise
+    never cut price on low stock, move at most MAX_STEP per run,
+    then clamp to the rule's margin band over cost.
+
+Changes from auto-apply rules are written with chunked unordered bulk_write
+(guarded on the old price, so concurrent edits win) and every change is
+appended to the `price_history` time-series collection; other rules leave
+a pending suggestion in `pricing_suggestions`.
+
+PricingScheduler runs due rules in the background (hourly / daily /
+realtime); scripts/run_pricing.py runs them from cron.
+"""
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import CollectionInvalid, OperationFailure, PyMongoError
+
+from core.responses import content_versions
+from core.shared_state import Leader
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+DEFAULT_COST_RATIO = 0.7   # cost estimate when the product has no cost
+LOW_STOCK = 5
+MAX_STEP = 0.2             # max relative move per run
+MIN_CHANGE = 0.005         # ignore changes under 0.5%
+MAX_MARGIN = 95.0
+SCHEDULE_INTERVALS = {
+    "realtime": timedelta(minutes=5),
+    "hourly": timedelta(hours=1),
+    "daily": timedelta(days=1),
+}
+SCHEDULER_TICK = 60
+
+PRODUCT_FIELDS = {"_id": 0, "id": 1, "price": 1, "cost": 1, "stock": 1, "category": 1}
+
+
+# ==================== STORAGE ====================
+
+def ensure_collections(db):
+    """price_history as a time-series collection where the server supports it"""
+    try:
+        db.create_collection("price_history", timeseries={
+            "timeField": "ts", "metaField": "product_id", "granularity": "hours"})
+    except (CollectionInvalid, OperationFailure, TypeError, NotImplementedError):
+        pass  # already exists, or pre-5.0 server: plain collection + index below
+    db.price_history.create_index([("product_id", ASCENDING), ("ts", DESCENDING)])
+    db.pricing_suggestions.create_index("product_id", unique=True)
+    db.pricing_rules.create_index("id", unique=True)
+
+
+def history_doc(product_id, old_price, new_price, source, rule_id=None, ts=None):
+    return {
+        "ts": ts or datetime.utcnow(),
+        "product_id": product_id,
+        "price": float(new_price),
+        "old_price": float(old_price) if old_price is not None else None,
+        "source": source,
+        "rule_id": rule_id,
+    }
+
+
+def record_price_change(db, product_id, old_price, new_price, source="manual", rule_id=None):
+    if old_price is not None and float(old_price) == float(new_price):
+        return
+    db.price_history.insert_one(history_doc(product_id, old_price, new_price, source, rule_id))
+
+
+def competitor_floor(db, product_ids):
+    """{product_id: lowest in-stock competitor price} from competitor snapshots"""
+    cursor = db.competitor_snapshots.find(
+        {"product_id": {"$in": list(product_ids)}, "min_price": {"$ne": None}},
+        {"_id": 0, "product_id": 1, "min_price": 1})
+    return {doc["product_id"]: doc["min_price"] for doc in cursor}
+
+
+# ==================== RULES ====================
+
+def next_run(rule, now=None):
+    return (now or datetime.utcnow()) + SCHEDULE_INTERVALS.get(rule.get("schedule"), SCHEDULE_INTERVALS["daily"])
+
+
+class RuleSet:
+    """Active rules indexed for most-specific-wins resolution"""
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.by_product = {}
+        self.by_category = {}
+        self.catalog = None
+        for i, rule in enumerate(self.rules):
+            if rule.get("product_id"):
+                self.by_product.setdefault(rule["product_id"], i)
+            elif rule.get("category"):
+                self.by_category.setdefault(rule["category"], i)
+            elif self.catalog is None:
+                self.catalog = i
+        as_array = lambda field, dtype: np.array([r.get(field) or 0 for r in self.rules], dtype=dtype)
+        self.min_margin = np.clip(as_array("min_margin", np.float64), 0, MAX_MARGIN)
+        self.max_margin = np.clip(as_array("max_margin", np.float64), 0, MAX_MARGIN)
+        self.undercut = np.clip(as_array("undercut_percentage", np.float64), 0, 50)
+        self.match = as_array("match_competitor", bool)
+        self.auto_apply = as_array("auto_apply", bool)
+
+    @classmethod
+    def load(cls, db):
+        return cls(db.pricing_rules.find({"status": "active"}, {"_id": 0}))
+
+    def resolve(self, product_ids, categories):
+        """Rule index per product, -1 where no rule applies"""
+        fallback = -1 if self.catalog is None else self.catalog
+        return np.array([
+            self.by_product.get(pid, self.by_category.get(cat, fallback))
+            for pid, cat in zip(product_ids, categories)
+        ], dtype=np.int64)
+
+    def scope_query(self, rule_ids):
+        """Products query covering the given rules"""
+        clauses = []
+        for rule in self.rules:
+            if rule["id"] not in rule_ids:
+                continue
+            if rule.get("product_id"):
+                clauses.append({"id": rule["product_id"]})
+            elif rule.get("category"):
+                clauses.append({"category": rule["category"]})
+            else:
+                return {}
+        return {"$or": clauses} if clauses else None
+
+
+def evaluate(price, cost, stock, competitor, rules, rule_idx):
+    """Vectorized rule evaluation; returns (new_price, changed mask)"""
+    applies = rule_idx >= 0
+    idx = np.where(applies, rule_idx, 0)
+    min_margin = rules.min_margin[idx] / 100
+    max_margin = np.maximum(rules.max_margin[idx], rules.min_margin[idx]) / 100
+    match = rules.match[idx] & ~np.isnan(competitor)
+
+    cost = np.where(np.isnan(cost) | (cost <= 0), price * DEFAULT_COST_RATIO, cost)
+    target = np.where(match, competitor * (1 - rules.undercut[idx] / 100), price)
+    target = np.where(stock <= LOW_STOCK, np.maximum(target, price), target)
+    target = np.clip(target, price * (1 - MAX_STEP), price * (1 + MAX_STEP))
+    target = np.clip(target, cost / (1 - min_margin), cost / (1 - max_margin))
+    target = np.round(target, 2)
+
+    changed = applies & (stock > 0) & (price > 0) & (np.abs(target - price) >= price * MIN_CHANGE)
+    return target, changed
+
+
+# ==================== RUNS ====================
+
+def _chunks(cursor, size):
+    while True:
+        chunk = list(itertools.islice(cursor, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _as_float(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def run_rules(db, rule_ids=None, chunk_size=CHUNK_SIZE, dry_run=False):
+    """
+    Evaluate active rules (or only `rule_ids`) over their products. Returns
+    per-rule stats {rule_id: {"products": n, "changed": n, "applied": n}}.
+    """
+    rules = RuleSet.load(db)
+    if not rules.rules:
+        return {}
+    due = set(rule_ids) if rule_ids else {r["id"] for r in rules.rules}
+    query = rules.scope_query(due)
+    if query is None:
+        return {}
+    due_mask = np.array([r["id"] in due for r in rules.rules])
+    stats = {r["id"]: {"products": 0, "changed": 0, "applied": 0} for r in rules.rules if r["id"] in due}
+    now = datetime.utcnow()
+
+    cursor = db.products.find(query, PRODUCT_FIELDS).batch_size(chunk_size)
+    for chunk in _chunks(cursor, chunk_size):
+        ids = [p["id"] for p in chunk]
+        rule_idx = rules.resolve(ids, [p.get("category") for p in chunk])
+        # Products governed by a more specific rule that is not due are skipped
+        rule_idx = np.where((rule_idx >= 0) & due_mask[np.maximum(rule_idx, 0)], rule_idx, -1)
+
+        floors = competitor_floor(db, ids)
+        price = _as_float([p.get("price") for p in chunk])
+        new_price, changed = evaluate(
+            np.nan_to_num(price),
+            _as_float([p.get("cost") for p in chunk]),
+            np.array([p.get("stock") or 0 for p in chunk], dtype=np.int64),
+            _as_float([floors.get(pid) for pid in ids]),
+            rules, rule_idx,
+        )
+
+        for i in np.flatnonzero(rule_idx >= 0):
+            stats[rules.rules[rule_idx[i]]["id"]]["products"] += 1
+        updates, history, suggestions = [], [], []
+        for i in np.flatnonzero(changed):
+            rule = rules.rules[rule_idx[i]]
+            stats[rule["id"]]["changed"] += 1
+            old, new = float(price[i]), float(new_price[i])
+            if rules.auto_apply[rule_idx[i]]:
+                updates.append(UpdateOne({"id": ids[i], "price": old}, {"$set": {
+                    "price": new, "price_updated_at": now.isoformat(), "updated_at": now.isoformat()}}))
+                history.append(history_doc(ids[i], old, new, "auto_rule", rule["id"], now))
+                stats[rule["id"]]["applied"] += 1
+            else:
+                suggestions.append(UpdateOne({"product_id": ids[i]}, {"$set": {
+                    "product_id": ids[i], "rule_id": rule["id"], "current_price": old,
+                    "suggested_price": new, "created_at": now.isoformat()}}, upsert=True))
+
+        if dry_run:
+            continue
+        if updates:
+            result = db.products.bulk_write(updates, ordered=False)
+            content_versions.bump("products")
+            if result.matched_count < len(updates):
+                held = {pid for pid, _, _ in _held(db, [(h["product_id"], h["old_price"], h["price"]) for h in history], result)}
+                history = [h for h in history if h["product_id"] in held]
+        if history:
+            db.price_history.insert_many(history, ordered=False)
+        if suggestions:
+            db.pricing_suggestions.bulk_write(suggestions, ordered=False)
+
+    if not dry_run:
+        for rule in rules.rules:
+            if rule["id"] in stats:
+                db.pricing_rules.update_one({"id": rule["id"]}, {"$set": {
+                    "last_run": now.isoformat(), "next_run": next_run(rule, now).isoformat(),
+                    "products_affected": stats[rule["id"]]["products"],
+                    "prices_updated": stats[rule["id"]]["applied"],
+                    "suggestions": stats[rule["id"]]["changed"] - stats[rule["id"]]["applied"],
+                }})
+    return stats
+
+
+def _held(db, changes, result):
+    """Changes whose old-price guard matched (unordered bulk results are not per-op)"""
+    if result.matched_count == len(changes):
+        return changes
+    current = {p["id"]: p["price"] for p in db.products.find(
+        {"id": {"$in": [c[0] for c in changes]}}, {"_id": 0, "id": 1, "price": 1})}
+    return [(pid, old, new) for pid, old, new in changes if current.get(pid) == new]
+
+
+def apply_prices(db, changes, source="manual"):
+    """
+    changes: [(product_id, expected_old_price, new_price)]. Writes in chunks,
+    guarded on the old price; returns the set of product ids updated.
+    """
+    now = datetime.utcnow()
+    changes = [(pid, old, new) for pid, old, new in changes if old != new]
+    applied = set()
+    for start in range(0, len(changes), CHUNK_SIZE):
+        chunk = changes[start:start + CHUNK_SIZE]
+        ops = [UpdateOne({"id": pid, "price": old}, {"$set": {
+                   "price": new, "price_updated_at": now.isoformat(), "updated_at": now.isoformat()}})
+               for pid, old, new in chunk]
+        result = db.products.bulk_write(ops, ordered=False)
+        done = _held(db, chunk, result)
+        if done:
+            db.price_history.insert_many([history_doc(pid, old, new, source, ts=now) for pid, old, new in done],
+                                         ordered=False)
+        applied.update(pid for pid, _, _ in done)
+    if applied:
+        content_versions.bump("products")
+    return applied
+
+
+def price_history(db, product_id, days=30, current_price=None):
+    """Daily closing price over the last `days` days, carried forward"""
+    since = datetime.utcnow() - timedelta(days=days)
+    events = list(db.price_history.find({"product_id": product_id, "ts": {"$gte": since}},
+                                        {"_id": 0, "ts": 1, "price": 1, "old_price": 1}).sort("ts", ASCENDING))
+    before = db.price_history.find_one({"product_id": product_id, "ts": {"$lt": since}},
+                                       {"_id": 0, "price": 1}, sort=[("ts", DESCENDING)])
+    if before:
+        price = before["price"]
+    elif events and events[0].get("old_price") is not None:
+        price = events[0]["old_price"]
+    else:
+        price = current_price
+
+    closing = {}
+    for event in events:
+        closing[event["ts"].date()] = event["price"]
+    series = []
+    for i in range(days):
+        day = (since + timedelta(days=i + 1)).date()
+        price = closing.get(day, price)
+        series.append({"date": day.isoformat(), "price": price})
+    return series, len(events)
+
+
+# ==================== SCHEDULER ====================
+
+class PricingScheduler:
+    """Background thread running rules whose next_run has passed, in the `pricing-scheduler` lease holder only"""
+
+    def __init__(self):
+        self.db = None
+        self._thread = None
+        self.leader = Leader("pricing-scheduler", ttl=SCHEDULER_TICK * 3)
+
+    def start(self, db):
+        self.db = db
+        if self._thread is not None:
+            return
+        try:
+            ensure_collections(db)
+        except PyMongoError:
+            logger.exception("Could not prepare pricing collections")
+        self._thread = threading.Thread(target=self._run, name="pricing-scheduler", daemon=True)
+        self._thread.start()
+
+    def due_rules(self):
+        now = datetime.utcnow().isoformat()
+        return [r["id"] for r in self.db.pricing_rules.find(
+            {"status": "active", "$or": [{"next_run": {"$lte": now}}, {"next_run": None}]}, {"_id": 0, "id": 1})]
+
+    def _run(self):
+        while True:
+            time.sleep(SCHEDULER_TICK)
+            if not self.leader.held():
+                continue
+            try:
+                due = self.due_rules()
+                if due:
+                    started = time.time()
+                    stats = run_rules(self.db, due)
+                    logger.info("Pricing run: %d rules, %d prices applied in %.1fs", len(stats),
+                                sum(s["applied"] for s in stats.values()), time.time() - started)
+            except Exception:
+                logger.exception("Pricing run failed")
+
+
+pricing_scheduler = PricingScheduler()
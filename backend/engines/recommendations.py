@@ -0,0 +1,228 @@
+"""
+Precomputed per-user recommendation feed.
+
+A background worker turns a user's signals (browsing_history,
+recently_viewed, wishlist, orders) into a ranked list of candidate products
+and stores it in `user_recs`, denormalised so that serving a feed is one
+indexed read plus an in-memory re-rank. The write endpoints for those
+signals call `schedule(user_id)`; repeated triggers for the same user while
+a refresh is queued collapse into one job.
+
+Candidates come from the co-purchase model (purchases, wishlist), the
+content similarity index (views) and the user's strongest categories.
+"""
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from engines.copurchase import copurchase_index
+from engines.similarity import similarity_index
+
+logger = logging.getLogger("ocean.recommendations")
+
+FEED_SIZE = 50
+# Feeds older than this are served but refreshed in the background
+FEED_TTL = 6 * 3600
+# Signal weights per source; recency decays them by position
+SIGNAL_WEIGHTS = {"purchase": 3.0, "wishlist": 2.0, "recent": 1.5, "browse": 1.0}
+RECENCY_DECAY = 0.9
+MAX_SEEDS = 20
+NEIGHBORS_PER_SEED = 10
+CATEGORY_CANDIDATES = 30
+MAX_PER_CATEGORY = 3
+
+PRODUCT_FIELDS = {"_id": 0, "id": 1, "title": 1, "price": 1, "category": 1, "image_url": 1, "stock": 1}
+
+
+def _item_id(item):
+    """wishlist/recently viewed entries are plain ids; tolerate legacy dicts"""
+    if isinstance(item, dict):
+        return item.get("product_id") or item.get("id")
+    return item
+
+
+def user_signals(db, user_id, order_limit=10):
+    """(source, product id) pairs, most recent first within each source"""
+    signals = []
+    for order in db.orders.find({"user_id": user_id}, {"_id": 0, "items.product_id": 1}) \
+            .sort("created_at", -1).limit(order_limit):
+        signals.extend(("purchase", item.get("product_id")) for item in order.get("items", []))
+    wishlist = db.wishlist.find_one({"user_id": user_id}, {"_id": 0, "items": 1})
+    signals.extend(("wishlist", _item_id(i)) for i in (wishlist or {}).get("items", []))
+    recent = db.recently_viewed.find_one({"user_id": user_id}, {"_id": 0, "products": 1})
+    signals.extend(("recent", _item_id(i)) for i in (recent or {}).get("products", [])[:MAX_SEEDS])
+    history = db.browsing_history.find_one({"user_id": user_id}, {"_id": 0, "products": 1})
+    signals.extend(("browse", _item_id(i)) for i in (history or {}).get("products", [])[:MAX_SEEDS])
+    return [(source, pid) for source, pid in signals if pid]
+
+
+def compute_feed(db, user_id, size=FEED_SIZE):
+    """Score candidates for one user; returns the `user_recs` document"""
+    signals = user_signals(db, user_id)
+    seen = {pid for _, pid in signals}
+
+    # Weight each seed product by source and recency
+    seed_weight = {}
+    position = {}
+    for source, pid in signals:
+        rank = position.get(source, 0)
+        position[source] = rank + 1
+        seed_weight[pid] = seed_weight.get(pid, 0.0) + SIGNAL_WEIGHTS[source] * RECENCY_DECAY ** rank
+
+    seeds = sorted(seed_weight, key=seed_weight.get, reverse=True)[:MAX_SEEDS]
+    seed_products = {p["id"]: p for p in db.products.find({"id": {"$in": seeds}}, {"_id": 0, "id": 1, "category": 1})}
+
+    category_weight = {}
+    for pid in seeds:
+        category = seed_products.get(pid, {}).get("category")
+        if category:
+            category_weight[category] = category_weight.get(category, 0.0) + seed_weight[pid]
+
+    scores, reasons = {}, {}
+
+    def add(pid, score, reason):
+        if pid in seen:
+            return
+        scores[pid] = scores.get(pid, 0.0) + score
+        if score > reasons.get(pid, (None, 0))[1]:
+            reasons[pid] = (reason, score)
+
+    if seeds:
+        similarity_index.ensure_built(db)
+    for pid in seeds:
+        weight = seed_weight[pid]
+        for neighbor in copurchase_index.neighbors(pid, k=NEIGHBORS_PER_SEED):
+            add(neighbor["product_id"], weight * min(neighbor["confidence"] * 2, 1.0), "bought_together")
+        for other, similarity in similarity_index.similar(pid, k=NEIGHBORS_PER_SEED):
+            add(other, weight * max(similarity, 0.0) * 0.8, "similar")
+
+    # Category affinity, plus popular stock when there is no signal at all
+    top_categories = sorted(category_weight, key=category_weight.get, reverse=True)[:5]
+    query = {"stock": {"$gt": 0}, "id": {"$nin": list(seen)}}
+    if top_categories:
+        query["category"] = {"$in": top_categories}
+    total_weight = sum(category_weight.values()) or 1.0
+    for rank, product in enumerate(db.products.find(query, {"_id": 0, "id": 1, "category": 1})
+                                   .sort("stock", -1).limit(CATEGORY_CANDIDATES)):
+        affinity = category_weight.get(product.get("category"), 0.0) / total_weight
+        add(product["id"], 0.5 * affinity + 0.1 * RECENCY_DECAY ** rank, "category" if affinity else "popular")
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:size]
+    products = {p["id"]: p for p in db.products.find({"id": {"$in": ranked}}, PRODUCT_FIELDS)}
+    items = [
+        {**products[pid], "score": round(scores[pid], 4), "reason": reasons[pid][0]}
+        for pid in ranked if pid in products
+    ]
+    return {
+        "user_id": user_id,
+        "items": items,
+        "seen": list(seen),
+        "based_on": {
+            "purchase_history": sum(1 for s, _ in signals if s == "purchase"),
+            "wishlist": sum(1 for s, _ in signals if s == "wishlist"),
+            "recently_viewed": sum(1 for s, _ in signals if s == "recent"),
+            "browsing_history": sum(1 for s, _ in signals if s == "browse"),
+        },
+        "computed_at": time.time(),
+        "updated_at": datetime.utcnow().isoformat(),
+    }
+
+
+def refresh_feed(db, user_id):
+    feed = compute_feed(db, user_id)
+    db.user_recs.replace_one({"user_id": user_id}, feed, upsert=True)
+    return feed
+
+
+def rerank(feed, limit=8, exclude=()):
+    """
+    Serve-time pass over a stored feed: drop excluded and out-of-stock
+    items and cap any one category so the top of the list stays diverse.
+    """
+    excluded = set(exclude)
+    picked, per_category, overflow = [], {}, []
+    for item in feed.get("items", []):
+        if item["id"] in excluded or item.get("stock", 1) <= 0:
+            continue
+        category = item.get("category")
+        if per_category.get(category, 0) >= MAX_PER_CATEGORY:
+            overflow.append(item)
+            continue
+        per_category[category] = per_category.get(category, 0) + 1
+        picked.append(item)
+        if len(picked) == limit:
+            return picked
+    return (picked + overflow)[:limit]
+
+
+class FeedWorker:
+    """Single background thread draining a de-duplicated queue of user ids"""
+
+    def __init__(self):
+        self.db = None
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.processed = 0
+        self.failed = 0
+
+    def start(self, db):
+        with self._lock:
+            self.db = db
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="recs-feed-worker", daemon=True)
+            self._thread.start()
+
+    def schedule(self, user_id):
+        """Queue a refresh; no-op if one is already pending for this user"""
+        if self.db is None:
+            return
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+        self._queue.put(user_id)
+
+    def _run(self):
+        try:
+            self.db.user_recs.create_index("user_id", unique=True)
+        except Exception:
+            logger.exception("Could not create user_recs index")
+        while True:
+            user_id = self._queue.get()
+            with self._lock:
+                self._pending.discard(user_id)
+            try:
+                refresh_feed(self.db, user_id)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Recommendation feed refresh failed for %s", user_id)
+
+    @property
+    def backlog(self):
+        return self._queue.qsize()
+
+
+feed_worker = FeedWorker()
+
+
+def get_feed(db, user_id, limit=8):
+    """
+    One indexed read of the stored feed. A user without a feed gets one
+    computed inline (cold start); a stale feed is served and refreshed.
+    """
+    feed = db.user_recs.find_one({"user_id": user_id}, {"_id": 0})
+    if feed is None:
+        feed = refresh_feed(db, user_id)
+    elif time.time() - feed.get("computed_at", 0) > FEED_TTL:
+        feed_worker.schedule(user_id)
+    return {
+        "recommendations": rerank(feed, limit),
+        "based_on": feed.get("based_on", {}),
+        "generated_at": feed.get("updated_at"),
+    }
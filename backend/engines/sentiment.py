@@ -0,0 +1,439 @@
+"""
+Offline Arabic/English sentiment engine for reviews.
+
+Text is normalised (Arabic diacritics and tatweel removed, alef/yaa/taa
+marbuta variants folded, Latin lower-cased) with a single str.translate, then
+tokenised and scored against a polarity lexicon with negation and
+intensifier handling. Aspects ("delivery", "price", ...) are found by one
+pass of a precompiled Aho-Corasick automaton over the normalised text, and
+each aspect takes the polarity of the words around it.
+
+Scores are in [-1, 1] (VADER-style normalisation of the summed polarity).
+`record_review` scores a new review inline and $inc's per-target aggregates
+(`sentiment_aggregates`) and daily buckets (`sentiment_daily`);
+`backfill` does the same for existing reviews in batches.
+"""
+import bisect
+import math
+import re
+from collections import deque
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+POSITIVE_THRESHOLD = 0.3
+NEGATIVE_THRESHOLD = -0.3
+NEGATION_SCOPE = 3          # tokens after a negator whose polarity flips
+ASPECT_WINDOW = 3           # tokens either side of an aspect mention
+NORMALIZATION_ALPHA = 4.0
+ALL_TARGETS = "__all__"
+
+# ==================== NORMALIZATION ====================
+
+_DIACRITICS = [chr(c) for c in range(0x064B, 0x0653)] + ["ٰ", "ـ"]  # harakat, dagger alef, tatweel
+_FOLD = {"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي"}
+_TABLE = str.maketrans({**{d: None for d in _DIACRITICS}, **_FOLD})
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_ARABIC_RE = re.compile(r"[؀-ۿ]")
+_ARABIC_PREFIXES = ("وبال", "وال", "بال", "فال", "كال", "لل", "ال", "و", "ب", "ف", "ل")
+
+
+def normalize(text):
+    return (text or "").lower().translate(_TABLE)
+
+
+def detect_language(text):
+    return "ar" if _ARABIC_RE.search(text or "") else "en"
+
+
+# ==================== LEXICON ====================
+
+# word -> (polarity, emotion); polarity roughly -3..3
+_LEXICON_SOURCE = {
+    # Arabic positive
+    "ممتاز": (3, "joy"), "ممتازه": (3, "joy"), "رائع": (3, "joy"), "رائعه": (3, "joy"), "جميل": (2, "joy"),
+    "جميله": (2, "joy"), "جيد": (2, "trust"), "جيده": (2, "trust"), "حلو": (2, "joy"), "حلوه": (2, "joy"),
+    "افضل": (2, "trust"), "احسن": (2, "trust"), "مميز": (2, "joy"), "مذهل": (3, "surprise"), "سريع": (2, "trust"),
+    "سريعه": (2, "trust"), "نظيف": (2, "trust"), "نظيفه": (2, "trust"), "لذيذ": (3, "joy"), "لذيذه": (3, "joy"),
+    "مريح": (2, "trust"), "مريحه": (2, "trust"), "انصح": (2, "trust"), "انصحكم": (2, "trust"), "شكرا": (1, "joy"),
+    "سعيد": (2, "joy"), "راضي": (2, "trust"), "مناسب": (1, "trust"), "مناسبه": (1, "trust"), "ممتع": (2, "joy"),
+    "اصلي": (2, "trust"), "موثوق": (2, "trust"), "محترم": (2, "trust"), "رخيص": (1, "joy"), "متعاون": (2, "trust"),
+    "يستاهل": (2, "trust"), "روعه": (3, "joy"), "خرافي": (3, "surprise"), "تحفه": (3, "joy"), "احببت": (2, "joy"),
+    "عجبني": (2, "joy"), "يعجبني": (2, "joy"), "اعجبني": (2, "joy"), "ودود": (2, "trust"), "دقيق": (1, "trust"), "متقن": (2, "trust"), "فخم": (2, "joy"),
+    # Arabic negative
+    "سيء": (-3, "anger"), "سيئ": (-3, "anger"), "سيئه": (-3, "anger"), "رديء": (-3, "anger"), "رديئه": (-3, "anger"),
+    "سيي": (-3, "anger"), "سييه": (-3, "anger"),
+    "تعبان": (-2, "sadness"), "بطيء": (-2, "anger"), "بطيئه": (-2, "anger"), "بطيي": (-2, "anger"),
+    "متاخر": (-2, "anger"), "تاخير": (-2, "anger"), "تاخر": (-2, "anger"), "غالي": (-2, "anger"), "غاليه": (-2, "anger"),
+    "مكسور": (-3, "anger"), "تالف": (-3, "anger"), "خربان": (-3, "anger"), "وسخ": (-3, "anger"), "قذر": (-3, "anger"),
+    "مزعج": (-2, "anger"), "زعلان": (-2, "sadness"), "محبط": (-2, "sadness"), "مخيب": (-2, "sadness"),
+    "ضعيف": (-2, "sadness"), "ضعيفه": (-2, "sadness"), "مقلد": (-3, "anger"), "تقليد": (-3, "anger"),
+    "احتيال": (-3, "anger"), "نصب": (-3, "anger"), "مشكله": (-2, "sadness"), "مشاكل": (-2, "sadness"),
+    "خايس": (-3, "anger"), "بارد": (-1, "sadness"), "باهت": (-1, "sadness"), "ندمت": (-3, "sadness"),
+    "اسوا": (-3, "anger"), "فاشل": (-3, "anger"), "وقح": (-3, "anger"), "مخيبه": (-2, "sadness"), "سييء": (-3, "anger"),
+    # English positive
+    "excellent": (3, "joy"), "great": (3, "joy"), "amazing": (3, "surprise"), "awesome": (3, "joy"),
+    "good": (2, "trust"), "nice": (2, "joy"), "love": (3, "joy"), "loved": (3, "joy"), "perfect": (3, "joy"),
+    "fast": (2, "trust"), "quick": (2, "trust"), "clean": (2, "trust"), "delicious": (3, "joy"), "tasty": (2, "joy"),
+    "comfortable": (2, "trust"), "recommend": (2, "trust"), "recommended": (2, "trust"), "happy": (2, "joy"),
+    "satisfied": (2, "trust"), "friendly": (2, "trust"), "helpful": (2, "trust"), "cheap": (1, "joy"),
+    "affordable": (2, "joy"), "best": (3, "trust"), "fantastic": (3, "joy"), "wonderful": (3, "joy"),
+    "reliable": (2, "trust"), "authentic": (2, "trust"), "fresh": (2, "joy"), "thanks": (1, "joy"), "worth": (2, "trust"),
+    # English negative
+    "bad": (-2, "anger"), "terrible": (-3, "anger"), "awful": (-3, "anger"), "horrible": (-3, "anger"),
+    "poor": (-2, "sadness"), "slow": (-2, "anger"), "late": (-2, "anger"), "delayed": (-2, "anger"),
+    "expensive": (-2, "anger"), "overpriced": (-3, "anger"), "broken": (-3, "anger"), "damaged": (-3, "anger"),
+    "dirty": (-3, "anger"), "rude": (-3, "anger"), "disappointed": (-2, "sadness"), "disappointing": (-2, "sadness"),
+    "worst": (-3, "anger"), "fake": (-3, "anger"), "scam": (-3, "anger"), "cold": (-1, "sadness"),
+    "problem": (-2, "sadness"), "problems": (-2, "sadness"), "hate": (-3, "anger"), "useless": (-3, "anger"),
+    "waste": (-3, "anger"), "refund": (-1, "sadness"), "noisy": (-2, "anger"), "missing": (-2, "sadness"),
+}
+LEXICON = {normalize(word): value for word, value in _LEXICON_SOURCE.items()}
+
+NEGATORS = {normalize(w) for w in (
+    "لا", "ما", "ليس", "ليست", "لم", "لن", "مو", "مش", "غير", "بدون", "مب",
+    "not", "no", "never", "without", "isn", "wasn", "don", "didn", "doesn", "aren", "weren", "cannot", "nothing",
+)}
+INTENSIFIERS = {normalize(w): m for w, m in (
+    ("جدا", 1.5), ("كثير", 1.4), ("مره", 1.4), ("للغايه", 1.6), ("جداً", 1.5), ("اكثر", 1.2), ("تماما", 1.4),
+    ("very", 1.5), ("really", 1.4), ("extremely", 1.7), ("so", 1.3), ("too", 1.3), ("super", 1.5), ("totally", 1.4),
+)}
+QUESTION_WORDS = {normalize(w) for w in ("هل", "كيف", "متى", "لماذا", "ليش", "وين", "اين", "how", "when", "why", "where", "what", "can", "does")}
+URGENT_WORDS = {normalize(w) for w in ("عاجل", "فورا", "حالا", "ضروري", "urgent", "asap", "immediately", "emergency")}
+
+# aspect id -> (Arabic label, keywords)
+ASPECTS = {
+    "quality": ("جودة المنتج", ["جوده", "نوعيه", "خامه", "quality", "material", "build"]),
+    "price": ("السعر", ["سعر", "اسعار", "ثمن", "قيمه", "price", "prices", "cost", "value for money"]),
+    "delivery": ("سرعة التوصيل", ["توصيل", "شحن", "مندوب", "delivery", "shipping", "courier", "arrived"]),
+    "service": ("خدمة العملاء", ["خدمه العملاء", "خدمه", "الدعم", "تعامل", "customer service", "support", "service"]),
+    "packaging": ("التغليف", ["تغليف", "علبه", "كرتون", "packaging", "package", "box", "wrapping"]),
+    "wait_time": ("وقت الانتظار", ["انتظار", "وقت", "تاخير", "wait", "waiting", "waited", "delay"]),
+    "taste": ("الطعم", ["طعم", "اكل", "اكله", "وجبه", "taste", "food", "meal", "flavor"]),
+    "cleanliness": ("النظافة", ["نظافه", "cleanliness", "hygiene"]),
+    "location": ("الموقع", ["موقع", "مكان", "location", "area"]),
+    "room": ("الغرفة", ["غرفه", "سرير", "حمام", "room", "bed", "bathroom"]),
+    "staff": ("الموظفين", ["موظفين", "موظف", "طاقم", "استقبال", "staff", "reception", "employee", "waiter"]),
+}
+
+
+def _lookup(token, table):
+    """Exact hit, else retry with common Arabic proclitics stripped"""
+    value = table.get(token)
+    if value is not None:
+        return value
+    for prefix in _ARABIC_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            value = table.get(token[len(prefix):])
+            if value is not None:
+                return value
+    if token.endswith("ا") and len(token) > 3:
+        return _lookup(token[:-1], table)  # accusative alif: "جيدا"
+    return None
+
+
+# ==================== AHO-CORASICK ====================
+
+class AhoCorasick:
+    """Character-level Aho-Corasick automaton; built once, matched in one pass"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for pattern, value in patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            self.output[state].append((len(pattern), value))
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def finditer(self, text):
+        """Yield (start, end, value) for every pattern occurrence"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, value in output[state]:
+                yield i + 1 - length, i + 1, value
+
+
+_ASPECT_AUTOMATON = AhoCorasick(
+    (normalize(keyword), aspect) for aspect, (_, keywords) in ASPECTS.items() for keyword in keywords
+)
+
+
+# ==================== SCORING ====================
+
+def _label(score):
+    if score > POSITIVE_THRESHOLD:
+        return "positive"
+    if score < NEGATIVE_THRESHOLD:
+        return "negative"
+    return "neutral"
+
+
+LABELS_AR = {"positive": "إيجابي", "negative": "سلبي", "neutral": "محايد"}
+
+
+def analyze(text):
+    """Full analysis of one text: score, label, aspects, emotions, keywords, intent"""
+    norm = normalize(text)
+    spans = [(m.start(), m.end()) for m in _TOKEN_RE.finditer(norm)]
+    tokens = [norm[s:e] for s, e in spans]
+
+    polarities = [0.0] * len(tokens)
+    emotions = {}
+    hits = []
+    negate_until = -1
+    for i, token in enumerate(tokens):
+        if token in NEGATORS:
+            negate_until = i + NEGATION_SCOPE
+            continue
+        entry = _lookup(token, LEXICON)
+        if entry is None:
+            continue
+        polarity, emotion = entry
+        if i > 0 and tokens[i - 1] in INTENSIFIERS:
+            polarity *= INTENSIFIERS[tokens[i - 1]]
+        if i + 1 < len(tokens) and tokens[i + 1] in INTENSIFIERS:
+            polarity *= INTENSIFIERS[tokens[i + 1]]
+        if i <= negate_until:
+            polarity *= -0.75  # "not good" is weaker than "bad"
+            emotion = "sadness" if polarity < 0 else emotion
+        polarities[i] = polarity
+        hits.append(token)
+        if emotion:
+            emotions[emotion] = emotions.get(emotion, 0.0) + abs(polarity)
+
+    total = sum(polarities)
+    score = total / math.sqrt(total * total + NORMALIZATION_ALPHA) if total else 0.0
+    label = _label(score)
+
+    # Aspects: keyword matches at a word start (after an optional proclitic)
+    starts = [s for s, _ in spans]
+    aspects = {}
+    seen = set()
+    for start, end, aspect in _ASPECT_AUTOMATON.finditer(norm):
+        index = bisect.bisect_right(starts, start) - 1
+        if index < 0 or (aspect, index) in seen:
+            continue
+        token_start = spans[index][0]
+        if start != token_start and norm[token_start:start] not in _ARABIC_PREFIXES:
+            continue
+        seen.add((aspect, index))
+        last = bisect.bisect_right(starts, end - 1) - 1
+        window = polarities[max(0, index - ASPECT_WINDOW):last + ASPECT_WINDOW + 1]
+        aspect_total = sum(window)
+        entry = aspects.setdefault(aspect, [0, 0.0])
+        entry[0] += 1
+        entry[1] += aspect_total / math.sqrt(aspect_total * aspect_total + NORMALIZATION_ALPHA) if aspect_total else 0.0
+
+    emotion_total = sum(emotions.values()) or 1.0
+    has_question = "?" in text or "؟" in text or (tokens and tokens[0] in QUESTION_WORDS)
+    urgent = any(t in URGENT_WORDS for t in tokens)
+    return {
+        "score": round(score, 3),
+        "label": label,
+        "confidence": round(min(0.98, 0.5 + 0.15 * len(hits)), 2) if hits else 0.5,
+        "aspects": [
+            {"aspect": aspect, "label_ar": ASPECTS[aspect][0], "mentions": n,
+             "score": round(s / n, 3), "sentiment": _label(s / n)}
+            for aspect, (n, s) in aspects.items()
+        ],
+        "emotions": {e: round(emotions.get(e, 0.0) / emotion_total, 2)
+                     for e in ("joy", "anger", "sadness", "surprise", "trust")},
+        "keywords": list(dict.fromkeys(hits))[:5],
+        "intent": "question" if has_question else "complaint" if label == "negative"
+                  else "praise" if score > 0.6 else "feedback",
+        "urgency": "high" if urgent or score < -0.7 else "medium" if label == "negative" else "low",
+    }
+
+
+def score_text(text):
+    """Fast path for batch scoring: (score, label) without aspects"""
+    tokens = _TOKEN_RE.findall(normalize(text))
+    total = 0.0
+    negate_until = -1
+    for i, token in enumerate(tokens):
+        if token in NEGATORS:
+            negate_until = i + NEGATION_SCOPE
+            continue
+        entry = _lookup(token, LEXICON)
+        if entry is None:
+            continue
+        polarity = entry[0]
+        if i > 0 and tokens[i - 1] in INTENSIFIERS:
+            polarity *= INTENSIFIERS[tokens[i - 1]]
+        if i + 1 < len(tokens) and tokens[i + 1] in INTENSIFIERS:
+            polarity *= INTENSIFIERS[tokens[i + 1]]
+        if i <= negate_until:
+            polarity *= -0.75
+        total += polarity
+    score = total / math.sqrt(total * total + NORMALIZATION_ALPHA) if total else 0.0
+    return round(score, 3), _label(score)
+
+
+def summarize(results):
+    counts = {"positive": 0, "negative": 0, "neutral": 0}
+    for r in results:
+        counts[r["sentiment"]] += 1
+    n = len(results) or 1
+    return {
+        **counts,
+        "positive_percentage": round(counts["positive"] / n * 100, 1),
+        "negative_percentage": round(counts["negative"] / n * 100, 1),
+        "overall_sentiment": "positive" if counts["positive"] > counts["negative"]
+                             else "negative" if counts["negative"] > counts["positive"] else "neutral",
+    }
+
+
+# ==================== PERSISTED AGGREGATES ====================
+
+# review collection -> (target type, target id field)
+REVIEW_SOURCES = {
+    "reviews": ("product", "product_id"),
+    "food_reviews": ("restaurant", "restaurant_id"),
+    "hotel_reviews": ("hotel", "hotel_id"),
+}
+
+
+def review_fields(text):
+    """Sentiment fields stored on the review document itself"""
+    result = analyze(text)
+    return {
+        "sentiment": {
+            "score": result["score"],
+            "label": result["label"],
+            "aspects": {a["aspect"]: a["score"] for a in result["aspects"]},
+        }
+    }
+
+
+def _increments(sentiment, rating):
+    inc = {
+        "count": 1,
+        f"labels.{sentiment['label']}": 1,
+        "score_sum": sentiment["score"],
+        "rating_sum": rating or 0,
+    }
+    for aspect, score in sentiment["aspects"].items():
+        inc[f"aspects.{aspect}.mentions"] = 1
+        inc[f"aspects.{aspect}.score_sum"] = score
+    return inc
+
+
+def _aggregate_ops(target_type, target_id, sentiment, rating, created_at):
+    """Upserts for the target, the per-type total and their daily buckets"""
+    inc = _increments(sentiment, rating)
+    day = (created_at or datetime.utcnow().isoformat())[:10]
+    daily_inc = {"count": 1, f"labels.{sentiment['label']}": 1, "score_sum": sentiment["score"]}
+    aggregates, daily = [], []
+    for tid in (target_id, ALL_TARGETS):
+        aggregates.append(UpdateOne({"target_type": target_type, "target_id": tid},
+                                    {"$inc": inc, "$set": {"updated_at": datetime.utcnow().isoformat()}}, upsert=True))
+        daily.append(UpdateOne({"target_type": target_type, "target_id": tid, "date": day},
+                               {"$inc": daily_inc}, upsert=True))
+    return aggregates, daily
+
+
+def record_review(db, collection, review_doc):
+    """Call after inserting a review that already carries `review_fields`"""
+    target_type, field = REVIEW_SOURCES[collection]
+    aggregates, daily = _aggregate_ops(target_type, review_doc[field], review_doc["sentiment"],
+                                       review_doc.get("rating"), review_doc.get("created_at"))
+    db.sentiment_aggregates.bulk_write(aggregates, ordered=False)
+    db.sentiment_daily.bulk_write(daily, ordered=False)
+
+
+def backfill(db, collection, chunk_size=1000):
+    """Score every review in `collection` that has no sentiment yet; returns count"""
+    target_type, field = REVIEW_SOURCES[collection]
+    projection = {"_id": 0, "id": 1, "comment": 1, "rating": 1, "created_at": 1, field: 1}
+    done = 0
+    review_ops, aggregate_ops, daily_ops = [], [], []
+
+    def flush():
+        if review_ops:
+            db[collection].bulk_write(review_ops, ordered=False)
+            db.sentiment_aggregates.bulk_write(aggregate_ops, ordered=False)
+            db.sentiment_daily.bulk_write(daily_ops, ordered=False)
+        review_ops.clear()
+        aggregate_ops.clear()
+        daily_ops.clear()
+
+    for review in db[collection].find({"sentiment": {"$exists": False}}, projection).batch_size(chunk_size):
+        fields = review_fields(review.get("comment", ""))
+        review_ops.append(UpdateOne({"id": review["id"]}, {"$set": fields}))
+        aggregates, daily = _aggregate_ops(target_type, review.get(field), fields["sentiment"],
+                                           review.get("rating"), review.get("created_at"))
+        aggregate_ops.extend(aggregates)
+        daily_ops.extend(daily)
+        done += 1
+        if len(review_ops) >= chunk_size:
+            flush()
+    flush()
+    return done
+
+
+def aggregate_summary(db, target_type, target_id=None, since=None):
+    """
+    Read side for dashboards. Distribution and review count cover the daily
+    buckets since `since`; rating and aspect scores are all-time totals.
+    """
+    tid = target_id or ALL_TARGETS
+    doc = db.sentiment_aggregates.find_one({"target_type": target_type, "target_id": tid}, {"_id": 0}) or {}
+    query = {"target_type": target_type, "target_id": tid}
+    if since:
+        query["date"] = {"$gte": since}
+    daily = list(db.sentiment_daily.find(query, {"_id": 0}).sort("date", 1))
+
+    count = doc.get("count", 0)
+    period_count = sum(d.get("count", 0) for d in daily)
+    period_labels = {}
+    for d in daily:
+        for label, n in d.get("labels", {}).items():
+            period_labels[label] = period_labels.get(label, 0) + n
+    aspects = [
+        {"aspect": ASPECTS.get(name, (name,))[0], "aspect_id": name, "mentions": a["mentions"],
+         "sentiment": round(a["score_sum"] / a["mentions"], 2)}
+        for name, a in doc.get("aspects", {}).items() if a.get("mentions")
+    ]
+    return {
+        "total_reviews": period_count,
+        "distribution": {
+            label: round(period_labels.get(label, 0) / period_count * 100, 1) if period_count else 0
+            for label in ("positive", "neutral", "negative")
+        },
+        "average_score": round(doc.get("score_sum", 0) / count, 3) if count else 0,
+        "average_rating": round(doc.get("rating_sum", 0) / count, 2) if count else 0,
+        "aspects": aspects,
+        "trend": [
+            {
+                "date": d["date"],
+                "reviews": d["count"],
+                "positive": round(d.get("labels", {}).get("positive", 0) / d["count"] * 100, 1),
+                "negative": round(d.get("labels", {}).get("negative", 0) / d["count"] * 100, 1),
+            }
+            for d in daily if d.get("count")
+        ],
+    }
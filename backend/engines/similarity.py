@@ -0,0 +1,286 @@
+"""
+Content-based product similarity.
+
+Products are vectorised with hashed TF-IDF features over title (unigrams and
+bigrams), description and category, plus a soft-binned log price so that
+items at a similar price score closer. Vectors are L2-normalised and stored
+row-wise in one contiguous float32 matrix; a top-K cosine query is a single
+matrix-vector product (or matrix-matrix for batches). Above LSH_MIN_ROWS an
+optional random-projection LSH index narrows candidates before the exact
+re-rank.
+
+The index is built lazily from `products` on first use and kept current by
+the product write endpoints calling `upsert` / `remove`.
+"""
+import math
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+DIMENSIONS = int(os.environ.get("SIMILARITY_DIMENSIONS", "256"))
+PRICE_BINS = 16
+TEXT_WEIGHT = 0.95          # share of the unit norm given to text features
+TITLE_WEIGHT = 2.0
+CATEGORY_WEIGHT = 3.0
+INITIAL_CAPACITY = 1024
+
+# Approximate search only pays off on large catalogues
+USE_LSH = os.environ.get("SIMILARITY_INDEX", "exact") == "lsh"
+LSH_MIN_ROWS = 50000
+LSH_TABLES = 8
+LSH_BITS = 12
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# log(price) range covered by the price bins: ~1 to ~60,000
+_LOG_PRICE_MIN, _LOG_PRICE_MAX = 0.0, 11.0
+_BIN_CENTERS = np.linspace(_LOG_PRICE_MIN, _LOG_PRICE_MAX, PRICE_BINS, dtype=np.float32)
+_BIN_WIDTH = (_LOG_PRICE_MAX - _LOG_PRICE_MIN) / (PRICE_BINS - 1)
+
+
+def _tokens(text):
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if len(t) > 1]
+
+
+def product_features(product):
+    """Raw term weights for one product; title terms count double"""
+    title = _tokens(product.get("title"))
+    features = {}
+    for token in title:
+        features[token] = features.get(token, 0) + TITLE_WEIGHT
+    for a, b in zip(title, title[1:]):
+        bigram = f"{a} {b}"
+        features[bigram] = features.get(bigram, 0) + 1
+    for token in _tokens(product.get("description")):
+        features[token] = features.get(token, 0) + 1
+    if product.get("category"):
+        features[f"cat:{product['category'].lower()}"] = CATEGORY_WEIGHT
+    return features
+
+
+def _bucket(feature):
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % DIMENSIONS, (1.0 if h & 0x80000000 else -1.0)
+
+
+def _price_vector(price):
+    try:
+        log_price = math.log1p(max(float(price or 0), 0.0))
+    except (TypeError, ValueError):
+        log_price = 0.0
+    vec = np.exp(-0.5 * ((_BIN_CENTERS - log_price) / _BIN_WIDTH) ** 2)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class SimilarityIndex:
+    def __init__(self, dimensions=DIMENSIONS):
+        self.text_dims = dimensions
+        self.width = dimensions + PRICE_BINS
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.matrix = np.zeros((INITIAL_CAPACITY, self.width), dtype=np.float32)
+        self.active = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self.ids = []            # row -> product id
+        self.rows = {}           # product id -> row
+        self.free_rows = []
+        self.doc_freq = {}       # feature -> number of products containing it
+        self.features = {}       # product id -> feature set (for df upkeep)
+        self.size = 0            # rows in use, including freed ones
+        self.built = False
+        self.lsh = None
+
+    # ---- Vectorisation ----
+
+    def _idf(self, feature):
+        n = max(len(self.features), 1)
+        return math.log((1 + n) / (1 + self.doc_freq.get(feature, 0))) + 1
+
+    def _vector(self, product, features):
+        vec = np.zeros(self.width, dtype=np.float32)
+        for feature, tf in features.items():
+            index, sign = _bucket(feature)
+            vec[index] += sign * (1 + math.log(tf)) * self._idf(feature)
+        text = vec[:self.text_dims]
+        norm = np.linalg.norm(text)
+        if norm:
+            text *= TEXT_WEIGHT / norm
+        vec[self.text_dims:] = _price_vector(product.get("price")) * math.sqrt(1 - TEXT_WEIGHT ** 2)
+        return vec
+
+    # ---- Storage ----
+
+    def _grow(self, needed):
+        capacity = len(self.matrix)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.zeros((capacity, self.width), dtype=np.float32)
+        matrix[:self.size] = self.matrix[:self.size]
+        active = np.zeros(capacity, dtype=bool)
+        active[:self.size] = self.active[:self.size]
+        self.matrix, self.active = matrix, active
+
+    def _allocate_row(self, product_id):
+        if self.free_rows:
+            row = self.free_rows.pop()
+            self.ids[row] = product_id
+        else:
+            row = self.size
+            self._grow(row + 1)
+            self.ids.append(product_id)
+            self.size += 1
+        self.rows[product_id] = row
+        return row
+
+    def _track_features(self, product_id, features):
+        for feature in self.features.pop(product_id, ()):
+            self.doc_freq[feature] -= 1
+        keys = frozenset(features)
+        for feature in keys:
+            self.doc_freq[feature] = self.doc_freq.get(feature, 0) + 1
+        self.features[product_id] = keys
+
+    # ---- Build / incremental maintenance ----
+
+    def build(self, products):
+        """Full (re)index from an iterable of product documents"""
+        with self._lock:
+            self._reset()
+            docs = [(p, product_features(p)) for p in products if p.get("id")]
+            for product, features in docs:
+                self._track_features(product["id"], features)
+            self._grow(len(docs))
+            for product, features in docs:
+                row = self._allocate_row(product["id"])
+                self.matrix[row] = self._vector(product, features)
+                self.active[row] = True
+            self.built = True
+            self._rebuild_lsh()
+
+    def upsert(self, product):
+        """Index a new or updated product"""
+        with self._lock:
+            if not self.built:
+                return  # the lazy full build will include it
+            product_id = product["id"]
+            features = product_features(product)
+            self._track_features(product_id, features)
+            row = self.rows.get(product_id)
+            if row is None:
+                row = self._allocate_row(product_id)
+            self.matrix[row] = self._vector(product, features)
+            self.active[row] = True
+            if self.lsh is not None:
+                self.lsh.add(row, self.matrix[row])
+
+    def remove(self, product_id):
+        with self._lock:
+            row = self.rows.pop(product_id, None)
+            if row is None:
+                return
+            for feature in self.features.pop(product_id, ()):
+                self.doc_freq[feature] -= 1
+            self.active[row] = False
+            self.matrix[row] = 0
+            self.free_rows.append(row)
+
+    def ensure_built(self, db):
+        if self.built or db is None:
+            return
+        with self._lock:
+            if not self.built:
+                self.build(db.products.find(
+                    {}, {"_id": 0, "id": 1, "title": 1, "description": 1, "category": 1, "price": 1}))
+
+    # ---- Queries ----
+
+    def _rebuild_lsh(self):
+        self.lsh = None
+        if USE_LSH and self.size >= LSH_MIN_ROWS:
+            self.lsh = RandomProjectionLSH(self.width)
+            self.lsh.add_many(np.flatnonzero(self.active[:self.size]), self.matrix[:self.size])
+
+    def _top_k(self, scores, k, exclude_row=None, candidates=None):
+        if candidates is not None:
+            # scores are already aligned with candidates
+            mask = self.active[candidates] & (candidates != exclude_row)
+        else:
+            mask = self.active[:self.size].copy()
+            if exclude_row is not None:
+                mask[exclude_row] = False
+        scores = np.where(mask, scores, -np.inf)
+        k = min(k, int(mask.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = candidates[top] if candidates is not None else top
+        return [(self.ids[r], float(scores[t])) for r, t in zip(rows, top)]
+
+    def similar(self, product_id, k=10):
+        """Top-k (product id, cosine) pairs for an indexed product"""
+        with self._lock:
+            row = self.rows.get(product_id)
+            if row is None:
+                return []
+            query = self.matrix[row]
+            if self.lsh is not None:
+                candidates = self.lsh.candidates(query)
+                if len(candidates) > k:
+                    return self._top_k(self.matrix[candidates] @ query, k, row, candidates)
+            return self._top_k(self.matrix[:self.size] @ query, k, row)
+
+    def similar_many(self, product_ids, k=10):
+        """Batched exact queries: one matrix-matrix product for all ids"""
+        with self._lock:
+            known = [(pid, self.rows[pid]) for pid in product_ids if pid in self.rows]
+            if not known:
+                return {}
+            rows = np.array([row for _, row in known])
+            scores = self.matrix[:self.size] @ self.matrix[rows].T
+            return {pid: self._top_k(scores[:, i], k, row) for i, (pid, row) in enumerate(known)}
+
+
+class RandomProjectionLSH:
+    """Sign-of-random-projection hashing; candidates are the union of buckets"""
+
+    def __init__(self, width, tables=LSH_TABLES, bits=LSH_BITS, seed=13):
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((tables, bits, width)).astype(np.float32)
+        self.weights = (1 << np.arange(bits)).astype(np.int64)
+        self.buckets = [dict() for _ in range(tables)]
+
+    def _codes(self, vectors):
+        # (tables, n) integer bucket codes
+        signs = np.einsum("tbw,nw->tnb", self.planes, np.atleast_2d(vectors)) > 0
+        return signs.astype(np.int64) @ self.weights
+
+    def add_many(self, rows, matrix):
+        if len(rows) == 0:
+            return
+        codes = self._codes(matrix[rows])
+        for table, table_codes in zip(self.buckets, codes):
+            for row, code in zip(rows.tolist(), table_codes.tolist()):
+                table.setdefault(code, []).append(row)
+
+    def add(self, row, vector):
+        for table, code in zip(self.buckets, self._codes(vector)[:, 0].tolist()):
+            bucket = table.setdefault(code, [])
+            if row not in bucket:
+                bucket.append(row)
+
+    def candidates(self, vector):
+        found = set()
+        for table, code in zip(self.buckets, self._codes(vector)[:, 0].tolist()):
+            found.update(table.get(code, ()))
+        return np.fromiter(found, dtype=np.int64, count=len(found))
+
+
+similarity_index = SimilarityIndex()
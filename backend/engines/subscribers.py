@@ -0,0 +1,145 @@
+"""
+Event bus subscribers for order, food, ride and hotel events.
+
+Importing this module registers the handlers on `event_bus`. Every handler
+takes a batch and is safe to run more than once for the same event:
+notifications are upserted by a deterministic id, counters go through
+`first_delivery()`, and loyalty entries carry their own idempotency keys.
+
+Events and payloads:
+    order.created           {order_id, user_id, total, items: [{product_id, quantity, price}], created_at}
+    order.status_changed    {order_id, user_id, total, status, previous_status}
+    food_order.created      {order_id, order_number, user_id, restaurant_id, total, created_at}
+    ride.requested          {ride_id, ride_number, user_id, ride_type, estimated_fare, created_at}
+    hotel_booking.created   {booking_id, booking_number, user_id, hotel_id, hotel_name, total_price, created_at}
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from core.responses import content_versions
+from engines import loyalty
+from engines.events import event_bus
+
+ORDER_CREATED = "order.created"
+ORDER_STATUS_CHANGED = "order.status_changed"
+FOOD_ORDER_CREATED = "food_order.created"
+RIDE_REQUESTED = "ride.requested"
+HOTEL_BOOKING_CREATED = "hotel_booking.created"
+
+# event type -> (service, amount field)
+SERVICES = {
+    ORDER_CREATED: ("store", "total"),
+    FOOD_ORDER_CREATED: ("food", "total"),
+    RIDE_REQUESTED: ("rides", "estimated_fare"),
+    HOTEL_BOOKING_CREATED: ("hotels", "total_price"),
+}
+
+
+def _notification(event, suffix, user_id, title, message, notification_type, icon, action_url=None):
+    doc = {
+        "id": f"{event['_id']}:{suffix}",
+        "user_id": user_id,
+        "title": title,
+        "message": message,
+        "type": notification_type,
+        "icon": icon,
+        "action_url": action_url,
+        "read": False,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    return UpdateOne({"id": doc["id"]}, {"$setOnInsert": doc}, upsert=True)
+
+
+@event_bus.subscriber("notifications", ORDER_CREATED, FOOD_ORDER_CREATED, RIDE_REQUESTED, HOTEL_BOOKING_CREATED)
+def notify(db, events):
+    """Confirmation to the customer, and a new-order notice to each seller involved"""
+    product_ids = {i["product_id"] for e in events if e["type"] == ORDER_CREATED for i in e["payload"]["items"]}
+    sellers = {p["id"]: p.get("seller_id") for p in db.products.find(
+        {"id": {"$in": list(product_ids)}}, {"_id": 0, "id": 1, "seller_id": 1})} if product_ids else {}
+
+    ops = []
+    for e in events:
+        p = e["payload"]
+        if e["type"] == ORDER_CREATED:
+            short = p["order_id"][:8]
+            ops.append(_notification(e, "customer", p["user_id"], "تم استلام طلبك",
+                                     f"طلبك #{short} بقيمة {p['total']:.2f} ر.س قيد المعالجة",
+                                     "order", "📦", f"/orders/{p['order_id']}"))
+            units = defaultdict(int)
+            for item in p["items"]:
+                seller_id = sellers.get(item["product_id"])
+                if seller_id:
+                    units[seller_id] += item["quantity"]
+            for seller_id, count in units.items():
+                ops.append(_notification(e, f"seller:{seller_id}", seller_id, "طلب جديد",
+                                         f"طلب جديد #{short} يحتوي على {count} من منتجاتك",
+                                         "order", "🛍️", "/seller/orders"))
+        elif e["type"] == FOOD_ORDER_CREATED:
+            ops.append(_notification(e, "customer", p["user_id"], "تم استلام طلبك",
+                                     f"طلب الطعام {p['order_number']} قيد التحضير", "food", "🍔"))
+        elif e["type"] == RIDE_REQUESTED:
+            ops.append(_notification(e, "customer", p["user_id"], "جاري البحث عن كابتن",
+                                     f"مشوارك {p['ride_number']} قيد البحث عن أقرب كابتن", "ride", "🚗"))
+        elif e["type"] == HOTEL_BOOKING_CREATED:
+            ops.append(_notification(e, "customer", p["user_id"], "تم استلام حجزك",
+                                     f"حجزك {p['booking_number']} في {p.get('hotel_name') or 'الفندق'} بانتظار التأكيد",
+                                     "hotel", "🏨"))
+    if ops:
+        db.notifications.bulk_write(ops, ordered=False)
+
+
+@event_bus.subscriber("rollups", *SERVICES)
+def rollup(db, events):
+    """Daily per-service counts and revenue in `daily_rollups`"""
+    with event_bus.first_delivery(db, "rollups", events) as fresh:
+        totals = defaultdict(lambda: {"count": 0, "revenue": 0.0, "units": 0})
+        for e in fresh:
+            p = e["payload"]
+            service, amount_field = SERVICES[e["type"]]
+            day = str(p.get("created_at") or e["created_at"].isoformat())[:10]
+            bucket = totals[(day, service)]
+            bucket["count"] += 1
+            bucket["revenue"] += p.get(amount_field) or 0
+            bucket["units"] += sum(i["quantity"] for i in p.get("items", []))
+        ops = [UpdateOne({"_id": f"{day}:{service}"},
+                         {"$set": {"day": day, "service": service}, "$inc": values}, upsert=True)
+               for (day, service), values in totals.items()]
+        if ops:
+            db.daily_rollups.bulk_write(ops, ordered=False)
+
+
+@event_bus.subscriber("search", ORDER_CREATED)
+def search_ranking(db, events):
+    """Units sold per product, used to rank search suggestions"""
+    with event_bus.first_delivery(db, "search", events) as fresh:
+        sold = defaultdict(int)
+        for e in fresh:
+            for item in e["payload"]["items"]:
+                sold[item["product_id"]] += item["quantity"]
+        now = datetime.utcnow().isoformat()
+        ops = [UpdateOne({"id": pid}, {"$inc": {"sales_count": qty}, "$set": {"updated_at": now}})
+               for pid, qty in sold.items()]
+        if ops:
+            db.products.bulk_write(ops, ordered=False)
+            content_versions.bump("products")
+
+
+@event_bus.subscriber("loyalty", ORDER_STATUS_CHANGED)
+def loyalty_points(db, events):
+    """Points credited on delivery and taken back on refund"""
+    now = datetime.utcnow()
+    delivered, refunded = [], []
+    for e in events:
+        p = e["payload"]
+        order = {"id": p["order_id"], "user_id": p["user_id"], "total": p["total"]}
+        if p["status"] == "delivered" and order["user_id"] and loyalty.order_points(order) > 0:
+            delivered.append(loyalty.order_entry(order, now))
+        elif p["status"] == "refunded":
+            refunded.append(order)
+    # Credits first, so a delivery and refund in the same batch net out
+    if delivered:
+        loyalty.post_entries(db, delivered)
+    for order in refunded:
+        loyalty.reverse_order(db, order)
@@ -0,0 +1,277 @@
+"""
+Real-time trending products.
+
+Views, cart adds and purchases feed exponentially time-decayed scores. Decay
+uses the forward-decay trick: an event at time t adds w * exp(t - t0) / tau
+to a landmark-scaled counter, so old scores never need touching and ranking
+is unaffected by the scale; the true score at `now` is the stored value times
+exp(-(now - t0) / tau). Counters are rebased before the scale overflows.
+
+Per-item scores live in a Count-Min sketch (bounded memory regardless of
+catalogue size); a small top-K table per scope (global and each category)
+tracks the leaders, so reads are O(K). State is snapshotted to disk every
+SNAPSHOT_INTERVAL seconds and reloaded on start, so restarts are warm.
+
+With several API workers each process applies its own events and publishes
+them on the `trending` shared-state channel; peers fold them in within a
+publish interval, so every worker ranks the same traffic. One worker (the
+`trending-snapshot` lease holder) writes the snapshots.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from core.shared_state import Leader, shared_state
+
+logger = logging.getLogger("ocean.trending")
+
+DEFAULT_SNAPSHOT_DIR = os.environ.get(
+    "TRENDING_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "trending"))
+SNAPSHOT_INTERVAL = 60
+
+EVENT_WEIGHTS = {"view": 1.0, "cart": 3.0, "purchase": 5.0}
+# timeframe -> half-life in seconds
+TIMEFRAMES = {"1h": 3600, "24h": 86400, "7d": 7 * 86400}
+DEFAULT_TIMEFRAME = "24h"
+SALES_HALF_LIFE = 7 * 86400
+
+SKETCH_DEPTH = 4
+SKETCH_WIDTH = 4096
+TOP_CAPACITY = 100
+# Rebase once exp() of the landmark offset reaches e^REBASE_EXPONENT
+REBASE_EXPONENT = 40.0
+CATEGORY_CACHE_SIZE = 50000
+
+GLOBAL = "__all__"
+
+
+def _hashes(key):
+    data = key.encode("utf-8")
+    return [zlib.crc32(data, seed * 0x9E3779B1 & 0xFFFFFFFF) % SKETCH_WIDTH for seed in range(SKETCH_DEPTH)]
+
+
+class DecayedTopK:
+    """Count-Min sketch of forward-decayed scores plus per-scope top-K tables"""
+
+    def __init__(self, half_life, capacity=TOP_CAPACITY, now=None):
+        self.half_life = half_life
+        self.tau = half_life / math.log(2)
+        self.capacity = capacity
+        self.landmark = now if now is not None else time.time()
+        self.sketch = np.zeros((SKETCH_DEPTH, SKETCH_WIDTH), dtype=np.float64)
+        self.tops = {}       # scope -> {product id: landmark-scaled score}
+        self._mins = {}      # scope -> (product id, score) of the smallest entry
+        self._rows = np.arange(SKETCH_DEPTH)
+
+    def _scale(self, ts):
+        return math.exp((ts - self.landmark) / self.tau)
+
+    def _rebase(self, ts):
+        factor = 1.0 / self._scale(ts)
+        self.sketch *= factor
+        for top in self.tops.values():
+            for pid in top:
+                top[pid] *= factor
+        self._mins.clear()
+        self.landmark = ts
+
+    def _min(self, scope, top):
+        entry = self._mins.get(scope)
+        if entry is None:
+            pid = min(top, key=top.get)
+            entry = self._mins[scope] = (pid, top[pid])
+        return entry
+
+    def _offer(self, scope, product_id, score):
+        top = self.tops.setdefault(scope, {})
+        if product_id in top or len(top) < self.capacity:
+            top[product_id] = score
+            entry = self._mins.get(scope)
+            if entry is not None and (entry[0] == product_id or score < entry[1]):
+                self._mins.pop(scope)
+            return
+        min_id, min_score = self._min(scope, top)
+        if score > min_score:
+            del top[min_id]
+            top[product_id] = score
+            self._mins.pop(scope)
+
+    def add(self, product_id, scopes, weight, ts):
+        if (ts - self.landmark) / self.tau > REBASE_EXPONENT:
+            self._rebase(ts)
+        cols = _hashes(product_id)
+        self.sketch[self._rows, cols] += weight * self._scale(ts)
+        # Scores only grow in landmark space, so an item can only enter a
+        # top table through its own increment
+        score = float(self.sketch[self._rows, cols].min())
+        for scope in scopes:
+            self._offer(scope, product_id, score)
+
+    def top(self, k, scope=GLOBAL, now=None):
+        """[(product id, decayed score)] best first"""
+        top = self.tops.get(scope)
+        if not top:
+            return []
+        decay = 1.0 / self._scale(now if now is not None else time.time())
+        leaders = sorted(top.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [(pid, score * decay) for pid, score in leaders]
+
+    def score(self, product_id, now=None):
+        cols = _hashes(product_id)
+        return float(self.sketch[self._rows, cols].min()) / self._scale(now if now is not None else time.time())
+
+    # ---- Snapshots ----
+
+    def state(self):
+        return {"half_life": self.half_life, "landmark": self.landmark, "tops": self.tops}
+
+    def load_state(self, state, sketch):
+        self.landmark = state["landmark"]
+        self.tops = {scope: dict(top) for scope, top in state["tops"].items()}
+        self._mins.clear()
+        self.sketch = np.array(sketch, dtype=np.float64)
+
+
+class TrendingEngine:
+    def __init__(self, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+        self.snapshot_dir = snapshot_dir
+        self._lock = threading.Lock()
+        self.windows = {name: DecayedTopK(half_life) for name, half_life in TIMEFRAMES.items()}
+        self.sales = DecayedTopK(SALES_HALF_LIFE)
+        self.db = None
+        self._categories = {}
+        self._thread = None
+        self.events = 0
+
+    # ---- Recording ----
+
+    def category_of(self, product_id):
+        category = self._categories.get(product_id)
+        if category is None and self.db is not None:
+            product = self.db.products.find_one({"id": product_id}, {"_id": 0, "category": 1})
+            category = (product or {}).get("category") or ""
+            self.remember_category(product_id, category)
+        return category or None
+
+    def remember_category(self, product_id, category):
+        if len(self._categories) >= CATEGORY_CACHE_SIZE:
+            self._categories.clear()
+        self._categories[product_id] = category or ""
+
+    def record(self, product_id, kind, quantity=1, category=None, ts=None):
+        """Feed one view / cart / purchase event"""
+        if not product_id:
+            return
+        if category is not None:
+            self.remember_category(product_id, category)
+        else:
+            category = self.category_of(product_id)
+        ts = ts or time.time()
+        self._apply(product_id, kind, quantity, category, ts)
+        shared_state.publish("trending", [product_id, kind, quantity, category, ts])
+
+    def _apply(self, product_id, kind, quantity, category, ts):
+        weight = EVENT_WEIGHTS[kind] * max(quantity, 1)
+        scopes = (GLOBAL, category) if category else (GLOBAL,)
+        with self._lock:
+            for window in self.windows.values():
+                window.add(product_id, scopes, weight, ts)
+            if kind == "purchase":
+                self.sales.add(product_id, scopes, max(quantity, 1), ts)
+            self.events += 1
+
+    def _apply_remote(self, event):
+        product_id, kind, quantity, category, ts = event
+        if category:
+            self.remember_category(product_id, category)
+        self._apply(product_id, kind, quantity, category, ts)
+
+    # ---- Reads ----
+
+    def trending(self, k=12, category=None, timeframe=DEFAULT_TIMEFRAME):
+        window = self.windows.get(timeframe, self.windows[DEFAULT_TIMEFRAME])
+        with self._lock:
+            return window.top(k, category or GLOBAL)
+
+    def best_sellers(self, k=12, category=None):
+        with self._lock:
+            return self.sales.top(k, category or GLOBAL)
+
+    def momentum(self, product_id):
+        """Short-window event rate over long-window rate; > 1 means accelerating"""
+        with self._lock:
+            now = time.time()
+            short, long = self.windows["1h"], self.windows["24h"]
+            short_rate = short.score(product_id, now) / short.tau
+            long_rate = long.score(product_id, now) / long.tau
+        return short_rate / long_rate if long_rate else 0.0
+
+    # ---- Snapshots ----
+
+    def snapshot(self):
+        """Write all windows to disk; the JSON file is swapped in atomically"""
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        with self._lock:
+            trackers = {**self.windows, "sales": self.sales}
+            meta = {name: tracker.state() for name, tracker in trackers.items()}
+            sketches = {name: tracker.sketch.copy() for name, tracker in trackers.items()}
+            meta = json.loads(json.dumps(meta))
+        stamp = f"{int(time.time())}-{os.getpid()}"
+        np.savez(os.path.join(self.snapshot_dir, f"sketches-{stamp}.npz"), **sketches)
+        meta["sketches"] = f"sketches-{stamp}.npz"
+        pointer = os.path.join(self.snapshot_dir, "state.json")
+        with open(pointer + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(pointer + ".tmp", pointer)
+        for name in os.listdir(self.snapshot_dir):
+            if name.startswith("sketches-") and name != meta["sketches"]:
+                try:
+                    os.remove(os.path.join(self.snapshot_dir, name))
+                except OSError:
+                    pass
+
+    def restore(self):
+        try:
+            with open(os.path.join(self.snapshot_dir, "state.json")) as f:
+                meta = json.load(f)
+            sketches = np.load(os.path.join(self.snapshot_dir, meta.pop("sketches")))
+        except (FileNotFoundError, KeyError, ValueError):
+            return False
+        with self._lock:
+            for name, tracker in {**self.windows, "sales": self.sales}.items():
+                if name in meta and name in sketches:
+                    tracker.load_state(meta[name], sketches[name])
+        return True
+
+    def start(self, db):
+        """Restore the last snapshot, follow peers' events and start the periodic snapshot thread"""
+        self.db = db
+        if self._thread is not None:
+            return
+        self.restore()
+        shared_state.subscribe("trending", self._apply_remote)
+        self._thread = threading.Thread(target=self._run, name="trending-snapshot", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        written = self.events
+        leader = Leader("trending-snapshot", ttl=SNAPSHOT_INTERVAL * 3)
+        while True:
+            time.sleep(SNAPSHOT_INTERVAL)
+            if self.events == written or not leader.held():
+                continue
+            try:
+                self.snapshot()
+                written = self.events
+            except Exception:
+                logger.exception("Trending snapshot failed")
+
+
+trending_engine = TrendingEngine()
@@ -7,6 +7,11 @@ import jwt
 import os
 import uuid
 
+from core.responses import content_versions
+from engines.similarity import similarity_index
+from engines.events import event_bus
+from engines.subscribers import ORDER_STATUS_CHANGED
+
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
 # JWT Configuration
@@ -17,10 +22,13 @@ security = HTTPBearer()
 
 # Database will be set from server.py
 db = None
+# Read-only dashboards/analytics; may be served by secondaries
+analytics_db = None
 
-def set_db(database):
-    global db
+def set_db(database, analytics_database=None):
+    global db, analytics_db
     db = database
+    analytics_db = analytics_database if analytics_database is not None else database
 
 # Models
 class AdminLogin(BaseModel):
@@ -67,25 +75,25 @@ def get_dashboard_stats(admin: dict = Depends(get_admin_user)):
     """Get main dashboard KPIs"""
     
     # Total Revenue
-    orders = list(db.orders.find({"status": "completed"}, {"_id": 0}))
+    orders = list(analytics_db.orders.find({"status": "completed"}, {"_id": 0}))
     total_revenue = sum(order.get('total', 0) for order in orders)
     
     # Orders count
-    total_orders = db.orders.count_documents({})
-    pending_orders = db.orders.count_documents({"status": "pending"})
+    total_orders = analytics_db.orders.count_documents({})
+    pending_orders = analytics_db.orders.count_documents({"status": "pending"})
     
     # Users count
-    total_users = db.users.count_documents({})
-    new_users_today = db.users.count_documents({
+    total_users = analytics_db.users.count_documents({})
+    new_users_today = analytics_db.users.count_documents({
         "created_at": {"$gte": (datetime.utcnow() - timedelta(days=1)).isoformat()}
     })
     
     # Products count
-    total_products = db.products.count_documents({})
-    pending_products = db.products.count_documents({"approval_status": "pending"})
+    total_products = analytics_db.products.count_documents({})
+    pending_products = analytics_db.products.count_documents({"approval_status": "pending"})
     
     # Sellers count
-    total_sellers = db.users.count_documents({"role": "seller"})
+    total_sellers = analytics_db.users.count_documents({"role": "seller"})
     
     return {
         "revenue": {
@@ -119,7 +127,7 @@ def get_revenue_chart(days: int = 7, admin: dict = Depends(get_admin_user)):
         date_str = date.strftime("%Y-%m-%d")
         
         # Get orders for this day
-        day_orders = list(db.orders.find({
+        day_orders = list(analytics_db.orders.find({
             "created_at": {"$regex": f"^{date_str}"}
         }, {"_id": 0}))
         
@@ -136,11 +144,11 @@ def get_revenue_chart(days: int = 7, admin: dict = Depends(get_admin_user)):
 @router.get("/dashboard/recent-orders")
 def get_recent_orders(limit: int = 10, admin: dict = Depends(get_admin_user)):
     """Get recent orders for dashboard"""
-    orders = list(db.orders.find({}, {"_id": 0}).sort("created_at", -1).limit(limit))
+    orders = list(analytics_db.orders.find({}, {"_id": 0}).sort("created_at", -1).limit(limit))
     
     # Populate user info
     for order in orders:
-        user = db.users.find_one({"id": order.get('user_id')}, {"_id": 0, "password": 0})
+        user = analytics_db.users.find_one({"id": order.get('user_id')}, {"_id": 0, "password": 0})
         order['user'] = user
     
     return orders
@@ -151,7 +159,7 @@ def get_alerts(admin: dict = Depends(get_admin_user)):
     alerts = []
     
     # Check for low stock products
-    low_stock = db.products.count_documents({"stock": {"$lt": 5}})
+    low_stock = analytics_db.products.count_documents({"stock": {"$lt": 5}})
     if low_stock > 0:
         alerts.append({
             "type": "warning",
@@ -163,7 +171,7 @@ def get_alerts(admin: dict = Depends(get_admin_user)):
         })
     
     # Check for pending approvals
-    pending = db.products.count_documents({"approval_status": "pending"})
+    pending = analytics_db.products.count_documents({"approval_status": "pending"})
     if pending > 0:
         alerts.append({
             "type": "info",
@@ -175,7 +183,7 @@ def get_alerts(admin: dict = Depends(get_admin_user)):
         })
     
     # Check for pending orders
-    pending_orders = db.orders.count_documents({"status": "pending"})
+    pending_orders = analytics_db.orders.count_documents({"status": "pending"})
     if pending_orders > 0:
         alerts.append({
             "type": "info",
@@ -239,10 +247,12 @@ def approve_product(product_id: str, approval: ProductApproval, admin: dict = De
         "approval_status": approval.status,
         "approval_notes": approval.notes,
         "approved_by": admin['user_id'],
-        "approved_at": datetime.utcnow().isoformat()
+        "approved_at": datetime.utcnow().isoformat(),
+        "updated_at": datetime.utcnow().isoformat()
     }
     
     db.products.update_one({"id": product_id}, {"$set": update_data})
+    content_versions.bump("products")
     
     return {"message": f"Product {approval.status}", "product_id": product_id}
 
@@ -252,6 +262,8 @@ def delete_product(product_id: str, admin: dict = Depends(get_admin_user)):
     result = db.products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    similarity_index.remove(product_id)
+    content_versions.bump("products")
     
     return {"message": "Product deleted", "product_id": product_id}
 
@@ -428,7 +440,14 @@ def update_order_status(order_id: str, status: str, admin: dict = Depends(get_ad
     })
     update_data['status_history'] = status_history
     
-    db.orders.update_one({"id": order_id}, {"$set": update_data})
+    # Loyalty points (credited on delivery, taken back on refund) follow via the event bus
+    event_bus.update(db, db.orders, {"id": order_id}, {"$set": update_data}, ORDER_STATUS_CHANGED, {
+        "order_id": order_id,
+        "user_id": order.get("user_id"),
+        "total": order.get("total", 0),
+        "status": status,
+        "previous_status": order.get("status"),
+    })
     
     return {"message": f"Order status updated to {status}", "order_id": order_id}
 
@@ -436,16 +455,37 @@ def update_order_status(order_id: str, status: str, admin: dict = Depends(get_ad
 @router.get("/categories")
 def get_categories(admin: dict = Depends(get_admin_user)):
     """Get all categories with product counts"""
-    pipeline = [
-        {"$group": {"_id": "$category", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}
-    ]
-    
-    categories = list(db.products.aggregate(pipeline))
+    # Maintained by the category_stats change consumer
+    categories = list(db.category_stats.find({}).sort("count", -1))
+    if not categories:
+        categories = list(db.products.aggregate([
+            {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}}
+        ]))
     
     return [{"name": cat['_id'], "product_count": cat['count']} for cat in categories]
 
 # ============ ANALYTICS ============
+def aggregate_sales(orders, top_n=10):
+    """Revenue totals and the top products by revenue for a list of order documents"""
+    total_revenue = sum(order.get('total', 0) for order in orders)
+    total_orders = len(orders)
+    avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
+    
+    # Top selling products
+    product_sales = {}
+    for order in orders:
+        for item in order.get('items', []):
+            pid = item.get('product_id')
+            if pid:
+                if pid not in product_sales:
+                    product_sales[pid] = {'quantity': 0, 'revenue': 0}
+                product_sales[pid]['quantity'] += item.get('quantity', 0)
+                product_sales[pid]['revenue'] += item.get('price', 0) * item.get('quantity', 0)
+    
+    top_products = sorted(product_sales.items(), key=lambda x: x[1]['revenue'], reverse=True)[:top_n]
+    return total_revenue, total_orders, avg_order_value, top_products
+
 @router.get("/analytics/sales")
 def get_sales_analytics(
     period: str = "week",  # day, week, month, year
@@ -463,30 +503,14 @@ def get_sales_analytics(
     
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    orders = list(db.orders.find({
+    orders = list(analytics_db.orders.find({
         "created_at": {"$gte": start_date.isoformat()}
     }, {"_id": 0}))
     
-    total_revenue = sum(order.get('total', 0) for order in orders)
-    total_orders = len(orders)
-    avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
-    
-    # Top selling products
-    product_sales = {}
-    for order in orders:
-        for item in order.get('items', []):
-            pid = item.get('product_id')
-            if pid:
-                if pid not in product_sales:
-                    product_sales[pid] = {'quantity': 0, 'revenue': 0}
-                product_sales[pid]['quantity'] += item.get('quantity', 0)
-                product_sales[pid]['revenue'] += item.get('price', 0) * item.get('quantity', 0)
-    
-    # Get top 10 products
-    top_products = sorted(product_sales.items(), key=lambda x: x[1]['revenue'], reverse=True)[:10]
+    total_revenue, total_orders, avg_order_value, top_products = aggregate_sales(orders)
     top_products_with_details = []
     for pid, stats in top_products:
-        product = db.products.find_one({"id": pid}, {"_id": 0})
+        product = analytics_db.products.find_one({"id": pid}, {"_id": 0})
         if product:
             top_products_with_details.append({
                 **product,
@@ -505,20 +529,20 @@ def get_sales_analytics(
 @router.get("/analytics/users")
 def get_user_analytics(admin: dict = Depends(get_admin_user)):
     """Get user analytics"""
-    total_users = db.users.count_documents({})
-    buyers = db.users.count_documents({"role": "buyer"})
-    sellers = db.users.count_documents({"role": "seller"})
-    admins = db.users.count_documents({"role": {"$in": ["admin", "super_admin"]}})
+    total_users = analytics_db.users.count_documents({})
+    buyers = analytics_db.users.count_documents({"role": "buyer"})
+    sellers = analytics_db.users.count_documents({"role": "seller"})
+    admins = analytics_db.users.count_documents({"role": {"$in": ["admin", "super_admin"]}})
     
     # New users this week
     week_ago = datetime.utcnow() - timedelta(days=7)
-    new_this_week = db.users.count_documents({
+    new_this_week = analytics_db.users.count_documents({
         "created_at": {"$gte": week_ago.isoformat()}
     })
     
     # New users this month
     month_ago = datetime.utcnow() - timedelta(days=30)
-    new_this_month = db.users.count_documents({
+    new_this_month = analytics_db.users.count_documents({
         "created_at": {"$gte": month_ago.isoformat()}
     })
     
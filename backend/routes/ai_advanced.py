@@ -8,6 +8,13 @@ from uuid import uuid4
 import random
 import math
 
+from engines.copurchase import copurchase_index
+from engines.similarity import similarity_index
+from engines.trending import trending_engine, TIMEFRAMES
+from engines.fraud import fraud_scorer, parse_condition, transaction
+from engines import sentiment as sentiment_engine
+from engines import forecasting
+
 router = APIRouter(prefix="/api/ai-advanced", tags=["ai-advanced"])
 
 db = None
@@ -37,6 +44,7 @@ class FraudAnalysisRequest(BaseModel):
     customer_id: str
     ip_address: str
     device_fingerprint: Optional[str] = ""
+    card_fingerprint: Optional[str] = None
     shipping_address: Optional[Dict] = {}
     billing_address: Optional[Dict] = {}
 
@@ -104,66 +112,112 @@ async def get_personalized_recommendations(context: RecommendationContext, user
     }
 
 @router.get("/recommendations/similar/{product_id}")
-async def get_similar_products(product_id: str, limit: int = 10, user = Depends(verify_admin_token)):
+def get_similar_products(product_id: str, limit: int = 10, user = Depends(verify_admin_token)):
     """الحصول على منتجات مشابهة"""
+    similarity_index.ensure_built(db)
+    neighbors = similarity_index.similar(product_id, k=limit)
+    products = {
+        p["id"]: p for p in db.products.find(
+            {"id": {"$in": [pid for pid, _ in neighbors]}},
+            {"_id": 0, "id": 1, "title": 1, "price": 1, "category": 1, "image_url": 1}
+        )
+    } if neighbors else {}
+    
     similar = [
-        {"id": f"SIM-{i}", "name": f"منتج مشابه {i}", "similarity_score": round(random.uniform(0.7, 0.98), 2), "price": random.randint(100, 5000)} 
-        for i in range(1, limit + 1)
+        {**products[pid], "similarity_score": round(score, 4)}
+        for pid, score in neighbors if pid in products
     ]
     return {
         "product_id": product_id,
         "similar_products": similar,
-        "algorithm": "Visual + Attribute Similarity",
-        "confidence": round(random.uniform(0.85, 0.95), 2)
+        "algorithm": "Hashed TF-IDF + Price Cosine Similarity",
+        "confidence": round(sum(s["similarity_score"] for s in similar) / len(similar), 4) if similar else 0
     }
 
 @router.get("/recommendations/frequently-bought/{product_id}")
-async def get_frequently_bought_together(product_id: str, user = Depends(verify_admin_token)):
+async def get_frequently_bought_together(product_id: str, limit: int = 5, user = Depends(verify_admin_token)):
     """المنتجات التي يتم شراؤها معاً"""
-    bundles = [
-        {
-            "products": [
-                {"id": "P-101", "name": "iPhone 15 Pro", "price": 4999},
-                {"id": "P-201", "name": "AirPods Pro 2", "price": 999},
-                {"id": "P-301", "name": "حافظة MagSafe", "price": 199}
-            ],
-            "bundle_discount": 10,
-            "bundle_price": 5577,
-            "original_price": 6197,
-            "confidence": 0.92
-        },
-        {
-            "products": [
-                {"id": "P-101", "name": "iPhone 15 Pro", "price": 4999},
-                {"id": "P-401", "name": "شاحن سريع 20W", "price": 99}
-            ],
-            "bundle_discount": 5,
-            "bundle_price": 4843,
-            "original_price": 5098,
-            "confidence": 0.88
+    neighbors = copurchase_index.neighbors(product_id, k=limit)
+    ids = [product_id] + [n["product_id"] for n in neighbors]
+    products = {
+        p["id"]: p for p in db.products.find(
+            {"id": {"$in": ids}}, {"_id": 0, "id": 1, "title": 1, "price": 1, "category": 1}
+        )
+    } if db is not None else {}
+    
+    anchor = products.get(product_id)
+    if anchor is None or not neighbors:
+        return {
+            "product_id": product_id,
+            "bundles": [],
+            "frequently_bought_with": [],
+            "cross_sell_revenue_potential": 0
         }
-    ]
+    
+    def as_item(pid):
+        p = products[pid]
+        return {"id": pid, "name": p.get("title"), "price": p.get("price", 0)}
+    
+    related = [n for n in neighbors if n["product_id"] in products]
+    
+    # الحزمة الكاملة (أقوى منتجين) ثم حزمة المنتج الأقوى وحده
+    bundles = []
+    for size, discount in ((2, 10), (1, 5)):
+        members = related[:size]
+        if len(members) < size:
+            continue
+        items = [as_item(product_id)] + [as_item(n["product_id"]) for n in members]
+        original = sum(i["price"] for i in items)
+        bundles.append({
+            "products": items,
+            "bundle_discount": discount,
+            "bundle_price": round(original * (1 - discount / 100), 2),
+            "original_price": round(original, 2),
+            "confidence": min(n["confidence"] for n in members)
+        })
+    
+    # الإيراد المتوقع = احتمال الشراء المشترك × السعر × عدد طلبات المنتج
+    anchor_orders = max((n["support"] / n["confidence"] for n in related if n["confidence"]), default=0)
+    potential = sum(n["confidence"] * products[n["product_id"]].get("price", 0) for n in related) * anchor_orders
+    
     return {
         "product_id": product_id,
         "bundles": bundles,
-        "cross_sell_revenue_potential": 25000
+        "frequently_bought_with": [{**as_item(n["product_id"]), **n} for n in related],
+        "cross_sell_revenue_potential": round(potential, 2),
+        "model_version": copurchase_index.version
     }
 
 @router.get("/recommendations/trending")
 async def get_trending_products(category: str = None, timeframe: str = "24h", user = Depends(verify_admin_token)):
     """المنتجات الرائجة"""
-    trending = [
-        {"id": "T-001", "name": "iPhone 15 Pro Max", "trend_score": 98, "sales_velocity": "+45%", "views_24h": 15420},
-        {"id": "T-002", "name": "Samsung Galaxy S24 Ultra", "trend_score": 92, "sales_velocity": "+32%", "views_24h": 12350},
-        {"id": "T-003", "name": "MacBook Air M3", "trend_score": 88, "sales_velocity": "+28%", "views_24h": 9870},
-        {"id": "T-004", "name": "AirPods Pro 2", "trend_score": 85, "sales_velocity": "+22%", "views_24h": 8540},
-        {"id": "T-005", "name": "PlayStation 5", "trend_score": 82, "sales_velocity": "+18%", "views_24h": 7650},
-    ]
+    if timeframe not in TIMEFRAMES:
+        raise HTTPException(status_code=400, detail=f"timeframe must be one of {list(TIMEFRAMES)}")
+    leaders = trending_engine.trending(10, category, timeframe)
+    products = {
+        p["id"]: p for p in db.products.find(
+            {"id": {"$in": [pid for pid, _ in leaders]}}, {"_id": 0, "id": 1, "title": 1, "price": 1, "category": 1}
+        )
+    } if leaders and db is not None else {}
+    
+    top_score = leaders[0][1] if leaders else 0
+    trending = []
+    for pid, score in leaders:
+        if pid not in products:
+            continue
+        momentum = trending_engine.momentum(pid)
+        trending.append({
+            **products[pid],
+            "trend_score": round(100 * score / top_score, 1),
+            "decayed_score": round(score, 3),
+            "momentum": round(momentum, 2),
+            "sales_velocity": f"{(momentum - 1) * 100:+.0f}%"
+        })
     return {
         "timeframe": timeframe,
         "category": category,
         "trending_products": trending,
-        "trend_factors": ["مبيعات مرتفعة", "زيادة البحث", "نشاط وسائل التواصل"]
+        "trend_factors": ["المشاهدات", "الإضافة إلى السلة", "المبيعات"]
     }
 
 def analyze_user_profile(context: RecommendationContext):
@@ -255,65 +309,81 @@ def generate_category_recommendations(profile):
 async def analyze_fraud_risk(request: FraudAnalysisRequest, user = Depends(verify_admin_token)):
     """تحليل مخاطر الاحتيال المتقدم"""
     
-    # تحليل عوامل الخطر
-    risk_factors = calculate_risk_factors(request)
+    # نفس محرك القواعد المستخدم عند الدفع، دون تسجيل المعاملة
+    txn = transaction(
+        request.customer_id, request.amount, ip=request.ip_address, card=request.card_fingerprint or None,
+        device=request.device_fingerprint, shipping_address=request.shipping_address,
+        billing_address=request.billing_address
+    )
+    result = fraud_scorer.score(txn)
+    features = result["features"]
     
-    # حساب درجة الخطر الإجمالية
-    total_risk_score = sum(f["score"] * f["weight"] for f in risk_factors) / sum(f["weight"] for f in risk_factors)
+    # تحليل عوامل الخطر
+    risk_factors = calculate_risk_factors(request, features)
     
-    # تحديد مستوى الخطر
-    risk_level = "low" if total_risk_score < 30 else "medium" if total_risk_score < 60 else "high" if total_risk_score < 80 else "critical"
+    total_risk_score = result["score"]
+    risk_level = result["risk_level"]
     
     # تحديد الإجراء المقترح
     action = determine_action(risk_level, total_risk_score)
     
+    similar_cases = db.fraud_alerts.count_documents({
+        "$or": [{"user_id": request.customer_id}, {"ip_address": request.ip_address}]
+    }) if db is not None else 0
+    
     return {
         "transaction_id": request.transaction_id,
         "risk_analysis": {
-            "overall_score": round(total_risk_score, 1),
+            "overall_score": total_risk_score,
             "risk_level": risk_level,
-            "confidence": round(random.uniform(0.85, 0.98), 2)
+            "confidence": round(min(0.98, 0.6 + 0.05 * features["user_txn_total"]), 2)
         },
         "risk_factors": risk_factors,
         "behavioral_analysis": {
-            "velocity_check": random.choice(["passed", "warning", "failed"]),
-            "device_reputation": random.choice(["trusted", "neutral", "suspicious"]),
-            "ip_reputation": random.choice(["clean", "proxy_detected", "vpn_detected", "blacklisted"]),
-            "address_verification": random.choice(["match", "partial_match", "mismatch"])
+            "velocity_check": "failed" if features["user_txn_1m"] >= 3 else "warning" if features["user_txn_1h"] > 5 else "passed",
+            "device_reputation": "neutral" if features["new_device"] else "trusted",
+            "ip_reputation": "shared" if features["ip_users_24h"] > 3 else "clean",
+            "address_verification": "mismatch" if features["address_mismatch"] else "match"
         },
-        "similar_fraud_cases": random.randint(0, 5) if total_risk_score > 50 else 0,
+        "similar_fraud_cases": similar_cases,
         "recommendation": action,
-        "rules_triggered": get_triggered_rules(total_risk_score),
+        "rules_triggered": result["rules_triggered"],
+        "evaluation_ms": result["elapsed_ms"],
         "analyzed_at": datetime.now(timezone.utc).isoformat()
     }
 
 @router.get("/fraud/rules")
 async def get_fraud_rules(user = Depends(verify_admin_token)):
     """الحصول على قواعد كشف الاحتيال"""
+    rules = [
+        {**rule, "enabled": rule.get("enabled", True), "triggers_24h": fraud_scorer.triggers_24h(rule["id"])}
+        for rule in fraud_scorer.rules.rules
+    ]
     return {
-        "rules": [
-            {"id": "FR-001", "name": "معاملة عالية القيمة", "condition": "amount > 10000", "action": "review", "enabled": True, "triggers_24h": 45},
-            {"id": "FR-002", "name": "IP مشبوه", "condition": "ip_reputation == 'blacklisted'", "action": "block", "enabled": True, "triggers_24h": 12},
-            {"id": "FR-003", "name": "سرعة عالية", "condition": "transactions_per_hour > 5", "action": "review", "enabled": True, "triggers_24h": 28},
-            {"id": "FR-004", "name": "عدم تطابق العنوان", "condition": "shipping != billing AND amount > 2000", "action": "verify", "enabled": True, "triggers_24h": 67},
-            {"id": "FR-005", "name": "جهاز جديد + قيمة عالية", "condition": "new_device AND amount > 5000", "action": "otp_verify", "enabled": True, "triggers_24h": 34},
-            {"id": "FR-006", "name": "بطاقة من دولة مختلفة", "condition": "card_country != shipping_country", "action": "review", "enabled": True, "triggers_24h": 89},
-            {"id": "FR-007", "name": "محاولات متعددة فاشلة", "condition": "failed_attempts > 3", "action": "block_temp", "enabled": True, "triggers_24h": 156},
-            {"id": "FR-008", "name": "VPN/Proxy detected", "condition": "proxy_detected == true", "action": "flag", "enabled": True, "triggers_24h": 234},
-        ],
+        "rules": rules,
         "summary": {
-            "total_rules": 8,
-            "active_rules": 8,
-            "total_triggers_24h": 665,
-            "blocked_24h": 12,
-            "reviewed_24h": 45
+            "total_rules": len(rules),
+            "active_rules": len([r for r in rules if r["enabled"]]),
+            "total_triggers_24h": sum(r["triggers_24h"] for r in rules),
+            "blocked_24h": sum(r["triggers_24h"] for r in rules if r["action"].startswith("block")),
+            "reviewed_24h": sum(r["triggers_24h"] for r in rules if r["action"] == "review")
         }
     }
 
 @router.post("/fraud/rules")
-async def create_fraud_rule(name: str, condition: str, action: str, user = Depends(verify_admin_token)):
+async def create_fraud_rule(name: str, condition: str, action: str, weight: float = 0.3, user = Depends(verify_admin_token)):
     """إنشاء قاعدة كشف احتيال جديدة"""
+    try:
+        parse_condition(condition)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not 0 < weight <= 1:
+        raise HTTPException(status_code=400, detail="weight must be in (0, 1]")
+    
     rule_id = f"FR-{str(uuid4())[:8].upper()}"
+    if db is not None:
+        db.fraud_rules.insert_one({"id": rule_id, "name": name, "condition": condition, "action": action, "weight": weight})
+        fraud_scorer.load_rules(db)
     return {
         "success": True,
         "rule_id": rule_id,
@@ -358,9 +428,11 @@ async def get_fraud_dashboard(user = Depends(verify_admin_token)):
         }
     }
 
-def calculate_risk_factors(request: FraudAnalysisRequest):
-    """حساب عوامل الخطر"""
-    factors = [
+def calculate_risk_factors(request: FraudAnalysisRequest, features: Dict):
+    """حساب عوامل الخطر من مخزن الميزات"""
+    ratio = features["amount_vs_user_avg"]
+    history = features["user_txn_total"]
+    return [
         {
             "factor": "قيمة المعاملة",
             "score": min(100, (request.amount / 100)),
@@ -370,48 +442,47 @@ def calculate_risk_factors(request: FraudAnalysisRequest):
         },
         {
             "factor": "سمعة IP",
-            "score": random.randint(10, 60),
+            "score": min(100, (features["ip_users_24h"] - 1) * 20 + features["ip_txn_1h"] * 3),
             "weight": 0.15,
-            "flag": random.random() > 0.7,
-            "details": f"IP: {request.ip_address}"
+            "flag": features["ip_users_24h"] > 3,
+            "details": f"IP: {request.ip_address} ({features['ip_users_24h']} حسابات خلال 24 ساعة)"
         },
         {
             "factor": "بصمة الجهاز",
-            "score": random.randint(5, 40),
+            "score": 40 if features["new_device"] else 5,
             "weight": 0.15,
-            "flag": random.random() > 0.8,
-            "details": "جهاز معروف" if random.random() > 0.3 else "جهاز جديد"
+            "flag": features["new_device_high_value"],
+            "details": "جهاز جديد" if features["new_device"] else "جهاز معروف"
         },
         {
             "factor": "سرعة المعاملات",
-            "score": random.randint(5, 50),
+            "score": min(100, features["user_txn_1h"] * 10 + features["user_txn_1m"] * 25),
             "weight": 0.15,
-            "flag": random.random() > 0.8,
-            "details": f"{random.randint(1, 5)} معاملات في الساعة"
+            "flag": features["user_txn_1h"] > 5 or features["user_txn_1m"] >= 3,
+            "details": f"{features['user_txn_1h']} معاملات في الساعة"
         },
         {
             "factor": "تطابق العنوان",
-            "score": random.randint(0, 30),
+            "score": 30 if features["address_mismatch"] else 0,
             "weight": 0.1,
-            "flag": random.random() > 0.85,
-            "details": "متطابق" if random.random() > 0.2 else "غير متطابق"
+            "flag": features["address_mismatch"],
+            "details": "غير متطابق" if features["address_mismatch"] else "متطابق"
         },
         {
             "factor": "تاريخ العميل",
-            "score": random.randint(0, 25),
+            "score": max(0, 25 - history),
             "weight": 0.15,
-            "flag": random.random() > 0.9,
-            "details": f"عميل منذ {random.randint(1, 36)} شهر"
+            "flag": history == 0 and request.amount > 5000,
+            "details": f"{history} معاملات سابقة"
         },
         {
             "factor": "نمط الشراء",
-            "score": random.randint(5, 35),
+            "score": min(100, round(ratio * 10)) if ratio else 10,
             "weight": 0.1,
-            "flag": random.random() > 0.85,
-            "details": "نمط طبيعي" if random.random() > 0.3 else "نمط غير معتاد"
+            "flag": ratio > 5,
+            "details": "نمط غير معتاد" if ratio > 5 else "نمط طبيعي"
         }
     ]
-    return factors
 
 def determine_action(risk_level, score):
     """تحديد الإجراء المناسب"""
@@ -424,62 +495,33 @@ def determine_action(risk_level, score):
     else:
         return {"action": "approve", "message": "الموافقة على المعاملة", "requires_review": False}
 
-def get_triggered_rules(score):
-    """الحصول على القواعد المفعلة"""
-    rules = []
-    if score > 30:
-        rules.append({"rule": "FR-001", "name": "درجة خطر متوسطة"})
-    if score > 50:
-        rules.append({"rule": "FR-003", "name": "درجة خطر مرتفعة"})
-    if score > 70:
-        rules.append({"rule": "FR-002", "name": "درجة خطر عالية جداً"})
-    return rules
-
 # ==================== SENTIMENT ANALYSIS ENGINE ====================
 
 @router.post("/sentiment/analyze")
 async def analyze_sentiment(request: SentimentAnalysisRequest, user = Depends(verify_admin_token)):
     """تحليل المشاعر في النص"""
     
-    # محاكاة تحليل المشاعر
-    sentiment_score = random.uniform(-1, 1)
-    
-    if sentiment_score > 0.3:
-        sentiment = "positive"
-        sentiment_ar = "إيجابي"
-    elif sentiment_score < -0.3:
-        sentiment = "negative"
-        sentiment_ar = "سلبي"
-    else:
-        sentiment = "neutral"
-        sentiment_ar = "محايد"
-    
-    # استخراج الجوانب
-    aspects = extract_aspects(request.text, request.language)
-    
-    # استخراج الكلمات المفتاحية
-    keywords = extract_keywords(request.text, request.language)
+    # محرك محلي: معجم + نفي + استخراج الجوانب
+    result = sentiment_engine.analyze(request.text)
+    sentiment = result["label"]
     
     return {
         "text": request.text[:200] + "..." if len(request.text) > 200 else request.text,
-        "language": request.language,
+        "language": sentiment_engine.detect_language(request.text),
         "sentiment": {
             "label": sentiment,
-            "label_ar": sentiment_ar,
-            "score": round(sentiment_score, 3),
-            "confidence": round(random.uniform(0.75, 0.98), 2)
-        },
-        "aspects": aspects,
-        "keywords": keywords,
-        "emotions": {
-            "joy": round(random.uniform(0, 1), 2) if sentiment == "positive" else round(random.uniform(0, 0.3), 2),
-            "anger": round(random.uniform(0, 0.3), 2) if sentiment != "negative" else round(random.uniform(0.3, 0.8), 2),
-            "sadness": round(random.uniform(0, 0.2), 2),
-            "surprise": round(random.uniform(0, 0.4), 2),
-            "trust": round(random.uniform(0.3, 0.9), 2) if sentiment == "positive" else round(random.uniform(0, 0.4), 2)
+            "label_ar": sentiment_engine.LABELS_AR[sentiment],
+            "score": result["score"],
+            "confidence": result["confidence"]
         },
-        "intent": random.choice(["feedback", "complaint", "question", "praise"]),
-        "urgency": random.choice(["low", "medium", "high"]),
+        "aspects": [
+            {"aspect": a["label_ar"] if request.language == "ar" else a["aspect"], "sentiment": a["sentiment"], "score": a["score"]}
+            for a in result["aspects"]
+        ],
+        "keywords": result["keywords"],
+        "emotions": result["emotions"],
+        "intent": result["intent"],
+        "urgency": result["urgency"],
         "action_required": sentiment == "negative",
         "analyzed_at": datetime.now(timezone.utc).isoformat()
     }
@@ -487,157 +529,125 @@ async def analyze_sentiment(request: SentimentAnalysisRequest, user = Depends(ve
 @router.post("/sentiment/batch")
 async def batch_sentiment_analysis(texts: List[str], language: str = "ar", user = Depends(verify_admin_token)):
     """تحليل مشاعر مجموعة نصوص"""
+    if len(texts) > 5000:
+        raise HTTPException(status_code=400, detail="الحد الأقصى 5000 نص في الطلب الواحد")
+    
     results = []
-    for text in texts[:50]:  # حد أقصى 50 نص
-        score = random.uniform(-1, 1)
+    for text in texts:
+        score, label = sentiment_engine.score_text(text)
         results.append({
             "text": text[:100] + "..." if len(text) > 100 else text,
-            "sentiment": "positive" if score > 0.3 else "negative" if score < -0.3 else "neutral",
-            "score": round(score, 3)
+            "sentiment": label,
+            "score": score
         })
     
-    positive_count = len([r for r in results if r["sentiment"] == "positive"])
-    negative_count = len([r for r in results if r["sentiment"] == "negative"])
-    neutral_count = len([r for r in results if r["sentiment"] == "neutral"])
-    
     return {
         "total_analyzed": len(results),
         "results": results,
-        "summary": {
-            "positive": positive_count,
-            "negative": negative_count,
-            "neutral": neutral_count,
-            "positive_percentage": round(positive_count / len(results) * 100, 1),
-            "negative_percentage": round(negative_count / len(results) * 100, 1),
-            "overall_sentiment": "positive" if positive_count > negative_count else "negative" if negative_count > positive_count else "neutral"
-        }
+        "summary": sentiment_engine.summarize(results)
     }
 
 @router.get("/sentiment/reviews-analysis")
-async def get_reviews_sentiment_analysis(product_id: str = None, period: str = "30d", user = Depends(verify_admin_token)):
+async def get_reviews_sentiment_analysis(product_id: str = None, period: str = "30d", target_type: str = "product", user = Depends(verify_admin_token)):
     """تحليل مشاعر المراجعات"""
+    if target_type not in ("product", "restaurant", "hotel"):
+        raise HTTPException(status_code=400, detail="target_type must be product, restaurant or hotel")
+    days = int(period.rstrip("d")) if period.rstrip("d").isdigit() else 30
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    summary = sentiment_engine.aggregate_summary(db, target_type, product_id, since)
+    
+    aspects = sorted(summary["aspects"], key=lambda a: a["mentions"], reverse=True)
+    positive = [a for a in aspects if a["sentiment"] > 0][:3]
+    negative = sorted([a for a in aspects if a["sentiment"] < 0], key=lambda a: a["sentiment"])[:3]
+    
     return {
         "period": period,
         "product_id": product_id,
-        "total_reviews": 1250,
-        "sentiment_distribution": {
-            "positive": 68,
-            "neutral": 22,
-            "negative": 10
-        },
-        "average_rating": 4.2,
-        "sentiment_trend": [
-            {"date": "2024-01-01", "positive": 65, "negative": 12},
-            {"date": "2024-01-08", "positive": 68, "negative": 10},
-            {"date": "2024-01-15", "positive": 70, "negative": 9}
-        ],
-        "top_positive_aspects": [
-            {"aspect": "جودة المنتج", "mentions": 450, "sentiment": 0.85},
-            {"aspect": "سرعة التوصيل", "mentions": 380, "sentiment": 0.78},
-            {"aspect": "خدمة العملاء", "mentions": 220, "sentiment": 0.72}
-        ],
-        "top_negative_aspects": [
-            {"aspect": "سعر مرتفع", "mentions": 85, "sentiment": -0.65},
-            {"aspect": "التغليف", "mentions": 45, "sentiment": -0.55},
-            {"aspect": "وقت الانتظار", "mentions": 32, "sentiment": -0.48}
-        ],
+        "total_reviews": summary["total_reviews"],
+        "sentiment_distribution": summary["distribution"],
+        "average_rating": summary["average_rating"],
+        "sentiment_trend": summary["trend"],
+        "top_positive_aspects": positive,
+        "top_negative_aspects": negative,
         "action_items": [
-            {"priority": "high", "issue": "شكاوى عن التغليف - 45 مراجعة سلبية", "suggested_action": "تحسين مواد التغليف"},
-            {"priority": "medium", "issue": "ملاحظات عن السعر - 85 مراجعة", "suggested_action": "مراجعة استراتيجية التسعير"}
+            {
+                "priority": "high" if a["sentiment"] < -0.5 else "medium",
+                "issue": f"ملاحظات سلبية عن {a['aspect']} - {a['mentions']} مراجعة",
+                "suggested_action": f"مراجعة {a['aspect']}"
+            }
+            for a in negative
         ]
     }
 
-def extract_aspects(text, language):
-    """استخراج الجوانب من النص"""
-    aspects_ar = ["الجودة", "السعر", "التوصيل", "خدمة العملاء", "التغليف"]
-    aspects_en = ["quality", "price", "delivery", "customer service", "packaging"]
-    
-    aspects = aspects_ar if language == "ar" else aspects_en
-    
-    return [
-        {
-            "aspect": random.choice(aspects),
-            "sentiment": random.choice(["positive", "negative", "neutral"]),
-            "score": round(random.uniform(-1, 1), 2)
-        }
-        for _ in range(random.randint(1, 3))
-    ]
-
-def extract_keywords(text, language):
-    """استخراج الكلمات المفتاحية"""
-    keywords_ar = ["ممتاز", "سريع", "جودة", "سعر", "توصيل", "خدمة", "منتج"]
-    keywords_en = ["excellent", "fast", "quality", "price", "delivery", "service", "product"]
-    
-    keywords = keywords_ar if language == "ar" else keywords_en
-    
-    return random.sample(keywords, min(5, len(keywords)))
-
 # ==================== DEMAND FORECASTING ENGINE ====================
 
 @router.post("/demand/forecast")
-async def forecast_demand(request: DemandForecastRequest, user = Depends(verify_admin_token)):
+def forecast_demand(request: DemandForecastRequest, user = Depends(verify_admin_token)):
     """التنبؤ بالطلب على المنتج"""
-    
-    # توليد بيانات التنبؤ
+    if db is None:
+        raise HTTPException(status_code=500, detail="قاعدة البيانات غير متاحة")
+    product = db.products.find_one({"id": request.product_id}, {"_id": 0, "id": 1, "stock": 1})
+    if not product:
+        raise HTTPException(status_code=404, detail="المنتج غير موجود")
+
+    horizon = max(1, min(request.forecast_days, 180))
+    state, days = forecasting.daily_forecast(
+        db, "product", "units", request.product_id, horizon,
+        seasonality=request.include_seasonality, trend=request.include_trends
+    )
+    season = state["season"]
+    seasonal_model = state["model"] == "seasonal_naive"
+
     forecasts = []
-    base_demand = random.randint(50, 200)
-    
-    for day in range(request.forecast_days):
-        date = datetime.now(timezone.utc) + timedelta(days=day)
-        
-        # إضافة الموسمية
-        seasonality_factor = 1.0
-        if request.include_seasonality:
-            # زيادة في نهاية الأسبوع
-            if date.weekday() >= 4:
-                seasonality_factor *= 1.3
-            # زيادة في نهاية الشهر
-            if date.day > 25:
-                seasonality_factor *= 1.15
-        
-        # إضافة الاتجاه
-        trend_factor = 1.0
-        if request.include_trends:
-            trend_factor = 1 + (day * 0.005)  # نمو 0.5% يومياً
-        
-        predicted_demand = int(base_demand * seasonality_factor * trend_factor * random.uniform(0.9, 1.1))
-        
+    for i, day in enumerate(days):
+        s = season[i % forecasting.SEASON]
         forecasts.append({
-            "date": date.strftime("%Y-%m-%d"),
-            "predicted_demand": predicted_demand,
-            "confidence_low": int(predicted_demand * 0.85),
-            "confidence_high": int(predicted_demand * 1.15),
+            "date": day["date"],
+            "predicted_demand": round(day["value"], 1),
+            "confidence_low": round(day["low"], 1),
+            "confidence_high": round(day["high"], 1),
             "factors": {
-                "seasonality": round(seasonality_factor, 2),
-                "trend": round(trend_factor, 2)
+                # معامل اليوم من الأسبوع (نسبي أو إضافي حسب النموذج)
+                "seasonality": round(s if seasonal_model else (1 + s / state["level"] if state["level"] else 1.0), 2)
+                               if request.include_seasonality else 1.0,
+                "trend": round(state["trend"], 3) if request.include_trends else 0.0
             }
         })
-    
-    # حساب الإحصائيات
+
     total_demand = sum(f["predicted_demand"] for f in forecasts)
     avg_demand = total_demand / len(forecasts)
-    
+    peak = max(forecasts, key=lambda x: x["predicted_demand"])
+    low = min(forecasts, key=lambda x: x["predicted_demand"])
+    # مخزون الأمان من تذبذب الطلب اليومي الفعلي
+    safety_stock = math.ceil(forecasting.INTERVAL_Z * state["sigma"] * math.sqrt(7))
+    stock = product.get("stock") or 0
+
     return {
         "product_id": request.product_id,
-        "forecast_period": f"{request.forecast_days} days",
+        "forecast_period": f"{horizon} days",
         "forecasts": forecasts,
         "summary": {
-            "total_predicted_demand": total_demand,
+            "total_predicted_demand": round(total_demand, 1),
             "average_daily_demand": round(avg_demand, 1),
-            "peak_demand_date": max(forecasts, key=lambda x: x["predicted_demand"])["date"],
-            "peak_demand_value": max(f["predicted_demand"] for f in forecasts),
-            "low_demand_date": min(forecasts, key=lambda x: x["predicted_demand"])["date"],
-            "low_demand_value": min(f["predicted_demand"] for f in forecasts)
+            "peak_demand_date": peak["date"],
+            "peak_demand_value": peak["predicted_demand"],
+            "low_demand_date": low["date"],
+            "low_demand_value": low["predicted_demand"]
         },
         "inventory_recommendations": {
-            "recommended_stock": int(total_demand * 1.2),
-            "reorder_point": int(avg_demand * 7),
-            "safety_stock": int(avg_demand * 3)
+            "current_stock": stock,
+            "recommended_stock": math.ceil(total_demand + safety_stock),
+            "reorder_point": math.ceil(avg_demand * 7 + safety_stock),
+            "safety_stock": safety_stock,
+            "days_until_stockout": int(stock / avg_demand) if avg_demand > 0 else None
         },
         "model_info": {
-            "algorithm": "LSTM + Seasonal Decomposition",
-            "accuracy": round(random.uniform(85, 95), 1),
-            "last_trained": "2024-01-15"
+            "algorithm": state["model"],
+            "accuracy": forecasting.accuracy(state),
+            "history_days": state["n_obs"],
+            "last_trained": state.get("fitted_at")
         },
         "generated_at": datetime.now(timezone.utc).isoformat()
     }
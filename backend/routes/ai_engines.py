@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 from datetime import datetime, timezone, timedelta
@@ -7,6 +7,11 @@ import os
 from uuid import uuid4
 import random
 
+from core.responses import PRIVATE_CACHE, static_responses
+from engines import competitors as competitor_store
+from engines import pricing
+from engines.competitors import competitor_crawler
+
 router = APIRouter(prefix="/api/ai-engines", tags=["ai-engines"])
 
 db = None
@@ -61,48 +66,13 @@ class RecommendationRequest(BaseModel):
     context: str = "homepage"  # homepage, cart, product_page
     limit: int = 10
 
-# ==================== COMPETITOR DATA SIMULATION ====================
+# ==================== COMPETITOR DATA ====================
 
-COMPETITORS_DB = {
-    "amazon.sa": {"name": "أمازون السعودية", "icon": "🛒", "reliability": 95},
-    "noon.com": {"name": "نون", "icon": "🟡", "reliability": 92},
-    "extra.com": {"name": "اكسترا", "icon": "🔵", "reliability": 90},
-    "jarir.com": {"name": "جرير", "icon": "📚", "reliability": 94},
-    "lulu.com": {"name": "لولو", "icon": "🟢", "reliability": 88},
-    "carrefour.sa": {"name": "كارفور", "icon": "🔴", "reliability": 87},
-    "panda.com.sa": {"name": "بنده", "icon": "🐼", "reliability": 85},
-}
+COMPETITORS_DB = competitor_store.COMPETITORS
 
-# محاكاة قاعدة بيانات أسعار المنافسين
 def get_competitor_prices(product_id: str):
-    """محاكاة جلب أسعار المنافسين من الويب"""
-    base_prices = {
-        "iphone-15-pro": 4999,
-        "samsung-s24": 3499,
-        "airpods-pro": 999,
-        "macbook-air": 5499,
-        "ps5": 2199,
-        "xbox-series-x": 2099,
-    }
-    base = base_prices.get(product_id, random.randint(100, 5000))
-    
-    prices = []
-    for comp_id, comp_info in COMPETITORS_DB.items():
-        variation = random.uniform(-0.15, 0.15)  # ±15% من السعر الأساسي
-        price = round(base * (1 + variation), 2)
-        prices.append({
-            "competitor_id": comp_id,
-            "competitor_name": comp_info["name"],
-            "icon": comp_info["icon"],
-            "price": price,
-            "currency": "SAR",
-            "in_stock": random.random() > 0.2,
-            "last_updated": datetime.now(timezone.utc).isoformat(),
-            "price_change": round(random.uniform(-5, 5), 1),  # تغير السعر %
-            "url": f"https://{comp_id}/product/{product_id}"
-        })
-    
-    return sorted(prices, key=lambda x: x["price"])
+    """أسعار المنافسين من آخر لقطة محفوظة (الأرخص أولاً)"""
+    return competitor_store.expand_prices(competitor_store.get_snapshot(db, product_id))
 
 # ==================== MULTILINGUAL SEO DATA ====================
 
@@ -308,14 +278,26 @@ async def toggle_engine(engine_id: str, enabled: bool, user = Depends(verify_adm
 # ==================== PRICING OPTIMIZER ====================
 
 @router.get("/pricing/competitors/{product_id}")
-async def get_competitors_prices(product_id: str, user = Depends(verify_admin_token)):
-    """جلب أسعار المنافسين تلقائياً للمنتج"""
-    prices = get_competitor_prices(product_id)
-    
-    min_price = min(p["price"] for p in prices)
-    max_price = max(p["price"] for p in prices)
+def get_competitors_prices(product_id: str, user = Depends(verify_admin_token)):
+    """جلب أسعار المنافسين للمنتج من آخر لقطة"""
+    snapshot = competitor_store.get_snapshot(db, product_id)
+    prices = competitor_store.expand_prices(snapshot)
+    if not prices:
+        return {
+            "product_id": product_id,
+            "competitors": [],
+            "analysis": None,
+            "message": "لا توجد أسعار منافسين لهذا المنتج بعد - فعّل التتبع أولاً",
+            "last_scan": None,
+            "next_scan": None
+        }
+
+    min_price = prices[0]["price"]
+    max_price = prices[-1]["price"]
     avg_price = sum(p["price"] for p in prices) / len(prices)
-    
+    product = db.products.find_one({"id": product_id}, {"_id": 0, "price": 1}) or {}
+    our_price = product.get("price")
+
     return {
         "product_id": product_id,
         "competitors": prices,
@@ -324,16 +306,29 @@ async def get_competitors_prices(product_id: str, user = Depends(verify_admin_to
             "max_price": max_price,
             "avg_price": round(avg_price, 2),
             "price_range": round(max_price - min_price, 2),
-            "cheapest_competitor": next(p["competitor_name"] for p in prices if p["price"] == min_price),
-            "market_position": "competitive" if avg_price < 3000 else "premium"
+            "cheapest_competitor": prices[0]["competitor_name"],
+            "our_price": our_price,
+            "market_position": None if our_price is None else
+                "competitive" if our_price <= avg_price else "premium"
         },
-        "last_scan": datetime.now(timezone.utc).isoformat(),
-        "next_scan": (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+        "last_scan": snapshot["fetched_at"],
+        "next_scan": (datetime.fromisoformat(snapshot["fetched_at"]) +
+                      timedelta(seconds=competitor_store.CRAWL_INTERVAL)).isoformat()
     }
 
 @router.post("/pricing/track-competitors")
-async def track_competitors(request: CompetitorTrackRequest, user = Depends(verify_admin_token)):
+def track_competitors(request: CompetitorTrackRequest, user = Depends(verify_admin_token)):
     """إضافة منتج لتتبع أسعار المنافسين"""
+    unknown = [c for c in request.competitors if c not in COMPETITORS_DB]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"منافسون غير معروفين: {', '.join(unknown)}")
+    db.competitor_tracking.update_one(
+        {"product_id": request.product_id},
+        {"$set": {"product_id": request.product_id, "competitors": request.competitors,
+                  "updated_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+    competitor_crawler.wake()
     return {
         "success": True,
         "product_id": request.product_id,
@@ -344,233 +339,213 @@ async def track_competitors(request: CompetitorTrackRequest, user = Depends(veri
     }
 
 @router.get("/pricing/history/{product_id}")
-async def get_price_history(product_id: str, days: int = 30, user = Depends(verify_admin_token)):
+def get_price_history(product_id: str, days: int = 30, user = Depends(verify_admin_token)):
     """الحصول على تاريخ الأسعار للمنتج والمنافسين"""
-    history = []
-    base_price = random.randint(1000, 5000)
-    
-    for i in range(days):
-        date = datetime.now(timezone.utc) - timedelta(days=days-i)
-        day_data = {
-            "date": date.strftime("%Y-%m-%d"),
-            "our_price": base_price + random.randint(-100, 100),
-            "competitors": {}
-        }
-        for comp_id in list(COMPETITORS_DB.keys())[:4]:
-            day_data["competitors"][comp_id] = base_price + random.randint(-200, 200)
-        history.append(day_data)
-    
+    product = db.products.find_one({"id": product_id}, {"_id": 0, "price": 1})
+    if not product:
+        raise HTTPException(status_code=404, detail="المنتج غير موجود")
+    days = max(1, min(days, 365))
+    series, changes = pricing.price_history(db, product_id, days, current_price=product.get("price"))
+
+    history = [{"date": day["date"], "our_price": day["price"], "competitors": {}} for day in series]
+    snapshot = competitor_store.get_snapshot(db, product_id)
+    if snapshot and history:
+        # أسعار المنافسين متاحة من آخر لقطة فقط
+        history[-1]["competitors"] = {p["c"]: p["p"] for p in snapshot["prices"]}
+    prices = [day["price"] for day in series if day["price"] is not None]
+    our_trend = "stable"
+    if prices and prices[0]:
+        change = (prices[-1] - prices[0]) / prices[0]
+        our_trend = "increasing" if change > 0.02 else "decreasing" if change < -0.02 else "stable"
+
     return {
         "product_id": product_id,
         "period": f"{days} days",
         "history": history,
+        "price_changes": changes,
         "trends": {
-            "our_trend": "stable",
-            "market_trend": "decreasing",
-            "recommendation": "يُنصح بتخفيض السعر 5% للحفاظ على التنافسية"
+            "our_trend": our_trend
         }
     }
 
 @router.get("/pricing/alerts")
-async def get_pricing_alerts(user = Depends(verify_admin_token)):
+def get_pricing_alerts(user = Depends(verify_admin_token)):
     """الحصول على تنبيهات تغير أسعار المنافسين"""
+    alerts = competitor_store.recent_alerts(db)
+    severities = [a["severity"] for a in alerts]
     return {
-        "alerts": [
-            {
-                "id": "ALT-001",
-                "type": "price_drop",
-                "severity": "high",
-                "product": "iPhone 15 Pro",
-                "competitor": "أمازون السعودية",
-                "old_price": 5199,
-                "new_price": 4799,
-                "change": -7.7,
-                "our_price": 4999,
-                "action_required": "تخفيض السعر للحفاظ على التنافسية",
-                "created_at": datetime.now(timezone.utc).isoformat()
-            },
-            {
-                "id": "ALT-002",
-                "type": "out_of_stock",
-                "severity": "medium",
-                "product": "AirPods Pro",
-                "competitor": "نون",
-                "message": "المنتج غير متوفر لدى المنافس - فرصة لزيادة السعر",
-                "suggested_increase": 5,
-                "created_at": (datetime.now(timezone.utc) - timedelta(hours=2)).isoformat()
-            },
-            {
-                "id": "ALT-003",
-                "type": "price_increase",
-                "severity": "low",
-                "product": "Samsung Galaxy S24",
-                "competitor": "جرير",
-                "old_price": 3299,
-                "new_price": 3499,
-                "change": 6.1,
-                "our_price": 3399,
-                "action_required": "لا يلزم إجراء - سعرنا تنافسي",
-                "created_at": (datetime.now(timezone.utc) - timedelta(hours=5)).isoformat()
-            }
-        ],
+        "alerts": alerts,
         "summary": {
-            "total_alerts": 3,
-            "high_priority": 1,
-            "medium_priority": 1,
-            "low_priority": 1,
-            "action_required": 1
+            "total_alerts": len(alerts),
+            "high_priority": severities.count("high"),
+            "medium_priority": severities.count("medium"),
+            "low_priority": severities.count("low"),
+            "action_required": severities.count("high")
         }
     }
 
 @router.post("/pricing/auto-rules")
-async def create_auto_pricing_rule(rule: AutoPricingRule, user = Depends(verify_admin_token)):
+def create_auto_pricing_rule(rule: AutoPricingRule, user = Depends(verify_admin_token)):
     """إنشاء قاعدة تسعير تلقائي"""
-    rule_id = f"APR-{str(uuid4())[:8].upper()}"
-    
+    if rule.schedule not in pricing.SCHEDULE_INTERVALS:
+        raise HTTPException(status_code=400, detail="جدول التشغيل غير صالح")
+    if not 0 <= rule.min_margin <= rule.max_margin < 100:
+        raise HTTPException(status_code=400, detail="هامش الربح غير صالح")
+
+    now = datetime.now(timezone.utc)
+    doc = {
+        "id": f"APR-{str(uuid4())[:8].upper()}",
+        **rule.dict(),
+        "status": "active",
+        "created_by": user.get("user_id"),
+        "created_at": now.isoformat(),
+        # أول تشغيل في الدورة القادمة للمجدول
+        "next_run": now.replace(tzinfo=None).isoformat(),
+        "products_affected": 0,
+        "prices_updated": 0
+    }
+    db.pricing_rules.insert_one(doc)
+    doc.pop("_id", None)
+
     return {
         "success": True,
-        "rule_id": rule_id,
-        "rule": {
-            "product_id": rule.product_id,
-            "category": rule.category,
-            "min_margin": rule.min_margin,
-            "max_margin": rule.max_margin,
-            "match_competitor": rule.match_competitor,
-            "undercut_percentage": rule.undercut_percentage,
-            "auto_apply": rule.auto_apply,
-            "schedule": rule.schedule
-        },
+        "rule_id": doc["id"],
+        "rule": doc,
         "message": "تم إنشاء قاعدة التسعير التلقائي بنجاح",
-        "next_run": (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat() if rule.schedule == "hourly" else (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+        "next_run": doc["next_run"]
     }
 
 @router.get("/pricing/auto-rules")
-async def get_auto_pricing_rules(user = Depends(verify_admin_token)):
+def get_auto_pricing_rules(user = Depends(verify_admin_token)):
     """الحصول على قواعد التسعير التلقائي"""
+    rules = list(db.pricing_rules.find({}, {"_id": 0}).sort("created_at", -1))
+    active = [r for r in rules if r.get("status") == "active"]
     return {
-        "rules": [
-            {
-                "id": "APR-001",
-                "name": "مطابقة أقل سعر - إلكترونيات",
-                "category": "electronics",
-                "min_margin": 8,
-                "max_margin": 25,
-                "match_competitor": True,
-                "undercut_percentage": 2,
-                "auto_apply": True,
-                "schedule": "hourly",
-                "status": "active",
-                "products_affected": 156,
-                "last_run": (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat(),
-                "prices_updated": 23
-            },
-            {
-                "id": "APR-002",
-                "name": "تسعير ديناميكي - أزياء",
-                "category": "fashion",
-                "min_margin": 15,
-                "max_margin": 40,
-                "match_competitor": False,
-                "undercut_percentage": 0,
-                "auto_apply": False,
-                "schedule": "daily",
-                "status": "active",
-                "products_affected": 892,
-                "last_run": (datetime.now(timezone.utc) - timedelta(days=1)).isoformat(),
-                "prices_updated": 45
-            }
-        ],
+        "rules": rules,
         "summary": {
-            "total_rules": 2,
-            "active_rules": 2,
-            "auto_apply_enabled": 1,
-            "total_products_managed": 1048
+            "total_rules": len(rules),
+            "active_rules": len(active),
+            "auto_apply_enabled": len([r for r in active if r.get("auto_apply")]),
+            "total_products_managed": sum(r.get("products_affected") or 0 for r in active)
         }
     }
 
+@router.post("/pricing/auto-rules/{rule_id}/run")
+def run_auto_pricing_rule(rule_id: str, dry_run: bool = False, user = Depends(verify_admin_token)):
+    """تشغيل قاعدة تسعير فوراً"""
+    if not db.pricing_rules.find_one({"id": rule_id, "status": "active"}):
+        raise HTTPException(status_code=404, detail="القاعدة غير موجودة أو غير مفعلة")
+    stats = pricing.run_rules(db, [rule_id], dry_run=dry_run)
+    return {"success": True, "rule_id": rule_id, "dry_run": dry_run, **stats.get(rule_id, {})}
+
 @router.post("/pricing/apply-suggestion")
-async def apply_price_suggestion(product_id: str, new_price: float, user = Depends(verify_admin_token)):
+def apply_price_suggestion(product_id: str, new_price: float, user = Depends(verify_admin_token)):
     """تطبيق السعر المقترح على المنتج"""
+    if new_price <= 0:
+        raise HTTPException(status_code=400, detail="السعر غير صالح")
+    product = db.products.find_one({"id": product_id}, {"_id": 0, "price": 1})
+    if not product:
+        raise HTTPException(status_code=404, detail="المنتج غير موجود")
+
+    old_price = product.get("price")
+    new_price = round(new_price, 2)
+    if not pricing.apply_prices(db, [(product_id, old_price, new_price)], source="suggestion") and old_price != new_price:
+        raise HTTPException(status_code=409, detail="تم تعديل سعر المنتج أثناء التطبيق، أعد المحاولة")
+    db.pricing_suggestions.delete_one({"product_id": product_id})
+
     return {
         "success": True,
         "product_id": product_id,
-        "old_price": new_price * random.uniform(0.9, 1.1),
+        "old_price": old_price,
         "new_price": new_price,
         "applied_at": datetime.now(timezone.utc).isoformat(),
-        "message": f"تم تحديث سعر المنتج إلى {new_price} ر.س",
-        "sync_status": {
-            "website": "synced",
-            "mobile_app": "synced",
-            "marketplaces": "pending"
-        }
+        "message": f"تم تحديث سعر المنتج إلى {new_price} ر.س"
     }
 
 @router.post("/pricing/bulk-apply")
-async def bulk_apply_prices(product_ids: List[str], user = Depends(verify_admin_token)):
+def bulk_apply_prices(product_ids: List[str], user = Depends(verify_admin_token)):
     """تطبيق الأسعار المقترحة على مجموعة منتجات"""
+    suggestions = {s["product_id"]: s for s in db.pricing_suggestions.find(
+        {"product_id": {"$in": product_ids}}, {"_id": 0})}
+    applied = pricing.apply_prices(db, [
+        (pid, s["current_price"], s["suggested_price"]) for pid, s in suggestions.items()
+    ], source="suggestion")
+    if applied:
+        db.pricing_suggestions.delete_many({"product_id": {"$in": list(applied)}})
+
     results = []
     for pid in product_ids:
+        suggestion = suggestions.get(pid)
         results.append({
             "product_id": pid,
-            "status": "updated",
-            "old_price": random.randint(100, 5000),
-            "new_price": random.randint(100, 5000)
+            # stale: السعر تغير منذ إنشاء الاقتراح
+            "status": "updated" if pid in applied else "stale" if suggestion else "no_suggestion",
+            "old_price": suggestion["current_price"] if suggestion else None,
+            "new_price": suggestion["suggested_price"] if suggestion else None
         })
-    
+
     return {
         "success": True,
         "total_products": len(product_ids),
-        "updated": len(product_ids),
-        "failed": 0,
+        "updated": len(applied),
+        "failed": len(product_ids) - len(applied),
         "results": results,
         "applied_at": datetime.now(timezone.utc).isoformat()
     }
 
 @router.post("/pricing/optimize")
-async def optimize_pricing(request: PricingRequest, user = Depends(verify_admin_token)):
+def optimize_pricing(request: PricingRequest, user = Depends(verify_admin_token)):
     """Get AI-optimized pricing suggestion with competitor analysis"""
-    # جلب أسعار المنافسين تلقائياً
-    competitor_data = get_competitor_prices(request.product_id)
-    competitor_prices = [p["price"] for p in competitor_data]
-    
+    product = db.products.find_one({"id": request.product_id}, {"_id": 0, "price": 1, "cost": 1, "stock": 1}) or {}
+    snapshot = competitor_store.get_snapshot(db, request.product_id)
+    competitor_data = competitor_store.expand_prices(snapshot)
+    in_stock_prices = [p["price"] for p in competitor_data if p["in_stock"]]
+    competitor_prices = in_stock_prices or [p["price"] for p in competitor_data]
+
     # إذا تم توفير أسعار يدوية، استخدمها
     if request.competitor_prices:
         competitor_prices = request.competitor_prices
-    
-    base_price = competitor_prices[0] if competitor_prices else 100
-    competitor_avg = sum(competitor_prices) / len(competitor_prices) if competitor_prices else base_price
-    min_competitor = min(competitor_prices) if competitor_prices else base_price
-    
+
+    current_price = product.get("price") or (competitor_prices[0] if competitor_prices else 100)
+    competitor_avg = sum(competitor_prices) / len(competitor_prices) if competitor_prices else current_price
+    min_competitor = min(competitor_prices) if competitor_prices else current_price
+
     # حساب السعر الأمثل
     suggested_price = round(min_competitor * (1 - 0.02), 2)  # 2% أقل من أقل منافس
-    
+
     # التأكد من الهامش المستهدف
-    cost_estimate = suggested_price * 0.7  # تقدير التكلفة
-    actual_margin = ((suggested_price - cost_estimate) / suggested_price) * 100
-    
-    if actual_margin < request.target_margin:
+    cost_estimate = product.get("cost") or current_price * pricing.DEFAULT_COST_RATIO
+    if (suggested_price - cost_estimate) / suggested_price * 100 < request.target_margin:
         suggested_price = round(cost_estimate / (1 - request.target_margin / 100), 2)
-    
+    actual_margin = ((suggested_price - cost_estimate) / suggested_price) * 100
+
+    # الثقة: تغطية المنافسين وحداثة اللقطة
+    confidence = 50.0
+    if snapshot:
+        age_hours = (datetime.utcnow() - datetime.fromisoformat(snapshot["fetched_at"])).total_seconds() / 3600
+        coverage = len(competitor_data) / len(COMPETITORS_DB)
+        confidence = round(min(98.0, 60 + 30 * coverage + max(0.0, 10 - age_hours)), 1)
+
     return {
         "product_id": request.product_id,
-        "current_price": base_price,
+        "current_price": current_price,
         "suggested_price": suggested_price,
         "competitor_analysis": {
             "prices_fetched_automatically": len(competitor_data),
             "min_price": min_competitor,
-            "max_price": max(competitor_prices) if competitor_prices else base_price,
+            "max_price": max(competitor_prices) if competitor_prices else current_price,
             "avg_price": round(competitor_avg, 2),
-            "cheapest_competitor": competitor_data[0]["competitor_name"] if competitor_data else "N/A"
+            "cheapest_competitor": competitor_data[0]["competitor_name"] if competitor_data else "N/A",
+            "snapshot_at": snapshot["fetched_at"] if snapshot else None
         },
         "competitors_detail": competitor_data[:5],  # أول 5 منافسين
         "expected_margin": round(actual_margin, 1),
         "target_margin": request.target_margin,
-        "confidence": round(random.uniform(88, 98), 1),
+        "confidence": confidence,
         "factors": [
-            {"factor": "أسعار المنافسين (تم جلبها تلقائياً)", "impact": "high", "direction": "analyzed"},
-            {"factor": "الطلب الموسمي", "impact": "medium", "direction": "up"},
-            {"factor": "مستوى المخزون", "impact": "low", "direction": "neutral"},
-            {"factor": "تاريخ المبيعات", "impact": "medium", "direction": "stable"},
+            {"factor": "أسعار المنافسين (آخر لقطة محفوظة)", "impact": "high", "direction": "analyzed"},
+            {"factor": "مستوى المخزون", "impact": "low",
+             "direction": "up" if (product.get("stock") or 0) <= pricing.LOW_STOCK else "neutral"},
         ],
         "recommendation": "يُنصح بتطبيق السعر المقترح - أقل بـ 2% من أقل منافس مع الحفاظ على هامش ربح مقبول",
         "auto_apply_available": True,
@@ -663,9 +638,7 @@ async def optimize_seo_multilang(request: MultiLangSEORequest, user = Depends(ve
         ]
     }
 
-@router.get("/seo/supported-languages")
-async def get_supported_languages(user = Depends(verify_admin_token)):
-    """الحصول على اللغات المدعومة لتحسين SEO"""
+def supported_languages():
     languages = []
     for lang_code, template in SEO_TEMPLATES.items():
         languages.append({
@@ -684,12 +657,23 @@ async def get_supported_languages(user = Depends(verify_admin_token)):
         "recommended_for_international": ["ar", "en", "fr", "de", "tr"]
     }
 
+@router.get("/seo/supported-languages")
+async def get_supported_languages(request: Request, user = Depends(verify_admin_token)):
+    """الحصول على اللغات المدعومة لتحسين SEO"""
+    return static_responses.variant("seo.supported_languages", None, supported_languages,
+                                    PRIVATE_CACHE).respond(request)
+
 @router.get("/seo/keywords/{language}")
-async def get_keywords_by_language(language: str, category: str = None, user = Depends(verify_admin_token)):
+async def get_keywords_by_language(language: str, request: Request, category: str = None,
+                                   user = Depends(verify_admin_token)):
     """الحصول على الكلمات المفتاحية المقترحة حسب اللغة والفئة"""
     if language not in SEO_TEMPLATES:
         raise HTTPException(status_code=400, detail="اللغة غير مدعومة")
     
+    return static_responses.variant("seo.keywords", (language, category),
+                                    lambda: language_keywords(language, category), PRIVATE_CACHE).respond(request)
+
+def language_keywords(language, category):
     base_keywords = SEO_TEMPLATES[language]["keywords"]
     
     category_keywords = {
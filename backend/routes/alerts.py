@@ -9,10 +9,11 @@ import random
 import asyncio
 import json
 
+from core.shared_state import shared_state
+
 router = APIRouter(prefix="/api/alerts", tags=["real-time-alerts"])
 
 db = None
-active_connections: List[WebSocket] = []
 
 def set_db(database):
     global db
@@ -20,6 +21,48 @@ def set_db(database):
 
 SECRET_KEY = os.environ.get("JWT_SECRET", "ocean-secret-key-2024")
 
+
+class AlertHub:
+    """
+    Dashboard websockets connected to this worker. Events are sent to the
+    local sockets and published on the `alerts` channel; every other worker
+    forwards them to its own sockets, so a dashboard sees every event
+    whichever worker it is connected to.
+    """
+
+    def __init__(self):
+        self.connections = set()
+        self.loop = None
+        shared_state.subscribe("alerts", self._from_peer)
+
+    async def connect(self, websocket):
+        await websocket.accept()
+        self.loop = asyncio.get_running_loop()
+        self.connections.add(websocket)
+
+    def disconnect(self, websocket):
+        self.connections.discard(websocket)
+
+    async def broadcast(self, event):
+        event = {**event, "at": datetime.now(timezone.utc).isoformat()}
+        shared_state.publish("alerts", event)
+        await self._send_local(event)
+
+    async def _send_local(self, event):
+        for websocket in list(self.connections):
+            try:
+                await websocket.send_json(event)
+            except Exception:
+                self.disconnect(websocket)
+
+    def _from_peer(self, event):
+        # Called on the shared-state tail thread
+        if self.connections and self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self._send_local(event), self.loop)
+
+
+hub = AlertHub()
+
 # Models
 class AlertRule(BaseModel):
     name: str
@@ -47,6 +90,23 @@ async def verify_admin_token(authorization: str = Header(None)):
 
 # ==================== REAL-TIME ALERTS ====================
 
+@router.websocket("/ws")
+async def alerts_stream(websocket: WebSocket, token: str = ""):
+    """Stream alert and incident events to the dashboard"""
+    try:
+        jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    except Exception:
+        await websocket.close(code=1008)
+        return
+    await hub.connect(websocket)
+    try:
+        while True:
+            await websocket.receive_text()      # keep-alive pings; nothing to handle
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.disconnect(websocket)
+
 @router.get("/active")
 async def get_active_alerts(user = Depends(verify_admin_token), severity: str = None):
     """Get all active alerts"""
@@ -139,6 +199,8 @@ async def get_active_alerts(user = Depends(verify_admin_token), severity: str =
 @router.post("/acknowledge")
 async def acknowledge_alert(request: AlertAcknowledge, user = Depends(verify_admin_token)):
     """Acknowledge an alert"""
+    await hub.broadcast({"type": "alert.acknowledged", "alert_id": request.alert_id,
+                         "by": user.get("email", "admin")})
     return {
         "success": True,
         "message": f"تم الإقرار بالتنبيه {request.alert_id}",
@@ -149,6 +211,7 @@ async def acknowledge_alert(request: AlertAcknowledge, user = Depends(verify_adm
 @router.post("/resolve/{alert_id}")
 async def resolve_alert(alert_id: str, resolution: str, user = Depends(verify_admin_token)):
     """Resolve an alert"""
+    await hub.broadcast({"type": "alert.resolved", "alert_id": alert_id, "by": user.get("email", "admin")})
     return {
         "success": True,
         "message": f"تم حل التنبيه {alert_id}",
@@ -278,15 +341,19 @@ async def get_incidents(user = Depends(verify_admin_token), status: str = None):
 @router.post("/incidents")
 async def create_incident(title: str, description: str, severity: str, user = Depends(verify_admin_token)):
     """Create a new incident"""
+    incident_id = f"INC-{str(uuid4())[:8].upper()}"
+    await hub.broadcast({"type": "incident.created", "incident_id": incident_id, "title": title,
+                         "severity": severity})
     return {
         "success": True,
-        "incident_id": f"INC-{str(uuid4())[:8].upper()}",
+        "incident_id": incident_id,
         "message": f"تم إنشاء الحادثة: {title}"
     }
 
 @router.post("/incidents/{incident_id}/update")
 async def update_incident(incident_id: str, update: str, user = Depends(verify_admin_token)):
     """Add update to incident timeline"""
+    await hub.broadcast({"type": "incident.updated", "incident_id": incident_id, "update": update})
     return {
         "success": True,
         "message": f"تم إضافة تحديث للحادثة {incident_id}"
@@ -295,6 +362,7 @@ async def update_incident(incident_id: str, update: str, user = Depends(verify_a
 @router.post("/incidents/{incident_id}/resolve")
 async def resolve_incident(incident_id: str, resolution: str, root_cause: str, user = Depends(verify_admin_token)):
     """Resolve an incident"""
+    await hub.broadcast({"type": "incident.resolved", "incident_id": incident_id})
     return {
         "success": True,
         "message": f"تم حل الحادثة {incident_id}",
@@ -6,6 +6,8 @@ import jwt
 import os
 import random
 
+from engines import forecasting
+
 router = APIRouter(prefix="/api/analytics-advanced", tags=["advanced-analytics"])
 
 db = None
@@ -29,42 +31,51 @@ async def verify_admin_token(authorization: str = Header(None)):
 # ==================== SALES PREDICTION ====================
 
 @router.get("/sales-prediction")
-async def get_sales_prediction(period: str = "7d", user = Depends(verify_admin_token)):
+def get_sales_prediction(period: str = "7d", user = Depends(verify_admin_token)):
     """التنبؤ بالمبيعات"""
-    predictions = []
-    base = 125000
-    
+    if db is None:
+        raise HTTPException(status_code=500, detail="قاعدة البيانات غير متاحة")
     days = 7 if period == "7d" else 30 if period == "30d" else 90
-    
-    for i in range(days):
-        date = datetime.now(timezone.utc) + timedelta(days=i+1)
-        # Weekend boost
-        multiplier = 1.3 if date.weekday() >= 4 else 1.0
-        predicted = int(base * multiplier * random.uniform(0.9, 1.15))
+
+    state, forecast = forecasting.daily_forecast(db, "total", "revenue", "total", days)
+    predictions = []
+    for day in forecast:
+        weekday = datetime.fromisoformat(day["date"]).weekday()
         predictions.append({
-            "date": date.strftime("%Y-%m-%d"),
-            "predicted_sales": predicted,
-            "confidence_low": int(predicted * 0.85),
-            "confidence_high": int(predicted * 1.15),
-            "is_weekend": date.weekday() >= 4
+            "date": day["date"],
+            "predicted_sales": round(day["value"]),
+            "confidence_low": round(day["low"]),
+            "confidence_high": round(day["high"]),
+            "is_weekend": weekday >= 4
         })
-    
+
+    total = sum(p["predicted_sales"] for p in predictions)
     return {
         "period": period,
         "predictions": predictions,
         "summary": {
-            "total_predicted": sum(p["predicted_sales"] for p in predictions),
-            "average_daily": sum(p["predicted_sales"] for p in predictions) // len(predictions),
+            "total_predicted": total,
+            "average_daily": total // len(predictions),
             "peak_day": max(predictions, key=lambda x: x["predicted_sales"])["date"],
-            "model_accuracy": 92.5
+            "model_accuracy": forecasting.accuracy(state),
+            "model": state["model"]
         },
-        "factors": [
-            {"name": "الموسمية", "impact": "+15%"},
-            {"name": "الحملات التسويقية", "impact": "+8%"},
-            {"name": "المنافسة", "impact": "-3%"}
-        ]
+        "factors": _prediction_factors(state, predictions)
     }
 
+def _prediction_factors(state, predictions):
+    """أثر الموسمية الأسبوعية والاتجاه من النموذج المدرب"""
+    weekend = [p["predicted_sales"] for p in predictions if p["is_weekend"]]
+    weekday = [p["predicted_sales"] for p in predictions if not p["is_weekend"]]
+    factors = []
+    if weekend and weekday and sum(weekday):
+        uplift = (sum(weekend) / len(weekend)) / (sum(weekday) / len(weekday)) - 1
+        factors.append({"name": "الموسمية", "impact": f"{uplift * 100:+.0f}%"})
+    if state["level"]:
+        weekly = state["trend"] * 7 / state["level"]
+        factors.append({"name": "الاتجاه الأسبوعي", "impact": f"{weekly * 100:+.1f}%"})
+    return factors
+
 # ==================== COMPETITOR ANALYSIS ====================
 
 @router.get("/competitor-analysis")
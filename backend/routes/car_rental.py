@@ -4,7 +4,10 @@ from typing import Optional, List, Dict
 from datetime import datetime, timezone, timedelta
 import jwt
 import os
-import random
+from uuid import uuid4
+
+from engines import fleet
+from engines.fleet import fleet_index
 
 router = APIRouter(prefix="/api/car-rental", tags=["car-rental"])
 
@@ -28,151 +31,62 @@ async def verify_token(authorization: str = Header(None)):
 
 # ==================== CAR CATALOG ====================
 
+def parse_rental_window(pickup_date: str, return_date: str):
+    """تحويل تواريخ الاستلام والتسليم مع التحقق منها"""
+    try:
+        pickup = datetime.fromisoformat(pickup_date.replace("Z", "+00:00"))
+        dropoff = datetime.fromisoformat(return_date.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="صيغة التاريخ غير صحيحة (YYYY-MM-DD أو ISO)")
+    # تخزين التواريخ بتوقيت UTC بدون منطقة زمنية
+    if pickup.tzinfo:
+        pickup = pickup.astimezone(timezone.utc).replace(tzinfo=None)
+    if dropoff.tzinfo:
+        dropoff = dropoff.astimezone(timezone.utc).replace(tzinfo=None)
+    if dropoff <= pickup:
+        raise HTTPException(status_code=400, detail="تاريخ التسليم يجب أن يكون بعد تاريخ الاستلام")
+    if pickup < datetime.utcnow() - timedelta(days=1):
+        raise HTTPException(status_code=400, detail="تاريخ الاستلام في الماضي")
+    if fleet.rental_days(pickup, dropoff) > fleet.MAX_RENTAL_DAYS:
+        raise HTTPException(status_code=400, detail=f"أقصى مدة للإيجار {fleet.MAX_RENTAL_DAYS} يوماً")
+    return pickup, dropoff
+
 @router.get("/cars")
-async def get_available_cars(city: str = "الرياض", category: str = None, user = Depends(verify_token)):
+def get_available_cars(city: str = "الرياض", category: str = None, pickup_date: str = None,
+                       return_date: str = None, user = Depends(verify_token)):
     """السيارات المتاحة"""
-    cars = [
-        {
-            "id": "CAR-001",
-            "brand": "تويوتا",
-            "model": "كامري 2024",
-            "category": "سيدان",
-            "year": 2024,
-            "color": "أبيض",
-            "seats": 5,
-            "transmission": "أوتوماتيك",
-            "fuel_type": "بنزين",
-            "daily_rate": 250,
-            "weekly_rate": 1500,
-            "monthly_rate": 5000,
-            "features": ["بلوتوث", "كاميرا خلفية", "مثبت سرعة"],
-            "available": True,
-            "location": "مطار الرياض",
-            "image": "/images/cars/camry-2024.jpg",
-            "rating": 4.8
-        },
-        {
-            "id": "CAR-002",
-            "brand": "هيونداي",
-            "model": "سوناتا 2024",
-            "category": "سيدان",
-            "year": 2024,
-            "color": "أسود",
-            "seats": 5,
-            "transmission": "أوتوماتيك",
-            "fuel_type": "بنزين",
-            "daily_rate": 200,
-            "weekly_rate": 1200,
-            "monthly_rate": 4000,
-            "features": ["بلوتوث", "شاشة لمس"],
-            "available": True,
-            "location": "وسط الرياض",
-            "image": "/images/cars/sonata-2024.jpg",
-            "rating": 4.6
-        },
-        {
-            "id": "CAR-003",
-            "brand": "لكزس",
-            "model": "ES 350 2024",
-            "category": "فاخرة",
-            "year": 2024,
-            "color": "فضي",
-            "seats": 5,
-            "transmission": "أوتوماتيك",
-            "fuel_type": "بنزين",
-            "daily_rate": 450,
-            "weekly_rate": 2800,
-            "monthly_rate": 10000,
-            "features": ["مقاعد جلد", "نظام صوتي مارك ليفنسون", "شاشة HUD"],
-            "available": True,
-            "location": "مطار الرياض",
-            "image": "/images/cars/lexus-es-2024.jpg",
-            "rating": 4.9
-        },
-        {
-            "id": "CAR-004",
-            "brand": "تويوتا",
-            "model": "فورتشنر 2024",
-            "category": "SUV",
-            "year": 2024,
-            "color": "أبيض",
-            "seats": 7,
-            "transmission": "أوتوماتيك",
-            "fuel_type": "بنزين",
-            "daily_rate": 350,
-            "weekly_rate": 2100,
-            "monthly_rate": 7500,
-            "features": ["دفع رباعي", "شاشة كبيرة", "كاميرات 360"],
-            "available": True,
-            "location": "مطار الرياض",
-            "image": "/images/cars/fortuner-2024.jpg",
-            "rating": 4.7
-        },
-        {
-            "id": "CAR-005",
-            "brand": "نيسان",
-            "model": "صني 2024",
-            "category": "اقتصادية",
-            "year": 2024,
-            "color": "رمادي",
-            "seats": 5,
-            "transmission": "أوتوماتيك",
-            "fuel_type": "بنزين",
-            "daily_rate": 120,
-            "weekly_rate": 700,
-            "monthly_rate": 2500,
-            "features": ["بلوتوث", "تكييف"],
-            "available": True,
-            "location": "وسط الرياض",
-            "image": "/images/cars/sunny-2024.jpg",
-            "rating": 4.4
-        }
-    ]
-    
-    if category:
-        cars = [c for c in cars if c["category"] == category]
+    if pickup_date and return_date:
+        pickup, dropoff = parse_rental_window(pickup_date, return_date)
+    else:
+        # بدون تواريخ: المتاح خلال الـ 24 ساعة القادمة
+        pickup = datetime.utcnow()
+        dropoff = pickup + timedelta(days=1)
+
+    cars = []
+    for car in fleet_index.available(db, city, pickup, dropoff, category):
+        cars.append({**car, "available": True, "quote": fleet.quote(car, pickup, dropoff)})
+    cars.sort(key=lambda c: c["quote"]["total"])
     
     return {
         "cars": cars,
         "total": len(cars),
         "city": city,
-        "categories": ["اقتصادية", "سيدان", "SUV", "فاخرة", "عائلية"]
+        "pickup_date": pickup.isoformat(),
+        "return_date": dropoff.isoformat(),
+        "categories": fleet.CATEGORIES
     }
 
 @router.get("/cars/{car_id}")
-async def get_car_details(car_id: str, user = Depends(verify_token)):
+def get_car_details(car_id: str, user = Depends(verify_token)):
     """تفاصيل السيارة"""
+    car = fleet_index.car(db, car_id)
+    if not car:
+        raise HTTPException(status_code=404, detail="السيارة غير موجودة")
     return {
-        "id": car_id,
-        "brand": "تويوتا",
-        "model": "كامري 2024",
-        "full_description": "سيارة تويوتا كامري 2024 الجديدة بالكامل...",
-        "specifications": {
-            "engine": "2.5L 4-cylinder",
-            "horsepower": 203,
-            "fuel_economy": "7.8L/100km",
-            "trunk_capacity": "428L"
-        },
-        "insurance": {
-            "basic": {"price": 50, "coverage": "تغطية أساسية"},
-            "full": {"price": 100, "coverage": "تغطية شاملة + سائق إضافي"}
-        },
-        "extras": [
-            {"name": "GPS", "price": 25},
-            {"name": "كرسي أطفال", "price": 30},
-            {"name": "WiFi", "price": 20}
-        ],
-        "reviews": [
-            {"user": "أحمد", "rating": 5, "comment": "سيارة ممتازة", "date": "2024-01-10"},
-            {"user": "محمد", "rating": 4, "comment": "جيدة جداً", "date": "2024-01-08"}
-        ],
-        "availability_calendar": [
-            {"date": "2024-01-20", "available": True},
-            {"date": "2024-01-21", "available": True},
-            {"date": "2024-01-22", "available": False},
-            {"date": "2024-01-23", "available": False},
-            {"date": "2024-01-24", "available": True}
-        ]
+        **car,
+        "insurance": fleet.INSURANCE,
+        "extras": [{"name": name, "price": price} for name, price in fleet.EXTRAS.items()],
+        "availability_calendar": fleet_index.calendar(db, car_id)
     }
 
 # ==================== BOOKINGS ====================
@@ -188,107 +102,122 @@ class BookingRequest(BaseModel):
     driver_license: str
 
 @router.post("/bookings")
-async def create_booking(booking: BookingRequest, user = Depends(verify_token)):
+def create_booking(booking: BookingRequest, user = Depends(verify_token)):
     """إنشاء حجز"""
-    days = 3  # حساب الأيام
-    daily_rate = 250
-    insurance = 50 if booking.insurance_type == "basic" else 100
-    extras_cost = len(booking.extras) * 25
-    
-    total = (daily_rate * days) + (insurance * days) + (extras_cost * days)
+    pickup, dropoff = parse_rental_window(booking.pickup_date, booking.return_date)
+    if booking.insurance_type not in fleet.INSURANCE:
+        raise HTTPException(status_code=400, detail="نوع التأمين غير صالح")
+    unknown = [e for e in booking.extras if e not in fleet.EXTRAS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"إضافات غير معروفة: {', '.join(unknown)}")
+    car = fleet_index.car(db, booking.car_id)
+    if not car:
+        raise HTTPException(status_code=404, detail="السيارة غير موجودة")
+
+    pricing = fleet.quote(car, pickup, dropoff, booking.insurance_type, booking.extras)
+    booking_id = f"BK-{uuid4().hex[:10].upper()}"
+    try:
+        fleet_index.reserve(db, booking.car_id, pickup, dropoff, booking_id)
+    except fleet.BookingConflict:
+        raise HTTPException(status_code=409, detail="السيارة محجوزة في هذه الفترة")
+
+    record = {
+        "id": booking_id,
+        "user_id": user.get("user_id"),
+        "car_id": booking.car_id,
+        "car": f"{car['brand']} {car['model']}",
+        "pickup_date": pickup.isoformat(),
+        "return_date": dropoff.isoformat(),
+        "pickup_location": booking.pickup_location,
+        "return_location": booking.return_location,
+        "insurance_type": booking.insurance_type,
+        "extras": booking.extras,
+        "driver_license": booking.driver_license,
+        "pricing": pricing,
+        "total": pricing["total"],
+        "status": "confirmed",
+        "created_at": datetime.utcnow().isoformat()
+    }
+    db.car_bookings.insert_one(record)
     
     return {
         "success": True,
-        "booking_id": f"BK-{random.randint(100000, 999999)}",
+        "booking_id": booking_id,
         "car_id": booking.car_id,
         "dates": {
-            "pickup": booking.pickup_date,
-            "return": booking.return_date,
-            "days": days
-        },
-        "pricing": {
-            "daily_rate": daily_rate,
-            "insurance_daily": insurance,
-            "extras_daily": extras_cost,
-            "subtotal": daily_rate * days,
-            "insurance_total": insurance * days,
-            "extras_total": extras_cost * days,
-            "vat": round(total * 0.15, 2),
-            "total": round(total * 1.15, 2)
+            "pickup": record["pickup_date"],
+            "return": record["return_date"],
+            "days": pricing["days"]
         },
+        "pricing": pricing,
         "status": "confirmed",
         "pickup_details": {
             "location": booking.pickup_location,
-            "time": "10:00 AM",
+            "time": pickup.strftime("%I:%M %p"),
             "instructions": "يرجى إحضار رخصة القيادة والهوية"
         }
     }
 
 @router.get("/bookings")
-async def get_user_bookings(status: str = "all", user = Depends(verify_token)):
+def get_user_bookings(status: str = "all", user = Depends(verify_token)):
     """حجوزات المستخدم"""
-    bookings = [
-        {
-            "id": "BK-123456",
-            "car": "تويوتا كامري 2024",
-            "pickup_date": "2024-01-20",
-            "return_date": "2024-01-23",
-            "status": "active",
-            "total": 1035
-        },
-        {
-            "id": "BK-123455",
-            "car": "هيونداي سوناتا 2024",
-            "pickup_date": "2024-01-10",
-            "return_date": "2024-01-12",
-            "status": "completed",
-            "total": 575
-        }
-    ]
+    query = {"user_id": user.get("user_id")}
+    if status != "all":
+        query["status"] = status
+    bookings = list(db.car_bookings.find(
+        query, {"_id": 0, "id": 1, "car": 1, "pickup_date": 1, "return_date": 1, "status": 1, "total": 1}
+    ).sort("created_at", -1).limit(100))
     return {"bookings": bookings, "total": len(bookings)}
 
 @router.get("/bookings/{booking_id}")
-async def get_booking_details(booking_id: str, user = Depends(verify_token)):
+def get_booking_details(booking_id: str, user = Depends(verify_token)):
     """تفاصيل الحجز"""
+    booking = db.car_bookings.find_one({"id": booking_id, "user_id": user.get("user_id")}, {"_id": 0, "driver_license": 0})
+    if not booking:
+        raise HTTPException(status_code=404, detail="الحجز غير موجود")
+    car = fleet_index.car(db, booking["car_id"]) or {}
     return {
         "id": booking_id,
         "car": {
-            "brand": "تويوتا",
-            "model": "كامري 2024",
-            "plate": "ABC 1234"
+            "brand": car.get("brand"),
+            "model": car.get("model"),
+            "plate": car.get("plate")
         },
         "dates": {
-            "pickup": "2024-01-20 10:00",
-            "return": "2024-01-23 10:00"
+            "pickup": booking["pickup_date"],
+            "return": booking["return_date"]
         },
         "locations": {
-            "pickup": "مطار الرياض",
-            "return": "مطار الرياض"
+            "pickup": booking["pickup_location"],
+            "return": booking["return_location"]
         },
-        "pricing": {
-            "rental": 750,
-            "insurance": 150,
-            "extras": 75,
-            "vat": 146.25,
-            "total": 1121.25
-        },
-        "status": "confirmed",
-        "contract_url": "/contracts/BK-123456.pdf"
+        "pricing": booking["pricing"],
+        "status": booking["status"],
+        "contract_url": f"/contracts/{booking_id}.pdf"
     }
 
 @router.post("/bookings/{booking_id}/cancel")
-async def cancel_booking(booking_id: str, reason: str = "", user = Depends(verify_token)):
+def cancel_booking(booking_id: str, reason: str = "", user = Depends(verify_token)):
     """إلغاء الحجز"""
+    booking = db.car_bookings.find_one_and_update(
+        {"id": booking_id, "user_id": user.get("user_id"), "status": "confirmed"},
+        {"$set": {"status": "cancelled", "cancel_reason": reason, "cancelled_at": datetime.utcnow().isoformat()}},
+        projection={"_id": 0, "car_id": 1, "total": 1}
+    )
+    if not booking:
+        raise HTTPException(status_code=404, detail="الحجز غير موجود أو لا يمكن إلغاؤه")
+    fleet_index.release(db, booking["car_id"], booking_id)
+
     return {
         "success": True,
         "booking_id": booking_id,
         "status": "cancelled",
         "refund": {
-            "amount": 1000,
+            "amount": round(max(0, booking["total"] - fleet.CANCELLATION_FEE), 2),
             "method": "المحفظة",
             "processing_time": "3-5 أيام"
         },
-        "cancellation_fee": 50
+        "cancellation_fee": fleet.CANCELLATION_FEE
     }
 
 # ==================== LOCATIONS ====================
@@ -296,12 +225,7 @@ async def cancel_booking(booking_id: str, reason: str = "", user = Depends(verif
 @router.get("/locations")
 async def get_rental_locations(city: str = None, user = Depends(verify_token)):
     """مواقع التأجير"""
-    locations = [
-        {"id": "LOC-001", "name": "مطار الملك خالد - الرياض", "city": "الرياض", "type": "airport", "hours": "24/7"},
-        {"id": "LOC-002", "name": "وسط الرياض - العليا", "city": "الرياض", "type": "city", "hours": "8AM-10PM"},
-        {"id": "LOC-003", "name": "مطار الملك عبدالعزيز - جدة", "city": "جدة", "type": "airport", "hours": "24/7"},
-        {"id": "LOC-004", "name": "مطار الدمام", "city": "الدمام", "type": "airport", "hours": "24/7"}
-    ]
+    locations = fleet.LOCATIONS
     
     if city:
         locations = [l for l in locations if l["city"] == city]
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import Optional, List
@@ -7,6 +7,8 @@ from datetime import datetime
 import uuid
 import os
 
+from core.responses import static_responses
+
 router = APIRouter(prefix="/api/compliance", tags=["compliance"])
 
 security = HTTPBearer()
@@ -22,35 +24,17 @@ JWT_ALGORITHM = 'HS256'
 # ==================== PROVIDER REQUIREMENTS ====================
 
 @router.get("/requirements")
-async def get_all_requirements():
+async def get_all_requirements(request: Request):
     """Get requirements for all provider types"""
-    return {
-        "seller": get_seller_requirements(),
-        "driver": get_driver_requirements(),
-        "captain": get_captain_requirements(),
-        "restaurant": get_restaurant_requirements(),
-        "hotel": get_hotel_requirements(),
-        "service_provider": get_service_provider_requirements(),
-        "experience_provider": get_experience_provider_requirements()
-    }
+    return ALL_REQUIREMENTS.respond(request)
 
 @router.get("/requirements/{provider_type}")
-async def get_provider_requirements(provider_type: str):
+async def get_provider_requirements(provider_type: str, request: Request):
     """Get requirements for specific provider type"""
-    requirements_map = {
-        "seller": get_seller_requirements(),
-        "driver": get_driver_requirements(),
-        "captain": get_captain_requirements(),
-        "restaurant": get_restaurant_requirements(),
-        "hotel": get_hotel_requirements(),
-        "service_provider": get_service_provider_requirements(),
-        "experience_provider": get_experience_provider_requirements()
-    }
-    
-    if provider_type not in requirements_map:
+    if provider_type not in REQUIREMENTS:
         raise HTTPException(status_code=404, detail="Provider type not found")
     
-    return requirements_map[provider_type]
+    return REQUIREMENTS[provider_type].respond(request)
 
 def get_seller_requirements():
     """Requirements for sellers/stores"""
@@ -704,8 +688,11 @@ def get_experience_provider_requirements():
 # ==================== TERMS & CONDITIONS ====================
 
 @router.get("/terms")
-async def get_terms_and_conditions():
+async def get_terms_and_conditions(request: Request):
     """Get platform terms and conditions"""
+    return TERMS.respond(request)
+
+def terms_and_conditions():
     return {
         "version": "1.0",
         "last_updated": "2024-12-19",
@@ -812,8 +799,11 @@ async def get_terms_and_conditions():
     }
 
 @router.get("/privacy-policy")
-async def get_privacy_policy():
+async def get_privacy_policy(request: Request):
     """Get privacy policy"""
+    return PRIVACY_POLICY.respond(request)
+
+def privacy_policy():
     return {
         "version": "1.0",
         "last_updated": "2024-12-19",
@@ -859,3 +849,22 @@ async def get_privacy_policy():
             }
         ]
     }
+
+# ==================== PRECOMPILED RESPONSES ====================
+# Constant documents: encoded once at import, served with an ETag
+
+_REQUIREMENT_BUILDERS = {
+    "seller": get_seller_requirements,
+    "driver": get_driver_requirements,
+    "captain": get_captain_requirements,
+    "restaurant": get_restaurant_requirements,
+    "hotel": get_hotel_requirements,
+    "service_provider": get_service_provider_requirements,
+    "experience_provider": get_experience_provider_requirements,
+}
+ALL_REQUIREMENTS = static_responses.register(
+    "compliance.requirements", {name: build() for name, build in _REQUIREMENT_BUILDERS.items()})
+REQUIREMENTS = {name: static_responses.register(f"compliance.requirements.{name}", build())
+                for name, build in _REQUIREMENT_BUILDERS.items()}
+TERMS = static_responses.register("compliance.terms", terms_and_conditions())
+PRIVACY_POLICY = static_responses.register("compliance.privacy", privacy_policy())
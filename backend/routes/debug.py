@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException
+
+from core.query_debug import query_debugger
+
+router = APIRouter(prefix="/api/debug", tags=["debug"])
+
+def _require_debug():
+    if not query_debugger.enabled:
+        raise HTTPException(status_code=404, detail="Query debugging is disabled (set OCEAN_QUERY_DEBUG=1)")
+
+@router.get("/queries")
+def get_query_summary(limit: int = 20, sort: str = "total_time"):
+    """Worst MongoDB query shapes per route: N+1 loops and slow commands"""
+    _require_debug()
+    return query_debugger.summary(limit=limit, sort=sort)
+
+@router.delete("/queries")
+def reset_query_summary():
+    """Clear collected query statistics"""
+    _require_debug()
+    query_debugger.reset()
+    return {"message": "Query statistics cleared"}
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
@@ -7,6 +7,11 @@ from datetime import datetime, timedelta
 import uuid
 import os
 
+from engines.fraud import check_transaction, client_ip, transaction
+from engines.sentiment import record_review, review_fields
+from engines.events import event_bus
+from engines.subscribers import FOOD_ORDER_CREATED
+
 router = APIRouter(prefix="/api/food", tags=["food-service"])
 
 security = HTTPBearer()
@@ -259,7 +264,7 @@ async def delete_menu_item(item_id: str, user = Depends(verify_restaurant_owner)
 # ==================== ORDERS ====================
 
 @router.post("/orders")
-async def create_food_order(order: FoodOrderCreate, user = Depends(verify_token)):
+async def create_food_order(order: FoodOrderCreate, request: Request, user = Depends(verify_token)):
     """Create a food order"""
     if db is None:
         raise HTTPException(status_code=500, detail="Database not initialized")
@@ -288,8 +293,12 @@ async def create_food_order(order: FoodOrderCreate, user = Depends(verify_token)
     # Add delivery fee
     total += restaurant.get("delivery_fee", 0)
     
+    order_id = str(uuid.uuid4())
+    ip = client_ip(request)
+    fraud = check_transaction(db, transaction(user["user_id"], total, ip=ip), "food_order", order_id)
+    
     order_data = {
-        "id": str(uuid.uuid4()),
+        "id": order_id,
         "order_number": f"FO-{datetime.utcnow().strftime('%Y%m%d')}-{str(uuid.uuid4())[:6].upper()}",
         "user_id": user["user_id"],
         "restaurant_id": order.restaurant_id,
@@ -303,12 +312,21 @@ async def create_food_order(order: FoodOrderCreate, user = Depends(verify_token)
         "notes": order.notes,
         "status": "pending",
         "driver_id": None,
+        "client_ip": ip,
+        **fraud,
         "estimated_delivery": (datetime.utcnow() + timedelta(minutes=45)).isoformat(),
         "created_at": datetime.utcnow().isoformat(),
         "updated_at": datetime.utcnow().isoformat()
     }
     
-    db.food_orders.insert_one(order_data)
+    event_bus.insert(db, db.food_orders, order_data, FOOD_ORDER_CREATED, {
+        "order_id": order_id,
+        "order_number": order_data["order_number"],
+        "user_id": user["user_id"],
+        "restaurant_id": order.restaurant_id,
+        "total": total,
+        "created_at": order_data["created_at"],
+    })
     
     return {"message": "Order placed successfully", "order": {k: v for k, v in order_data.items() if k != "_id"}}
 
@@ -367,10 +385,12 @@ async def add_restaurant_review(restaurant_id: str, rating: int, comment: str, u
         "user_id": user["user_id"],
         "rating": rating,
         "comment": comment,
+        **review_fields(comment),
         "created_at": datetime.utcnow().isoformat()
     }
     
     db.food_reviews.insert_one(review_data)
+    record_review(db, "food_reviews", review_data)
     
     return {"message": "Review added successfully"}
 
@@ -7,6 +7,10 @@ from datetime import datetime, timedelta
 import uuid
 import os
 
+from engines.sentiment import record_review, review_fields
+from engines.events import event_bus
+from engines.subscribers import HOTEL_BOOKING_CREATED
+
 router = APIRouter(prefix="/api/hotels", tags=["hotels-service"])
 
 security = HTTPBearer()
@@ -268,7 +272,15 @@ async def create_booking(booking: BookingCreate, user = Depends(verify_token)):
         "created_at": datetime.utcnow().isoformat()
     }
     
-    db.hotel_bookings.insert_one(booking_data)
+    event_bus.insert(db, db.hotel_bookings, booking_data, HOTEL_BOOKING_CREATED, {
+        "booking_id": booking_data["id"],
+        "booking_number": booking_data["booking_number"],
+        "user_id": user["user_id"],
+        "hotel_id": booking.hotel_id,
+        "hotel_name": booking_data["hotel_name"],
+        "total_price": total_price,
+        "created_at": booking_data["created_at"],
+    })
     
     return {
         "message": "تم الحجز بنجاح! سيتم تأكيد الحجز قريباً",
@@ -337,10 +349,12 @@ async def add_review(hotel_id: str, rating: int, comment: str, user = Depends(ve
         "user_id": user["user_id"],
         "rating": rating,
         "comment": comment,
+        **review_fields(comment),
         "created_at": datetime.utcnow().isoformat()
     }
     
     db.hotel_reviews.insert_one(review_data)
+    record_review(db, "hotel_reviews", review_data)
     
     return {"message": "شكراً لتقييمك!"}
 
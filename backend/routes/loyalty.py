@@ -6,6 +6,8 @@ import jwt
 import os
 import random
 
+from engines import loyalty as loyalty_engine
+
 router = APIRouter(prefix="/api/loyalty", tags=["loyalty"])
 
 db = None
@@ -26,6 +28,16 @@ async def verify_token(authorization: str = Header(None)):
     except:
         raise HTTPException(status_code=401, detail="Token غير صالح")
 
+STAFF_ROLES = ['admin', 'super_admin', 'superadmin']
+
+def is_staff(user):
+    return user.get('role') in STAFF_ROLES
+
+async def verify_staff_token(user = Depends(verify_token)):
+    if not is_staff(user):
+        raise HTTPException(status_code=403, detail="صلاحيات غير كافية")
+    return user
+
 # ==================== LOYALTY PROGRAM ====================
 
 @router.get("/program/overview")
@@ -51,71 +63,107 @@ async def get_loyalty_overview(user = Depends(verify_token)):
     }
 
 @router.get("/members")
-async def get_loyalty_members(tier: str = "all", limit: int = 50, user = Depends(verify_token)):
+def get_loyalty_members(tier: str = "all", limit: int = 50, user = Depends(verify_token)):
     """قائمة أعضاء برنامج الولاء"""
-    tiers = ["برونزي", "فضي", "ذهبي", "بلاتيني"]
+    query = {}
+    if tier != "all":
+        # يقبل الاسم العربي أو الإنجليزي للمستوى
+        names = {v: k for k, v in loyalty_engine.TIER_NAMES_AR.items()}
+        query["tier"] = names.get(tier, tier)
+    balances = list(db.loyalty_points.find(query, {"_id": 0}).sort("points", -1).limit(min(limit, 500)))
+    users = {u["id"]: u for u in db.users.find(
+        {"id": {"$in": [b["user_id"] for b in balances]}}, {"_id": 0, "id": 1, "name": 1, "email": 1, "created_at": 1})}
+
     members = []
-    
-    for i in range(limit):
+    for balance in balances:
+        member = users.get(balance["user_id"], {})
         members.append({
-            "id": f"MEM-{10000 + i}",
-            "name": f"عضو {i+1}",
-            "email": f"member{i+1}@email.com",
-            "tier": random.choice(tiers) if tier == "all" else tier,
-            "points_balance": random.randint(100, 50000),
-            "lifetime_points": random.randint(1000, 100000),
-            "joined_date": (datetime.now(timezone.utc) - timedelta(days=random.randint(30, 730))).strftime("%Y-%m-%d"),
-            "last_activity": (datetime.now(timezone.utc) - timedelta(days=random.randint(0, 30))).strftime("%Y-%m-%d")
+            "id": balance["user_id"],
+            "name": member.get("name"),
+            "email": member.get("email"),
+            "tier": loyalty_engine.TIER_NAMES_AR.get(balance.get("tier"), balance.get("tier")),
+            "points_balance": balance.get("points", 0),
+            "lifetime_points": balance.get("lifetime_points", 0),
+            "joined_date": (member.get("created_at") or "")[:10] or None,
+            "last_activity": (balance.get("updated_at") or "")[:10] or None
         })
     
     return {"members": members, "total": len(members)}
 
 @router.get("/member/{member_id}")
-async def get_member_details(member_id: str, user = Depends(verify_token)):
+def get_member_details(member_id: str, user = Depends(verify_token)):
     """تفاصيل العضو"""
+    member = db.users.find_one({"id": member_id}, {"_id": 0, "name": 1, "email": 1, "phone": 1})
+    if not member:
+        raise HTTPException(status_code=404, detail="العضو غير موجود")
+    balance = loyalty_engine.get_balance(db, member_id)
+    entries = loyalty_engine.history(db, member_id, limit=20)
+    expiring = loyalty_engine.expiring_soon(db, member_id)
+
+    recommendations = []
+    if expiring:
+        recommendations.append(f"استخدم {expiring} نقطة قبل انتهائها")
+    next_tier = next(((name, threshold) for name, threshold in reversed(loyalty_engine.TIERS)
+                      if threshold > balance.get("points", 0)), None)
+    if next_tier:
+        recommendations.append(f"اجمع {next_tier[1] - balance.get('points', 0)} نقطة إضافية للترقية إلى "
+                               f"{loyalty_engine.TIER_NAMES_AR[next_tier[0]]}")
+
     return {
         "id": member_id,
-        "name": "عبدالله محمد",
-        "email": "abdullah@email.com",
-        "phone": "+966501234567",
-        "tier": "ذهبي",
-        "points_balance": 15450,
-        "points_expiring_soon": 2500,
-        "expiry_date": "2024-03-31",
-        "lifetime_points": 45000,
-        "lifetime_redemptions": 12500,
+        "name": member.get("name"),
+        "email": member.get("email"),
+        "phone": member.get("phone"),
+        "tier": loyalty_engine.TIER_NAMES_AR.get(balance.get("tier"), balance.get("tier")),
+        "points_balance": balance.get("points", 0),
+        "points_expiring_soon": expiring,
+        "expiring_within_days": loyalty_engine.EXPIRING_SOON_DAYS,
+        "lifetime_points": balance.get("lifetime_points", 0),
+        "lifetime_redemptions": loyalty_engine.lifetime_redemptions(db, member_id),
         "history": [
-            {"date": "2024-01-15", "type": "earned", "points": 450, "source": "طلب #12345"},
-            {"date": "2024-01-14", "type": "redeemed", "points": -500, "source": "شحن مجاني"},
-            {"date": "2024-01-12", "type": "earned", "points": 320, "source": "طلب #12340"},
-            {"date": "2024-01-10", "type": "bonus", "points": 1000, "source": "مكافأة الترقية"}
+            {"date": e["created_at"][:10], "type": e["type"], "points": e["points"], "source": e.get("source")}
+            for e in entries
         ],
-        "recommendations": [
-            "استخدم 2500 نقطة قبل انتهائها",
-            "اشتري 5000 ر.س إضافية للترقية لبلاتيني"
-        ]
+        "recommendations": recommendations
     }
 
 @router.post("/points/award")
-async def award_points(member_id: str, points: int, reason: str, user = Depends(verify_token)):
-    """منح نقاط"""
+def award_points(member_id: str, points: int, reason: str, idempotency_key: Optional[str] = None,
+                 user = Depends(verify_staff_token)):
+    """منح نقاط (للمشرفين فقط)"""
+    if points <= 0:
+        raise HTTPException(status_code=400, detail="عدد النقاط يجب أن يكون موجباً")
+    balance, replayed = loyalty_engine.earn(db, member_id, points, reason, idempotency_key)
     return {
         "success": True,
         "member_id": member_id,
-        "points_awarded": points,
+        "points_awarded": 0 if replayed else points,
         "reason": reason,
-        "new_balance": random.randint(1000, 50000)
+        "new_balance": balance["points"],
+        "tier": balance["tier"],
+        "replayed": replayed
     }
 
 @router.post("/points/redeem")
-async def redeem_points(member_id: str, points: int, reward_type: str, user = Depends(verify_token)):
-    """استبدال نقاط"""
+def redeem_points(member_id: str, points: int, reward_type: str, idempotency_key: Optional[str] = None,
+                  user = Depends(verify_token)):
+    """استبدال نقاط: العميل من رصيده فقط، والمشرف لأي عضو"""
+    if not is_staff(user) and member_id != user.get('user_id'):
+        raise HTTPException(status_code=403, detail="لا يمكن استبدال نقاط عضو آخر")
+    if points <= 0:
+        raise HTTPException(status_code=400, detail="عدد النقاط يجب أن يكون موجباً")
+    try:
+        balance, replayed = loyalty_engine.redeem(db, member_id, points, reward_type, idempotency_key)
+    except loyalty_engine.InsufficientPoints:
+        raise HTTPException(status_code=400, detail="رصيد النقاط غير كافٍ")
     return {
         "success": True,
         "member_id": member_id,
-        "points_redeemed": points,
+        "points_redeemed": 0 if replayed else points,
         "reward": reward_type,
-        "new_balance": random.randint(500, 45000)
+        "new_balance": balance["points"],
+        "tier": balance["tier"],
+        "replayed": replayed
     }
 
 # ==================== INSTALLMENTS ====================
@@ -155,9 +203,8 @@ async def get_active_installments(limit: int = 50, user = Depends(verify_token))
         })
     return {"installments": installments, "total": len(installments)}
 
-@router.post("/installments/calculate")
-async def calculate_installment(amount: float, months: int, user = Depends(verify_token)):
-    """حساب التقسيط"""
+def compute_installment(amount: float, months: int) -> Dict:
+    """حساب أقساط مبلغ على عدد من الأشهر"""
     interest = 0 if months <= 6 else 5 if months == 12 else 8
     total = amount * (1 + interest / 100)
     monthly = total / months
@@ -168,6 +215,13 @@ async def calculate_installment(amount: float, months: int, user = Depends(verif
         "interest_rate": f"{interest}%",
         "total_amount": round(total, 2),
         "monthly_payment": round(monthly, 2),
-        "first_payment": round(monthly, 2),
+        "first_payment": round(monthly, 2)
+    }
+
+@router.post("/installments/calculate")
+async def calculate_installment(amount: float, months: int, user = Depends(verify_token)):
+    """حساب التقسيط"""
+    return {
+        **compute_installment(amount, months),
         "start_date": datetime.now(timezone.utc).strftime("%Y-%m-%d")
     }
@@ -0,0 +1,38 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from core.change_streams import change_feed
+from core.lazy_routers import lazy_routers
+from core.metrics import registry
+from core.rate_limit import rate_limiter
+from core.responses import content_versions
+from core.shared_state import shared_state
+
+router = APIRouter(prefix="/api", tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus scrape endpoint: route latency, status counts, in-flight and MongoDB time"""
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@router.get("/metrics/changes")
+def get_change_consumers():
+    """Change consumer mode (stream/poll), per-consumer delivery counters and content versions"""
+    return {"mode": change_feed.mode, "consumers": change_feed.stats, "content_versions": content_versions.summary()}
+
+@router.get("/metrics/shared-state")
+def get_shared_state():
+    """Shared-state backend of this worker, its subscriptions and messages received from peers"""
+    return shared_state.summary()
+
+@router.get("/metrics/routers")
+def get_routers():
+    """Feature routers enabled in this deployment, which are mounted (with import time in ms) and which are pending"""
+    return lazy_routers.summary()
+
+@router.get("/metrics/rate-limits")
+def get_rate_limits():
+    """Configured rate limits, the store they use and how many requests were rejected by this worker"""
+    return rate_limiter.summary()
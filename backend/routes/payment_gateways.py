@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 from datetime import datetime, timezone
@@ -6,6 +6,8 @@ import jwt
 import os
 from uuid import uuid4
 
+from core.responses import PRIVATE_CACHE, static_responses
+
 router = APIRouter(prefix="/api/payment-gateways", tags=["multi-gateway-payments"])
 
 db = None
@@ -92,9 +94,10 @@ GATEWAYS_CATALOG = {
 
 # ==================== GATEWAY CATALOG ====================
 
-@router.get("/catalog")
-async def get_gateways_catalog(user = Depends(verify_admin_token), region: str = None, type: str = None):
-    """Get all available payment gateways"""
+GATEWAY_REGIONS = ["saudi", "gulf", "egypt", "international", "india", "china", "southeast_asia", "europe", "usa", "global"]
+GATEWAY_TYPES = ["cards", "wallet", "bnpl", "aggregator", "crypto", "pos"]
+
+def gateways_catalog(region=None, type=None):
     gateways = []
     for gw_id, gw_info in GATEWAYS_CATALOG.items():
         if region and gw_info["region"] != region:
@@ -105,17 +108,35 @@ async def get_gateways_catalog(user = Depends(verify_admin_token), region: str =
     
     return {
         "gateways": gateways,
-        "regions": ["saudi", "gulf", "egypt", "international", "india", "china", "southeast_asia", "europe", "usa", "global"],
-        "types": ["cards", "wallet", "bnpl", "aggregator", "crypto", "pos"],
+        "regions": GATEWAY_REGIONS,
+        "types": GATEWAY_TYPES,
         "total": len(gateways)
     }
 
+def _filter_key(value, known):
+    """Unknown filter values all match nothing, so they share one variant"""
+    if not value or value in known:
+        return value or None
+    return "<unknown>"
+
+@router.get("/catalog")
+async def get_gateways_catalog(request: Request, user = Depends(verify_admin_token), region: str = None, type: str = None):
+    """Get all available payment gateways"""
+    # One precompiled body per filter combination
+    key = (_filter_key(region, GATEWAY_REGIONS), _filter_key(type, GATEWAY_TYPES))
+    catalog = static_responses.variant("payment_gateways.catalog", key,
+                                       lambda: gateways_catalog(region, type), PRIVATE_CACHE)
+    return catalog.respond(request)
+
 @router.get("/catalog/{gateway_id}")
-async def get_gateway_details(gateway_id: str, user = Depends(verify_admin_token)):
+async def get_gateway_details(gateway_id: str, request: Request, user = Depends(verify_admin_token)):
     """Get detailed info about a specific gateway"""
-    if gateway_id not in GATEWAYS_CATALOG:
+    if gateway_id not in GATEWAY_DETAILS:
         raise HTTPException(status_code=404, detail="بوابة الدفع غير موجودة")
     
+    return GATEWAY_DETAILS[gateway_id].respond(request)
+
+def gateway_details(gateway_id):
     gw = GATEWAYS_CATALOG[gateway_id]
     return {
         "id": gateway_id,
@@ -160,6 +181,9 @@ def get_gateway_fees(gateway_id):
     }
     return fees_map.get(gateway_id, {"percentage": 2.5, "fixed": 0.25, "currency": "USD"})
 
+GATEWAY_DETAILS = {gw_id: static_responses.register(f"payment_gateways.{gw_id}", gateway_details(gw_id), PRIVATE_CACHE)
+                   for gw_id in GATEWAYS_CATALOG}
+
 # ==================== CONFIGURED GATEWAYS ====================
 
 @router.get("/configured")
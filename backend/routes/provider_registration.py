@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
@@ -8,6 +8,8 @@ from datetime import datetime, timedelta
 import uuid
 import os
 
+from core.responses import static_responses
+
 router = APIRouter(prefix="/api/join", tags=["provider-registration"])
 
 security = HTTPBearer()
@@ -111,8 +113,89 @@ def create_token(user_id: str, email: str, role: str) -> str:
 
 # ==================== GET AVAILABLE SERVICES ====================
 
+ALL_SERVICES = [
+    {
+        "id": "seller",
+        "service_id": "shopping",
+        "name": "بائع / متجر",
+        "name_en": "Seller / Store",
+        "description": "سجل كبائع وافتح متجرك الإلكتروني",
+        "icon": "🏪",
+        "requirements": ["الهوية الوطنية", "السجل التجاري (اختياري)"],
+        "route": "/join/seller"
+    },
+    {
+        "id": "driver",
+        "service_id": "delivery",
+        "name": "سائق توصيل",
+        "name_en": "Delivery Driver",
+        "description": "انضم كسائق توصيل واربح من توصيل الطلبات",
+        "icon": "🚚",
+        "requirements": ["رخصة قيادة سارية", "الهوية الوطنية", "مركبة"],
+        "route": "/join/driver"
+    },
+    {
+        "id": "restaurant",
+        "service_id": "food",
+        "name": "مطعم / مقهى",
+        "name_en": "Restaurant / Cafe",
+        "description": "سجل مطعمك وابدأ استقبال الطلبات",
+        "icon": "🍔",
+        "requirements": ["السجل التجاري", "رخصة البلدية", "شهادة صحية"],
+        "route": "/join/restaurant"
+    },
+    {
+        "id": "captain",
+        "service_id": "rides",
+        "name": "كابتن / سائق",
+        "name_en": "Ride Captain",
+        "description": "انضم ككابتن وقدم خدمات التوصيل والمشاوير",
+        "icon": "🚗",
+        "requirements": ["رخصة قيادة سارية", "الهوية الوطنية", "سيارة حديثة"],
+        "route": "/join/captain"
+    },
+    {
+        "id": "hotel",
+        "service_id": "hotels",
+        "name": "فندق / شقق فندقية",
+        "name_en": "Hotel / Apartments",
+        "description": "سجل فندقك أو شققك الفندقية",
+        "icon": "🏨",
+        "requirements": ["السجل التجاري", "رخصة الهيئة العامة للسياحة"],
+        "route": "/join/hotel"
+    },
+    {
+        "id": "experience",
+        "service_id": "experiences",
+        "name": "مقدم تجارب / أنشطة",
+        "name_en": "Experience Provider",
+        "description": "قدم جولات سياحية وأنشطة ترفيهية",
+        "icon": "🎭",
+        "requirements": ["رخصة الهيئة العامة للسياحة (للجولات)"],
+        "route": "/join/experience"
+    },
+    {
+        "id": "service_provider",
+        "service_id": "ondemand",
+        "name": "مقدم خدمات",
+        "name_en": "Service Provider",
+        "description": "قدم خدمات التنظيف والصيانة والسباكة وغيرها",
+        "icon": "🔧",
+        "requirements": ["الهوية الوطنية", "شهادة خبرة (اختياري)"],
+        "route": "/join/service-provider"
+    }
+]
+
+def available_services(enabled_ids):
+    """Registration services; with no Command Center config only shopping is enabled"""
+    all_services = [{**service, "enabled": service["service_id"] in enabled_ids} for service in ALL_SERVICES]
+    return {
+        "available_services": [service for service in all_services if service["enabled"]],
+        "all_services": all_services
+    }
+
 @router.get("/available-services")
-async def get_available_services():
+async def get_available_services(request: Request):
     """Get list of services available for registration based on Command Center settings"""
     if db is None:
         raise HTTPException(status_code=500, detail="Database not initialized")
@@ -120,100 +203,15 @@ async def get_available_services():
     # Get services configuration from command center
     services_config = db.command_services.find_one({"type": "services_config"}, {"_id": 0})
     
-    all_services = [
-        {
-            "id": "seller",
-            "service_id": "shopping",
-            "name": "بائع / متجر",
-            "name_en": "Seller / Store",
-            "description": "سجل كبائع وافتح متجرك الإلكتروني",
-            "icon": "🏪",
-            "requirements": ["الهوية الوطنية", "السجل التجاري (اختياري)"],
-            "route": "/join/seller"
-        },
-        {
-            "id": "driver",
-            "service_id": "delivery",
-            "name": "سائق توصيل",
-            "name_en": "Delivery Driver",
-            "description": "انضم كسائق توصيل واربح من توصيل الطلبات",
-            "icon": "🚚",
-            "requirements": ["رخصة قيادة سارية", "الهوية الوطنية", "مركبة"],
-            "route": "/join/driver"
-        },
-        {
-            "id": "restaurant",
-            "service_id": "food",
-            "name": "مطعم / مقهى",
-            "name_en": "Restaurant / Cafe",
-            "description": "سجل مطعمك وابدأ استقبال الطلبات",
-            "icon": "🍔",
-            "requirements": ["السجل التجاري", "رخصة البلدية", "شهادة صحية"],
-            "route": "/join/restaurant"
-        },
-        {
-            "id": "captain",
-            "service_id": "rides",
-            "name": "كابتن / سائق",
-            "name_en": "Ride Captain",
-            "description": "انضم ككابتن وقدم خدمات التوصيل والمشاوير",
-            "icon": "🚗",
-            "requirements": ["رخصة قيادة سارية", "الهوية الوطنية", "سيارة حديثة"],
-            "route": "/join/captain"
-        },
-        {
-            "id": "hotel",
-            "service_id": "hotels",
-            "name": "فندق / شقق فندقية",
-            "name_en": "Hotel / Apartments",
-            "description": "سجل فندقك أو شققك الفندقية",
-            "icon": "🏨",
-            "requirements": ["السجل التجاري", "رخصة الهيئة العامة للسياحة"],
-            "route": "/join/hotel"
-        },
-        {
-            "id": "experience",
-            "service_id": "experiences",
-            "name": "مقدم تجارب / أنشطة",
-            "name_en": "Experience Provider",
-            "description": "قدم جولات سياحية وأنشطة ترفيهية",
-            "icon": "🎭",
-            "requirements": ["رخصة الهيئة العامة للسياحة (للجولات)"],
-            "route": "/join/experience"
-        },
-        {
-            "id": "service_provider",
-            "service_id": "ondemand",
-            "name": "مقدم خدمات",
-            "name_en": "Service Provider",
-            "description": "قدم خدمات التنظيف والصيانة والسباكة وغيرها",
-            "icon": "🔧",
-            "requirements": ["الهوية الوطنية", "شهادة خبرة (اختياري)"],
-            "route": "/join/service-provider"
-        }
-    ]
-    
-    # Filter based on enabled services
-    enabled_services = []
     if services_config and "services" in services_config:
-        enabled_ids = [s["id"] for s in services_config["services"] if s.get("enabled")]
-        for service in all_services:
-            if service["service_id"] in enabled_ids:
-                service["enabled"] = True
-                enabled_services.append(service)
-            else:
-                service["enabled"] = False
+        enabled_ids = frozenset(s["id"] for s in services_config["services"] if s.get("enabled"))
     else:
-        # If no config, only shopping is enabled by default
-        for service in all_services:
-            service["enabled"] = service["service_id"] == "shopping"
-            if service["enabled"]:
-                enabled_services.append(service)
+        enabled_ids = frozenset(["shopping"])
     
-    return {
-        "available_services": enabled_services,
-        "all_services": all_services
-    }
+    # Precompiled once per distinct configuration
+    response = static_responses.variant("join.available_services", enabled_ids,
+                                        lambda: available_services(enabled_ids))
+    return response.respond(request)
 
 # ==================== SELLER REGISTRATION ====================
 
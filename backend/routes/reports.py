@@ -10,6 +10,8 @@ import random
 import io
 import json
 
+from engines import forecasting
+
 router = APIRouter(prefix="/api/reports", tags=["reports-analytics"])
 
 db = None
@@ -305,35 +307,45 @@ async def get_historical_analysis(user = Depends(verify_admin_token), metric: st
 # ==================== FORECAST ====================
 
 @router.get("/forecast")
-async def get_forecast(user = Depends(verify_admin_token), metric: str = "revenue", months: int = 3):
+def get_forecast(user = Depends(verify_admin_token), metric: str = "revenue", months: int = 3):
     """Get forecast predictions"""
+    if metric not in ("revenue", "orders"):
+        raise HTTPException(status_code=400, detail="metric must be revenue or orders")
+    months = max(1, min(months, 12))
+
+    # Daily forecast rolled up into calendar months
+    first = forecasting.last_complete_day() + timedelta(days=1)
+    end = first
+    for _ in range(months):
+        end = (end.replace(day=1) + timedelta(days=32)).replace(day=1)
+    state, days = forecasting.daily_forecast(db, "total", metric, "total", (end - first).days)
+
+    buckets = {}
+    for day in days:
+        key = day["date"][:7]
+        bucket = buckets.setdefault(key, {"value": 0.0, "low": 0.0, "high": 0.0})
+        for field in bucket:
+            bucket[field] += day[field]
+
+    base_accuracy = forecasting.accuracy(state) or 60
     predictions = []
-    base = 3200000
-    
-    month_names = ["فبراير", "مارس", "أبريل", "مايو", "يونيو", "يوليو", "أغسطس", "سبتمبر", "أكتوبر", "نوفمبر", "ديسمبر", "يناير"]
-    
-    # Limit months to available month names
-    months = min(months, len(month_names))
-    
-    for i in range(months):
-        growth = 1.08 + (i * 0.02)
-        predicted = base * growth
+    for i, (key, bucket) in enumerate(sorted(buckets.items())):
         predictions.append({
-            "month": month_names[i],
-            "predicted_value": round(predicted),
-            "confidence": max(60, 95 - (i * 5)),
+            "month": forecasting.MONTHS_AR[int(key[5:7]) - 1],
+            "predicted_value": round(bucket["value"]),
+            "confidence": max(50, round(base_accuracy - i * 5)),
             "range": {
-                "low": round(predicted * 0.9),
-                "high": round(predicted * 1.1)
+                "low": round(bucket["low"]),
+                "high": round(bucket["high"])
             }
         })
-        base = predicted
-    
+
     return {
         "metric": metric,
         "predictions": predictions,
-        "methodology": "تحليل الاتجاهات التاريخية مع عوامل موسمية",
-        "factors_considered": ["النمو التاريخي", "الموسمية", "اتجاهات السوق", "الحملات المخطط لها"]
+        "methodology": "Holt-Winters مع موسمية أسبوعية أو نموذج موسمي بسيط حسب دقة التحقق",
+        "model": state["model"],
+        "factors_considered": ["النمو التاريخي", "الموسمية الأسبوعية", "الاتجاه"]
     }
 
 # ==================== REPORTS DASHBOARD ====================
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import Optional, List
@@ -8,6 +8,11 @@ import uuid
 import os
 import math
 
+from core.responses import static_responses
+from engines.fraud import check_transaction, client_ip, transaction
+from engines.events import event_bus
+from engines.subscribers import RIDE_REQUESTED
+
 router = APIRouter(prefix="/api/rides", tags=["rides-service"])
 
 security = HTTPBearer()
@@ -97,55 +102,58 @@ def calculate_fare(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, ride_type):
 
 # ==================== RIDE TYPES ====================
 
+RIDE_TYPES = [
+    {
+        "id": "economy",
+        "name": "اقتصادي",
+        "name_en": "Economy",
+        "description": "رحلات يومية بأسعار مناسبة",
+        "icon": "🚗",
+        "base_fare": 5,
+        "per_km": 1.5,
+        "min_fare": 10,
+        "capacity": 4
+    },
+    {
+        "id": "comfort",
+        "name": "مريح",
+        "name_en": "Comfort",
+        "description": "سيارات حديثة ومريحة",
+        "icon": "🚙",
+        "base_fare": 8,
+        "per_km": 2.0,
+        "min_fare": 15,
+        "capacity": 4
+    },
+    {
+        "id": "premium",
+        "name": "فاخر",
+        "name_en": "Premium",
+        "description": "سيارات فاخرة لرحلات مميزة",
+        "icon": "🚘",
+        "base_fare": 15,
+        "per_km": 3.0,
+        "min_fare": 25,
+        "capacity": 4
+    },
+    {
+        "id": "xl",
+        "name": "عائلي XL",
+        "name_en": "XL",
+        "description": "سيارات كبيرة للعائلات",
+        "icon": "🚐",
+        "base_fare": 12,
+        "per_km": 2.5,
+        "min_fare": 20,
+        "capacity": 6
+    }
+]
+RIDE_TYPES_RESPONSE = static_responses.register("rides.types", RIDE_TYPES)
+
 @router.get("/types")
-async def get_ride_types():
+async def get_ride_types(request: Request):
     """Get available ride types with pricing"""
-    return [
-        {
-            "id": "economy",
-            "name": "اقتصادي",
-            "name_en": "Economy",
-            "description": "رحلات يومية بأسعار مناسبة",
-            "icon": "🚗",
-            "base_fare": 5,
-            "per_km": 1.5,
-            "min_fare": 10,
-            "capacity": 4
-        },
-        {
-            "id": "comfort",
-            "name": "مريح",
-            "name_en": "Comfort",
-            "description": "سيارات حديثة ومريحة",
-            "icon": "🚙",
-            "base_fare": 8,
-            "per_km": 2.0,
-            "min_fare": 15,
-            "capacity": 4
-        },
-        {
-            "id": "premium",
-            "name": "فاخر",
-            "name_en": "Premium",
-            "description": "سيارات فاخرة لرحلات مميزة",
-            "icon": "🚘",
-            "base_fare": 15,
-            "per_km": 3.0,
-            "min_fare": 25,
-            "capacity": 4
-        },
-        {
-            "id": "xl",
-            "name": "عائلي XL",
-            "name_en": "XL",
-            "description": "سيارات كبيرة للعائلات",
-            "icon": "🚐",
-            "base_fare": 12,
-            "per_km": 2.5,
-            "min_fare": 20,
-            "capacity": 6
-        }
-    ]
+    return RIDE_TYPES_RESPONSE.respond(request)
 
 # ==================== FARE ESTIMATE ====================
 
@@ -172,7 +180,7 @@ async def estimate_fare(
 # ==================== RIDE REQUESTS ====================
 
 @router.post("/request")
-async def request_ride(ride: RideRequest, user = Depends(verify_token)):
+async def request_ride(ride: RideRequest, request: Request, user = Depends(verify_token)):
     """Request a new ride"""
     if db is None:
         raise HTTPException(status_code=500, detail="Database not initialized")
@@ -184,8 +192,12 @@ async def request_ride(ride: RideRequest, user = Depends(verify_token)):
         ride.ride_type
     )
     
+    ride_id = str(uuid.uuid4())
+    ip = client_ip(request)
+    fraud = check_transaction(db, transaction(user["user_id"], fare_estimate["estimated_fare"], ip=ip), "ride", ride_id)
+    
     ride_data = {
-        "id": str(uuid.uuid4()),
+        "id": ride_id,
         "ride_number": f"R-{datetime.utcnow().strftime('%Y%m%d')}-{str(uuid.uuid4())[:6].upper()}",
         "user_id": user["user_id"],
         "pickup": {
@@ -208,11 +220,20 @@ async def request_ride(ride: RideRequest, user = Depends(verify_token)):
         "status": "searching",  # searching, accepted, arriving, started, completed, cancelled
         "captain_id": None,
         "captain_info": None,
+        "client_ip": ip,
+        **fraud,
         "created_at": datetime.utcnow().isoformat(),
         "updated_at": datetime.utcnow().isoformat()
     }
     
-    db.rides.insert_one(ride_data)
+    event_bus.insert(db, db.rides, ride_data, RIDE_REQUESTED, {
+        "ride_id": ride_id,
+        "ride_number": ride_data["ride_number"],
+        "user_id": user["user_id"],
+        "ride_type": ride.ride_type,
+        "estimated_fare": ride_data["estimated_fare"],
+        "created_at": ride_data["created_at"],
+    })
     
     return {
         "message": "تم طلب المشوار بنجاح",
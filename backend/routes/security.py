@@ -53,43 +53,65 @@ async def verify_admin_token(authorization: str = Header(None)):
 # ==================== FRAUD ALERTS ====================
 
 @router.get("/fraud-alerts")
-async def get_fraud_alerts(user = Depends(verify_admin_token), status: str = None, severity: str = None):
-    """Get all fraud alerts"""
-    alerts = [
-        {"id": "FA-001", "type": "multiple_accounts", "user_id": "user-123", "user_name": "محمد أحمد", "description": "إنشاء حسابات متعددة من نفس الجهاز", "severity": "high", "risk_score": 85, "status": "pending", "detected_at": "2024-01-15T10:30:00", "ip_address": "192.168.1.100", "device_id": "dev-abc123"},
-        {"id": "FA-002", "type": "unusual_transaction", "user_id": "user-456", "user_name": "سارة علي", "description": "معاملة بمبلغ كبير غير معتاد", "severity": "medium", "risk_score": 65, "status": "investigating", "detected_at": "2024-01-15T09:15:00", "amount": 15000, "currency": "SAR"},
-        {"id": "FA-003", "type": "suspicious_login", "user_id": "user-789", "user_name": "خالد محمد", "description": "تسجيل دخول من موقع جغرافي مختلف", "severity": "low", "risk_score": 45, "status": "resolved", "detected_at": "2024-01-15T08:00:00", "location": "دبي، الإمارات"},
-        {"id": "FA-004", "type": "payment_fraud", "user_id": "user-321", "user_name": "فاطمة أحمد", "description": "محاولة دفع ببطاقة مسروقة", "severity": "critical", "risk_score": 95, "status": "blocked", "detected_at": "2024-01-15T07:45:00", "card_last4": "4532"},
-        {"id": "FA-005", "type": "fake_reviews", "user_id": "user-654", "user_name": "علي حسن", "description": "نشر تقييمات وهمية متعددة", "severity": "medium", "risk_score": 70, "status": "pending", "detected_at": "2024-01-14T16:30:00", "reviews_count": 15},
-        {"id": "FA-006", "type": "refund_abuse", "user_id": "user-987", "user_name": "نورة سعود", "description": "طلبات استرداد متكررة مشبوهة", "severity": "high", "risk_score": 80, "status": "investigating", "detected_at": "2024-01-14T14:20:00", "refund_count": 8},
-    ]
-    
+async def get_fraud_alerts(user = Depends(verify_admin_token), status: str = None, severity: str = None, limit: int = 100):
+    """Get fraud alerts raised by checkout-time scoring"""
+    query = {}
     if status:
-        alerts = [a for a in alerts if a["status"] == status]
+        query["status"] = status
     if severity:
-        alerts = [a for a in alerts if a["severity"] == severity]
+        query["severity"] = severity
+    alerts = list(db.fraud_alerts.find(query, {"_id": 0}).sort("detected_at", -1).limit(limit)) if db is not None else []
+    
+    # Summary counts over all alerts matching the filters, not just this page
+    counts = {}
+    if db is not None:
+        for row in db.fraud_alerts.aggregate([
+            {"$match": query},
+            {"$facet": {
+                "severity": [{"$group": {"_id": "$severity", "n": {"$sum": 1}}}],
+                "status": [{"$group": {"_id": "$status", "n": {"$sum": 1}}}]
+            }}
+        ]):
+            for group in ("severity", "status"):
+                for bucket in row[group]:
+                    counts[bucket["_id"]] = counts.get(bucket["_id"], 0) + bucket["n"]
     
     return {
         "alerts": alerts,
         "summary": {
-            "total": len(alerts),
-            "critical": len([a for a in alerts if a["severity"] == "critical"]),
-            "high": len([a for a in alerts if a["severity"] == "high"]),
-            "medium": len([a for a in alerts if a["severity"] == "medium"]),
-            "low": len([a for a in alerts if a["severity"] == "low"]),
-            "pending": len([a for a in alerts if a["status"] == "pending"]),
-            "blocked": len([a for a in alerts if a["status"] == "blocked"])
+            "total": sum(counts.get(s, 0) for s in ("critical", "high", "medium", "low")),
+            "critical": counts.get("critical", 0),
+            "high": counts.get("high", 0),
+            "medium": counts.get("medium", 0),
+            "low": counts.get("low", 0),
+            "pending": counts.get("pending", 0),
+            "blocked": counts.get("blocked", 0)
         }
     }
 
 @router.post("/fraud-alerts/{alert_id}/resolve")
 async def resolve_fraud_alert(alert_id: str, action: str, user = Depends(verify_admin_token)):
     """Resolve a fraud alert"""
+    result = db.fraud_alerts.update_one({"id": alert_id}, {"$set": {
+        "status": "blocked" if action == "block" else "resolved",
+        "resolution": action,
+        "resolved_by": user.get("user_id"),
+        "resolved_at": datetime.now(timezone.utc).isoformat()
+    }})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="التنبيه غير موجود")
     return {"success": True, "message": f"تم حل التنبيه {alert_id} بإجراء: {action}"}
 
 @router.post("/fraud-alerts/{alert_id}/escalate")
 async def escalate_fraud_alert(alert_id: str, user = Depends(verify_admin_token)):
     """Escalate a fraud alert"""
+    result = db.fraud_alerts.update_one({"id": alert_id}, {"$set": {
+        "status": "investigating",
+        "escalated_by": user.get("user_id"),
+        "escalated_at": datetime.now(timezone.utc).isoformat()
+    }})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="التنبيه غير موجود")
     return {"success": True, "message": f"تم تصعيد التنبيه {alert_id}"}
 
 # ==================== RISK SCORES ====================
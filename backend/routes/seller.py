@@ -7,6 +7,10 @@ import jwt
 import os
 import uuid
 
+from core.responses import content_versions
+from engines.similarity import similarity_index
+from engines.pricing import record_price_change
+
 router = APIRouter(prefix="/api/seller", tags=["seller"])
 
 # JWT Configuration
@@ -253,6 +257,8 @@ def create_product(product: ProductCreate, seller: dict = Depends(get_seller_use
     db.products.insert_one(product_data)
     if '_id' in product_data:
         del product_data['_id']
+    similarity_index.upsert(product_data)
+    content_versions.bump("products")
     
     return {"message": "Product created", "product": product_data}
 
@@ -280,6 +286,10 @@ def update_product(product_id: str, product: ProductUpdate, seller: dict = Depen
     update_data['updated_at'] = datetime.utcnow().isoformat()
     
     db.products.update_one({"id": product_id}, {"$set": update_data})
+    similarity_index.upsert({**existing, **update_data})
+    content_versions.bump("products")
+    if "price" in update_data:
+        record_price_change(db, product_id, existing.get("price"), update_data["price"], source="seller")
     
     return {"message": "Product updated"}
 
@@ -289,6 +299,8 @@ def delete_product(product_id: str, seller: dict = Depends(get_seller_user)):
     result = db.products.delete_one({"id": product_id, "seller_id": seller['seller_id']})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    similarity_index.remove(product_id)
+    content_versions.bump("products")
     
     return {"message": "Product deleted"}
 
@@ -301,6 +313,7 @@ def update_stock(product_id: str, stock: int, seller: dict = Depends(get_seller_
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    content_versions.bump("products")
     
     return {"message": "Stock updated"}
 
@@ -509,6 +522,8 @@ def bulk_update_inventory(updates: List[dict], seller: dict = Depends(get_seller
         )
         if result.matched_count > 0:
             updated += 1
+    if updated:
+        content_versions.bump("products")
     
     return {"message": f"Updated {updated} products"}
 
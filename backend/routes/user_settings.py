@@ -1,10 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 from datetime import datetime, timezone
 import jwt
 import os
 
+from core.responses import PRIVATE_CACHE, static_responses
+
 router = APIRouter(prefix="/api/settings", tags=["settings"])
 
 db = None
@@ -27,19 +29,21 @@ async def verify_token(authorization: str = Header(None)):
 
 # ==================== THEME SETTINGS ====================
 
+THEMES = static_responses.register("settings.themes", {
+    "themes": [
+        {"id": "ocean", "name": "أوشن الأزرق", "primary": "#0EA5E9", "secondary": "#0284C7", "default": True},
+        {"id": "emerald", "name": "الزمردي", "primary": "#10B981", "secondary": "#059669", "default": False},
+        {"id": "purple", "name": "البنفسجي", "primary": "#8B5CF6", "secondary": "#7C3AED", "default": False},
+        {"id": "rose", "name": "الوردي", "primary": "#F43F5E", "secondary": "#E11D48", "default": False},
+        {"id": "amber", "name": "الكهرماني", "primary": "#F59E0B", "secondary": "#D97706", "default": False}
+    ],
+    "current": "ocean"
+}, PRIVATE_CACHE)
+
 @router.get("/themes")
-async def get_themes(user = Depends(verify_token)):
+async def get_themes(request: Request, user = Depends(verify_token)):
     """السمات المتاحة"""
-    return {
-        "themes": [
-            {"id": "ocean", "name": "أوشن الأزرق", "primary": "#0EA5E9", "secondary": "#0284C7", "default": True},
-            {"id": "emerald", "name": "الزمردي", "primary": "#10B981", "secondary": "#059669", "default": False},
-            {"id": "purple", "name": "البنفسجي", "primary": "#8B5CF6", "secondary": "#7C3AED", "default": False},
-            {"id": "rose", "name": "الوردي", "primary": "#F43F5E", "secondary": "#E11D48", "default": False},
-            {"id": "amber", "name": "الكهرماني", "primary": "#F59E0B", "secondary": "#D97706", "default": False}
-        ],
-        "current": "ocean"
-    }
+    return THEMES.respond(request)
 
 @router.post("/themes/{theme_id}")
 async def set_theme(theme_id: str, user = Depends(verify_token)):
@@ -48,20 +52,22 @@ async def set_theme(theme_id: str, user = Depends(verify_token)):
 
 # ==================== LANGUAGE SETTINGS ====================
 
+LANGUAGES = static_responses.register("settings.languages", {
+    "languages": [
+        {"code": "ar", "name": "العربية", "direction": "rtl", "default": True},
+        {"code": "en", "name": "English", "direction": "ltr", "default": False},
+        {"code": "ur", "name": "اردو", "direction": "rtl", "default": False},
+        {"code": "tl", "name": "Filipino", "direction": "ltr", "default": False},
+        {"code": "hi", "name": "हिंदी", "direction": "ltr", "default": False},
+        {"code": "bn", "name": "বাংলা", "direction": "ltr", "default": False}
+    ],
+    "current": "ar"
+}, PRIVATE_CACHE)
+
 @router.get("/languages")
-async def get_languages(user = Depends(verify_token)):
+async def get_languages(request: Request, user = Depends(verify_token)):
     """اللغات المتاحة"""
-    return {
-        "languages": [
-            {"code": "ar", "name": "العربية", "direction": "rtl", "default": True},
-            {"code": "en", "name": "English", "direction": "ltr", "default": False},
-            {"code": "ur", "name": "اردو", "direction": "rtl", "default": False},
-            {"code": "tl", "name": "Filipino", "direction": "ltr", "default": False},
-            {"code": "hi", "name": "हिंदी", "direction": "ltr", "default": False},
-            {"code": "bn", "name": "বাংলা", "direction": "ltr", "default": False}
-        ],
-        "current": "ar"
-    }
+    return LANGUAGES.respond(request)
 
 @router.post("/languages/{lang_code}")
 async def set_language(lang_code: str, user = Depends(verify_token)):
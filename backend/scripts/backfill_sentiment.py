@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Score existing reviews that have no sentiment yet and fold them into the
+per-target sentiment aggregates. New reviews are scored on insert, so this
+only needs to run once after deploy (and is safe to re-run).
+
+    python scripts/backfill_sentiment.py
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+
+from core.database import create_client, get_database
+from engines.sentiment import REVIEW_SOURCES, backfill
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill review sentiment and aggregates")
+    parser.add_argument("--collection", choices=list(REVIEW_SOURCES), action="append",
+                        help="review collection (repeatable; default: all)")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    client = create_client(app_name="oceansouq-sentiment", monitor=False)
+    db = get_database(client)
+
+    for collection in args.collection or REVIEW_SOURCES:
+        started = time.time()
+        count = backfill(db, collection, chunk_size=args.chunk_size)
+        elapsed = time.time() - started
+        rate = count / elapsed if elapsed else 0
+        print(f"✅ {collection}: scored {count} reviews in {elapsed:.1f}s ({rate:.0f}/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Rebuild the co-purchase model from orders and publish a new snapshot.
+API processes pick it up within RELOAD_INTERVAL seconds. Run from cron, e.g.
+
+    */30 * * * * cd backend && python scripts/build_copurchase.py
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+
+from core.database import create_client, get_analytics_database
+from engines.copurchase import DEFAULT_MODEL_DIR, DEFAULT_MIN_SUPPORT, DEFAULT_TOP_K, SCORES, rebuild
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the frequently-bought-together model")
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--min-support", type=int, default=DEFAULT_MIN_SUPPORT)
+    parser.add_argument("--metric", choices=SCORES, default="pmi")
+    args = parser.parse_args()
+
+    client = create_client(app_name="oceansouq-copurchase", monitor=False)
+    db = get_analytics_database(client)
+
+    started = time.time()
+    path, model = rebuild(db, args.model_dir, args.top_k, args.min_support, args.metric)
+    print(f"✅ Co-purchase model: {len(model['item_ids'])} items from {model['n_orders']} orders "
+          f"in {time.time() - started:.1f}s -> {path}")
+
+if __name__ == "__main__":
+    main()
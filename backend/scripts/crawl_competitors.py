@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Crawl competitor prices for the catalog (or only tracked products) into
+competitor_snapshots. The API refreshes tracked products hourly on its own;
+run this from cron to cover the whole catalog.
+
+    python scripts/crawl_competitors.py --tracked
+    COMPETITOR_FETCHER=http python scripts/crawl_competitors.py --concurrency 32 --rps 4
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import time
+
+from core.database import create_client, get_database
+from engines.competitors import CONCURRENCY, DOMAIN_RPS, CompetitorCrawler, crawl, ensure_indexes
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl competitor prices")
+    parser.add_argument("--tracked", action="store_true", help="only products in competitor_tracking")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--rps", type=float, default=DOMAIN_RPS, help="requests per second per domain")
+    args = parser.parse_args()
+
+    client = create_client(app_name="oceansouq-competitors", monitor=False)
+    db = get_database(client)
+    ensure_indexes(db)
+
+    if args.tracked:
+        crawler = CompetitorCrawler()
+        crawler.db = db
+        products = crawler.tracked_products()
+    else:
+        products = db.products.find({}, {"_id": 0, "id": 1, "title": 1, "price": 1, "sku": 1}).batch_size(1000)
+
+    started = time.time()
+    stats = asyncio.run(crawl(db, products, concurrency=args.concurrency, domain_rps=args.rps))
+    print(f"✅ {stats['products']} products, {stats['offers']} offers, {stats['alerts']} alerts, "
+          f"{stats['errors']} errors in {time.time() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Refit demand / sales forecast models for every series in one batch, spread
+over a process pool, so that API requests for the day hit cached models.
+Run once a day after midnight UTC (models are keyed by last complete day).
+
+    python scripts/fit_forecasts.py
+    python scripts/fit_forecasts.py --level product --workers 4
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+
+from core.database import create_client, get_database
+from engines.forecasting import refit_all
+
+JOBS = {
+    "total": [("total", "revenue"), ("total", "orders")],
+    "product": [("product", "units")],
+    "category": [("category", "units"), ("category", "revenue")],
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Refit forecast models")
+    parser.add_argument("--level", choices=list(JOBS), action="append",
+                        help="series level (repeatable; default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size")
+    args = parser.parse_args()
+
+    client = create_client(app_name="oceansouq-forecasting", monitor=False)
+    db = get_database(client)
+
+    for level in args.level or JOBS:
+        for series_level, metric in JOBS[level]:
+            started = time.time()
+            count = refit_all(db, series_level, metric, workers=args.workers)
+            print(f"✅ {series_level}/{metric}: fitted {count} series in {time.time() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Loyalty ledger jobs: post points for orders delivered in a period, expire
+unspent points, and repair balances after interrupted writes. Safe to
+re-run: every ledger entry carries an idempotency key.
+
+    python scripts/loyalty_accrual.py --days 1            # daily cron
+    python scripts/loyalty_accrual.py --since 2024-01-01 --until 2024-02-01
+    python scripts/loyalty_accrual.py --open-balances     # once, before first run
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from core.database import create_client, get_database
+from engines.loyalty import CHUNK_SIZE, accrue_delivered, ensure_indexes, expire_points, open_balances, reconcile
+
+def main():
+    parser = argparse.ArgumentParser(description="Loyalty points accrual and expiry")
+    parser.add_argument("--days", type=int, default=1, help="period ending now (default: 1 day)")
+    parser.add_argument("--since", help="period start, YYYY-MM-DD (overrides --days)")
+    parser.add_argument("--until", help="period end, YYYY-MM-DD (default: now)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--open-balances", action="store_true",
+                        help="record pre-ledger balances as opening entries")
+    args = parser.parse_args()
+
+    client = create_client(app_name="oceansouq-loyalty", monitor=False)
+    db = get_database(client)
+    ensure_indexes(db)
+
+    if args.open_balances:
+        print(f"✅ Opening entries: {open_balances(db, args.chunk_size)}")
+
+    until = datetime.fromisoformat(args.until) if args.until else datetime.utcnow()
+    since = datetime.fromisoformat(args.since) if args.since else until - timedelta(days=args.days)
+
+    started = time.time()
+    repaired = reconcile(db, args.chunk_size)
+    orders, points = accrue_delivered(db, since, until, args.chunk_size)
+    expired = expire_points(db, since, until, args.chunk_size)
+    print(f"✅ {since:%Y-%m-%d %H:%M} → {until:%Y-%m-%d %H:%M}: {orders} orders credited ({points} points), "
+          f"{expired} points expired, {repaired} balances repaired in {time.time() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
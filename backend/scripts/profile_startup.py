@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Cold-start profile of the API: runs `python -X importtime -c "import server"`
+in a fresh interpreter and reports where import time goes, per module and
+per package. By default it profiles both lazy routers (how workers start)
+and eager mounting (OCEAN_PRELOAD_ROUTERS=all, the old behaviour) so the
+saving is visible. Needs the same MONGO_URL as the server, since importing
+server.py connects and starts the background engines.
+
+    python scripts/profile_startup.py
+    python scripts/profile_startup.py --mode lazy --top 40
+    python scripts/profile_startup.py --output benchmarks/results/startup.json
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import subprocess
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = {"lazy": "", "eager": "all"}
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth)] from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip())) // 2
+            rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return rows
+
+
+def group_of(module):
+    """routes.rides -> routes.rides, engines.x -> engines.x, fastapi.routing -> fastapi"""
+    parts = module.split(".")
+    return ".".join(parts[:2]) if parts[0] in ("routes", "engines", "core") else parts[0]
+
+
+def profile(mode):
+    env = {**os.environ, "OCEAN_PRELOAD_ROUTERS": MODES[mode], "PYTHONDONTWRITEBYTECODE": "1"}
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise SystemExit(f"❌ import server failed ({mode}):\n{result.stderr[-2000:]}")
+    rows = parse_importtime(result.stderr)
+    groups = defaultdict(int)
+    for module, self_us, _, _ in rows:
+        groups[group_of(module)] += self_us
+    server = next((cumulative for module, _, cumulative, _ in rows if module == "server"), None)
+    return {
+        "mode": mode,
+        "wall_seconds": round(wall, 3),
+        "import_seconds": round((server or sum(r[1] for r in rows)) / 1e6, 3),
+        "modules": len(rows),
+        "top_modules": [{"module": m, "self_ms": round(s / 1000, 1), "cumulative_ms": round(c / 1000, 1)}
+                        for m, s, c, _ in sorted(rows, key=lambda r: -r[1])],
+        "top_groups": [{"group": g, "self_ms": round(us / 1000, 1)}
+                       for g, us in sorted(groups.items(), key=lambda kv: -kv[1])],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile API cold-start import time")
+    parser.add_argument("--mode", choices=list(MODES), action="append",
+                        help="router loading mode to profile (repeatable; default: lazy and eager)")
+    parser.add_argument("--top", type=int, default=20, help="modules and packages to list")
+    parser.add_argument("--output", help="write the full report as JSON")
+    args = parser.parse_args()
+
+    reports = [profile(mode) for mode in args.mode or list(MODES)]
+    for report in reports:
+        print(f"\n✅ {report['mode']}: import server {report['import_seconds']:.2f}s "
+              f"({report['modules']} modules, process wall {report['wall_seconds']:.2f}s)")
+        print("   slowest packages (self time):")
+        for row in report["top_groups"][:args.top]:
+            print(f"     {row['self_ms']:9.1f} ms  {row['group']}")
+        print("   slowest modules (self time):")
+        for row in report["top_modules"][:args.top]:
+            print(f"     {row['self_ms']:9.1f} ms  {row['module']}  (cumulative {row['cumulative_ms']:.1f} ms)")
+    if len(reports) == 2:
+        lazy, eager = reports
+        print(f"\n✅ Lazy routers save {eager['import_seconds'] - lazy['import_seconds']:.2f}s "
+              f"and {eager['modules'] - lazy['modules']} module imports per worker start")
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"reports": reports}, f, indent=2)
+        print(f"✅ Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
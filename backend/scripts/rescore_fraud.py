@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Batch re-score historical transactions with the current fraud rules.
+Replays each collection in time order so every score reflects only the
+activity that preceded it, and writes fraud_score / fraud_level back.
+
+    python scripts/rescore_fraud.py --since 2024-01-01
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+
+from core.database import create_client, get_database
+from engines.fraud import rescore_orders
+
+COLLECTIONS = ("orders", "food_orders", "rides")
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score historical orders for fraud")
+    parser.add_argument("--collection", choices=COLLECTIONS, action="append",
+                        help="collection to re-score (repeatable; default: all)")
+    parser.add_argument("--since", help="ISO date; only re-score transactions created on or after it")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    client = create_client(app_name="oceansouq-fraud-rescore", monitor=False)
+    db = get_database(client)
+
+    for collection in args.collection or COLLECTIONS:
+        started = time.time()
+        levels = rescore_orders(db, collection, since=args.since, chunk_size=args.chunk_size)
+        total = sum(levels.values())
+        print(f"✅ {collection}: re-scored {total} in {time.time() - started:.1f}s "
+              + ", ".join(f"{level}={count}" for level, count in sorted(levels.items())))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Evaluate auto-pricing rules over the catalog and apply / suggest prices.
+The API server runs due rules on its own schedule; use this from cron for
+large catalogs or to force a run.
+
+    python scripts/run_pricing.py                 # all active rules
+    python scripts/run_pricing.py --rule APR-1A2B --dry-run
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+
+from core.database import create_client, get_database
+from engines.pricing import CHUNK_SIZE, ensure_collections, run_rules
+
+def main():
+    parser = argparse.ArgumentParser(description="Run auto-pricing rules")
+    parser.add_argument("--rule", action="append", help="rule id (repeatable; default: all active)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="evaluate without writing")
+    args = parser.parse_args()
+
+    client = create_client(app_name="oceansouq-pricing", monitor=False)
+    db = get_database(client)
+    ensure_collections(db)
+
+    started = time.time()
+    stats = run_rules(db, args.rule, chunk_size=args.chunk_size, dry_run=args.dry_run)
+    for rule_id, s in stats.items():
+        print(f"✅ {rule_id}: {s['products']} products, {s['changed']} changes, {s['applied']} applied")
+    print(f"✅ Done in {time.time() - started:.1f}s{' (dry run)' if args.dry_run else ''}")
+
+if __name__ == "__main__":
+    main()
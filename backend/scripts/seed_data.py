@@ -6,13 +6,17 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from pymongo import MongoClient
+import argparse
+import json
+import random
 import uuid
-from datetime import datetime
+import bcrypt
+from datetime import datetime, timedelta
 
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
-client = MongoClient(MONGO_URL)
-db = client['oceansouq']
+from core.database import create_client, get_database
+
+client = create_client(app_name="oceansouq-seed", monitor=False)
+db = get_database(client)
 
 def seed_restaurants():
     """Add demo restaurants with menu items"""
@@ -687,7 +691,243 @@ def seed_subscriptions():
     db.subscriptions.insert_many(subscriptions)
     print(f"✅ Added {len(subscriptions)} subscription packages")
 
+# ==================== SCALE DATA (benchmarks) ====================
+
+BENCH_PASSWORD = "bench123"
+BENCH_CATEGORIES = [
+    "Electronics", "WomensFashion", "MensFashion", "Shoes", "HomeKitchen",
+    "Beauty", "SportsFitness", "KidsBaby", "Fragrance", "Books", "Toys", "Jewelry"
+]
+BENCH_CITIES = ["riyadh", "jeddah", "makkah", "madinah", "dammam", "abha"]
+BENCH_ADJECTIVES = ["Premium", "Classic", "Smart", "Wireless", "Portable", "Organic", "Luxury", "Compact"]
+BENCH_NOUNS = ["Headphones", "Watch", "Jacket", "Sneakers", "Blender", "Perfume", "Backpack", "Lamp", "Novel", "Drone"]
+BENCH_REVIEWS = [
+    "Great quality, fast delivery", "Not worth the price", "Excellent product, highly recommend",
+    "منتج ممتاز والتوصيل سريع", "الجودة سيئة جدا", "جيد لكن السعر مرتفع"
+]
+BENCH_ORDER_STATUSES = ["pending", "confirmed", "processing", "shipped", "delivered", "delivered", "delivered", "cancelled"]
+
+def _insert_chunked(collection, docs, chunk_size=5000):
+    for start in range(0, len(docs), chunk_size):
+        collection.insert_many(docs[start:start + chunk_size], ordered=False)
+
+def clear_scale_data():
+    """Remove everything previously generated by seed_scale (tagged bench: True)"""
+    for name in ["users", "products", "orders", "reviews", "hotels", "hotel_rooms", "captains", "carts"]:
+        db[name].delete_many({"bench": True})
+
+def seed_scale(users=1000, sellers=50, captains=50, products=10000, orders=20000,
+               hotels=200, reviews=5000, days=180, seed=42, manifest_path=None):
+    """
+    Generate a reproducible data set of arbitrary size for load testing.
+    Every document is tagged `bench: True`; re-running replaces the previous set.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    # bcrypt is deliberately slow: hash the shared benchmark password once
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+    def bench_id(kind, i):
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"oceansouq-bench/{seed}/{kind}/{i}"))
+
+    def past(max_days):
+        return (now - timedelta(days=rng.random() * max_days)).isoformat()
+
+    clear_scale_data()
+
+    user_docs = []
+    for role, count in (("buyer", users), ("seller", sellers), ("captain", captains)):
+        for i in range(count):
+            user_docs.append({
+                "id": bench_id(role, i),
+                "email": f"bench-{role}-{i}@ocean.test",
+                "password": password_hash,
+                "name": f"Bench {role.title()} {i}",
+                "role": role,
+                "bench": True,
+                "created_at": past(days)
+            })
+    _insert_chunked(db.users, user_docs)
+
+    _insert_chunked(db.captains, [{
+        "user_id": bench_id("captain", i),
+        "vehicle_model": rng.choice(["Camry", "Sonata", "Accord", "Tahoe"]),
+        "vehicle_plate": f"BEN {i:04d}",
+        "rating": round(rng.uniform(4.0, 5.0), 1),
+        "status": "online",
+        "bench": True
+    } for i in range(captains)])
+
+    product_docs = []
+    for i in range(products):
+        category = BENCH_CATEGORIES[i % len(BENCH_CATEGORIES)]
+        title = f"{rng.choice(BENCH_ADJECTIVES)} {rng.choice(BENCH_NOUNS)} {i}"
+        product_docs.append({
+            "id": bench_id("product", i),
+            "seller_id": bench_id("seller", i % max(sellers, 1)),
+            "title": title,
+            "description": f"{title} in {category}, benchmark item",
+            "price": round(rng.lognormvariate(4.0, 0.8), 2),
+            "category": category,
+            "image_url": "",
+            "stock": 1_000_000,
+            "bench": True,
+            "created_at": past(days)
+        })
+    _insert_chunked(db.products, product_docs)
+
+    order_docs = []
+    for i in range(orders):
+        items = []
+        for product in rng.sample(product_docs, min(rng.randint(1, 4), len(product_docs))):
+            quantity = rng.randint(1, 3)
+            items.append({
+                "product_id": product["id"],
+                "title": product["title"],
+                "price": product["price"],
+                "quantity": quantity,
+                "item_total": round(product["price"] * quantity, 2)
+            })
+        order_docs.append({
+            "id": bench_id("order", i),
+            "user_id": bench_id("buyer", rng.randrange(max(users, 1))),
+            "items": items,
+            "total": round(sum(item["item_total"] for item in items), 2),
+            "status": rng.choice(BENCH_ORDER_STATUSES),
+            "shipping_name": "Bench Buyer",
+            "shipping_address": "Bench Street",
+            "shipping_city": rng.choice(BENCH_CITIES),
+            "shipping_zip": "12345",
+            "shipping_phone": "+966500000000",
+            "bench": True,
+            "created_at": past(days)
+        })
+    _insert_chunked(db.orders, order_docs)
+
+    _insert_chunked(db.reviews, [{
+        "id": bench_id("review", i),
+        "product_id": rng.choice(product_docs)["id"],
+        "user_id": bench_id("buyer", rng.randrange(max(users, 1))),
+        "user_name": "Bench Buyer",
+        "rating": rng.randint(1, 5),
+        "comment": rng.choice(BENCH_REVIEWS),
+        "bench": True,
+        "created_at": past(days)
+    } for i in range(reviews if product_docs else 0)])
+
+    hotel_docs, room_docs = [], []
+    for i in range(hotels):
+        hotel_id = bench_id("hotel", i)
+        stars = rng.randint(3, 5)
+        hotel_docs.append({
+            "id": hotel_id,
+            "manager_id": "bench-manager",
+            "name": f"Bench Hotel {i}",
+            "name_ar": f"فندق {i}",
+            "star_rating": stars,
+            "city": BENCH_CITIES[i % len(BENCH_CITIES)],
+            "facilities": rng.sample(["wifi", "pool", "gym", "spa", "restaurant", "parking"], 3),
+            "is_featured": i % 10 == 0,
+            "status": "active",
+            "bench": True,
+            "created_at": past(days)
+        })
+        for name, factor in (("Standard Room", 1), ("Deluxe Room", 1.6), ("Suite", 3)):
+            room_docs.append({
+                "id": bench_id("room", f"{i}-{name}"),
+                "hotel_id": hotel_id,
+                "name": name,
+                "price_per_night": round(stars * 100 * factor, 2),
+                "max_guests": 2 if factor < 3 else 4,
+                "available_rooms": 10,
+                "bench": True,
+                "created_at": past(days)
+            })
+    _insert_chunked(db.hotels, hotel_docs)
+    _insert_chunked(db.hotel_rooms, room_docs)
+
+    print(f"✅ Scale data: {len(user_docs)} users, {len(product_docs)} products, "
+          f"{len(order_docs)} orders, {len(hotel_docs)} hotels")
+
+    manifest = {
+        "seed": seed,
+        "password": BENCH_PASSWORD,
+        "counts": {"users": users, "sellers": sellers, "captains": captains, "products": products,
+                   "orders": orders, "hotels": hotels, "reviews": reviews},
+        "categories": BENCH_CATEGORIES,
+        "cities": BENCH_CITIES,
+        "buyers": [f"bench-buyer-{i}@ocean.test" for i in range(min(users, 500))],
+        "sellers": [f"bench-seller-{i}@ocean.test" for i in range(min(sellers, 100))],
+        "captains": [f"bench-captain-{i}@ocean.test" for i in range(min(captains, 100))],
+        "product_ids": [p["id"] for p in product_docs[:2000]]
+    }
+    if manifest_path:
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        print(f"✅ Manifest written to {manifest_path}")
+    return manifest
+
+def seed_competitor_prices(path=None, seed=42):
+    """
+    Write the FileFetcher stub (data/competitor_prices.json, not committed)
+    from the products in the database: each competitor lists about 70% of
+    them within ±15% of our price, a few out of stock.
+    """
+    from engines.competitors import COMPETITORS, STUB_PATH
+    path = path or STUB_PATH
+    rng = random.Random(seed)
+    prices = {domain: {} for domain in COMPETITORS}
+    count = 0
+    for product in db.products.find({"price": {"$gt": 0}}, {"_id": 0, "id": 1, "price": 1}):
+        count += 1
+        for domain in COMPETITORS:
+            if rng.random() < 0.7:
+                prices[domain][product["id"]] = {
+                    "price": round(product["price"] * rng.uniform(0.85, 1.15), 2),
+                    "in_stock": rng.random() > 0.1
+                }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(prices, f)
+    print(f"✅ Competitor prices for {count} products written to {path}")
+
 def main():
+    parser = argparse.ArgumentParser(description="Seed OceanSouq demo or benchmark data")
+    parser.add_argument("--scale", action="store_true", help="generate benchmark data instead of demo data")
+    parser.add_argument("--clear-scale", action="store_true", help="remove previously generated benchmark data")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--sellers", type=int, default=50)
+    parser.add_argument("--captains", type=int, default=50)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--hotels", type=int, default=200)
+    parser.add_argument("--reviews", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=180, help="spread created_at over this many days")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--manifest", default=None, help="write a JSON manifest for benchmarks/load_test.py")
+    parser.add_argument("--competitor-prices", action="store_true",
+                        help="only (re)write data/competitor_prices.json from the current products")
+    args = parser.parse_args()
+
+    if args.competitor_prices:
+        seed_competitor_prices(seed=args.seed)
+        return
+
+    if args.clear_scale:
+        clear_scale_data()
+        print("✅ Benchmark data removed")
+        return
+
+    if args.scale:
+        print("\n🌊 Ocean Super App - Seeding Benchmark Data\n")
+        seed_scale(
+            users=args.users, sellers=args.sellers, captains=args.captains,
+            products=args.products, orders=args.orders, hotels=args.hotels,
+            reviews=args.reviews, days=args.days, seed=args.seed, manifest_path=args.manifest
+        )
+        seed_competitor_prices(seed=args.seed)
+        return
+
     print("\n🌊 Ocean Super App - Seeding Demo Data\n")
     print("="*50)
     
@@ -696,6 +936,7 @@ def main():
     seed_experiences()
     seed_services()
     seed_subscriptions()
+    seed_competitor_prices()
     
     print("="*50)
     print("\n✅ All demo data seeded successfully!\n")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Production launcher: several uvicorn worker processes behind one socket.
+
+    python serve.py                         # one worker per available CPU
+    python serve.py --workers 4 --port 8001
+    WEB_CONCURRENCY=4 python serve.py
+
+uvicorn's supervisor spawns each worker as a fresh interpreter that imports
+server:app, so every worker builds its own MongoClient after the process
+exists (pymongo clients must not cross a fork). The worker count is exported
+as WEB_CONCURRENCY before spawning, which sizes each worker's pool from the
+host's MONGO_CONNECTION_BUDGET and switches cross-worker state to the mongo
+shared-state backend (see core/shared_state.py).
+
+Without --workers the count is the CPUs this process may use (affinity and
+cgroup quota), capped so every worker still gets the minimum Mongo pool.
+Point the load balancer's health check at /api/health/ready.
+
+Workers are not recycled: uvicorn's supervisor (0.24) does not respawn a
+worker that exits, so a max-requests limit would drain the pool.
+
+X-Forwarded-For / X-Forwarded-Proto are only honoured from the addresses
+in FORWARDED_ALLOW_IPS (comma-separated, default 127.0.0.1; --forwarded-allow-ips
+overrides it). Set it to the load balancer's addresses: the client IP it
+yields keys the rate limits and fraud checks, so trusting every peer would
+let any caller choose its own IP.
+"""
+import argparse
+import math
+import os
+
+from core.database import MIN_WORKER_POOL
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def available_cpus():
+    """CPUs usable by this process: scheduler affinity, then a cgroup v2 quota if one is set"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(math.ceil(int(quota) / int(period)), 1))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def default_workers():
+    budget = _env_int("MONGO_CONNECTION_BUDGET", 400)
+    return max(min(available_cpus(), budget // MIN_WORKER_POOL), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the OceanSouq API with multiple workers")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int("PORT", 8001))
+    parser.add_argument("--workers", type=int, default=_env_int("WEB_CONCURRENCY", 0) or None,
+                        help="worker processes (default: WEB_CONCURRENCY, else available CPUs)")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="seconds to finish in-flight requests on shutdown")
+    parser.add_argument("--forwarded-allow-ips", default=os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+                        help="proxies trusted to set X-Forwarded-For (default: FORWARDED_ALLOW_IPS, else 127.0.0.1)")
+    args = parser.parse_args()
+
+    workers = args.workers or default_workers()
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    print(f"✅ Starting {workers} worker(s) on {args.host}:{args.port}")
+
+    import uvicorn
+    uvicorn.run("server:app", host=args.host, port=args.port, workers=workers,
+                proxy_headers=True, forwarded_allow_ips=args.forwarded_allow_ips,
+                timeout_graceful_shutdown=args.graceful_timeout)
+
+
+if __name__ == "__main__":
+    main()
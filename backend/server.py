@@ -1,60 +1,63 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from core.responses import DefaultJSONResponse, conditional, content_versions
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
-from pymongo import MongoClient
 from typing import Optional, List
+import logging
 import os
 from dotenv import load_dotenv
 import bcrypt
 import jwt
 from datetime import datetime, timedelta
 import uuid
+import json
+from pymongo.errors import PyMongoError
 
 # Load environment variables
 load_dotenv()
-
-app = FastAPI()
-
-# Import and include admin routes
-from routes.admin import router as admin_router, set_db as set_admin_db
-from routes.seller import router as seller_router, set_db as set_seller_db
-from routes.command import router as command_router, set_db as set_command_db
-from routes.food import router as food_router, set_db as set_food_db
-from routes.provider_registration import router as provider_router, set_db as set_provider_db
-from routes.rides import router as rides_router, set_db as set_rides_db
-from routes.hotels import router as hotels_router, set_db as set_hotels_db
-from routes.experiences import router as experiences_router, set_db as set_experiences_db
-from routes.ondemand import router as ondemand_router, set_db as set_ondemand_db
-from routes.subscriptions import router as subscriptions_router, set_db as set_subscriptions_db
-from routes.notifications import router as notifications_router, set_db as set_notifications_db
-from routes.driver import router as driver_router, set_db as set_driver_db
-from routes.restaurant_dashboard import router as restaurant_dashboard_router, set_db as set_restaurant_dashboard_db
-from routes.captain import router as captain_router, set_db as set_captain_db
-from routes.hotel_dashboard import router as hotel_dashboard_router, set_db as set_hotel_dashboard_db
-from routes.security import router as security_router, set_db as set_security_db
-from routes.finance import router as finance_router, set_db as set_finance_db
-from routes.reports import router as reports_router, set_db as set_reports_db
-from routes.alerts import router as alerts_router, set_db as set_alerts_db
-from routes.payment_gateways import router as payment_gateways_router, set_db as set_payment_gateways_db
-from routes.ai_engines import router as ai_engines_router, set_db as set_ai_engines_db
-from routes.advanced_analytics import router as advanced_analytics_router, set_db as set_advanced_analytics_db
-from routes.ai_advanced import router as ai_advanced_router, set_db as set_ai_advanced_db
-
-# Phase 4 Routes
-from routes.digital_twin import router as digital_twin_router, set_db as set_digital_twin_db
-from routes.autonomous import router as autonomous_router, set_db as set_autonomous_db
-from routes.voice_commands import router as voice_router, set_db as set_voice_db
-from routes.analytics_ai import router as analytics_ai_router, set_db as set_analytics_ai_db
-from routes.support_center import router as support_center_router, set_db as set_support_center_db
-from routes.loyalty import router as loyalty_router, set_db as set_loyalty_db
-from routes.logistics import router as logistics_router, set_db as set_logistics_db
-from routes.security_advanced import router as security_advanced_router, set_db as set_security_advanced_db
-from routes.car_rental import router as car_rental_router, set_db as set_car_rental_db
-from routes.user_settings import router as user_settings_router, set_db as set_user_settings_db
-
-# Platform Settings Routes
-from routes.platform_settings import router as platform_settings_router, set_db as set_platform_settings_db
+logger = logging.getLogger(__name__)
+
+# orjson-backed JSON responses when available (core/responses.py)
+app = FastAPI(default_response_class=DefaultJSONResponse)
+
+# Observability
+from routes.metrics import router as metrics_router
+from routes.debug import router as debug_router
+from core.metrics import MetricsMiddleware
+from core.idempotency import IdempotencyMiddleware, idempotency_store
+from core.compression import CompressionMiddleware
+from core.database import create_client, get_database, get_analytics_database
+from core.shared_state import shared_state
+from core.health import readiness
+from core.lazy_routers import LazyRouterMiddleware, lazy_routers
+from core.rate_limit import Limit, RateLimitMiddleware, rate_limiter
+from engines.copurchase import copurchase_index
+from engines.similarity import similarity_index
+from engines.recommendations import feed_worker, get_feed
+from engines.trending import trending_engine
+from engines.fraud import check_transaction, client_ip, fraud_scorer, transaction
+from engines.sentiment import record_review, review_fields
+from engines.pricing import pricing_scheduler, record_price_change
+from engines.competitors import competitor_crawler
+from engines.chat import chat_manager
+from engines.loyalty import earn as earn_loyalty_points, get_balance as get_loyalty_balance
+from engines.loyalty import ensure_indexes as ensure_loyalty_indexes
+from engines.events import event_bus
+from engines import subscribers as event_subscribers
+from core.change_streams import change_feed
+import engines.consumers  # registers change_feed consumers
+
+# Imports a feature router on the first request to its prefix
+app.add_middleware(LazyRouterMiddleware)
+
+# Idempotency-Key replay for order/booking POSTs (inside CORS and metrics, so replays pass through them)
+app.add_middleware(IdempotencyMiddleware)
+
+# Token-bucket rate limits (inside CORS, so browsers can read the 429)
+app.add_middleware(RateLimitMiddleware)
 
 # CORS Configuration
 app.add_middleware(
@@ -65,10 +68,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# brotli/gzip for large JSON bodies (inside metrics, so timings include compression)
+app.add_middleware(CompressionMiddleware)
+
+# Request timing, status counts and per-request MongoDB attribution
+app.add_middleware(MetricsMiddleware)
+
 # MongoDB Configuration
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
-client = MongoClient(MONGO_URL)
-db = client['oceansouq']
+client = create_client()
+db = get_database(client)
+# Dashboards and reports read from secondaries when available; checkout stays on the primary
+analytics_db = get_analytics_database(client)
+idempotency_store.configure(db["idempotency_keys"])
+# Cross-worker counters, leases and fan-out (mongo backend when WEB_CONCURRENCY > 1)
+shared_state.configure(db)
+
+# Rate limits: bcrypt logins, regex-scanning suggestions and paid LLM calls.
+# Shared limits are exact across workers; the others are split between them.
+rate_limiter.limit("POST", "/api/auth/login", Limit(20, per=60, burst=10, key="ip", shared=True))
+rate_limiter.limit("POST", "/api/auth/register", Limit(10, per=3600, burst=5, key="ip", shared=True))
+rate_limiter.limit("GET", "/api/search/suggestions", Limit(10, per=1, burst=20))
+for chat_path in ("/api/chat", "/api/chat/stream"):
+    rate_limiter.limit("POST", chat_path,
+                       Limit(20, per=60, burst=5, shared=True),
+                       Limit(600, per=60, burst=60, key="route", shared=True))
+rate_limiter.limit_prefix("/api/ai-engines", Limit(120, per=60, burst=30))
+rate_limiter.limit_prefix("/api/ai-advanced", Limit(120, per=60, burst=30))
+rate_limiter.limit_prefix("/api/voice", Limit(60, per=60, burst=20))
+rate_limiter.configure(db)
 
 # Collections
 users_collection = db['users']
@@ -89,169 +116,81 @@ product_comparisons_collection = db['product_comparisons']  # Compare products
 recently_viewed_collection = db['recently_viewed']  # Recently viewed products
 review_votes_collection = db['review_votes']  # Helpful review votes
 
-# Set database for admin routes
-set_admin_db(db)
-
-# Set database for seller routes
-set_seller_db(db)
-
-# Set database for command center routes
-set_command_db(db)
-
-# Set database for food service routes
-set_food_db(db)
-
-# Set database for provider registration routes
-set_provider_db(db)
-
-# Set database for rides service routes
-set_rides_db(db)
-
-# Set database for hotels service routes
-set_hotels_db(db)
-
-# Set database for experiences service routes
-set_experiences_db(db)
-
-# Set database for on-demand service routes
-set_ondemand_db(db)
-
-# Set database for subscriptions routes
-set_subscriptions_db(db)
-
-# Set database for notifications routes
-set_notifications_db(db)
-
-# Set database for driver dashboard routes
-set_driver_db(db)
-
-# Set database for restaurant dashboard routes
-set_restaurant_dashboard_db(db)
-
-# Set database for captain dashboard routes
-set_captain_db(db)
-
-# Set database for hotel dashboard routes
-set_hotel_dashboard_db(db)
-
-# Set database for security routes
-set_security_db(db)
-
-# Set database for finance routes
-set_finance_db(db)
-
-# Set database for reports routes
-set_reports_db(db)
-
-# Set database for alerts routes
-set_alerts_db(db)
-
-# Set database for payment gateways routes
-set_payment_gateways_db(db)
-
-# Set database for AI engines routes
-set_ai_engines_db(db)
-
-# Set database for advanced analytics routes
-set_advanced_analytics_db(db)
-
-# Set database for AI advanced routes
-set_ai_advanced_db(db)
-
-# Set database for Phase 4 routes
-set_digital_twin_db(db)
-set_autonomous_db(db)
-set_voice_db(db)
-set_analytics_ai_db(db)
-set_support_center_db(db)
-set_loyalty_db(db)
-set_logistics_db(db)
-set_security_advanced_db(db)
-set_car_rental_db(db)
-set_user_settings_db(db)
-set_platform_settings_db(db)
-
-# Include admin router
-app.include_router(admin_router)
-
-# Include seller router
-app.include_router(seller_router)
-
-# Include command center router
-app.include_router(command_router)
-
-# Include food service router
-app.include_router(food_router)
-
-# Include provider registration router
-app.include_router(provider_router)
-
-# Include rides service router
-app.include_router(rides_router)
-
-# Include hotels service router
-app.include_router(hotels_router)
-
-# Include experiences service router
-app.include_router(experiences_router)
-
-# Include on-demand service router
-app.include_router(ondemand_router)
-
-# Include subscriptions router
-app.include_router(subscriptions_router)
-
-# Include notifications router
-app.include_router(notifications_router)
-
-# Include driver dashboard router
-app.include_router(driver_router)
-
-# Include restaurant dashboard router
-app.include_router(restaurant_dashboard_router)
-
-# Include captain dashboard router
-app.include_router(captain_router)
-
-# Include hotel dashboard router
-app.include_router(hotel_dashboard_router)
-
-# Include security routes
-app.include_router(security_router)
-
-# Include finance routes
-app.include_router(finance_router)
-
-# Include reports routes
-app.include_router(reports_router)
-
-# Include alerts routes
-app.include_router(alerts_router)
+# Background engines
+feed_worker.start(db)
+trending_engine.start(db)
+fraud_scorer.start(db)
+copurchase_index.start(analytics_db)
+pricing_scheduler.start(db)
+try:
+    ensure_loyalty_indexes(db)
+except PyMongoError:
+    logger.exception("Could not create loyalty indexes")
+competitor_crawler.start(db)
+event_bus.start(db)
+change_feed.start(db)
+
+# Feature routers are imported and mounted on the first request to their prefix
+# (core/lazy_routers.py). OCEAN_ROUTERS picks what this deployment serves,
+# OCEAN_PRELOAD_ROUTERS mounts some or all of them at startup instead.
+lazy_routers.register("admin", "routes.admin", "/api/admin", database="both")
+lazy_routers.register("seller", "routes.seller", "/api/seller")
+lazy_routers.register("command", "routes.command", "/api/command")
+lazy_routers.register("food", "routes.food", "/api/food")
+lazy_routers.register("provider_registration", "routes.provider_registration", "/api/join")
+lazy_routers.register("rides", "routes.rides", "/api/rides")
+lazy_routers.register("hotels", "routes.hotels", "/api/hotels")
+lazy_routers.register("experiences", "routes.experiences", "/api/experiences")
+lazy_routers.register("ondemand", "routes.ondemand", "/api/services")
+lazy_routers.register("subscriptions", "routes.subscriptions", "/api/subscriptions")
+lazy_routers.register("notifications", "routes.notifications", "/api/notifications")
+lazy_routers.register("driver", "routes.driver", "/api/driver")
+lazy_routers.register("restaurant_dashboard", "routes.restaurant_dashboard", "/api/restaurant")
+lazy_routers.register("captain", "routes.captain", "/api/captain")
+lazy_routers.register("hotel_dashboard", "routes.hotel_dashboard", "/api/hotel")
+lazy_routers.register("security", "routes.security", "/api/security")
+lazy_routers.register("finance", "routes.finance", "/api/finance")
+lazy_routers.register("reports", "routes.reports", "/api/reports", database="analytics")
+lazy_routers.register("alerts", "routes.alerts", "/api/alerts")
+lazy_routers.register("payment_gateways", "routes.payment_gateways", "/api/payment-gateways")
+lazy_routers.register("ai_engines", "routes.ai_engines", "/api/ai-engines")
+lazy_routers.register("advanced_analytics", "routes.advanced_analytics", "/api/advanced-analytics", database="analytics")
+lazy_routers.register("ai_advanced", "routes.ai_advanced", "/api/ai-advanced")
 
-# Include payment gateways routes
-app.include_router(payment_gateways_router)
-
-# Include AI engines routes
-app.include_router(ai_engines_router)
-
-# Include advanced analytics routes
-app.include_router(advanced_analytics_router)
-
-# Include AI advanced routes
-app.include_router(ai_advanced_router)
+# Phase 4 Routes
+lazy_routers.register("digital_twin", "routes.digital_twin", "/api/digital-twin")
+lazy_routers.register("autonomous", "routes.autonomous", "/api/autonomous")
+lazy_routers.register("voice", "routes.voice_commands", "/api/voice")
+lazy_routers.register("analytics_ai", "routes.analytics_ai", "/api/analytics-advanced")
+lazy_routers.register("support_center", "routes.support_center", "/api/support-center")
+lazy_routers.register("loyalty", "routes.loyalty", "/api/loyalty")
+lazy_routers.register("logistics", "routes.logistics", "/api/logistics")
+lazy_routers.register("security_advanced", "routes.security_advanced", "/api/security-advanced")
+lazy_routers.register("car_rental", "routes.car_rental", "/api/car-rental")
+lazy_routers.register("user_settings", "routes.user_settings", "/api/settings")
 
-# Include Phase 4 routes
-app.include_router(digital_twin_router)
-app.include_router(autonomous_router)
-app.include_router(voice_router)
-app.include_router(analytics_ai_router)
-app.include_router(support_center_router)
-app.include_router(loyalty_router)
-app.include_router(logistics_router)
-app.include_router(security_advanced_router)
-app.include_router(car_rental_router)
-app.include_router(user_settings_router)
-app.include_router(platform_settings_router, prefix="/api/platform", tags=["Platform Settings"])
+# Platform Settings Routes
+lazy_routers.register("platform_settings", "routes.platform_settings", "/api/platform", tags=["Platform Settings"])
+
+# Deployment profiles for OCEAN_ROUTERS (the storefront endpoints in this file are always served)
+lazy_routers.profile("marketplace", ["seller", "notifications", "payment_gateways", "loyalty", "subscriptions",
+                                     "user_settings", "support_center", "logistics"])
+lazy_routers.profile("rides-only", ["rides", "driver", "captain", "car_rental", "payment_gateways", "notifications",
+                                    "user_settings"])
+lazy_routers.profile("food-only", ["food", "restaurant_dashboard", "driver", "payment_gateways", "notifications",
+                                   "user_settings"])
+lazy_routers.profile("hotels-only", ["hotels", "hotel_dashboard", "experiences", "payment_gateways", "notifications",
+                                     "user_settings"])
+lazy_routers.profile("backoffice", ["admin", "command", "security", "security_advanced", "finance", "reports", "alerts",
+                                    "advanced_analytics", "analytics_ai", "ai_engines", "ai_advanced", "digital_twin",
+                                    "autonomous", "voice", "provider_registration", "ondemand"])
+lazy_routers.configure(app, {"primary": db, "analytics": analytics_db})
+
+# Include metrics routes
+app.include_router(metrics_router)
+
+# Include query debugger routes (404 unless OCEAN_QUERY_DEBUG=1)
+app.include_router(debug_router)
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'oceansouq-secret-key-change-in-production')
@@ -352,6 +291,35 @@ def read_root():
 def health_check():
     return {"status": "healthy", "database": "connected"}
 
+@readiness.check("mongo")
+def mongo_ready():
+    return client.admin.command("ping").get("ok") == 1
+
+@readiness.check("shared_state")
+def shared_state_ready():
+    return shared_state.backend.healthy()
+
+@app.get("/api/health/live")
+async def liveness():
+    return {"status": "alive", "pid": os.getpid()}
+
+@app.get("/api/health/ready")
+def readiness_probe():
+    ready, checks = readiness.status()
+    return DefaultJSONResponse({"status": "ready" if ready else "not_ready", "pid": os.getpid(), "checks": checks},
+                               status_code=200 if ready else 503)
+
+@app.on_event("startup")
+def mark_started():
+    readiness.started = True
+
+@app.on_event("shutdown")
+def drain_worker():
+    # Fail readiness first so the balancer stops routing here, then flush buffered writes
+    readiness.stopping = True
+    chat_manager.history.flush()
+    shared_state.close()
+
 # Authentication Endpoints
 @app.post("/api/auth/register")
 def register(user: UserRegister):
@@ -417,7 +385,11 @@ def get_me(current_user: dict = Depends(get_current_user)):
 
 # Product Endpoints
 @app.get("/api/products")
-def get_products(category: Optional[str] = None, search: Optional[str] = None):
+def get_products(request: Request, category: Optional[str] = None, search: Optional[str] = None):
+    # Unchanged catalog: 304 straight from the content version, no query
+    etag, not_modified = conditional(request, "products", category, search)
+    if not_modified:
+        return not_modified
     query = {}
     if category:
         query['category'] = category
@@ -428,12 +400,21 @@ def get_products(category: Optional[str] = None, search: Optional[str] = None):
         ]
     
     products = list(products_collection.find(query, {"_id": 0}).sort("created_at", -1))
-    return products
+    return DefaultJSONResponse(jsonable_encoder(products),
+                               headers={"ETag": etag, "Cache-Control": "no-cache"} if etag else None)
 
 # Special Product Endpoints (must be before /{product_id})
 @app.get("/api/products/trending")
-def get_trending_products():
-    trending = list(products_collection.find({}, {"_id": 0}).sort("created_at", -1).limit(12))
+def get_trending_products(category: Optional[str] = None, timeframe: str = "24h"):
+    # Time-decayed views, cart adds and purchases; newest products until there is activity
+    ids = [pid for pid, _ in trending_engine.trending(12, category, timeframe)]
+    if ids:
+        found = {p['id']: p for p in products_collection.find({"id": {"$in": ids}}, {"_id": 0})}
+        trending = [found[pid] for pid in ids if pid in found]
+        if trending:
+            return trending
+    query = {"category": category} if category else {}
+    trending = list(products_collection.find(query, {"_id": 0}).sort("created_at", -1).limit(12))
     return trending
 
 @app.get("/api/products/daily-deals")
@@ -448,8 +429,15 @@ def get_daily_deals():
     return deals
 
 @app.get("/api/products/best-sellers")
-def get_best_sellers():
-    best_sellers = list(products_collection.find({}, {"_id": 0}).sort("stock", -1).limit(12))
+def get_best_sellers(category: Optional[str] = None):
+    ids = [pid for pid, _ in trending_engine.best_sellers(12, category)]
+    if ids:
+        found = {p['id']: p for p in products_collection.find({"id": {"$in": ids}}, {"_id": 0})}
+        best_sellers = [found[pid] for pid in ids if pid in found]
+        if best_sellers:
+            return best_sellers
+    query = {"category": category} if category else {}
+    best_sellers = list(products_collection.find(query, {"_id": 0}).sort("stock", -1).limit(12))
     return best_sellers
 
 @app.get("/api/products/recommended")
@@ -503,9 +491,12 @@ def create_product(product: Product, current_user: dict = Depends(get_current_us
         "category": product.category,
         "image_url": product.image_url,
         "stock": product.stock,
-        "created_at": datetime.utcnow().isoformat()
+        "created_at": datetime.utcnow().isoformat(),
+        "updated_at": datetime.utcnow().isoformat()
     }
     products_collection.insert_one(product_doc)
+    similarity_index.upsert(product_doc)
+    content_versions.bump("products")
     
     return {"id": product_id, **product.dict()}
 
@@ -522,9 +513,14 @@ def update_product(product_id: str, product: ProductUpdate, current_user: dict =
     # Update only provided fields
     update_data = {k: v for k, v in product.dict().items() if v is not None}
     if update_data:
+        update_data["updated_at"] = datetime.utcnow().isoformat()
         products_collection.update_one({"id": product_id}, {"$set": update_data})
+        content_versions.bump("products")
+        if "price" in update_data:
+            record_price_change(db, product_id, existing_product.get("price"), update_data["price"])
     
     updated_product = products_collection.find_one({"id": product_id}, {"_id": 0})
+    similarity_index.upsert(updated_product)
     return updated_product
 
 @app.delete("/api/products/{product_id}")
@@ -538,6 +534,8 @@ def delete_product(product_id: str, current_user: dict = Depends(get_current_use
         raise HTTPException(status_code=403, detail="Not authorized to delete this product")
     
     products_collection.delete_one({"id": product_id})
+    similarity_index.remove(product_id)
+    content_versions.bump("products")
     return {"message": "Product deleted successfully"}
 
 @app.get("/api/products/seller/my-products")
@@ -599,6 +597,7 @@ def add_to_cart(item: CartItem, current_user: dict = Depends(get_current_user)):
         {"$set": cart},
         upsert=True
     )
+    trending_engine.record(item.product_id, "cart", item.quantity, category=product.get('category'))
     
     return {"message": "Item added to cart"}
 
@@ -644,7 +643,7 @@ def remove_from_cart(product_id: str, current_user: dict = Depends(get_current_u
 
 # Order Endpoints
 @app.post("/api/orders")
-def create_order(order: Order, current_user: dict = Depends(get_current_user)):
+def create_order(order: Order, request: Request, current_user: dict = Depends(get_current_user)):
     # Get cart
     cart = carts_collection.find_one({"user_id": current_user['user_id']})
     if not cart or not cart.get('items'):
@@ -665,15 +664,19 @@ def create_order(order: Order, current_user: dict = Depends(get_current_user)):
                 "item_total": item_total
             })
             total += item_total
+            trending_engine.record(item['product_id'], "purchase", item['quantity'], category=product.get('category'))
             
             # Update stock
             products_collection.update_one(
                 {"id": item['product_id']},
-                {"$inc": {"stock": -item['quantity']}}
+                {"$inc": {"stock": -item['quantity']}, "$set": {"updated_at": datetime.utcnow().isoformat()}}
             )
+    content_versions.bump("products")
     
     # Create order
     order_id = str(uuid.uuid4())
+    ip = client_ip(request)
+    fraud = check_transaction(db, transaction(current_user['user_id'], total, ip=ip), "order", order_id)
     order_doc = {
         "id": order_id,
         "user_id": current_user['user_id'],
@@ -685,9 +688,20 @@ def create_order(order: Order, current_user: dict = Depends(get_current_user)):
         "shipping_city": order.shipping_city,
         "shipping_zip": order.shipping_zip,
         "shipping_phone": order.shipping_phone,
+        "client_ip": ip,
+        **fraud,
         "created_at": datetime.utcnow().isoformat()
     }
-    orders_collection.insert_one(order_doc)
+    # Seller notifications, rollups, search ranking: delivered by the event bus off the request path
+    event_bus.insert(db, orders_collection, order_doc, event_subscribers.ORDER_CREATED, {
+        "order_id": order_id,
+        "user_id": current_user['user_id'],
+        "total": total,
+        "items": [{k: item[k] for k in ("product_id", "quantity", "price")} for item in order_items],
+        "created_at": order_doc["created_at"],
+    })
+    copurchase_index.record_order([item['product_id'] for item in order_items])
+    feed_worker.schedule(current_user['user_id'])
     
     # Clear cart
     carts_collection.update_one(
@@ -741,9 +755,11 @@ def create_review(review: Review, current_user: dict = Depends(get_current_user)
         "user_name": user['name'],
         "rating": review.rating,
         "comment": review.comment,
+        **review_fields(review.comment),
         "created_at": datetime.utcnow().isoformat()
     }
     reviews_collection.insert_one(review_doc)
+    record_review(db, "reviews", review_doc)
     
     return {"id": review_id, "message": "Review added successfully"}
 
@@ -788,6 +804,7 @@ def add_to_wishlist(product_id: str, current_user: dict = Depends(get_current_us
             {"$set": wishlist},
             upsert=True
         )
+        feed_worker.schedule(current_user['user_id'])
     
     return {"message": "Added to wishlist"}
 
@@ -804,6 +821,7 @@ def remove_from_wishlist(product_id: str, current_user: dict = Depends(get_curre
             {"user_id": current_user['user_id']},
             {"$set": {"items": wishlist['items']}}
         )
+        feed_worker.schedule(current_user['user_id'])
     
     return {"message": "Removed from wishlist"}
 
@@ -816,7 +834,16 @@ def get_similar_products(product_id: str):
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Find similar products in same category
+    # Nearest neighbours by content (title, description, category, price)
+    similarity_index.ensure_built(db)
+    neighbor_ids = [pid for pid, _ in similarity_index.similar(product_id, k=6)]
+    if neighbor_ids:
+        found = {p['id']: p for p in products_collection.find({"id": {"$in": neighbor_ids}}, {"_id": 0})}
+        similar = [found[pid] for pid in neighbor_ids if pid in found]
+        if similar:
+            return similar
+    
+    # Not indexed yet: fall back to the same category
     similar = list(products_collection.find({
         "category": product['category'],
         "id": {"$ne": product_id}
@@ -826,11 +853,20 @@ def get_similar_products(product_id: str):
 
 @app.get("/api/products/{product_id}/cross-sell")
 def get_cross_sell_products(product_id: str):
-    # Get complementary products (different category, similar price range)
+    # Get complementary products: bought together, else different category at a similar price
     product = products_collection.find_one({"id": product_id}, {"_id": 0})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    # Precomputed co-purchase neighbours first
+    neighbor_ids = [n['product_id'] for n in copurchase_index.neighbors(product_id, k=6)]
+    if neighbor_ids:
+        found = {p['id']: p for p in products_collection.find({"id": {"$in": neighbor_ids}}, {"_id": 0})}
+        cross_sell = [found[pid] for pid in neighbor_ids if pid in found]
+        if cross_sell:
+            return cross_sell
+    
+    # Cold start: no purchase signal yet for this product
     price_min = product['price'] * 0.5
     price_max = product['price'] * 1.5
     
@@ -854,43 +890,21 @@ def search_suggestions(q: str):
             {"category": {"$regex": q, "$options": "i"}},
             {"description": {"$regex": q, "$options": "i"}}
         ]
-    }, {"_id": 0, "id": 1, "title": 1, "category": 1, "price": 1, "image_url": 1}).limit(5))
+    }, {"_id": 0, "id": 1, "title": 1, "category": 1, "price": 1, "image_url": 1}).sort("sales_count", -1).limit(5))
     
     return suggestions
 
 # Loyalty Points Endpoints
 @app.get("/api/loyalty/points")
 def get_loyalty_points(current_user: dict = Depends(get_current_user)):
-    points = loyalty_points_collection.find_one({"user_id": current_user['user_id']}, {"_id": 0})
-    if not points:
-        return {"user_id": current_user['user_id'], "points": 0, "tier": "bronze"}
-    return points
+    return get_loyalty_balance(db, current_user['user_id'])
 
 @app.post("/api/loyalty/add-points")
-def add_loyalty_points(points_to_add: int, current_user: dict = Depends(get_current_user)):
-    loyalty = loyalty_points_collection.find_one({"user_id": current_user['user_id']})
-    
-    if not loyalty:
-        loyalty = {"user_id": current_user['user_id'], "points": 0, "tier": "bronze"}
-    
-    loyalty['points'] += points_to_add
-    
-    # Update tier based on points
-    if loyalty['points'] >= 1000:
-        loyalty['tier'] = "platinum"
-    elif loyalty['points'] >= 500:
-        loyalty['tier'] = "gold"
-    elif loyalty['points'] >= 200:
-        loyalty['tier'] = "silver"
-    else:
-        loyalty['tier'] = "bronze"
-    
-    loyalty_points_collection.update_one(
-        {"user_id": current_user['user_id']},
-        {"$set": loyalty},
-        upsert=True
-    )
-    
+def add_loyalty_points(points_to_add: int, idempotency_key: Optional[str] = None,
+                       current_user: dict = Depends(get_current_user)):
+    if points_to_add <= 0:
+        raise HTTPException(status_code=400, detail="points_to_add must be positive")
+    loyalty, _ = earn_loyalty_points(db, current_user['user_id'], points_to_add, "manual", idempotency_key)
     return loyalty
 
 # Browsing History
@@ -912,6 +926,8 @@ def add_browsing_history(product_id: str, current_user: dict = Depends(get_curre
         {"$set": history},
         upsert=True
     )
+    feed_worker.schedule(current_user['user_id'])
+    trending_engine.record(product_id, "view")
     
     return {"message": "History updated"}
 
@@ -1225,6 +1241,8 @@ def add_to_recently_viewed(product_id: str, current_user: dict = Depends(get_cur
         {"$set": history},
         upsert=True
     )
+    feed_worker.schedule(current_user['user_id'])
+    trending_engine.record(product_id, "view")
     
     return {"message": "Added to recently viewed"}
 
@@ -1342,11 +1360,6 @@ def get_seller_products(seller_id: str, limit: int = 20, skip: int = 0):
 # AI CHATBOT - Customer Service Assistant
 # ==========================================
 
-from emergentintegrations.llm.chat import LlmChat, UserMessage
-
-# Chat sessions storage
-chat_sessions = {}
-
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY', '')
 
 class ChatMessage(BaseModel):
@@ -1457,38 +1470,42 @@ Directives:
     }
     return prompts.get(language, prompts["en"])
 
+CHAT_FALLBACK_RESPONSES = {
+    "en": "I'm having trouble connecting right now. Please try again in a moment. 🙏",
+    "ar": "أواجه مشكلة في الاتصال حالياً. يرجى المحاولة مرة أخرى. 🙏",
+    "tr": "Şu anda bağlantı sorunu yaşıyorum. Lütfen tekrar deneyin. 🙏",
+    "de": "Ich habe gerade Verbindungsprobleme. Bitte versuchen Sie es erneut. 🙏",
+    "zh": "我现在连接有问题。请稍后重试。🙏",
+    "fr": "J'ai des problèmes de connexion. Veuillez réessayer. 🙏"
+}
+
+def llm_client_module():
+    """The LLM client library is slow to import; load it on the first chat session, not at startup"""
+    import emergentintegrations.llm.chat as llm_chat
+    return llm_chat
+
+def create_llm_chat(session_id: str, system_message: str):
+    return llm_client_module().LlmChat(
+        api_key=EMERGENT_LLM_KEY,
+        session_id=session_id,
+        system_message=system_message
+    ).with_model("openai", "gpt-4o-mini")
+
+async def ask_llm(chat, text: str) -> str:
+    return await chat.send_message(llm_client_module().UserMessage(text=text))
+
+chat_manager.configure(chat_history_collection, create_llm_chat, ask_llm, get_system_prompt)
+
+def chat_session_id(chat_data: ChatMessage, current_user: Optional[dict]):
+    user_id = current_user['user_id'] if current_user else "anonymous"
+    return user_id, chat_data.session_id or f"{user_id}_{datetime.utcnow().strftime('%Y%m%d')}"
+
 @app.post("/api/chat")
 async def chat_with_ai(chat_data: ChatMessage, current_user: dict = Depends(get_current_user_optional)):
     """AI Chatbot endpoint"""
     try:
-        user_id = current_user['user_id'] if current_user else "anonymous"
-        session_id = chat_data.session_id or f"{user_id}_{datetime.utcnow().strftime('%Y%m%d')}"
-        
-        # Get or create chat instance
-        if session_id not in chat_sessions:
-            chat_sessions[session_id] = LlmChat(
-                api_key=EMERGENT_LLM_KEY,
-                session_id=session_id,
-                system_message=get_system_prompt(chat_data.language)
-            ).with_model("openai", "gpt-4o-mini")
-        
-        chat = chat_sessions[session_id]
-        
-        # Send message and get response
-        user_message = UserMessage(text=chat_data.message)
-        response = await chat.send_message(user_message)
-        
-        # Save to database
-        chat_record = {
-            "id": str(uuid.uuid4()),
-            "session_id": session_id,
-            "user_id": user_id,
-            "user_message": chat_data.message,
-            "ai_response": response,
-            "language": chat_data.language,
-            "created_at": datetime.utcnow().isoformat()
-        }
-        chat_history_collection.insert_one(chat_record)
+        user_id, session_id = chat_session_id(chat_data, current_user)
+        response = await chat_manager.send(session_id, user_id, chat_data.language, chat_data.message)
         
         return {
             "response": response,
@@ -1497,20 +1514,31 @@ async def chat_with_ai(chat_data: ChatMessage, current_user: dict = Depends(get_
     except Exception as e:
         print(f"Chat error: {e}")
         # Fallback response
-        fallback_responses = {
-            "en": "I'm having trouble connecting right now. Please try again in a moment. 🙏",
-            "ar": "أواجه مشكلة في الاتصال حالياً. يرجى المحاولة مرة أخرى. 🙏",
-            "tr": "Şu anda bağlantı sorunu yaşıyorum. Lütfen tekrar deneyin. 🙏",
-            "de": "Ich habe gerade Verbindungsprobleme. Bitte versuchen Sie es erneut. 🙏",
-            "zh": "我现在连接有问题。请稍后重试。🙏",
-            "fr": "J'ai des problèmes de connexion. Veuillez réessayer. 🙏"
-        }
         return {
-            "response": fallback_responses.get(chat_data.language, fallback_responses["en"]),
+            "response": CHAT_FALLBACK_RESPONSES.get(chat_data.language, CHAT_FALLBACK_RESPONSES["en"]),
             "session_id": chat_data.session_id or "error",
             "error": True
         }
 
+@app.post("/api/chat/stream")
+async def chat_with_ai_stream(chat_data: ChatMessage, current_user: dict = Depends(get_current_user_optional)):
+    """AI Chatbot endpoint, streamed as server-sent events"""
+    user_id, session_id = chat_session_id(chat_data, current_user)
+
+    async def events():
+        yield f"event: session\ndata: {json.dumps({'session_id': session_id})}\n\n"
+        try:
+            async for delta in chat_manager.stream(session_id, user_id, chat_data.language, chat_data.message):
+                yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            fallback = CHAT_FALLBACK_RESPONSES.get(chat_data.language, CHAT_FALLBACK_RESPONSES["en"])
+            yield f"event: error\ndata: {json.dumps({'response': fallback}, ensure_ascii=False)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/api/chat/history")
 async def get_chat_history(session_id: str = None, current_user: dict = Depends(get_current_user)):
     """Get chat history for a session"""
@@ -1518,6 +1546,7 @@ async def get_chat_history(session_id: str = None, current_user: dict = Depends(
     if session_id:
         query["session_id"] = session_id
     
+    chat_manager.history.flush()
     history = list(chat_history_collection.find(
         query,
         {"_id": 0}
@@ -1528,8 +1557,7 @@ async def get_chat_history(session_id: str = None, current_user: dict = Depends(
 @app.delete("/api/chat/clear")
 async def clear_chat_session(session_id: str, current_user: dict = Depends(get_current_user)):
     """Clear chat session"""
-    if session_id in chat_sessions:
-        del chat_sessions[session_id]
+    chat_manager.drop(session_id)
     
     chat_history_collection.delete_many({
         "session_id": session_id,
@@ -1543,56 +1571,12 @@ async def clear_chat_session(session_id: str, current_user: dict = Depends(get_c
 # ==========================================
 
 @app.get("/api/recommendations/ai")
-async def get_ai_recommendations(current_user: dict = Depends(get_current_user)):
+def get_ai_recommendations(current_user: dict = Depends(get_current_user)):
     """Get AI-powered product recommendations based on user behavior"""
-    user_id = current_user['user_id']
-    
-    # Get user's recently viewed products
-    recent = recently_viewed_collection.find_one({"user_id": user_id})
-    recent_ids = recent.get('products', [])[:5] if recent else []
-    
-    # Get user's purchase history
-    orders = list(orders_collection.find({"user_id": user_id}, {"items": 1}).limit(5))
-    purchased_categories = set()
-    for order in orders:
-        for item in order.get('items', []):
-            product = products_collection.find_one({"id": item.get('product_id')})
-            if product:
-                purchased_categories.add(product.get('category'))
-    
-    # Get user's wishlist
-    wishlist = wishlist_collection.find_one({"user_id": user_id})
-    wishlist_ids = [item['id'] for item in wishlist.get('items', [])] if wishlist else []
-    
-    # Combine all viewed/purchased/wishlisted IDs to exclude
-    exclude_ids = set(recent_ids + wishlist_ids)
-    
-    # Get recommendations based on categories
-    recommendations = []
-    for category in purchased_categories:
-        prods = list(products_collection.find(
-            {"category": category, "id": {"$nin": list(exclude_ids)}},
-            {"_id": 0}
-        ).limit(3))
-        recommendations.extend(prods)
-    
-    # If not enough, get trending products
-    if len(recommendations) < 8:
-        trending = list(products_collection.find(
-            {"id": {"$nin": list(exclude_ids)}},
-            {"_id": 0}
-        ).sort("stock", -1).limit(8 - len(recommendations)))
-        recommendations.extend(trending)
-    
-    return {
-        "recommendations": recommendations[:8],
-        "based_on": {
-            "recently_viewed": len(recent_ids),
-            "purchase_history": len(purchased_categories),
-            "wishlist": len(wishlist_ids)
-        }
-    }
+    # Feed is precomputed by the background worker from views, wishlist and orders
+    return get_feed(db, current_user['user_id'], limit=8)
 
 if __name__ == "__main__":
+    # Single process for development; production runs `python serve.py` (one worker per CPU)
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file